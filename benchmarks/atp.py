@@ -0,0 +1,112 @@
+"""Задержка проверки доступности (ATP): индекс в памяти против запроса через ORM.
+
+Временная SQLite с N продуктами на M складах; корзины из K случайных
+продуктов. Индекс отвечает одним векторным вызовом, ORM - запросом
+inventory_items по списку продуктов:
+
+    PYTHONPATH=src python -m benchmarks.atp --products 20000 --warehouses 5 --basket 20
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def measure(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    function()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "median_us": statistics.median(samples) * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(0.99 * len(samples)))] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--basket", type=int, default=20, help="Строк в корзине")
+    parser.add_argument("--repeat", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Результат в JSON")
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="ainventory-atp-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/atp.db"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    sys.path.insert(0, str(ROOT / "src"))
+    logging.disable(logging.WARNING)
+
+    from sqlalchemy import insert
+
+    from ainventory.database.connection import Base, engine, get_db_context
+    from ainventory.database.models import InventoryItem, Product, Warehouse
+    from ainventory.services.atp import stock_index
+
+    rng = random.Random(args.seed)
+    Base.metadata.create_all(bind=engine)
+    with get_db_context() as db:
+        db.execute(insert(Warehouse), [{"id": index + 1, "name": f"Склад {index + 1}"} for index in range(args.warehouses)])
+        db.execute(insert(Product), [
+            {"id": index + 1, "sku": f"SKU{index + 1:06d}", "name": f"Товар {index + 1}"} for index in range(args.products)
+        ])
+        db.execute(insert(InventoryItem), [
+            {"product_id": product + 1, "warehouse_id": warehouse + 1, "current_stock": rng.randint(0, 50)}
+            for product in range(args.products) for warehouse in range(args.warehouses)
+        ])
+
+    started = time.perf_counter()
+    snapshot = stock_index.build()
+    build_ms = (time.perf_counter() - started) * 1000
+
+    baskets: List[List[int]] = [rng.sample(range(1, args.products + 1), args.basket) for _ in range(64)]
+    quantities = [rng.randint(1, 5) for _ in range(args.basket)]
+    position = {"index": 0}
+
+    def next_basket() -> List[int]:
+        position["index"] = (position["index"] + 1) % len(baskets)
+        return baskets[position["index"]]
+
+    def index_lookup():
+        return stock_index.lookup(next_basket(), quantities)
+
+    def orm_lookup():
+        basket = next_basket()
+        needed = dict(zip(basket, quantities))
+        with get_db_context() as db:
+            items = db.query(InventoryItem).filter(InventoryItem.product_id.in_(basket)).all()
+            return [(item.product_id, item.warehouse_id) for item in items if item.current_stock >= needed[item.product_id]]
+
+    result = {
+        "positions": len(snapshot.keys),
+        "basket": args.basket,
+        "build_ms": build_ms,
+        "index": measure(index_lookup, args.repeat),
+        "orm": measure(orm_lookup, max(args.repeat // 5, 20)),
+    }
+    stock_index.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['positions']} позиций, индекс построен за {build_ms:.0f} мс, корзина {args.basket} строк")
+        for name in ("index", "orm"):
+            print(f"  {name:6s} медиана {result[name]['median_us']:8.0f} мкс, p99 {result[name]['p99_us']:8.0f} мкс")
+
+
+if __name__ == "__main__":
+    main()
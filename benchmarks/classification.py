@@ -0,0 +1,100 @@
+"""Время ABC/XYZ-классификации по дневным итогам продаж.
+
+Временная SQLite с N продуктами на M складах и дневными итогами за D дней
+(доля дней с продажами - --density). Классификация считается в БД одним
+UPDATE ... FROM по оконному запросу; выгрузка продаж в приложение не нужна:
+
+    PYTHONPATH=src python -m benchmarks.classification --products 5000 --warehouses 5 --days 365
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--density", type=float, default=0.5, help="Доля дней с продажами")
+    parser.add_argument("--orders-per-day", type=float, default=30.0, help="Среднее число продаж в строке итогов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Результат в JSON")
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="ainventory-classification-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/classification.db"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    sys.path.insert(0, str(ROOT / "src"))
+    logging.disable(logging.WARNING)
+
+    from sqlalchemy import insert
+
+    from ainventory.database.connection import Base, engine, get_db_context
+    from ainventory.database.models import DailySales, InventoryItem, Product, Warehouse
+    from ainventory.services.classification import run_classification
+
+    rng = random.Random(args.seed)
+    end = date(2024, 12, 31)
+    Base.metadata.create_all(bind=engine)
+    with get_db_context() as db:
+        db.execute(insert(Warehouse), [{"id": index + 1, "name": f"Склад {index + 1}"} for index in range(args.warehouses)])
+        db.execute(insert(Product), [
+            {"id": index + 1, "sku": f"SKU{index + 1:06d}", "name": f"Товар {index + 1}"} for index in range(args.products)
+        ])
+        db.execute(insert(InventoryItem), [
+            {"product_id": product + 1, "warehouse_id": warehouse + 1, "current_stock": 10}
+            for product in range(args.products) for warehouse in range(args.warehouses)
+        ])
+
+    rows = orders = 0
+    days = [end - timedelta(days=offset) for offset in range(args.days)]
+    for product in range(args.products):
+        # Цена и уровень спроса по Парето, чтобы классы A/B/C были неравными
+        price = rng.paretovariate(1.2) * 10
+        batch = []
+        for warehouse in range(args.warehouses):
+            for day in days:
+                if rng.random() >= args.density:
+                    continue
+                count = max(1, int(rng.expovariate(1 / args.orders_per_day)))
+                quantity = count * rng.uniform(1, 3)
+                batch.append({
+                    "product_id": product + 1, "warehouse_id": warehouse + 1, "sale_day": day,
+                    "quantity": quantity, "revenue": quantity * price, "cost": 0.0, "orders": count
+                })
+                orders += count
+        with get_db_context() as db:
+            db.execute(insert(DailySales), batch)
+        rows += len(batch)
+
+    started = time.perf_counter()
+    summary = run_classification(days=args.days)
+    seconds = time.perf_counter() - started
+
+    result = {
+        "items": args.products * args.warehouses,
+        "daily_rows": rows,
+        "sales_represented": orders,
+        "seconds": seconds,
+        "classified": summary["classified"],
+        "matrix": summary["matrix"],
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['items']} позиций, {rows} строк daily_sales (~{orders / 1e6:.1f} млн продаж)")
+        print(f"  классификация {seconds:.2f} с, классы: {result['matrix']}")
+
+
+if __name__ == "__main__":
+    main()
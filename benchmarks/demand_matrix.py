@@ -0,0 +1,198 @@
+"""Накладные расходы передачи истории рядов процессам-исполнителям.
+
+Синтетический спрос N рядов x D дней прогнозируется в пуле из W процессов
+простым сезонным средним, чтобы время определяла передача данных, а не
+модель. pickle - родитель собирает DataFrame ds/y каждого ряда и передает
+блоки рядов в задачах пула (как при передаче pandas-объектов); matrix -
+история один раз пишется в матрицу спроса (forecasting/demand_matrix.py),
+задача получает путь и номера строк, процесс подключается отображением в
+память. Каждый вариант выполняется в отдельном процессе, чтобы пиковая
+память не смешивалась:
+
+    PYTHONPATH=src python -m benchmarks.demand_matrix --series 50000 --days 1095 --workers 16
+"""
+import argparse
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULT_MARKER = "BENCHMARK_RESULT "
+HORIZON = 28
+BLOCK_ROWS = 5000
+
+
+def seasonal_mean(frame) -> Any:
+    """Прогноз средним по дню недели за последние 4 недели (дешевая модель вместо обучения)"""
+    import numpy as np
+
+    y = frame["y"].to_numpy()[-28:]
+    if len(y) < 28:
+        y = np.pad(y, (28 - len(y), 0))
+    return np.tile(y.reshape(4, 7).mean(axis=0), HORIZON // 7 + 1)[:HORIZON].astype(np.float32)
+
+
+def memory_kb() -> Dict[str, int]:
+    """Пиковый RSS процесса и текущий PSS (общие страницы делятся между процессами)"""
+    stats = {"pid": os.getpid(), "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "pss_kb": 0}
+    try:
+        for line in Path("/proc/self/smaps_rollup").read_text().splitlines():
+            if line.startswith("Pss:"):
+                stats["pss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return stats
+
+
+def forecast_frames(frames) -> Dict[str, Any]:
+    import numpy as np
+
+    return {"values": np.stack([seasonal_mean(frame) for frame in frames]), **memory_kb()}
+
+
+def forecast_rows(rows, path: str) -> Dict[str, Any]:
+    import numpy as np
+    from ainventory.forecasting.demand_matrix import DemandMatrix
+
+    matrix = DemandMatrix.attach(path)
+    return {"values": np.stack([seasonal_mean(matrix.series(row)) for row in rows]), **memory_kb()}
+
+
+def demand_block(rng, rows: int, days: int):
+    import numpy as np
+
+    week = np.array([1.0, 1.0, 1.0, 1.2, 1.5, 2.0, 0.8], dtype=np.float32)
+    level = rng.gamma(1.0, 3.0, size=(rows, 1)).astype(np.float32)
+    return rng.poisson(level * np.tile(week, days // 7 + 1)[:days]).astype(np.float32)
+
+
+def run_variant(args) -> Dict[str, Any]:
+    import numpy as np
+    import pandas as pd
+    from ainventory.forecasting.demand_matrix import DemandMatrix
+
+    rng = np.random.default_rng(args.seed)
+    start = date(2022, 1, 1)
+    dates = pd.date_range(pd.Timestamp(start), periods=args.days, freq="D")
+    keys = np.column_stack([np.arange(1, args.series + 1), np.ones(args.series, dtype=np.int64)])
+    chunks = [np.arange(begin, min(begin + args.chunk, args.series)) for begin in range(0, args.series, args.chunk)]
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    matrix = None
+    if args.variant == "matrix":
+        matrix = DemandMatrix.create(keys, start, args.days, args.dir)
+        for begin in range(0, args.series, BLOCK_ROWS):
+            block = demand_block(rng, min(BLOCK_ROWS, args.series - begin), args.days)
+            matrix.values[begin:begin + len(block)] = block
+        matrix.flush()
+        tasks = chunks
+        task = partial(forecast_rows, path=str(matrix.path))
+    else:
+        frames: List[Any] = []
+        for begin in range(0, args.series, BLOCK_ROWS):
+            block = demand_block(rng, min(BLOCK_ROWS, args.series - begin), args.days)
+            frames.extend(pd.DataFrame({"ds": dates, "y": row.astype(np.float64)}) for row in block)
+        tasks = [frames[rows[0]:rows[-1] + 1] for rows in chunks]
+        task = forecast_frames
+    prepare_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    workers: Dict[int, Dict[str, int]] = {}
+    values = np.zeros((args.series, HORIZON), dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for rows, part in zip(chunks, pool.map(task, tasks)):
+            values[rows] = part["values"]
+            stats = workers.setdefault(part["pid"], {"maxrss_kb": 0, "pss_kb": 0})
+            stats["maxrss_kb"] = max(stats["maxrss_kb"], part["maxrss_kb"])
+            stats["pss_kb"] = max(stats["pss_kb"], part["pss_kb"])
+    pool_seconds = time.perf_counter() - started
+
+    # Процессорное время родителя (сборка рядов, сериализация задач потоком пула) не
+    # распараллеливается и ограничивает ускорение от числа процессов
+    parent_cpu = time.process_time() - cpu_started
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    workers_cpu = children.ru_utime + children.ru_stime
+
+    # Объем данных задач (сериализация повторяется отдельно от замера времени)
+    task_bytes = sum(len(pickle.dumps((task, item), protocol=pickle.HIGHEST_PROTOCOL)) for item in tasks)
+    if matrix is not None:
+        matrix.remove()
+    return {
+        "variant": args.variant,
+        "prepare_seconds": prepare_seconds,
+        "pool_seconds": pool_seconds,
+        "total_seconds": prepare_seconds + pool_seconds,
+        "task_mb": task_bytes / 2 ** 20,
+        "parent_cpu_seconds": parent_cpu,
+        "workers_cpu_seconds": workers_cpu,
+        # Оценка времени при args.workers ядрах: родитель или процессы, что дольше
+        "bound_seconds": max(parent_cpu, workers_cpu / args.workers),
+        "checksum": float(values.sum()),
+        "parent_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": max(stats["maxrss_kb"] for stats in workers.values()) / 1024,
+        "workers_pss_total_mb": sum(stats["pss_kb"] for stats in workers.values()) / 1024,
+        "workers_used": len(workers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--chunk", type=int, default=200, help="Рядов в задаче пула")
+    parser.add_argument("--dir", default="/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                        help="Каталог матрицы спроса")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Результат в JSON")
+    parser.add_argument("--variant", choices=["pickle", "matrix"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        sys.path.insert(0, str(ROOT / "src"))
+        print(RESULT_MARKER + json.dumps(run_variant(args)))
+        return
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(ROOT / "src"), str(ROOT), env.get("PYTHONPATH", "")])
+    results = {}
+    for variant in ("pickle", "matrix"):
+        command = [sys.executable, "-m", "benchmarks.demand_matrix", "--variant", variant] + [
+            f"--{name}={getattr(args, name)}" for name in ("series", "days", "workers", "chunk", "dir", "seed")
+        ]
+        completed = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+        results[variant] = json.loads(lines[-1][len(RESULT_MARKER):]) if lines else {
+            "error": completed.stderr.strip().splitlines()[-5:]
+        }
+
+    report = {"series": args.series, "days": args.days, "workers": args.workers, "chunk": args.chunk, **results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.series} рядов x {args.days} дней, {args.workers} процессов, {args.chunk} рядов в задаче")
+    for variant, result in results.items():
+        if "error" in result:
+            print(f"  {variant}: ошибка {result['error']}")
+            continue
+        print(
+            f"  {variant:6s} подготовка {result['prepare_seconds']:6.1f} с, пул {result['pool_seconds']:6.1f} с, "
+            f"CPU родителя {result['parent_cpu_seconds']:6.1f} с, процессов {result['workers_cpu_seconds']:6.1f} с, "
+            f"задачи {result['task_mb']:8.1f} МБ, пик RSS родителя {result['parent_peak_rss_mb']:7.0f} МБ, "
+            f"процесса {result['worker_peak_rss_mb']:6.0f} МБ, PSS процессов {result['workers_pss_total_mb']:7.0f} МБ"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Нагрузочный тест приема продаж потоком событий (POST /api/v1/sales/events).
+
+N клиентов в течение заданного времени отправляют запросы по K событий
+(NDJSON) в приложение внутри процесса (ASGI, без сети). Результат -
+устойчивая пропускная способность (событий в секунду), задержка
+подтверждения (p50/p99, подтверждение после фиксации пакета) и средний
+размер пакета. Фиксация на каждый запрос для сравнения - --max-batch 1:
+
+    PYTHONPATH=src python -m benchmarks.ingest --clients 50 --events-per-request 10 --duration 10
+    PYTHONPATH=src python -m benchmarks.ingest --max-batch 1 --max-delay-ms 0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def prepare_database(products: int, warehouses: int) -> None:
+    from ainventory.database.connection import Base, engine, get_db_context
+    from ainventory.database.models import InventoryItem, Product, Warehouse
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with get_db_context() as db:
+        db.add_all(Warehouse(id=index + 1, name=f"Склад {index + 1}") for index in range(warehouses))
+        db.add_all(Product(id=index + 1, sku=f"SKU{index + 1:06d}", name=f"Товар {index + 1}") for index in range(products))
+        db.flush()
+        db.add_all(
+            InventoryItem(product_id=product + 1, warehouse_id=warehouse + 1, current_stock=1_000_000)
+            for product in range(products) for warehouse in range(warehouses)
+        )
+
+
+async def run_load(args) -> Dict[str, Any]:
+    import httpx
+
+    from ainventory.api.main import app
+    from ainventory.services.ingest import sales_ingest
+
+    rng = random.Random(args.seed)
+    start_day = datetime(2024, 1, 1)
+    latencies: List[float] = []
+    accepted = 0
+    deadline = time.perf_counter() + args.duration
+
+    def make_body(client_id: int, sequence: int) -> bytes:
+        lines = []
+        for line in range(args.events_per_request):
+            lines.append(json.dumps({
+                "sku": f"SKU{rng.randint(1, args.products):06d}",
+                "warehouse_id": rng.randint(1, args.warehouses),
+                "quantity": rng.randint(1, 3),
+                "revenue": round(rng.uniform(1, 100), 2),
+                "sale_date": (start_day + timedelta(minutes=rng.randint(0, 60 * 24 * 90))).isoformat(),
+                "transaction_id": f"{client_id}-{sequence}-{line}",
+            }))
+        return "\n".join(lines).encode()
+
+    async def client_loop(client: "httpx.AsyncClient", client_id: int):
+        nonlocal accepted
+        sequence = 0
+        while time.perf_counter() < deadline:
+            body = make_body(client_id, sequence)
+            sequence += 1
+            started = time.perf_counter()
+            response = await client.post("/api/v1/sales/events", content=body, headers={"content-type": "application/x-ndjson"})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                accepted += response.json()["accepted"]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, client_id) for client_id in range(args.clients)))
+        elapsed = time.perf_counter() - started
+    await sales_ingest.close()
+
+    status = sales_ingest.status()
+    return {
+        "clients": args.clients,
+        "events_per_request": args.events_per_request,
+        "max_batch": sales_ingest.max_batch,
+        "max_delay_ms": sales_ingest.max_delay * 1000,
+        "seconds": elapsed,
+        "requests": len(latencies),
+        "events_accepted": accepted,
+        "events_per_second": accepted / elapsed,
+        "batches": status["batches"],
+        "mean_batch_events": accepted / max(status["batches"], 1),
+        "ack_p50_ms": percentile(latencies, 0.50) * 1000,
+        "ack_p99_ms": percentile(latencies, 0.99) * 1000,
+        "ack_mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--events-per-request", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность нагрузки, секунд")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--max-batch", type=int, default=None, help="INGEST_MAX_BATCH для теста")
+    parser.add_argument("--max-delay-ms", type=float, default=None, help="INGEST_MAX_DELAY_MS для теста")
+    parser.add_argument("--database-url", default=None, help="По умолчанию временная SQLite")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Результат в JSON")
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте пакета
+    tmp_dir = Path(tempfile.mkdtemp(prefix="ainventory-ingest-"))
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp_dir}/ingest.db"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    if args.max_batch is not None:
+        os.environ["INGEST_MAX_BATCH"] = str(args.max_batch)
+    if args.max_delay_ms is not None:
+        os.environ["INGEST_MAX_DELAY_MS"] = str(args.max_delay_ms)
+    sys.path.insert(0, str(ROOT / "src"))
+    logging.disable(logging.WARNING)
+
+    prepare_database(args.products, args.warehouses)
+    result = asyncio.run(run_load(args))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"Клиентов {result['clients']}, событий в запросе {result['events_per_request']}, "
+              f"пакет до {result['max_batch']} событий / {result['max_delay_ms']:.0f} мс")
+        print(f"  {result['events_per_second']:.0f} событий/с ({result['events_accepted']} за {result['seconds']:.1f} с), "
+              f"{result['batches']} фиксаций, в среднем {result['mean_batch_events']:.0f} событий в пакете")
+        print(f"  подтверждение: p50 {result['ack_p50_ms']:.1f} мс, p99 {result['ack_p99_ms']:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
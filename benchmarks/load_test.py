@@ -0,0 +1,141 @@
+"""Нагрузочный тест: пропускная способность API в зависимости от числа воркеров.
+
+Для каждого числа воркеров поднимает uvicorn, в течение заданного времени
+шлет запросы с фиксированной конкурентностью и печатает RPS и задержки.
+
+    PYTHONPATH=src python benchmarks/load_test.py --workers 1 2 4 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def wait_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Сервер не запустился")
+
+
+async def run_load(base_url: str, path: str, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def prepare_database(env):
+    """Схема и начальные данные создаются один раз до запуска воркеров"""
+    code = "import asyncio; from ainventory.database.init_db import init_db; asyncio.run(init_db())"
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, cwd=ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--path", default="/api/v1/analytics/inventory/overview")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    workers_list = args.workers or sorted({1, 2, 4, cpu_count} & set(range(1, cpu_count + 1)))
+
+    tmp_dir = tempfile.mkdtemp(prefix="ainventory-load-")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(ROOT / "src") + os.pathsep + env.get("PYTHONPATH", "")
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp_dir}/load.db"
+    env["UPLOAD_DIR"] = os.path.join(tmp_dir, "uploads")
+    prepare_database(env)
+
+    results = []
+    for workers in workers_list:
+        worker_env = dict(env, API_WORKERS=str(workers))
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "ainventory.api.main:app",
+                "--host", "127.0.0.1", "--port", str(args.port),
+                "--workers", str(workers), "--log-level", "warning",
+            ],
+            env=worker_env,
+            cwd=ROOT,
+        )
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            asyncio.run(wait_ready(base_url))
+            result = asyncio.run(run_load(base_url, args.path, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        result["workers"] = workers
+        results.append(result)
+        print(
+            f"workers={workers:<3} rps={result['rps']:>9.1f} "
+            f"p50={result['p50_ms']:>7.1f}ms p99={result['p99_ms']:>7.1f}ms errors={result['errors']}"
+        )
+
+    base_rps = results[0]["rps"] if results else 0
+    for result in results:
+        result["speedup"] = result["rps"] / base_rps if base_rps else 0.0
+
+    report = {"path": args.path, "concurrency": args.concurrency, "cpu_count": cpu_count, "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
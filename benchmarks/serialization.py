@@ -0,0 +1,123 @@
+"""Микробенчмарк сериализации ответа-отчета на 10 000 строк (без БД и HTTP).
+
+Сравниваются прежний путь (jsonable_encoder + JSONResponse на стандартном json),
+путь с проверкой response_model и путь доверенных строк через orjson, а также
+цена и выигрыш сжатия:
+
+    PYTHONPATH=src python -m benchmarks.serialization --rows 10000 --repeat 20
+"""
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from ainventory.api.serialization import FastJSONResponse, trusted_response
+
+STATUSES = ["OK", "Low Stock", "Out of Stock", "Overstocked"]
+
+
+class ReportRow(BaseModel):
+    sku: str
+    name: str
+    warehouse: str
+    current_stock: float
+    min_stock: float
+    max_stock: float
+    reorder_point: float
+    status: str
+    last_updated: Optional[datetime]
+
+
+class Report(BaseModel):
+    report_type: str
+    generated_at: datetime
+    warehouse_id: Optional[int]
+    total_items: int
+    data: List[ReportRow]
+
+
+def make_report(rows: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    data = [
+        {
+            "sku": f"SKU{index:07d}",
+            "name": f"Товар {index}",
+            "warehouse": f"Склад {index % 5}",
+            "current_stock": round(rng.uniform(0, 500), 2),
+            "min_stock": round(rng.uniform(0, 50), 2),
+            "max_stock": round(rng.uniform(300, 600), 2),
+            "reorder_point": round(rng.uniform(50, 150), 2),
+            "status": rng.choice(STATUSES),
+            "last_updated": start + timedelta(minutes=index),
+        }
+        for index in range(rows)
+    ]
+    return {
+        "report_type": "inventory_status",
+        "generated_at": datetime.now(),
+        "warehouse_id": None,
+        "total_items": rows,
+        "data": data,
+    }
+
+
+def measure(function: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    function()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = make_report(args.rows, args.seed)
+    cases = {
+        # Прежний путь: словарь из обработчика без response_model
+        "jsonable_encoder+json": lambda: JSONResponse(jsonable_encoder(report)).body,
+        # Путь с response_model: проверка каждой строки и повторное кодирование
+        "response_model+json": lambda: JSONResponse(
+            jsonable_encoder(Report.model_validate(report).model_dump(mode="json"))
+        ).body,
+        "orjson (FastJSONResponse)": lambda: FastJSONResponse(jsonable_encoder(report)).body,
+        "trusted rows + orjson": lambda: trusted_response(report).body,
+    }
+    results = {name: measure(case, args.repeat) for name, case in cases.items()}
+
+    body = trusted_response(report).body
+    results["gzip level 5"] = measure(lambda: gzip.compress(body, compresslevel=5, mtime=0), args.repeat)
+    sizes = {"json_bytes": len(body), "gzip_bytes": len(gzip.compress(body, compresslevel=5, mtime=0))}
+    try:
+        import brotli
+
+        results["brotli quality 4"] = measure(lambda: brotli.compress(body, quality=4), args.repeat)
+        sizes["brotli_bytes"] = len(brotli.compress(body, quality=4))
+    except ImportError:
+        pass
+
+    assert json.loads(body) == json.loads(cases["jsonable_encoder+json"]())
+    baseline = results["jsonable_encoder+json"]["median_ms"]
+    print(f"Строк: {args.rows}, повторов: {args.repeat}")
+    for name, timing in results.items():
+        print(f"{name:28s} {timing['median_ms']:9.2f} ms  x{baseline / timing['median_ms']:.1f}")
+    print(json.dumps(sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Время холодного импорта API (python -X importtime) и проверка бюджета для CI.
+
+Каждый замер - отдельный процесс. Ошибка (код 1), если медиана импорта
+ainventory.api.main больше бюджета или при старте загружается тяжелая
+зависимость, которая должна загружаться при первом использовании:
+
+    PYTHONPATH=src python -m benchmarks.startup --budget-ms 2500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+TARGET = "ainventory.api.main"
+# Загружаются только при первой обработке файла, прогнозе или симуляции
+LAZY_MODULES = ("pandas", "numpy", "scipy", "sklearn", "prophet", "cmdstanpy", "matplotlib", "statsmodels", "holidays")
+
+
+def import_profile() -> Dict[str, int]:
+    """Накопленное время импорта модулей в микросекундах (один холодный процесс)"""
+    env = {**os.environ, "PYTHONPATH": str(ROOT / "src"), "PYTHONDONTWRITEBYTECODE": "1"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    profile = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def top_level_costs(profile: Dict[str, int], count: int) -> List[Dict[str, float]]:
+    modules = [name for name in profile if name.startswith("ainventory.") or "." not in name]
+    modules.sort(key=lambda name: -profile[name])
+    return [{"module": name, "ms": profile[name] / 1000} for name in modules[:count] if name != TARGET]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2500.0, help="Бюджет медианы импорта API")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Результат в JSON")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.repeat)]
+    samples = [profile[TARGET] / 1000 for profile in profiles]
+    eager = sorted(name for name in LAZY_MODULES if any(name in profile for profile in profiles))
+    result = {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "budget_ms": args.budget_ms,
+        "eager_heavy_modules": eager,
+        "top": top_level_costs(profiles[-1], args.top),
+    }
+    failed = result["median_ms"] > args.budget_ms or bool(eager)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"Импорт {TARGET}: медиана {result['median_ms']:.0f} мс, минимум {result['min_ms']:.0f} мс "
+              f"(бюджет {args.budget_ms:.0f} мс)")
+        for item in result["top"]:
+            print(f"  {item['module']:40s} {item['ms']:8.1f} мс")
+        if eager:
+            print(f"При старте загружены: {', '.join(eager)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Генератор синтетических данных: продукты, склады и дневные продажи.
+
+Спрос каждого ряда (продукт x склад) = базовый уровень x недельный профиль
+x годовая сезонность x тренд, с пуассоновским шумом. Часть рядов
+прерывистая: продажа в конкретный день происходит с вероятностью p < 1.
+Результат детерминирован при заданном seed.
+"""
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ["Электроника", "Одежда", "Книги", "Дом", "Спорт", "Игрушки"]
+BRANDS = ["Generic", "Premium", "Budget", "Pro"]
+
+
+def demand_matrix(
+    n_series: int,
+    n_days: int,
+    seed: int = 42,
+    intermittent_share: float = 0.4,
+    start: date = date(2022, 1, 1),
+) -> np.ndarray:
+    """Плотная матрица спроса (ряды x дни)"""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start, periods=n_days, freq="D")
+    t = np.arange(n_days, dtype=np.float64)
+
+    base = rng.lognormal(mean=1.0, sigma=1.0, size=n_series)
+    weekly_profile = 1.0 + rng.normal(0.0, 0.15, size=(n_series, 7))
+    weekly_profile[:, 5:] += rng.uniform(0.1, 0.5, size=(n_series, 1))
+    weekly = weekly_profile[:, days.dayofweek.values]
+
+    amplitude = rng.uniform(0.0, 0.6, size=(n_series, 1))
+    phase = rng.uniform(0.0, 2 * np.pi, size=(n_series, 1))
+    yearly = 1.0 + amplitude * np.sin(2 * np.pi * t / 365.25 + phase)
+
+    trend = 1.0 + rng.normal(0.0, 0.3, size=(n_series, 1)) * t / 365.25
+    rate = np.clip(base[:, None] * weekly * yearly * trend, 0.0, None)
+
+    # Прерывистые ряды: редкие продажи более крупными партиями
+    sale_probability = np.ones((n_series, 1))
+    intermittent = rng.random(n_series) < intermittent_share
+    sale_probability[intermittent, 0] = rng.uniform(0.05, 0.5, size=intermittent.sum())
+    rate = rate / sale_probability
+
+    occurs = rng.random((n_series, n_days)) < sale_probability
+    return (rng.poisson(rate) * occurs).astype(np.float32)
+
+
+def generate_dataset(
+    n_products: int,
+    n_warehouses: int,
+    years: float = 1.0,
+    seed: int = 42,
+    start: date = date(2022, 1, 1),
+) -> Dict[str, pd.DataFrame]:
+    """Набор таблиц в формате шаблонов загрузки (/data/templates)"""
+    rng = np.random.default_rng(seed)
+    n_days = int(round(365 * years))
+
+    skus = np.array([f"SKU{index:07d}" for index in range(n_products)])
+    unit_cost = np.round(rng.lognormal(mean=4.0, sigma=1.0, size=n_products), 2)
+    unit_price = np.round(unit_cost * rng.uniform(1.2, 2.0, size=n_products), 2)
+    products = pd.DataFrame({
+        "sku": skus,
+        "name": [f"Товар {index}" for index in range(n_products)],
+        "description": "Синтетический товар",
+        "category": rng.choice(CATEGORIES, size=n_products),
+        "brand": rng.choice(BRANDS, size=n_products),
+        "unit_cost": unit_cost,
+        "unit_price": unit_price,
+        "weight": np.round(rng.uniform(0.1, 20.0, size=n_products), 2),
+        "dimensions": "10x10x10 см",
+    })
+
+    demand = demand_matrix(n_products * n_warehouses, n_days, seed=seed + 1, start=start)
+    days = pd.date_range(start, periods=n_days, freq="D")
+
+    series_index, day_index = np.nonzero(demand)
+    quantity = demand[series_index, day_index].astype(np.float64)
+    product_index = series_index // n_warehouses
+    discount = np.where(rng.random(len(quantity)) < 0.1, rng.uniform(0.05, 0.3, len(quantity)), 0.0)
+    sales = pd.DataFrame({
+        "warehouse": series_index % n_warehouses,
+        "sku": skus[product_index],
+        "sale_date": days[day_index].strftime("%Y-%m-%d"),
+        "quantity": quantity,
+        "revenue": np.round(quantity * unit_price[product_index] * (1 - discount), 2),
+        "cost": np.round(quantity * unit_cost[product_index], 2),
+        "customer_id": np.char.add("CUST", rng.integers(0, 10000, len(quantity)).astype(str)),
+        "transaction_id": np.char.add("TXN", np.arange(len(quantity)).astype(str)),
+    })
+
+    mean_demand = demand.mean(axis=1)
+    lead_time = rng.integers(1, 21, size=n_products * n_warehouses)
+    safety = np.ceil(mean_demand * 7)
+    reorder_point = np.ceil(mean_demand * lead_time + safety)
+    inventory = pd.DataFrame({
+        "warehouse": np.arange(n_products * n_warehouses) % n_warehouses,
+        "sku": np.repeat(skus, n_warehouses),
+        "current_stock": np.floor(reorder_point * rng.uniform(0.0, 3.0, size=len(reorder_point))),
+        "min_stock": safety,
+        "max_stock": np.ceil(reorder_point * 3),
+        "reorder_point": reorder_point,
+        "safety_stock": safety,
+        "lead_time_days": lead_time,
+    })
+
+    return {"products": products, "inventory": inventory, "sales": sales}
+
+
+def write_files(
+    dataset: Dict[str, pd.DataFrame],
+    out_dir: Path,
+    file_format: str = "csv",
+    warehouse_ids: Optional[Dict[int, int]] = None,
+) -> Dict[str, object]:
+    """Запись файлов для FileProcessor: продукты - один файл, остатки и продажи - по складам"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def write(df: pd.DataFrame, path: Path):
+        if file_format == "csv":
+            df.to_csv(path, index=False)
+        else:
+            df.to_excel(path, index=False, engine="openpyxl")
+
+    files: Dict[str, object] = {}
+    products_path = out_dir / f"products.{file_format}"
+    write(dataset["products"], products_path)
+    files["products"] = products_path
+
+    for file_type in ("inventory", "sales"):
+        per_warehouse = {}
+        for warehouse, frame in dataset[file_type].groupby("warehouse"):
+            warehouse_id = warehouse_ids[warehouse] if warehouse_ids else int(warehouse) + 1
+            path = out_dir / f"{file_type}_{warehouse_id}.{file_format}"
+            write(frame.drop(columns="warehouse"), path)
+            per_warehouse[warehouse_id] = path
+        files[file_type] = per_warehouse
+    return files
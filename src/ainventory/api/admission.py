@@ -0,0 +1,156 @@
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.connection import is_statement_timeout, set_statement_timeout
+from ..database.models import DailySales
+from ..monitoring.metrics import admission_requests_total
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен: очередь класса полна (429) или место не освободилось вовремя (503)"""
+
+    def __init__(self, endpoint_class: str, status_code: int, message: str):
+        super().__init__(message)
+        self.endpoint_class = endpoint_class
+        self.status_code = status_code
+
+class ConcurrencyLimiter:
+    """Ограничение одновременных запросов класса маршрутов в воркере.
+
+    Не больше limit запросов выполняются, до queue_size ждут освобождения места
+    в порядке прихода, но не дольше queue_timeout секунд. Освободившееся место
+    передается первому ожидающему напрямую, новый запрос не может его перехватить.
+    """
+
+    def __init__(self, endpoint_class: str, limit: int, queue_size: int, queue_timeout: float):
+        self.endpoint_class = endpoint_class
+        self.limit = max(limit, 1)
+        self.queue_size = max(queue_size, 0)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        admission_requests_total.inc(endpoint_class=self.endpoint_class, result=result)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._count("admitted")
+            return
+        if len(self._waiters) >= self.queue_size:
+            self._count("rejected")
+            raise AdmissionRejected(self.endpoint_class, 429, "Слишком много одновременных запросов, повторите позже")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Место успели передать одновременно с таймаутом или отменой: возвращаем его
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._count("timed_out")
+            raise AdmissionRejected(self.endpoint_class, 503, "Сервер перегружен, повторите позже")
+        self._count("queued")
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "queue_size": self.queue_size,
+            **self.stats,
+        }
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+def limiter(endpoint_class: str) -> ConcurrencyLimiter:
+    if endpoint_class not in _limiters:
+        _limiters[endpoint_class] = ConcurrencyLimiter(
+            endpoint_class,
+            settings.admission_limits.get(endpoint_class, 1),
+            settings.admission_queue_sizes.get(endpoint_class, 0),
+            settings.admission_queue_timeout
+        )
+    return _limiters[endpoint_class]
+
+def route_statement_timeout(endpoint_class: str, name: str) -> Optional[int]:
+    timeouts = settings.admission_statement_timeouts
+    return timeouts.get(name, timeouts.get(endpoint_class))
+
+def admission(endpoint_class: str, name: str):
+    """Зависимость тяжелого маршрута: место в лимите класса endpoint_class на время
+    запроса и statement_timeout для его SQL (по имени маршрута name или по классу).
+
+    Синхронную работу в пуле потоков обработчик оборачивает with_statement_timeout,
+    иначе бюджет в поток не попадет.
+    """
+    async def dependency():
+        if not settings.admission_enabled:
+            yield
+            return
+        slots = limiter(endpoint_class)
+        try:
+            await slots.acquire()
+        except AdmissionRejected as e:
+            logger.warning(f"Запрос {name} не допущен ({e.status_code}): {slots.status()}")
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
+        # Асинхронная зависимость: контекст общий с обработчиком, сессии в нем видят бюджет.
+        # Значение восстанавливается без токена: выход из зависимости может идти в другом контексте
+        previous = set_statement_timeout(route_statement_timeout(endpoint_class, name))
+        try:
+            yield
+        finally:
+            set_statement_timeout(previous)
+            slots.release()
+
+    return dependency
+
+def raise_if_statement_timeout(error: BaseException):
+    """Отмена по statement_timeout - 503, а не внутренняя ошибка: запрос слишком тяжелый сейчас"""
+    if is_statement_timeout(error):
+        raise HTTPException(
+            status_code=503,
+            detail="Запрос превысил лимит времени, сузьте период или добавьте фильтры",
+            headers={"Retry-After": "30"}
+        )
+
+def estimate_sales_scan(db: Session, start_date: Optional[datetime], end_date: Optional[datetime], warehouse_id: Optional[int]) -> Dict[str, int]:
+    """Оценка объема чтения до запроса по продажам: строки sales (сумма orders дневных итогов)
+    и строки самих дневных итогов за период"""
+    query = db.query(func.coalesce(func.sum(DailySales.orders), 0), func.count())
+    if start_date:
+        query = query.filter(DailySales.sale_day >= start_date.date())
+    if end_date:
+        query = query.filter(DailySales.sale_day <= end_date.date())
+    if warehouse_id:
+        query = query.filter(DailySales.warehouse_id == warehouse_id)
+    sales_rows, rollup_rows = query.one()
+    return {"sales_rows": int(sales_rows), "rollup_rows": int(rollup_rows)}
+
+def admission_status() -> Dict[str, Any]:
+    return {endpoint_class: slots.status() for endpoint_class, slots in _limiters.items()}
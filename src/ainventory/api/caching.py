@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Sequence
+import hashlib
+
+from fastapi import HTTPException, Request, Response
+
+from ..config import settings
+from ..database.connection import SessionLocal
+from ..database.versions import table_versions
+
+def cache_control(name: str) -> str:
+    """Политика Cache-Control маршрута: http_cache_policies[name] или http_cache_default"""
+    return settings.http_cache_policies.get(name, settings.http_cache_default)
+
+def make_etag(name: str, request: Request, versions: dict) -> str:
+    """Слабый ETag: маршрут, параметры запроса, версия приложения и версии таблиц.
+
+    Слабый, потому что тело может отдаваться сжатым и несжатым.
+    """
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    key = "|".join([name, settings.version, request.url.path, query, *(f"{table}:{version}" for table, version in sorted(versions.items()))])
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def not_modified_since(last_modified: Optional[datetime], if_modified_since: str) -> bool:
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP-даты с точностью до секунды
+    return last_modified.replace(microsecond=0) <= since
+
+def conditional_get(name: str, tables: Sequence[str] = ()):
+    """Зависимость GET-маршрута: ETag и Last-Modified из версий таблиц, 304 Not Modified для
+    совпадающих If-None-Match / If-Modified-Since до выполнения самого запроса.
+
+    tables - таблицы, от которых зависит ответ; без таблиц ответ меняется только
+    с версией приложения (статические справочники). Зависимость синхронная:
+    FastAPI выполняет ее в пуле потоков, запрос версий не блокирует цикл событий.
+    """
+    def dependency(request: Request, response: Response):
+        if not settings.http_cache_enabled:
+            return
+        # Своя короткая сессия: 304 не проходит через сессию обработчика
+        with SessionLocal() as db:
+            versions, last_modified = table_versions(db, tables)
+        etag = make_etag(name, request, versions)
+        headers = {"ETag": etag, "Cache-Control": cache_control(name)}
+        if last_modified is not None:
+            headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            not_modified = etag_matches(etag, if_none_match)
+        else:
+            not_modified = not_modified_since(last_modified, request.headers.get("if-modified-since", ""))
+        if not_modified:
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return dependency
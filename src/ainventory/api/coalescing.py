@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Hashable, Tuple
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+
+from ..config import settings
+from ..database.replica import client_wrote_recently
+from ..monitoring.metrics import analytics_cache_requests_total
+
+logger = logging.getLogger(__name__)
+
+def _normalize(value: Any) -> Hashable:
+    # Параметры уже разобраны FastAPI: разные записи одной даты ('T' или пробел, без секунд) дают один ключ
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(_normalize(item) for item in value))
+    return value
+
+def request_key(route: str, **params: Any) -> Tuple:
+    """Ключ запроса: имя маршрута и разобранные параметры без пустых, по имени"""
+    return (route, *sorted((name, _normalize(value)) for name, value in params.items() if value is not None))
+
+class CacheEntry:
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+class SingleFlightCache:
+    """Объединение одинаковых одновременных запросов и короткий кеш результатов.
+
+    Пока вычисление по ключу идет в пуле потоков, остальные запросы с тем же
+    ключом ждут его результата, а не выполняют запрос к БД заново. Результат
+    свежий ttl секунд; следующие stale секунд он отдается сразу, а обновление
+    одно на ключ запускается в фоне (stale-while-revalidate). Ошибки не
+    кешируются. Кеш в памяти процесса, не больше max_entries ключей (LRU).
+    """
+
+    def __init__(self, ttl: float, stale: float, max_entries: int):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "coalesced": 0, "misses": 0, "bypassed": 0, "refresh_errors": 0}
+
+    def _count(self, key: Tuple, result: str):
+        self.stats[result] += 1
+        analytics_cache_requests_total.inc(route=key[0], result=result)
+
+    async def get(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        """Результат compute (синхронная функция, выполняется в пуле потоков) для ключа"""
+        loop = asyncio.get_running_loop()
+        if not settings.analytics_cache_enabled or client_wrote_recently():
+            # Клиент недавно писал: общий результат может не содержать его изменений.
+            # Контекст запроса передается в поток, чтобы сессия чтения открылась на primary
+            self._count(key, "bypassed")
+            return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, compute))
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry.stale_until:
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                self._count(key, "hits")
+            else:
+                self._count(key, "stale_hits")
+                if key not in self._inflight:
+                    self._start(loop, key, compute).add_done_callback(self._refresh_done)
+            return entry.value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._count(key, "coalesced")
+        else:
+            self._count(key, "misses")
+            future = self._start(loop, key, compute)
+        # Отмена одного ожидающего (клиент отключился) не отменяет вычисление для остальных
+        return await asyncio.shield(future)
+
+    def _start(self, loop: asyncio.AbstractEventLoop, key: Tuple, compute: Callable[[], Any]) -> asyncio.Future:
+        # Общий результат не зависит от клиента: вычисление без контекста запроса (может читать с реплики)
+        future = loop.run_in_executor(None, compute)
+        self._inflight[key] = future
+
+        def done(completed: asyncio.Future):
+            self._inflight.pop(key, None)
+            if completed.cancelled() or completed.exception() is not None:
+                return
+            now = time.monotonic()
+            self._entries[key] = CacheEntry(completed.result(), now + self.ttl, now + self.ttl + self.stale)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        future.add_done_callback(done)
+        return future
+
+    def _refresh_done(self, completed: asyncio.Future):
+        if not completed.cancelled() and completed.exception() is not None:
+            # Устаревший результат остается до конца окна stale, следующий запрос повторит обновление
+            self.stats["refresh_errors"] += 1
+            logger.warning(f"Фоновое обновление аналитики не удалось: {completed.exception()}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "ttl_seconds": self.ttl,
+            "stale_seconds": self.stale,
+            **self.stats,
+        }
+
+analytics_cache = SingleFlightCache(
+    ttl=settings.analytics_cache_ttl_seconds,
+    stale=settings.analytics_cache_stale_seconds,
+    max_entries=settings.analytics_cache_max_entries
+)
@@ -1,12 +1,28 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+import os
 
-from .routers import data, forecasts, inventory, analytics
+from .routers import data, forecasts, inventory, analytics, admin, simulations, events, sales, atp, anomalies, jobs
+from .admission import admission_status
+from .compression import CompressionMiddleware
+from .read_your_writes import ReadYourWritesMiddleware
+from .serialization import FastJSONResponse
 from ..database.init_db import init_db
+from ..database.connection import engine, pool_status
+from ..database.replica import replica_engine, replica_status
+from ..monitoring.metrics import registry
+from ..monitoring.middleware import MetricsMiddleware
+from ..monitoring.profiler import ProfilingMiddleware, instrument_engine_for_profiling
+from ..monitoring.sql import instrument_engine
+from ..services.events import event_broker
+from ..services.atp import stock_index
+from ..services.ingest import sales_ingest
+from ..services.scheduler import job_scheduler
 from ..config import settings
 
 logging.basicConfig(level=logging.INFO)
@@ -15,16 +31,29 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting AInventory API...")
-    await init_db()
-    logger.info("Database initialized successfully")
+    if settings.db_auto_migrate:
+        await init_db()
+        logger.info("Database initialized successfully")
+    if settings.atp_preload:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, stock_index.build)
+        except Exception as e:
+            logger.warning(f"Индекс ATP будет построен при первом запросе: {e}")
+    if settings.scheduler_enabled:
+        job_scheduler.start()
     yield
     logger.info("Shutting down AInventory API...")
+    await job_scheduler.close()
+    await sales_ingest.close()
+    stock_index.close()
+    event_broker.close()
 
 app = FastAPI(
     title="AInventory API",
     description="Demand & Inventory Intelligence API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -35,10 +64,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(data.router, prefix="/api/v1", tags=["data"])
-app.include_router(forecasts.router, prefix="/api/v1", tags=["forecasts"])
-app.include_router(inventory.router, prefix="/api/v1", tags=["inventory"])
-app.include_router(analytics.router, prefix="/api/v1", tags=["analytics"])
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality
+    )
+
+if replica_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+if settings.metrics_enabled:
+    instrument_engine(engine)
+    if replica_engine is not None:
+        instrument_engine(replica_engine)
+    app.add_middleware(MetricsMiddleware)
+
+# Профилирование подключается только при явном включении и в остальных случаях ничего не стоит
+if settings.profiling_enabled:
+    instrument_engine_for_profiling(engine)
+    app.add_middleware(ProfilingMiddleware, engine=engine)
+
+app.include_router(data.router, prefix=f"{settings.api_prefix}/data", tags=["data"])
+app.include_router(forecasts.router, prefix=f"{settings.api_prefix}/forecasts", tags=["forecasts"])
+app.include_router(inventory.router, prefix=f"{settings.api_prefix}/inventory", tags=["inventory"])
+app.include_router(analytics.router, prefix=f"{settings.api_prefix}/analytics", tags=["analytics"])
+app.include_router(simulations.router, prefix=f"{settings.api_prefix}/simulations", tags=["simulations"])
+app.include_router(sales.router, prefix=f"{settings.api_prefix}/sales", tags=["sales"])
+app.include_router(atp.router, prefix=f"{settings.api_prefix}/atp", tags=["atp"])
+app.include_router(anomalies.router, prefix=f"{settings.api_prefix}/anomalies", tags=["anomalies"])
+app.include_router(jobs.router, prefix=f"{settings.api_prefix}/jobs", tags=["jobs"])
+app.include_router(events.router, prefix=f"{settings.api_prefix}/events", tags=["events"])
+app.include_router(admin.router, prefix=f"{settings.api_prefix}/admin", tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -48,19 +106,40 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "ainventory-api"}
 
+@app.get("/health/db")
+async def database_pool_health():
+    """Состояние пула соединений и допуска тяжелых маршрутов воркера, обработавшего запрос"""
+    return {
+        "status": "healthy",
+        "pid": os.getpid(),
+        "pool": pool_status(),
+        "replica": replica_status(),
+        "admission": admission_status()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Global exception: {exc}")
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=500,
         content={"error": "Internal server error", "detail": str(exc)}
     )
 
-if __name__ == "__main__":
+def run():
+    """Запуск API: api_reload - режим разработки, иначе api_workers процессов"""
     uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        "ainventory.api.main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        reload=settings.api_reload,
+        workers=1 if settings.api_reload else settings.api_workers,
         log_level="info"
     )
+
+if __name__ == "__main__":
+    run()
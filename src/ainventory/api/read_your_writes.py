@@ -0,0 +1,46 @@
+from http.cookies import SimpleCookie
+
+from starlette.datastructures import MutableHeaders
+
+from ..config import settings
+from ..database.replica import request_scope
+
+COOKIE_NAME = "ainventory_last_write"
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware: после записи клиент читает с primary db_read_your_writes_seconds секунд.
+
+    Время последней записи хранится в cookie; запросы с недавней записью
+    (и сам запрос, в котором была запись) не уходят на реплику.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        last_write = None
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                morsel = SimpleCookie(value.decode("latin-1")).get(COOKIE_NAME)
+                try:
+                    last_write = float(morsel.value) if morsel else last_write
+                except ValueError:
+                    pass
+
+        with request_scope(last_write) as state:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and state["wrote"] is not None:
+                    cookie = SimpleCookie()
+                    cookie[COOKIE_NAME] = f"{state['wrote']:.3f}"
+                    cookie[COOKIE_NAME]["max-age"] = max(int(settings.db_read_your_writes_seconds), 1)
+                    cookie[COOKIE_NAME]["path"] = "/"
+                    cookie[COOKIE_NAME]["httponly"] = True
+                    cookie[COOKIE_NAME]["samesite"] = "Lax"
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie[COOKIE_NAME].OutputString())
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from typing import Optional
+import logging
+
+from ...config import settings
+from ...monitoring.profiler import profile_store
+from ...forecasting.model_store import model_store
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+async def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Проверка токена администратора (если он задан в настройках)"""
+    if settings.admin_token and x_admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+@router.get("/profiles", dependencies=[Depends(verify_admin_token)])
+async def get_slowest_profiles(
+    limit: int = Query(20, ge=1, le=100, description="Количество профилей")
+):
+    """Самые медленные из недавно профилированных запросов"""
+    return {
+        "profiling_enabled": settings.profiling_enabled,
+        "profiles": [profile.summary() for profile in profile_store.slowest(limit)]
+    }
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(verify_admin_token)])
+async def get_profile(profile_id: int):
+    """Полный профиль запроса: SQL с временем и планами, срез CPU"""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    
+    return profile.details()
+
+@router.delete("/profiles", dependencies=[Depends(verify_admin_token)])
+async def clear_profiles():
+    """Очистка буфера профилей"""
+    profile_store.clear()
+    return {"message": "Буфер профилей очищен"}
+
+@router.post("/model-store/gc", dependencies=[Depends(verify_admin_token)])
+async def collect_model_store_garbage():
+    """Удаление сериализованных моделей, замененных более новыми"""
+    removed = model_store.collect_garbage()
+    return {"message": "Очистка хранилища моделей выполнена", "removed_objects": removed}
@@ -2,26 +2,34 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func, desc, extract
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import asyncio
+import functools
 import logging
+import threading
 
-from ..database.connection import get_db
-from ..database.models import Sale, Product, InventoryItem, Warehouse, Category, Brand, Forecast
+from ...config import settings
+from ...database.connection import with_statement_timeout
+from ...database.replica import get_read_db, get_read_db_context
+from ...database.models import DailySales, Sale, Product, InventoryItem, Warehouse, Category, Brand, Forecast
+from ...services.classification import classification_matrix, run_classification
+from ...services.scheduler import PRIORITY_LOW, job_scheduler, run_job_stage
+from ..admission import admission, estimate_sales_scan, raise_if_statement_timeout
+from ..coalescing import analytics_cache, request_key
+from ..serialization import trusted_response
 from ..schemas import SalesAnalytics, InventoryAnalytics, ForecastAnalytics
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.get("/sales/overview", response_model=SalesAnalytics)
-async def get_sales_analytics(
-    start_date: Optional[datetime] = Query(None, description="Начальная дата"),
-    end_date: Optional[datetime] = Query(None, description="Конечная дата"),
-    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
-    category_id: Optional[int] = Query(None, description="Фильтр по категории"),
-    db: Session = Depends(get_db)
-):
-    """Получение аналитики по продажам"""
-    try:
+def sales_overview(
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    warehouse_id: Optional[int],
+    category_id: Optional[int]
+) -> Dict[str, Any]:
+    """Агрегаты обзора продаж в своей сессии чтения (результат общий для одинаковых запросов)"""
+    with get_read_db_context() as db:
         query = db.query(Sale).join(Product)
         
         # Применяем фильтры по датам
@@ -66,57 +74,68 @@ async def get_sales_analytics(
                 "total_revenue": float(row.total_revenue),
                 "total_quantity": float(row.total_quantity)
             })
-        
-        return SalesAnalytics(
-            total_sales=total_sales,
-            total_revenue=total_revenue,
-            total_quantity=total_quantity,
-            average_order_value=average_order_value,
-            top_products=top_products
+    
+    return {
+        "total_sales": total_sales,
+        "total_revenue": total_revenue,
+        "total_quantity": total_quantity,
+        "average_order_value": average_order_value,
+        "top_products": top_products
+    }
+
+@router.get("/sales/overview", response_model=SalesAnalytics, dependencies=[Depends(admission("analytics", "sales_overview"))])
+async def get_sales_analytics(
+    start_date: Optional[datetime] = Query(None, description="Начальная дата"),
+    end_date: Optional[datetime] = Query(None, description="Конечная дата"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    category_id: Optional[int] = Query(None, description="Фильтр по категории")
+):
+    """Получение аналитики по продажам (одинаковые одновременные запросы выполняются один раз)"""
+    try:
+        key = request_key(
+            "sales_overview", start_date=start_date, end_date=end_date, warehouse_id=warehouse_id, category_id=category_id
         )
+        return SalesAnalytics(**await analytics_cache.get(key, with_statement_timeout(functools.partial(
+            sales_overview, start_date, end_date, warehouse_id, category_id
+        ))))
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения аналитики продаж: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/sales/trends")
-async def get_sales_trends(
-    period: str = Query("month", description="Период группировки: day, week, month"),
-    start_date: datetime = Query(..., description="Начальная дата"),
-    end_date: datetime = Query(..., description="Конечная дата"),
-    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
-    db: Session = Depends(get_db)
-):
-    """Получение трендов продаж по периодам"""
-    try:
-        query = db.query(Sale).join(Product)
-        
-        # Применяем фильтры
-        query = query.filter(
+# Группировка трендов продаж по периоду
+TREND_PERIODS = ("day", "week", "month")
+
+def sales_trends(
+    period: str,
+    start_date: datetime,
+    end_date: datetime,
+    warehouse_id: Optional[int]
+) -> List[Dict[str, Any]]:
+    """Выручка, количество и заказы по периодам из дневных итогов в своей сессии чтения"""
+    with get_read_db_context() as db:
+        query = db.query(DailySales).filter(
             and_(
-                Sale.sale_date >= start_date,
-                Sale.sale_date <= end_date
+                DailySales.sale_day >= start_date.date(),
+                DailySales.sale_day <= end_date.date()
             )
         )
         
         if warehouse_id:
-            query = query.filter(Sale.warehouse_id == warehouse_id)
+            query = query.filter(DailySales.warehouse_id == warehouse_id)
         
         # Группируем по периоду
         if period == "day":
-            group_by = func.date(Sale.sale_date)
-        elif period == "week":
-            group_by = func.date_trunc('week', Sale.sale_date)
-        elif period == "month":
-            group_by = func.date_trunc('month', Sale.sale_date)
+            group_by = DailySales.sale_day
         else:
-            raise HTTPException(status_code=400, detail="Неподдерживаемый период группировки")
+            group_by = func.date_trunc(period, DailySales.sale_day)
         
         trends = query.with_entities(
             group_by.label('period'),
-            func.sum(Sale.revenue).label('revenue'),
-            func.sum(Sale.quantity).label('quantity'),
-            func.count(Sale.id).label('orders')
+            func.sum(DailySales.revenue).label('revenue'),
+            func.sum(DailySales.quantity).label('quantity'),
+            func.sum(DailySales.orders).label('orders')
         ).group_by(group_by).order_by(group_by).all()
         
         result = []
@@ -127,6 +146,24 @@ async def get_sales_trends(
                 "quantity": float(trend.quantity),
                 "orders": trend.orders
             })
+    return result
+
+@router.get("/sales/trends", dependencies=[Depends(admission("analytics", "sales_trends"))])
+async def get_sales_trends(
+    period: str = Query("month", description="Период группировки: day, week, month"),
+    start_date: datetime = Query(..., description="Начальная дата"),
+    end_date: datetime = Query(..., description="Конечная дата"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу")
+):
+    """Получение трендов продаж по периодам (из дневных итогов daily_sales; одинаковые одновременные запросы выполняются один раз)"""
+    try:
+        if period not in TREND_PERIODS:
+            raise HTTPException(status_code=400, detail="Неподдерживаемый период группировки")
+        
+        key = request_key("sales_trends", period=period, start_date=start_date, end_date=end_date, warehouse_id=warehouse_id)
+        result = await analytics_cache.get(
+            key, with_statement_timeout(functools.partial(sales_trends, period, start_date, end_date, warehouse_id))
+        )
         
         return {
             "period": period,
@@ -138,13 +175,19 @@ async def get_sales_trends(
     except HTTPException:
         raise
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения трендов продаж: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/inventory/overview", response_model=InventoryAnalytics)
+@router.get("/sales/cache/status")
+async def get_sales_cache_status():
+    """Состояние объединения запросов аналитики продаж в этом процессе"""
+    return analytics_cache.status()
+
+@router.get("/inventory/overview", response_model=InventoryAnalytics, dependencies=[Depends(admission("analytics", "inventory_overview"))])
 async def get_inventory_analytics(
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Получение аналитики по инвентарю"""
     try:
@@ -183,13 +226,14 @@ async def get_inventory_analytics(
         )
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения аналитики инвентаря: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/inventory/aging")
+@router.get("/inventory/aging", dependencies=[Depends(admission("analytics", "inventory_aging"))])
 async def get_inventory_aging(
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Получение анализа старения инвентаря"""
     try:
@@ -231,11 +275,12 @@ async def get_inventory_aging(
         }
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения анализа старения инвентаря: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/forecasts/overview", response_model=ForecastAnalytics)
-async def get_forecast_analytics(db: Session = Depends(get_db)):
+@router.get("/forecasts/overview", response_model=ForecastAnalytics, dependencies=[Depends(admission("analytics", "forecast_overview"))])
+async def get_forecast_analytics(db: Session = Depends(get_read_db)):
     """Получение аналитики по прогнозам"""
     try:
         # Общее количество прогнозов
@@ -260,11 +305,12 @@ async def get_forecast_analytics(db: Session = Depends(get_db)):
         )
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения аналитики прогнозов: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/dashboard/summary")
-async def get_dashboard_summary(db: Session = Depends(get_db)):
+@router.get("/dashboard/summary", dependencies=[Depends(admission("analytics", "dashboard_summary"))])
+async def get_dashboard_summary(db: Session = Depends(get_read_db)):
     """Получение сводки для дашборда"""
     try:
         # Статистика по продажам (последние 30 дней)
@@ -285,7 +331,9 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
         top_categories = db.query(
             Category.name,
             func.sum(Sale.revenue).label('revenue')
-        ).join(Product).join(Sale).group_by(Category.id, Category.name).order_by(
+        ).select_from(Category).join(Product, Product.category_id == Category.id).join(
+            Sale, Sale.product_id == Product.id
+        ).group_by(Category.id, Category.name).order_by(
             desc(func.sum(Sale.revenue))
         ).limit(5).all()
         
@@ -313,29 +361,47 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
         }
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка получения сводки дашборда: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/reports/inventory-status")
+@router.get("/reports/inventory-status", dependencies=[Depends(admission("report", "inventory_status"))])
 async def generate_inventory_status_report(
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
     include_zero_stock: bool = Query(True, description="Включать товары с нулевым остатком"),
-    db: Session = Depends(get_db)
+    abc_class: Optional[str] = Query(None, pattern="^[ABC]{1,3}$", description="Классы ABC, например A или AB"),
+    xyz_class: Optional[str] = Query(None, pattern="^[XYZ]{1,3}$", description="Классы XYZ, например X или XY"),
+    db: Session = Depends(get_read_db)
 ):
     """Генерация отчета по статусу инвентаря"""
     try:
-        query = db.query(InventoryItem).join(Product).join(Warehouse)
+        # Только нужные колонки одним запросом: без ORM-объектов и догрузки продукта и склада по каждой строке
+        query = db.query(
+            Product.sku,
+            Product.name,
+            Warehouse.name.label("warehouse"),
+            InventoryItem.current_stock,
+            InventoryItem.min_stock,
+            InventoryItem.max_stock,
+            InventoryItem.reorder_point,
+            InventoryItem.abc_class,
+            InventoryItem.xyz_class,
+            InventoryItem.last_updated
+        ).select_from(InventoryItem).join(Product).join(Warehouse)
         
         if warehouse_id:
             query = query.filter(InventoryItem.warehouse_id == warehouse_id)
         
+        if abc_class:
+            query = query.filter(InventoryItem.abc_class.in_(list(abc_class)))
+        if xyz_class:
+            query = query.filter(InventoryItem.xyz_class.in_(list(xyz_class)))
+        
         if not include_zero_stock:
             query = query.filter(InventoryItem.current_stock > 0)
         
-        items = query.all()
-        
         report_data = []
-        for item in items:
+        for item in query.all():
             status = "OK"
             if item.current_stock == 0:
                 status = "Out of Stock"
@@ -345,60 +411,102 @@ async def generate_inventory_status_report(
                 status = "Overstocked"
             
             report_data.append({
-                "sku": item.product.sku,
-                "name": item.product.name,
-                "warehouse": item.warehouse.name,
+                "sku": item.sku,
+                "name": item.name,
+                "warehouse": item.warehouse,
                 "current_stock": item.current_stock,
                 "min_stock": item.min_stock,
                 "max_stock": item.max_stock,
                 "reorder_point": item.reorder_point,
+                "abc_class": item.abc_class,
+                "xyz_class": item.xyz_class,
                 "status": status,
-                "last_updated": item.last_updated.isoformat() if item.last_updated else None
+                "last_updated": item.last_updated
             })
         
-        return {
+        return trusted_response({
             "report_type": "inventory_status",
-            "generated_at": datetime.now().isoformat(),
+            "generated_at": datetime.now(),
             "warehouse_id": warehouse_id,
+            "abc_class": abc_class,
+            "xyz_class": xyz_class,
             "total_items": len(report_data),
             "data": report_data
-        }
+        })
         
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка генерации отчета по статусу инвентаря: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/reports/sales-performance")
-async def generate_sales_performance_report(
-    start_date: datetime = Query(..., description="Начальная дата"),
-    end_date: datetime = Query(..., description="Конечная дата"),
-    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
-    db: Session = Depends(get_db)
-):
-    """Генерация отчета по эффективности продаж"""
-    try:
-        query = db.query(Sale).join(Product).join(Warehouse)
-        
-        query = query.filter(
-            and_(
-                Sale.sale_date >= start_date,
-                Sale.sale_date <= end_date
+class ScanTooLarge(Exception):
+    """Запрос прочитал бы слишком много строк даже из дневных итогов"""
+
+def sales_performance(
+    start_date: datetime,
+    end_date: datetime,
+    warehouse_id: Optional[int],
+    abc_class: Optional[str],
+    xyz_class: Optional[str]
+) -> Dict[str, Any]:
+    """Отчет по эффективности продаж в своей сессии чтения.
+
+    Если за период пришлось бы прочитать больше admission_max_scan_rows строк sales,
+    отчет строится по дневным итогам daily_sales: границы периода - целые дни, средняя
+    цена - выручка на единицу, а не среднее по продажам. Если и дневных итогов больше
+    этого числа, запрос отклоняется (ScanTooLarge).
+    """
+    with get_read_db_context() as db:
+        estimate = estimate_sales_scan(db, start_date, end_date, warehouse_id)
+        limit = settings.admission_max_scan_rows
+        if estimate["rollup_rows"] > limit:
+            raise ScanTooLarge(estimate)
+        approximate = estimate["sales_rows"] > limit
+        
+        if approximate:
+            source, quantity, revenue = DailySales, DailySales.quantity, DailySales.revenue
+            query = db.query(DailySales).join(Product).filter(
+                and_(
+                    DailySales.sale_day >= start_date.date(),
+                    DailySales.sale_day <= end_date.date()
+                )
             )
-        )
+            avg_unit_price = func.sum(revenue) / func.nullif(func.sum(quantity), 0)
+            order_count = func.sum(DailySales.orders)
+        else:
+            source, quantity, revenue = Sale, Sale.quantity, Sale.revenue
+            query = db.query(Sale).join(Product).join(Warehouse).filter(
+                and_(
+                    Sale.sale_date >= start_date,
+                    Sale.sale_date <= end_date
+                )
+            )
+            avg_unit_price = func.avg(Sale.revenue / Sale.quantity)
+            order_count = func.count(Sale.id)
         
         if warehouse_id:
-            query = query.filter(Sale.warehouse_id == warehouse_id)
+            query = query.filter(source.warehouse_id == warehouse_id)
+        
+        if abc_class or xyz_class:
+            query = query.join(InventoryItem, and_(
+                InventoryItem.product_id == source.product_id,
+                InventoryItem.warehouse_id == source.warehouse_id
+            ))
+            if abc_class:
+                query = query.filter(InventoryItem.abc_class.in_(list(abc_class)))
+            if xyz_class:
+                query = query.filter(InventoryItem.xyz_class.in_(list(xyz_class)))
         
         # Группируем по продуктам
         product_performance = query.with_entities(
             Product.sku,
             Product.name,
-            func.sum(Sale.quantity).label('total_quantity'),
-            func.sum(Sale.revenue).label('total_revenue'),
-            func.avg(Sale.revenue / Sale.quantity).label('avg_unit_price'),
-            func.count(Sale.id).label('order_count')
+            func.sum(quantity).label('total_quantity'),
+            func.sum(revenue).label('total_revenue'),
+            avg_unit_price.label('avg_unit_price'),
+            order_count.label('order_count')
         ).group_by(Product.id, Product.sku, Product.name).order_by(
-            desc(func.sum(Sale.revenue))
+            desc(func.sum(revenue))
         ).all()
         
         report_data = []
@@ -411,19 +519,87 @@ async def generate_sales_performance_report(
                 "avg_unit_price": float(perf.avg_unit_price) if perf.avg_unit_price else 0,
                 "order_count": perf.order_count
             })
+    
+    return {
+        "source": source.__tablename__,
+        "approximate": approximate,
+        "estimated_rows": estimate["sales_rows"],
+        "data": report_data
+    }
+
+@router.get("/reports/sales-performance", dependencies=[Depends(admission("report", "sales_performance"))])
+async def generate_sales_performance_report(
+    start_date: datetime = Query(..., description="Начальная дата"),
+    end_date: datetime = Query(..., description="Конечная дата"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    abc_class: Optional[str] = Query(None, pattern="^[ABC]{1,3}$", description="Классы ABC позиции (продукт на складе)"),
+    xyz_class: Optional[str] = Query(None, pattern="^[XYZ]{1,3}$", description="Классы XYZ позиции (продукт на складе)")
+):
+    """Генерация отчета по эффективности продаж (в пуле потоков; за длинный период - по дневным итогам)"""
+    try:
+        loop = asyncio.get_running_loop()
+        report = await loop.run_in_executor(None, with_statement_timeout(functools.partial(
+            sales_performance, start_date, end_date, warehouse_id, abc_class, xyz_class
+        )))
         
-        return {
+        return trusted_response({
             "report_type": "sales_performance",
-            "generated_at": datetime.now().isoformat(),
+            "generated_at": datetime.now(),
             "period": {
-                "start_date": start_date.isoformat(),
-                "end_date": end_date.isoformat()
+                "start_date": start_date,
+                "end_date": end_date
             },
             "warehouse_id": warehouse_id,
-            "total_products": len(report_data),
-            "data": report_data
-        }
-        
+            "abc_class": abc_class,
+            "xyz_class": xyz_class,
+            "source": report["source"],
+            "approximate": report["approximate"],
+            "estimated_rows": report["estimated_rows"],
+            "total_products": len(report["data"]),
+            "data": report["data"]
+        })
+        
+    except ScanTooLarge:
+        raise HTTPException(status_code=400, detail="Слишком большой объем данных за период: сузьте период или укажите склад")
     except Exception as e:
+        raise_if_statement_timeout(e)
         logger.error(f"Ошибка генерации отчета по эффективности продаж: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.get("/classification")
+async def get_classification(db: Session = Depends(get_read_db)):
+    """Матрица ABC/XYZ: число позиций в каждой клетке и время последнего расчета"""
+    return {
+        "classified_at": db.query(func.max(InventoryItem.classified_at)).scalar(),
+        "matrix": classification_matrix(db)
+    }
+
+@router.post("/classification")
+async def classify_inventory_items(
+    days: Optional[int] = Query(None, ge=7, description="Окно расчета, дней (по умолчанию из настроек)"),
+    period_days: Optional[int] = Query(None, ge=1, description="Длина периода для вариации спроса, дней"),
+    as_of: Optional[date] = Query(None, description="Последний день окна (по умолчанию - последний день продаж)")
+):
+    """Пересчет ABC/XYZ-классов всех позиций (в пуле потоков, цикл событий не блокируется)"""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(run_classification, days=days, period_days=period_days, as_of=as_of)
+        )
+    except Exception as e:
+        logger.error(f"Ошибка ABC/XYZ-классификации: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+async def classification_job(
+    days: Optional[int] = None,
+    period_days: Optional[int] = None,
+    as_of: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None
+):
+    """Задача планировщика: пересчет ABC/XYZ-классов (например, по расписанию раз в сутки)"""
+    await run_job_stage(
+        cancel_event, run_classification, days=days, period_days=period_days,
+        as_of=date.fromisoformat(as_of) if as_of else None
+    )
+
+job_scheduler.register("classification", "report", classification_job, PRIORITY_LOW)
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date
+import asyncio
+import functools
+import logging
+
+from ...database.connection import get_db
+from ...database.models import Product, SalesAnomaly
+from ...services.anomalies import review_anomaly, run_anomaly_scan
+from ..serialization import orm_to_dict, trusted_response
+from ..schemas import AnomalyReview, PaginatedResponse
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/", response_model=PaginatedResponse)
+async def get_anomalies(
+    product_id: Optional[int] = Query(None, description="Фильтр по продукту"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    status: Optional[str] = Query(None, pattern="^(open|confirmed|dismissed)$", description="Статус проверки"),
+    kind: Optional[str] = Query(None, pattern="^(spike|negative)$", description="Тип выброса"),
+    start_date: Optional[date] = Query(None, description="Начальная дата"),
+    end_date: Optional[date] = Query(None, description="Конечная дата"),
+    page: int = Query(1, ge=1, description="Номер страницы"),
+    limit: int = Query(50, ge=1, le=500, description="Количество записей на странице"),
+    db: Session = Depends(get_db)
+):
+    """Отметки выбросов продаж для проверки (сначала самые сильные)"""
+    query = db.query(SalesAnomaly, Product.sku).join(Product, Product.id == SalesAnomaly.product_id)
+    if product_id:
+        query = query.filter(SalesAnomaly.product_id == product_id)
+    if warehouse_id:
+        query = query.filter(SalesAnomaly.warehouse_id == warehouse_id)
+    if status:
+        query = query.filter(SalesAnomaly.status == status)
+    if kind:
+        query = query.filter(SalesAnomaly.kind == kind)
+    if start_date:
+        query = query.filter(SalesAnomaly.sale_day >= start_date)
+    if end_date:
+        query = query.filter(SalesAnomaly.sale_day <= end_date)
+
+    total = query.count()
+    rows = (
+        query.order_by(SalesAnomaly.score.desc(), SalesAnomaly.id)
+        .offset((page - 1) * limit).limit(limit).all()
+    )
+    return trusted_response({
+        "items": [{**orm_to_dict(anomaly), "sku": sku} for anomaly, sku in rows],
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": (total + limit - 1) // limit
+    })
+
+@router.put("/{anomaly_id}")
+async def update_anomaly(anomaly_id: int, review: AnomalyReview, db: Session = Depends(get_db)):
+    """Решение по отметке: confirmed - выброс, dismissed - нормальный спрос (не обрабатывается в моделях)"""
+    anomaly = review_anomaly(db, anomaly_id, review.status, review.comment)
+    if anomaly is None:
+        raise HTTPException(status_code=404, detail="Отметка не найдена")
+    return trusted_response(orm_to_dict(anomaly))
+
+@router.post("/scan")
+async def scan_anomalies(
+    history_days: Optional[int] = Query(None, ge=28, description="Окно поиска, дней (по умолчанию из настроек)"),
+    warehouse_id: Optional[int] = Query(None, description="Только ряды склада")
+):
+    """Поиск выбросов во всех рядах (в пуле потоков, цикл событий не блокируется)"""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(run_anomaly_scan, history_days=history_days, warehouse_id=warehouse_id)
+        )
+    except Exception as e:
+        logger.error(f"Ошибка поиска выбросов продаж: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List
+import asyncio
+import logging
+
+from ...database.connection import get_db
+from ...services.atp import InsufficientStock, list_reservations, release_reservations, reserve_stock, stock_index
+from ..schemas import AtpCheckRequest, AtpLine, ReservationCreate
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+async def index_ready():
+    """Индекс, не построенный при старте (ATP_PRELOAD=false или ошибка), строится в пуле потоков,
+    а не в цикле событий"""
+    if not stock_index.ready():
+        await asyncio.get_running_loop().run_in_executor(None, stock_index.snapshot)
+
+def resolve_lines(lines: List[AtpLine]) -> List[int]:
+    """product_id строк корзины (по sku через индекс)"""
+    resolved = stock_index.resolve_products([line.dict() for line in lines])
+    for line, product_id in zip(lines, resolved):
+        if product_id is None:
+            detail = f"Продукт с SKU {line.sku} не найден" if line.sku else "Не указан product_id или sku"
+            raise HTTPException(status_code=404 if line.sku else 400, detail=detail)
+    return resolved
+
+@router.post("/check", dependencies=[Depends(index_ready)])
+async def check_availability(request: AtpCheckRequest) -> Dict[str, Any]:
+    """Склады, которые могут отгрузить каждую строку корзины и всю корзину целиком"""
+    product_ids = resolve_lines(request.lines)
+    try:
+        return stock_index.lookup(product_ids, [line.quantity for line in request.lines], request.warehouse_ids)
+    except Exception as e:
+        logger.error(f"Ошибка проверки доступности: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.get("/products/{product_id}", dependencies=[Depends(index_ready)])
+async def product_availability(
+    product_id: int,
+    quantity: float = Query(1, gt=0, description="Нужное количество")
+) -> Dict[str, Any]:
+    """Склады, которые могут отгрузить quantity единиц продукта"""
+    return stock_index.lookup([product_id], [quantity])["lines"][0]
+
+@router.post("/reservations", dependencies=[Depends(index_ready)])
+async def create_reservation(reservation: ReservationCreate, db: Session = Depends(get_db)):
+    """Резерв всех строк заказа на складе (все или ничего)"""
+    product_ids = resolve_lines(reservation.lines)
+    try:
+        return reserve_stock(
+            db,
+            reference=reservation.reference,
+            warehouse_id=reservation.warehouse_id,
+            product_ids=product_ids,
+            quantities=[line.quantity for line in reservation.lines],
+            ttl_seconds=reservation.ttl_seconds
+        )
+    except InsufficientStock as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "shortages": e.shortages})
+    except Exception as e:
+        logger.error(f"Ошибка резервирования по заказу {reservation.reference}: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.get("/reservations/{reference}")
+async def get_reservations(reference: str, db: Session = Depends(get_db)):
+    """Резервы заказа"""
+    reservations = list_reservations(db, reference)
+    if not reservations:
+        raise HTTPException(status_code=404, detail="Резервы не найдены")
+    return {"reference": reference, "reservations": reservations}
+
+@router.delete("/reservations/{reference}")
+async def delete_reservations(reference: str, db: Session = Depends(get_db)):
+    """Снятие активных резервов заказа"""
+    try:
+        released = release_reservations(db, reference)
+    except Exception as e:
+        logger.error(f"Ошибка снятия резервов по заказу {reference}: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+    if not released:
+        raise HTTPException(status_code=404, detail="Активные резервы не найдены")
+    return {"message": "Резервы сняты", "released": released}
+
+@router.get("/status")
+async def index_status():
+    """Состояние индекса ATP текущего воркера"""
+    return stock_index.status()
@@ -1,24 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import os
-import shutil
 from pathlib import Path
 import logging
 
-from ..database.connection import get_db
-from ..database.models import DataUpload
-from ..services.file_processor import file_processor
-from ..schemas import FileUploadRequest, FileUploadResponse, DataUploadResponse
-from ..config import settings
+from ...database.connection import get_db, get_db_context
+from ...database.models import DataUpload
+from ...services.scheduler import PRIORITY_URGENT, job_scheduler
+from ...services.upload_pipeline import (
+    upload_pipeline, safe_filename, UploadTooLargeError, UploadSessionError
+)
+from ..caching import conditional_get
+from ..schemas import (
+    FileUploadRequest, FileUploadResponse, DataUploadResponse,
+    UploadSessionCreate, UploadSessionResponse
+)
+from ...config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+SUPPORTED_EXTENSIONS = ['.xlsx', '.xls', '.csv']
+
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     file_type: str = Form(..., description="Тип данных: products, inventory, sales"),
     warehouse_id: Optional[int] = Form(None, description="ID склада (для inventory и sales)"),
@@ -30,7 +37,7 @@ async def upload_file(
             raise HTTPException(status_code=400, detail="Имя файла не указано")
         
         file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in ['.xlsx', '.xls', '.csv']:
+        if file_ext not in SUPPORTED_EXTENSIONS:
             raise HTTPException(
                 status_code=400, 
                 detail="Неподдерживаемый формат файла. Используйте Excel (.xlsx, .xls) или CSV"
@@ -38,44 +45,47 @@ async def upload_file(
         
         if file.size and file.size > settings.max_file_size:
             raise HTTPException(
-                status_code=400,
+                status_code=413,
                 detail=f"Файл слишком большой. Максимальный размер: {settings.max_file_size / (1024*1024):.1f} MB"
             )
         
         upload_dir = Path(settings.upload_dir)
         upload_dir.mkdir(exist_ok=True)
         
-        timestamp = int(os.time.time())
-        safe_filename = f"{timestamp}_{file.filename.replace(' ', '_')}"
-        file_path = upload_dir / safe_filename
+        file_path = upload_dir / safe_filename(file.filename)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Потоковая запись с хешированием и контролем размера; CSV разбирается по мере записи
+        try:
+            stream_result = await upload_pipeline.save_upload(file, file_path)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
         upload_record = DataUpload(
             filename=file.filename,
             file_path=str(file_path),
-            file_size=file.size,
+            file_size=stream_result["size"],
             file_type=file.content_type,
+            file_hash=stream_result["sha256"],
             status="uploaded"
         )
         db.add(upload_record)
         db.commit()
         db.refresh(upload_record)
         
-        background_tasks.add_task(
-            process_uploaded_file,
-            str(file_path),
-            file_type,
-            warehouse_id,
-            upload_record.id
+        # Разобранный при записи файл передается обработке, если ее выполнит этот экземпляр
+        job = job_scheduler.submit(
+            "upload",
+            {"file_path": str(file_path), "file_type": file_type, "warehouse_id": warehouse_id, "upload_id": upload_record.id},
+            transient={"dataframe": stream_result["dataframe"]}
         )
         
         return FileUploadResponse(
             success=True,
             message="Файл успешно загружен и поставлен в очередь на обработку",
             records_processed=0,
-            file_id=upload_record.id
+            file_id=upload_record.id,
+            job=job["event_job"],
+            scheduled_job=job["id"]
         )
         
     except HTTPException:
@@ -84,24 +94,153 @@ async def upload_file(
         logger.error(f"Ошибка загрузки файла: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-async def process_uploaded_file(file_path: str, file_type: str, warehouse_id: Optional[int], upload_id: int):
+async def process_uploaded_file(
+    file_path: str,
+    file_type: str,
+    warehouse_id: Optional[int],
+    upload_id: int,
+    dataframe: Optional[Any] = None
+):
+    # pandas и обработчик файлов загружаются при первой обработке, а не при старте API
+    from ...services.file_processor import file_processor
+    
     try:
         logger.info(f"Начинаем обработку файла {file_path}")
         
-        result = await file_processor.process_file(file_path, file_type, warehouse_id)
+        result = await file_processor.process_file(file_path, file_type, warehouse_id, df=dataframe, upload_id=upload_id)
         
         logger.info(f"Файл {file_path} успешно обработан: {result['records_processed']} записей")
         
     except Exception as e:
         logger.error(f"Ошибка обработки файла {file_path}: {e}")
         # Обновляем статус на failed
-        with get_db() as db:
+        with get_db_context() as db:
             upload_record = db.query(DataUpload).filter(DataUpload.id == upload_id).first()
             if upload_record:
                 upload_record.status = "failed"
                 upload_record.error_message = str(e)
                 db.commit()
 
+def upload_cancelled(parameters: Dict[str, Any]):
+    """Отмена обработки файла: загрузка помечается failed, ее можно повторить"""
+    with get_db_context() as db:
+        upload_record = db.query(DataUpload).filter(DataUpload.id == parameters["upload_id"]).first()
+        if upload_record and upload_record.status != "completed":
+            upload_record.status = "failed"
+            upload_record.error_message = "Обработка отменена"
+
+job_scheduler.register(
+    "upload", "import", process_uploaded_file, PRIORITY_URGENT,
+    event_job=lambda parameters: f"upload:{parameters['upload_id']}", on_cancel=upload_cancelled
+)
+
+@router.post("/uploads/sessions", response_model=UploadSessionResponse)
+async def create_upload_session(session: UploadSessionCreate):
+    """Создание сессии поэтапной загрузки большого файла"""
+    try:
+        if Path(session.filename).suffix.lower() not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail="Неподдерживаемый формат файла. Используйте Excel (.xlsx, .xls) или CSV"
+            )
+        
+        return upload_pipeline.create_session(
+            session.filename,
+            session.file_type,
+            session.warehouse_id,
+            session.total_size
+        )
+        
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка создания сессии загрузки: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.get("/uploads/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str):
+    """Состояние сессии загрузки (для возобновления после обрыва)"""
+    try:
+        return upload_pipeline.get_session(session_id)
+    except (KeyError, UploadSessionError):
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+
+@router.put("/uploads/sessions/{session_id}/chunks", response_model=UploadSessionResponse)
+async def upload_session_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Смещение блока в файле"),
+):
+    """Приём очередного блока файла; тело запроса - сырые байты"""
+    try:
+        return await upload_pipeline.append_chunk(session_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadSessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка приема блока для сессии {session_id}: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.post("/uploads/sessions/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    session_id: str,
+    sha256: Optional[str] = Query(None, description="Ожидаемая контрольная сумма SHA-256"),
+    db: Session = Depends(get_db)
+):
+    """Завершение поэтапной загрузки и постановка файла в очередь на обработку"""
+    try:
+        result = await upload_pipeline.complete_session(session_id, sha256)
+        
+        upload_record = DataUpload(
+            filename=result["filename"],
+            file_path=result["file_path"],
+            file_size=result["size"],
+            file_hash=result["sha256"],
+            status="uploaded"
+        )
+        db.add(upload_record)
+        db.commit()
+        db.refresh(upload_record)
+        
+        job = job_scheduler.submit("upload", {
+            "file_path": result["file_path"],
+            "file_type": result["file_type"],
+            "warehouse_id": result["warehouse_id"],
+            "upload_id": upload_record.id
+        })
+        
+        return FileUploadResponse(
+            success=True,
+            message="Файл успешно загружен и поставлен в очередь на обработку",
+            records_processed=0,
+            file_id=upload_record.id,
+            job=job["event_job"],
+            scheduled_job=job["id"]
+        )
+        
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка завершения сессии загрузки {session_id}: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+@router.delete("/uploads/sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    """Отмена сессии загрузки"""
+    try:
+        upload_pipeline.abort_session(session_id)
+        return {"message": "Сессия загрузки отменена"}
+    except (KeyError, UploadSessionError):
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+
 @router.get("/uploads", response_model=List[DataUploadResponse])
 async def get_uploads(
     status: Optional[str] = None,
@@ -190,18 +329,12 @@ async def retry_upload(upload_id: int, db: Session = Depends(get_db)):
         upload.error_message = None
         db.commit()
         
-        # Запускаем обработку
-        import asyncio
-        asyncio.create_task(
-            process_uploaded_file(
-                upload.file_path,
-                file_type,
-                None,  # warehouse_id будет определен автоматически
-                upload.id
-            )
+        # Ставим обработку в очередь планировщика; warehouse_id будет определен автоматически
+        job = job_scheduler.submit(
+            "upload", {"file_path": upload.file_path, "file_type": file_type, "warehouse_id": None, "upload_id": upload.id}
         )
         
-        return {"message": "Файл поставлен в очередь на повторную обработку"}
+        return {"message": "Файл поставлен в очередь на повторную обработку", "scheduled_job": job["id"]}
         
     except HTTPException:
         raise
@@ -209,7 +342,7 @@ async def retry_upload(upload_id: int, db: Session = Depends(get_db)):
         logger.error(f"Ошибка повторной обработки загрузки {upload_id}: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/templates")
+@router.get("/templates", dependencies=[Depends(conditional_get("templates"))])
 async def get_templates():
     """Получение шаблонов файлов для загрузки"""
     return {
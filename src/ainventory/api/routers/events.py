@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+import json
+import logging
+
+from ...config import settings
+from ...database.connection import get_db_context
+from ...database.models import DataUpload, SimulationRun
+from ...services.events import FINAL_EVENTS, event_broker, job_kind
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Событие в формате text/event-stream"""
+    lines = [f"event: {event['type']}", f"data: {json.dumps(event, default=str, ensure_ascii=False)}"]
+    if "id" in event:
+        lines.insert(0, f"id: {event['id']}")
+    return "\n".join(lines) + "\n\n"
+
+def stored_state(job: str) -> Optional[Dict[str, Any]]:
+    """Итог задачи из БД, если ее событий нет в памяти (например, после перезапуска)"""
+    kind, _, key = job.partition(":")
+    if not key.isdigit() or kind not in ("upload", "simulation"):
+        return None
+    with get_db_context() as db:
+        if kind == "upload":
+            record = db.query(DataUpload).filter(DataUpload.id == int(key)).first()
+            data = {"records_processed": record.records_processed, "error": record.error_message} if record else {}
+        else:
+            record = db.query(SimulationRun).filter(SimulationRun.id == int(key)).first()
+            data = {"items_simulated": record.items_simulated, "error": record.error_message} if record else {}
+        if record is None or record.status not in FINAL_EVENTS:
+            return None
+        return {"job": job, "type": record.status, **data}
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    job: List[str] = Query([], description="Задачи: upload:<id>, forecast:<модель>:<продукт>:<склад>, forecast:global_<тип>, simulation:<id>"),
+    kind: List[str] = Query([], description="Все задачи типа: upload, forecast, simulation")
+):
+    """Поток событий фоновых задач (Server-Sent Events): started, progress, completed, failed.
+
+    Сначала отправляется последнее известное состояние запрошенных задач; если
+    заданы только задачи (job) и все они завершены, поток закрывается.
+    """
+    subscription = event_broker.subscribe(jobs=job, kinds=kind)
+    pending = set(job)
+
+    async def events():
+        with subscription:
+            for name in job:
+                event = event_broker.last_event(name) or stored_state(name)
+                if event is not None:
+                    yield format_event(event)
+                    if event["type"] in FINAL_EVENTS:
+                        pending.discard(name)
+            if job and not pending and not kind:
+                return
+
+            while not await request.is_disconnected():
+                event = await subscription.get(settings.events_heartbeat_seconds)
+                if event is None:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event)
+                if event["type"] in FINAL_EVENTS and event["job"] in pending:
+                    pending.discard(event["job"])
+                    if not pending and not kind:
+                        return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job:path}")
+async def get_job_state(job: str):
+    """Последнее событие задачи"""
+    event = event_broker.last_event(job) or stored_state(job)
+    return {"job": job, "kind": job_kind(job), "event": event}
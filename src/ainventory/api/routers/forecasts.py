@@ -1,22 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, or_, func, desc, insert, select, tuple_
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
+import asyncio
 import logging
 import json
+import threading
+import time
 
-from ..database.connection import get_db
-from ..database.models import Forecast, Product, InventoryItem, Sale
+from ...database.connection import get_db, get_db_context
+from ...database.replica import get_read_db
+from ...database.models import Category, Forecast, Product, InventoryItem, Sale, SeriesWatermark, Warehouse
+from ..caching import conditional_get
+from ..serialization import orm_to_dict, trusted_response
 from ..schemas import (
     ForecastResponse, ForecastCreate, ForecastUpdate,
-    SearchParams, PaginatedResponse, ForecastAnalytics
+    ForecastBatch, BatchResponse, SearchParams, PaginatedResponse, ForecastAnalytics
 )
-from ..forecasting.prophet_model import ProphetForecaster
+from ...forecasting.registry import (
+    ANOMALY_TREATMENTS, LEVELS, MODEL_KINDS, RECONCILIATION_METHODS, SERIES_MODELS, series_forecaster
+)
+from ...services.batch import BatchSpec, apply_batch
+from ...services.events import event_broker
+from ...services.scheduler import PRIORITY_NORMAL, check_cancelled, job_scheduler, run_job_stage, series_priority
+from ...services.watermarks import dirty_summary, forecast_config_hash, mark_forecasted, plan_refresh
+from ...config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+FORECAST_BATCH = BatchSpec(
+    Forecast,
+    unique_key=("product_id", "warehouse_id", "forecast_date", "model_name"),
+    references={"product_id": (Product, "Продукт не найден"), "warehouse_id": (Warehouse, "Склад не найден")}
+)
+
+# Рядов в одном условии IN при замене прогнозов подмножества (лимит параметров запроса)
+SERIES_CHUNK = 500
+
 @router.get("/", response_model=PaginatedResponse)
 async def get_forecasts(
     product_id: Optional[int] = Query(None, description="Фильтр по продукту"),
@@ -54,19 +76,22 @@ async def get_forecasts(
         # Получаем общее количество
         total = query.count()
         
-        # Применяем пагинацию
-        items = query.offset((page - 1) * limit).limit(limit).all()
+        # Применяем пагинацию; продукт берется из уже присоединенной таблицы
+        items = (
+            query.options(contains_eager(Forecast.product))
+            .offset((page - 1) * limit).limit(limit).all()
+        )
         
         # Вычисляем количество страниц
         pages = (total + limit - 1) // limit
         
-        return PaginatedResponse(
-            items=items,
-            total=total,
-            page=page,
-            limit=limit,
-            pages=pages
-        )
+        return trusted_response({
+            "items": [{**orm_to_dict(item), "product": orm_to_dict(item.product)} for item in items],
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": pages
+        })
         
     except Exception as e:
         logger.error(f"Ошибка получения прогнозов: {e}")
@@ -131,6 +156,30 @@ async def create_forecast(
         db.rollback()
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
+@router.post("/batch", response_model=BatchResponse)
+async def batch_forecasts(batch: ForecastBatch, db: Session = Depends(get_db)):
+    """Пакетное создание, изменение и удаление прогнозов одной транзакцией"""
+    total = len(batch.create) + len(batch.update) + len(batch.delete)
+    if total > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много элементов в пакете: {total} (максимум {settings.batch_max_items})"
+        )
+    try:
+        result = apply_batch(
+            db, FORECAST_BATCH,
+            creates=[forecast.dict() for forecast in batch.create],
+            updates=[forecast.dict(exclude_unset=True) for forecast in batch.update],
+            deletes=batch.delete,
+            atomic=batch.atomic
+        )
+        return trusted_response(result)
+
+    except Exception as e:
+        logger.error(f"Ошибка пакетной записи прогнозов: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
 @router.put("/{forecast_id}", response_model=ForecastResponse)
 async def update_forecast(
     forecast_id: int,
@@ -182,15 +231,19 @@ async def delete_forecast(forecast_id: int, db: Session = Depends(get_db)):
 
 @router.post("/generate", response_model=Dict[str, Any])
 async def generate_forecast(
-    background_tasks: BackgroundTasks,
     product_id: int = Query(..., description="ID продукта"),
     warehouse_id: int = Query(..., description="ID склада"),
     forecast_horizon: int = Query(30, ge=1, le=365, description="Горизонт прогнозирования в днях"),
-    model_name: str = Query("prophet", description="Название модели"),
+    model_name: str = Query("prophet", description="Название модели: prophet или ets"),
+    anomaly_treatment: Optional[str] = Query(None, description="Выбросы продаж: winsorize, exclude или none"),
     db: Session = Depends(get_db)
 ):
     """Генерация прогноза спроса для продукта"""
     try:
+        if model_name not in SERIES_MODELS:
+            raise HTTPException(status_code=400, detail=f"Неподдерживаемая модель: {model_name}")
+        check_anomaly_treatment(anomaly_treatment)
+        
         # Проверяем существование продукта и склада
         product = db.query(Product).filter(Product.id == product_id).first()
         if not product:
@@ -210,13 +263,17 @@ async def generate_forecast(
                 detail=f"Недостаточно данных для прогнозирования. Требуется минимум 10 записей о продажах, доступно: {sales_count}"
             )
         
-        # Запускаем генерацию прогноза в фоне
-        background_tasks.add_task(
-            generate_forecast_background,
-            product_id,
-            warehouse_id,
-            forecast_horizon,
-            model_name
+        # Ставим генерацию в очередь: позиции с наибольшей выручкой прогнозируются раньше
+        scheduled = job_scheduler.submit(
+            "forecast",
+            {
+                "product_id": product_id,
+                "warehouse_id": warehouse_id,
+                "forecast_horizon": forecast_horizon,
+                "model_name": model_name,
+                "anomaly_treatment": anomaly_treatment
+            },
+            priority=series_priority(db, product_id, warehouse_id)
         )
         
         return {
@@ -224,7 +281,9 @@ async def generate_forecast(
             "product_id": product_id,
             "warehouse_id": warehouse_id,
             "forecast_horizon": forecast_horizon,
-            "model_name": model_name
+            "model_name": model_name,
+            "job": forecast_job(model_name, product_id, warehouse_id),
+            "scheduled_job": scheduled["id"]
         }
         
     except HTTPException:
@@ -233,41 +292,66 @@ async def generate_forecast(
         logger.error(f"Ошибка запуска генерации прогноза: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
+def check_anomaly_treatment(anomaly_treatment: Optional[str]):
+    if anomaly_treatment is not None and anomaly_treatment not in ANOMALY_TREATMENTS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая обработка выбросов: {anomaly_treatment}")
+
+def forecast_job(model_name: str, product_id: Optional[int] = None, warehouse_id: Optional[int] = None) -> str:
+    """Идентификатор задачи прогноза для событий: forecast:<модель>[:<продукт>:<склад>]"""
+    if product_id is None:
+        return f"forecast:{model_name}"
+    return f"forecast:{model_name}:{product_id}:{warehouse_id}"
+
 async def generate_forecast_background(
     product_id: int,
     warehouse_id: int,
     forecast_horizon: int,
-    model_name: str
+    model_name: str,
+    anomaly_treatment: Optional[str] = None
 ):
     """Генерация прогноза в фоновом режиме"""
+    job = forecast_job(model_name, product_id, warehouse_id)
     try:
+        event_broker.publish(job, "started", forecast_horizon=forecast_horizon)
         logger.info(f"Начинаем генерацию прогноза для продукта {product_id} на складе {warehouse_id}")
         
         # Получаем данные о продажах
-        with get_db() as db:
+        with get_db_context() as db:
             sales_data = db.query(Sale).filter(
                 and_(
                     Sale.product_id == product_id,
                     Sale.warehouse_id == warehouse_id
                 )
             ).order_by(Sale.sale_date).all()
+            
+            if not sales_data:
+                logger.error(f"Нет данных о продажах для продукта {product_id}")
+                event_broker.publish(job, "failed", error="Нет данных о продажах")
+                return
+            
+            # Подготавливаем данные для прогнозирования: дневной ряд с обработанными выбросами
+            from ...services.anomalies import clean_demand
+            
+            anomaly_treatment = anomaly_treatment or settings.anomaly_treatment
+            sales_df = clean_demand(
+                db, prepare_sales_data(sales_data).assign(product_id=product_id, warehouse_id=warehouse_id),
+                anomaly_treatment, series=[(product_id, warehouse_id)], date_col="ds", value_col="y"
+            )[["ds", "y"]]
+            data_version = db.scalar(
+                select(SeriesWatermark.data_version)
+                .where(SeriesWatermark.product_id == product_id, SeriesWatermark.warehouse_id == warehouse_id)
+            )
         
-        if not sales_data:
-            logger.error(f"Нет данных о продажах для продукта {product_id}")
-            return
-        
-        # Подготавливаем данные для прогнозирования
-        sales_df = prepare_sales_data(sales_data)
+        # Генерируем прогноз (сохраненная модель переиспользуется, если данные не менялись)
+        from ...forecasting.model_store import forecast_series
         
-        # Генерируем прогноз
-        if model_name == "prophet":
-            forecaster = ProphetForecaster()
-            forecast_result = await forecaster.forecast(sales_df, forecast_horizon)
-        else:
-            raise ValueError(f"Неподдерживаемая модель: {model_name}")
+        forecaster = series_forecaster(model_name)()
+        forecast_result, fit_info = await forecast_series(
+            forecaster, product_id, warehouse_id, sales_df, forecast_horizon
+        )
         
         # Сохраняем прогнозы в базу данных
-        with get_db() as db:
+        with get_db_context() as db:
             for date, value, lower, upper in forecast_result:
                 forecast = Forecast(
                     product_id=product_id,
@@ -278,23 +362,489 @@ async def generate_forecast_background(
                     confidence_upper=upper,
                     model_name=model_name,
                     model_version="1.0",
-                    features_used=json.dumps({"sales_history": len(sales_data)}),
-                    accuracy_metrics=json.dumps({"model": model_name})
+                    features_used=json.dumps({"sales_history": len(sales_df), "anomaly_treatment": anomaly_treatment}),
+                    accuracy_metrics=json.dumps({"model": model_name, **fit_info})
                 )
                 db.add(forecast)
             
+            if data_version is not None:
+                config_hash = forecast_config_hash(model=model_name, horizon=forecast_horizon, anomaly_treatment=anomaly_treatment)
+                mark_forecasted(db, model_name, [(product_id, warehouse_id, data_version)], config_hash)
             db.commit()
         
         logger.info(f"Прогноз для продукта {product_id} успешно сгенерирован и сохранен")
+        event_broker.publish(job, "completed", forecasts=len(forecast_result), **fit_info)
         
     except Exception as e:
         logger.error(f"Ошибка генерации прогноза для продукта {product_id}: {e}")
+        event_broker.publish(job, "failed", error=str(e))
+
+@router.post("/generate/series", response_model=Dict[str, Any])
+async def generate_series_forecasts(
+    model_name: str = Query("ets", description="Модель по рядам: prophet или ets"),
+    forecast_horizon: int = Query(30, ge=1, le=365, description="Горизонт прогнозирования в днях"),
+    warehouse_id: Optional[int] = Query(None, description="Только ряды склада"),
+    force: bool = Query(False, description="Пересчитать все ряды, а не только измененные"),
+    anomaly_treatment: Optional[str] = Query(None, description="Выбросы продаж: winsorize, exclude или none")
+):
+    """Прогноз моделью по рядам для всех измененных рядов в пуле процессов.
+
+    История рядов один раз собирается в матрицу спроса в файле, процессы
+    подключаются к ней отображением в память.
+    """
+    if model_name not in SERIES_MODELS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая модель: {model_name}")
+    check_anomaly_treatment(anomaly_treatment)
+
+    scheduled = job_scheduler.submit("forecast_series", {
+        "model_name": model_name,
+        "forecast_horizon": forecast_horizon,
+        "warehouse_id": warehouse_id,
+        "force": force,
+        "anomaly_treatment": anomaly_treatment
+    })
+    return {
+        "message": "Прогноз по рядам поставлен в очередь на генерацию",
+        "model_name": model_name,
+        "forecast_horizon": forecast_horizon,
+        "warehouse_id": warehouse_id,
+        "job": forecast_job(model_name),
+        "scheduled_job": scheduled["id"]
+    }
+
+async def generate_series_forecasts_background(
+    model_name: str,
+    forecast_horizon: int,
+    warehouse_id: Optional[int] = None,
+    force: bool = False,
+    anomaly_treatment: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None
+):
+    """Генерация прогнозов по рядам в фоновом режиме: матрица спроса и пул процессов"""
+    job = forecast_job(model_name)
+    matrix = None
+    try:
+        event_broker.publish(job, "started", forecast_horizon=forecast_horizon, force=force)
+        anomaly_treatment = anomaly_treatment or settings.anomaly_treatment
+        config_hash = forecast_config_hash(model=model_name, horizon=forecast_horizon, anomaly_treatment=anomaly_treatment)
+
+        from ...services.demand_matrix import build_demand_matrix
+
+        with get_db_context() as db:
+            plan = plan_refresh(db, model_name, config_hash, force=force, warehouse_id=warehouse_id)
+            if plan.skip:
+                logger.info(f"Прогноз {model_name} по рядам: все {plan.total} рядов актуальны, пересчет пропущен")
+                event_broker.publish(job, "completed", forecasts=0, series=0, series_total=plan.total, skipped=True)
+                return
+            matrix = build_demand_matrix(
+                db, warehouse_id=warehouse_id, series=plan.subquery(), anomaly_treatment=anomaly_treatment
+            )
+        if matrix is None or not matrix.shape[0]:
+            logger.error(f"Нет данных о продажах для прогноза {model_name} по рядам")
+            event_broker.publish(job, "failed", error="Нет данных о продажах")
+            return
+        event_broker.publish(job, "progress", stage="forecasting", processed=0, total=matrix.shape[0])
+
+        from ...services.series_forecasts import forecast_matrix
+
+        prediction, stats = await run_job_stage(
+            cancel_event, forecast_matrix, matrix, model_name, forecast_horizon, job=job, cancel_event=cancel_event
+        )
+        stats = {**stats, "series_recomputed": len(plan.series), "series_total": plan.total}
+
+        check_cancelled(cancel_event)
+        event_broker.publish(job, "progress", stage="saving", rows=len(prediction))
+        features_used = {"series": stats["series"], "history_days": matrix.shape[1], "anomaly_treatment": anomaly_treatment}
+        saved = await run_job_stage(
+            cancel_event, replace_model_forecasts, prediction, model_name, features_used, {"model": model_name, **stats},
+            warehouse_id, plan.keys()
+        )
+        with get_db_context() as db:
+            mark_forecasted(db, model_name, plan.series, config_hash)
+
+        logger.info(f"Прогноз {model_name} по рядам: {saved} записей, {stats}")
+        event_broker.publish(job, "completed", forecasts=saved, **stats)
+
+    except Exception as e:
+        logger.error(f"Ошибка прогноза {model_name} по рядам: {e}")
+        event_broker.publish(job, "failed", error=str(e))
+    finally:
+        if matrix is not None:
+            matrix.remove()
+
+@router.post("/generate/global", response_model=Dict[str, Any])
+async def generate_global_forecast(
+    model_kind: str = Query(settings.global_model_kind, description="Тип глобальной модели: gbm или linear"),
+    forecast_horizon: int = Query(30, ge=1, description="Горизонт прогнозирования в днях"),
+    warehouse_id: Optional[int] = Query(None, description="Только ряды склада"),
+    retrain: bool = Query(False, description="Обучить модель заново вместо дообучения (пересчитываются все ряды)"),
+    force: bool = Query(False, description="Пересчитать все ряды, а не только измененные"),
+    anomaly_treatment: Optional[str] = Query(None, description="Выбросы продаж: winsorize, exclude или none")
+):
+    """Прогноз рядов (продукт x склад) одной глобальной моделью.
+
+    Пересчитываются только ряды, у которых с прошлого прогноза изменились данные
+    или конфигурация, и ряды с прогнозом старше forecast_max_staleness_days дней.
+    """
+    if model_kind not in MODEL_KINDS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая модель: {model_kind}")
+    check_anomaly_treatment(anomaly_treatment)
+    if forecast_horizon > settings.global_model_max_horizon:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Горизонт больше максимального для глобальной модели: {settings.global_model_max_horizon}"
+        )
+
+    scheduled = job_scheduler.submit("forecast_global", {
+        "model_kind": model_kind,
+        "forecast_horizon": forecast_horizon,
+        "warehouse_id": warehouse_id,
+        "retrain": retrain,
+        "anomaly_treatment": anomaly_treatment,
+        "force": force
+    })
+    return {
+        "message": "Глобальный прогноз поставлен в очередь на генерацию",
+        "model_name": f"global_{model_kind}",
+        "forecast_horizon": forecast_horizon,
+        "warehouse_id": warehouse_id,
+        "job": forecast_job(f"global_{model_kind}"),
+        "scheduled_job": scheduled["id"]
+    }
+
+@router.get("/generate/global/status", response_model=Dict[str, Any])
+async def get_global_forecast_status(
+    model_kind: str = Query(settings.global_model_kind, description="Тип глобальной модели: gbm или linear"),
+    forecast_horizon: int = Query(30, ge=1, description="Горизонт прогнозирования в днях"),
+    warehouse_id: Optional[int] = Query(None, description="Только ряды склада"),
+    anomaly_treatment: Optional[str] = Query(None, description="Выбросы продаж: winsorize, exclude или none"),
+    db: Session = Depends(get_db)
+):
+    """Сколько рядов пересчитает следующий глобальный прогноз с этими параметрами и почему"""
+    if model_kind not in MODEL_KINDS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая модель: {model_kind}")
+    check_anomaly_treatment(anomaly_treatment)
+
+    model_name = f"global_{model_kind}"
+    counts = dirty_summary(
+        db, model_name, global_config_hash(model_name, forecast_horizon, anomaly_treatment), warehouse_id=warehouse_id
+    )
+    return {
+        "model_name": model_name,
+        "forecast_horizon": forecast_horizon,
+        "warehouse_id": warehouse_id,
+        "max_staleness_days": settings.forecast_max_staleness_days,
+        "series_total": sum(counts.values()),
+        "series_dirty": sum(count for reason, count in counts.items() if reason != "fresh"),
+        "reasons": counts
+    }
+
+def load_demand_data(
+    db: Session,
+    warehouse_id: Optional[int] = None,
+    anomaly_treatment: Optional[str] = None,
+    series: Optional[Any] = None
+):
+    """Дневные продажи рядов (агрегация в БД, выбросы обработаны) и атрибуты продуктов.
+
+    series - подзапрос с колонками product_id и warehouse_id (например, ряды к
+    пересчету); без него загружаются все ряды.
+    """
+    import pandas as pd
+    from ...services.anomalies import clean_demand
+
+    sale_day = func.date(Sale.sale_date)
+    query = db.query(
+        Sale.product_id, Sale.warehouse_id, sale_day.label("sale_date"),
+        func.sum(Sale.quantity).label("quantity"), func.sum(Sale.revenue).label("revenue")
+    )
+    if series is not None:
+        query = query.join(series, and_(Sale.product_id == series.c.product_id, Sale.warehouse_id == series.c.warehouse_id))
+    if warehouse_id:
+        query = query.filter(Sale.warehouse_id == warehouse_id)
+    rows = query.group_by(Sale.product_id, Sale.warehouse_id, sale_day).all()
+    sales = pd.DataFrame(rows, columns=["product_id", "warehouse_id", "sale_date", "quantity", "revenue"])
+    sales = clean_demand(db, sales, anomaly_treatment, warehouse_id=warehouse_id)
+
+    products = db.query(Product.id, Product.category_id, Product.brand_id, Product.unit_price).all()
+    attributes = pd.DataFrame(products, columns=["product_id", "category_id", "brand_id", "list_price"]).set_index("product_id")
+    return sales, attributes
+
+def train_and_predict_global(
+    sales: Any,
+    attributes: Any,
+    model_kind: str,
+    forecast_horizon: int,
+    retrain: bool = False,
+    end_date: Optional[Any] = None,
+    cancel_event: Optional[threading.Event] = None
+):
+    """Признаки (с кешем), обучение или дообучение глобальной модели и прогноз переданных рядов.
+
+    end_date - последний день продаж по всем рядам: ряды подмножества дополняются
+    нулевыми днями до него, чтобы прогноз начинался с той же даты.
+    Отмена (cancel_event) проверяется между этапами; отмененное обучение не сохраняется.
+    """
+    from ...features.engineering import FeatureStore, daily_demand
+    from ...forecasting.global_model import GlobalDemandModel, model_path
+
+    timings = {}
+    start = time.perf_counter()
+    features = FeatureStore().get_features(daily_demand(sales, end_date=end_date))
+    timings["features_seconds"] = time.perf_counter() - start
+    check_cancelled(cancel_event)
+
+    path = model_path(model_kind)
+    model = None if retrain else GlobalDemandModel.load(path)
+    start = time.perf_counter()
+    if model is None or model.kind != model_kind:
+        model = GlobalDemandModel(kind=model_kind)
+        training = model.fit(features, attributes)
+    else:
+        training = model.update(features, attributes)
+    timings["train_seconds"] = time.perf_counter() - start
+    check_cancelled(cancel_event)
+    model.save(path)
+
+    start = time.perf_counter()
+    prediction = model.predict(features, forecast_horizon, attributes)
+    timings["predict_seconds"] = time.perf_counter() - start
+    return prediction, {**training, **timings}
+
+def global_config_hash(model_name: str, forecast_horizon: int, anomaly_treatment: Optional[str] = None) -> str:
+    """Конфигурация глобального прогноза, от которой зависят прогнозы рядов"""
+    from ...features.engineering import FeatureConfig
+    from ...forecasting.global_model import DESIGN_VERSION
+
+    return forecast_config_hash(
+        model=model_name,
+        horizon=forecast_horizon,
+        anomaly_treatment=anomaly_treatment or settings.anomaly_treatment,
+        features=FeatureConfig().version,
+        design=DESIGN_VERSION,
+        train_days=settings.global_model_train_days,
+        horizon_samples=settings.global_model_horizon_samples
+    )
+
+async def generate_global_forecast_background(
+    model_kind: str,
+    forecast_horizon: int,
+    warehouse_id: Optional[int] = None,
+    retrain: bool = False,
+    anomaly_treatment: Optional[str] = None,
+    force: bool = False,
+    cancel_event: Optional[threading.Event] = None
+):
+    """Генерация глобального прогноза в фоновом режиме: только ряды с измененными данными или конфигурацией"""
+    model_name = f"global_{model_kind}"
+    job = forecast_job(model_name)
+    try:
+        event_broker.publish(job, "started", forecast_horizon=forecast_horizon, retrain=retrain, force=force)
+        config_hash = global_config_hash(model_name, forecast_horizon, anomaly_treatment)
+        with get_db_context() as db:
+            plan = plan_refresh(db, model_name, config_hash, force=force or retrain, warehouse_id=warehouse_id)
+            if plan.skip:
+                logger.info(f"Глобальный прогноз {model_name}: все {plan.total} рядов актуальны, пересчет пропущен")
+                event_broker.publish(job, "completed", forecasts=0, series=0, series_total=plan.total, skipped=True)
+                return
+
+            # Без водяных знаков (ряды еще не отслеживаются) или когда изменились все ряды - полный расчет
+            sales, attributes = load_demand_data(db, warehouse_id, anomaly_treatment, plan.subquery())
+            last_day = select(func.date(func.max(Sale.sale_date)))
+            if warehouse_id:
+                last_day = last_day.where(Sale.warehouse_id == warehouse_id)
+            end_date = db.scalar(last_day)
+        if sales.empty:
+            logger.error("Нет данных о продажах для глобального прогноза")
+            event_broker.publish(job, "failed", error="Нет данных о продажах")
+            return
+        event_broker.publish(job, "progress", stage="training", rows=len(sales), series=len(plan.series), series_total=plan.total)
+
+        prediction, stats = await run_job_stage(
+            cancel_event, train_and_predict_global, sales, attributes, model_kind, forecast_horizon, retrain, end_date,
+            cancel_event
+        )
+        stats = {**stats, "series_recomputed": len(plan.series), "series_total": plan.total}
+
+        check_cancelled(cancel_event)
+        event_broker.publish(job, "progress", stage="saving", rows=len(prediction))
+        features_used = {
+            "series": int(prediction[["product_id", "warehouse_id"]].drop_duplicates().shape[0]),
+            "anomaly_treatment": anomaly_treatment or settings.anomaly_treatment
+        }
+        saved = replace_model_forecasts(
+            prediction, model_name, features_used, {"model": model_name, **stats}, warehouse_id, plan.keys()
+        )
+        with get_db_context() as db:
+            mark_forecasted(db, model_name, plan.series, config_hash)
+
+        logger.info(f"Глобальный прогноз {model_name}: {saved} записей, {stats}")
+        event_broker.publish(job, "completed", forecasts=saved, **stats)
+
+    except Exception as e:
+        logger.error(f"Ошибка генерации глобального прогноза {model_name}: {e}")
+        event_broker.publish(job, "failed", error=str(e))
+
+def replace_model_forecasts(
+    prediction: Any,
+    model_name: str,
+    features_used: Dict[str, Any],
+    accuracy_metrics: Dict[str, Any],
+    warehouse_id: Optional[int] = None,
+    series: Optional[List[Tuple[int, int]]] = None
+) -> int:
+    """Сохранение прогнозов модели (product_id, warehouse_id, forecast_date, значения) вместо прежних на те же даты.
+
+    series - заменить прогнозы только этих рядов (пересчет измененных рядов), иначе всех.
+    """
+    features_used = json.dumps(features_used)
+    accuracy_metrics = json.dumps(accuracy_metrics, default=str)
+    records = [
+        {
+            "product_id": int(row.product_id),
+            "warehouse_id": int(row.warehouse_id),
+            "forecast_date": row.forecast_date.to_pydatetime(),
+            "forecast_value": float(row.forecast_value),
+            "confidence_lower": float(row.confidence_lower) if row.confidence_lower == row.confidence_lower else None,
+            "confidence_upper": float(row.confidence_upper) if row.confidence_upper == row.confidence_upper else None,
+            "model_name": model_name,
+            "model_version": "1.0",
+            "features_used": features_used,
+            "accuracy_metrics": accuracy_metrics,
+        }
+        for row in prediction.itertuples(index=False)
+    ]
+    if not records:
+        return 0
+
+    with get_db_context() as db:
+        stale = db.query(Forecast).filter(
+            Forecast.model_name == model_name,
+            Forecast.forecast_date >= prediction["forecast_date"].min().to_pydatetime()
+        )
+        if warehouse_id:
+            stale = stale.filter(Forecast.warehouse_id == warehouse_id)
+        if series is None:
+            stale.delete(synchronize_session=False)
+        else:
+            for begin in range(0, len(series), SERIES_CHUNK):
+                stale.filter(
+                    tuple_(Forecast.product_id, Forecast.warehouse_id).in_(series[begin:begin + SERIES_CHUNK])
+                ).delete(synchronize_session=False)
+        db.execute(insert(Forecast), records)
+    return len(records)
+
+job_scheduler.register(
+    "forecast", "forecast", generate_forecast_background, PRIORITY_NORMAL,
+    event_job=lambda parameters: forecast_job(parameters["model_name"], parameters["product_id"], parameters["warehouse_id"])
+)
+job_scheduler.register(
+    "forecast_series", "forecast", generate_series_forecasts_background, PRIORITY_NORMAL,
+    event_job=lambda parameters: forecast_job(parameters.get("model_name", "ets"))
+)
+job_scheduler.register(
+    "forecast_global", "forecast", generate_global_forecast_background, PRIORITY_NORMAL,
+    event_job=lambda parameters: forecast_job(f"global_{parameters.get('model_kind', settings.global_model_kind)}")
+)
+
+@router.post("/hierarchical", response_model=Dict[str, Any])
+async def generate_hierarchical_forecast(
+    method: str = Query("mint", description="Согласование: bottom_up, top_down или mint"),
+    forecast_horizon: int = Query(30, ge=1, le=365, description="Горизонт прогнозирования в днях"),
+    levels: List[str] = Query(["total", "warehouse", "category"], description="Уровни в ответе"),
+    warehouse_id: Optional[int] = Query(None, description="Только ряды склада"),
+    save_bottom: bool = Query(False, description="Сохранить согласованные прогнозы продукт x склад"),
+    anomaly_treatment: Optional[str] = Query(None, description="Выбросы продаж: winsorize, exclude или none"),
+    db: Session = Depends(get_db)
+):
+    """Согласованный прогноз по уровням: сеть, склад, категория (с предками), категория x склад, продукт x склад"""
+    if method not in RECONCILIATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый метод согласования: {method}")
+    unknown = [level for level in levels if level not in LEVELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные уровни: {', '.join(unknown)}")
+    check_anomaly_treatment(anomaly_treatment)
+
+    try:
+        import numpy as np
+        import pandas as pd
+        from ...forecasting.hierarchy import Hierarchy, forecast_hierarchy, history_matrix
+
+        sales, attributes = load_demand_data(db, warehouse_id, anomaly_treatment)
+        if sales.empty:
+            raise HTTPException(status_code=404, detail="Нет данных о продажах")
+        categories = pd.DataFrame(db.query(Category.id, Category.parent_id).all(), columns=["id", "parent_id"])
+
+        def compute():
+            start = time.perf_counter()
+            bottom, history, history_start = history_matrix(sales, settings.hierarchy_history_days)
+            bottom["category_id"] = bottom["product_id"].map(attributes["category_id"])
+            hierarchy = Hierarchy.build(bottom, categories)
+            reconciled = forecast_hierarchy(hierarchy, history, forecast_horizon, method)
+            first_date = history_start + pd.Timedelta(days=history.shape[1])
+            return hierarchy, reconciled, first_date, time.perf_counter() - start
+
+        loop = asyncio.get_running_loop()
+        hierarchy, reconciled, first_date, seconds = await loop.run_in_executor(None, compute)
+
+        nodes = hierarchy.nodes
+        result = {}
+        for level in levels:
+            index = nodes.index[nodes["level"] == level].to_numpy()
+            keys = nodes.loc[index, ["warehouse_id", "category_id", "product_id"]]
+            result[level] = [
+                {
+                    **{key: int(value) for key, value in row.items() if value == value},
+                    "values": [float(value) for value in values],
+                }
+                for row, values in zip(keys.to_dict("records"), reconciled[index])
+            ]
+
+        saved = 0
+        if save_bottom:
+            bottom_nodes = nodes.iloc[hierarchy.n_aggregate:]
+            dates = pd.date_range(first_date, periods=forecast_horizon, freq="D")
+            prediction = pd.DataFrame({
+                "product_id": np.repeat(bottom_nodes["product_id"].to_numpy(), forecast_horizon),
+                "warehouse_id": np.repeat(bottom_nodes["warehouse_id"].to_numpy(), forecast_horizon),
+                "forecast_date": np.tile(dates, len(bottom_nodes)),
+                "forecast_value": reconciled[hierarchy.n_aggregate:].ravel(),
+                "confidence_lower": np.nan,
+                "confidence_upper": np.nan,
+            })
+            saved = await loop.run_in_executor(
+                None, replace_model_forecasts, prediction, f"hierarchical_{method}",
+                {"bottom_series": hierarchy.n_bottom, "nodes": int(len(nodes))}, {"method": method}, warehouse_id
+            )
+
+        return {
+            "method": method,
+            "forecast_horizon": forecast_horizon,
+            "start_date": first_date.date().isoformat(),
+            "bottom_series": hierarchy.n_bottom,
+            "nodes": int(len(nodes)),
+            "seconds": seconds,
+            "saved_forecasts": saved,
+            "levels": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка иерархического прогноза: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
 def prepare_sales_data(sales_data: List[Sale]) -> Any:
-    """Подготовка данных о продажах для прогнозирования"""
-    # TODO: Реализовать подготовку данных для Prophet
-    # Пока возвращаем заглушку
-    return sales_data
+    """Подготовка данных о продажах для прогнозирования: дневной ряд ds/y без пропусков"""
+    import pandas as pd
+    
+    df = pd.DataFrame(
+        {"ds": [sale.sale_date for sale in sales_data], "y": [sale.quantity for sale in sales_data]}
+    )
+    df["ds"] = pd.to_datetime(df["ds"], utc=True).dt.tz_localize(None).dt.normalize()
+    daily = df.groupby("ds")["y"].sum()
+    daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq="D"), fill_value=0.0)
+    return daily.rename_axis("ds").reset_index()
 
 @router.get("/analytics/overview", response_model=ForecastAnalytics)
 async def get_forecast_analytics(db: Session = Depends(get_db)):
@@ -325,7 +875,7 @@ async def get_forecast_analytics(db: Session = Depends(get_db)):
         logger.error(f"Ошибка получения аналитики прогнозов: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/products/{product_id}/latest")
+@router.get("/products/{product_id}/latest", dependencies=[Depends(conditional_get("latest_forecast", ["forecasts"]))])
 async def get_latest_product_forecast(
     product_id: int,
     warehouse_id: Optional[int] = Query(None, description="ID склада"),
@@ -346,7 +896,7 @@ async def get_latest_product_forecast(
                 detail="Прогнозы для данного продукта не найдены"
             )
         
-        return latest_forecast
+        return orm_to_dict(latest_forecast)
         
     except HTTPException:
         raise
@@ -360,7 +910,7 @@ async def evaluate_forecast_accuracy(
     warehouse_id: Optional[int] = Query(None, description="ID склада"),
     start_date: datetime = Query(..., description="Начальная дата для оценки"),
     end_date: datetime = Query(..., description="Конечная дата для оценки"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Оценка точности прогнозов"""
     try:
@@ -1,19 +1,29 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 from sqlalchemy import and_, or_, func
 from typing import List, Optional
 import logging
 
-from ..database.connection import get_db
-from ..database.models import InventoryItem, Product, Warehouse, Category, Brand
+from ...database.connection import get_db
+from ...database.models import InventoryItem, Product, Warehouse, Category, Brand
+from ..caching import conditional_get
+from ..serialization import orm_to_dict, trusted_response
+from ...config import settings
+from ...services.batch import BatchSpec, apply_batch
 from ..schemas import (
     InventoryItemResponse, InventoryItemCreate, InventoryItemUpdate,
-    SearchParams, PaginatedResponse, InventoryAnalytics
+    InventoryItemBatch, BatchResponse, SearchParams, PaginatedResponse, InventoryAnalytics
 )
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+INVENTORY_BATCH = BatchSpec(
+    InventoryItem,
+    unique_key=("product_id", "warehouse_id"),
+    references={"product_id": (Product, "Продукт не найден"), "warehouse_id": (Warehouse, "Склад не найден")}
+)
+
 @router.get("/", response_model=PaginatedResponse)
 async def get_inventory(
     search: Optional[str] = Query(None, description="Поиск по SKU или названию"),
@@ -22,6 +32,8 @@ async def get_inventory(
     brand_id: Optional[int] = Query(None, description="Фильтр по бренду"),
     low_stock: Optional[bool] = Query(None, description="Только товары с низким остатком"),
     out_of_stock: Optional[bool] = Query(None, description="Только товары без остатка"),
+    abc_class: Optional[str] = Query(None, pattern="^[ABC]{1,3}$", description="Классы ABC, например A или AB"),
+    xyz_class: Optional[str] = Query(None, pattern="^[XYZ]{1,3}$", description="Классы XYZ, например X или XY"),
     page: int = Query(1, ge=1, description="Номер страницы"),
     limit: int = Query(20, ge=1, le=100, description="Количество записей на странице"),
     db: Session = Depends(get_db)
@@ -57,22 +69,33 @@ async def get_inventory(
         if out_of_stock:
             query = query.filter(InventoryItem.current_stock == 0)
         
+        if abc_class:
+            query = query.filter(InventoryItem.abc_class.in_(list(abc_class)))
+        if xyz_class:
+            query = query.filter(InventoryItem.xyz_class.in_(list(xyz_class)))
+        
         # Получаем общее количество
         total = query.count()
         
-        # Применяем пагинацию
-        items = query.offset((page - 1) * limit).limit(limit).all()
+        # Применяем пагинацию; продукт и склад берутся из уже присоединенных таблиц
+        items = (
+            query.options(contains_eager(InventoryItem.product), contains_eager(InventoryItem.warehouse))
+            .offset((page - 1) * limit).limit(limit).all()
+        )
         
         # Вычисляем количество страниц
         pages = (total + limit - 1) // limit
         
-        return PaginatedResponse(
-            items=items,
-            total=total,
-            page=page,
-            limit=limit,
-            pages=pages
-        )
+        return trusted_response({
+            "items": [
+                {**orm_to_dict(item), "product": orm_to_dict(item.product), "warehouse": orm_to_dict(item.warehouse)}
+                for item in items
+            ],
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": pages
+        })
         
     except Exception as e:
         logger.error(f"Ошибка получения инвентаря: {e}")
@@ -139,6 +162,30 @@ async def create_inventory_item(
         db.rollback()
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
+@router.post("/batch", response_model=BatchResponse)
+async def batch_inventory_items(batch: InventoryItemBatch, db: Session = Depends(get_db)):
+    """Пакетное создание, изменение и удаление записей инвентаря одной транзакцией"""
+    total = len(batch.create) + len(batch.update) + len(batch.delete)
+    if total > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много элементов в пакете: {total} (максимум {settings.batch_max_items})"
+        )
+    try:
+        result = apply_batch(
+            db, INVENTORY_BATCH,
+            creates=[item.dict() for item in batch.create],
+            updates=[item.dict(exclude_unset=True) for item in batch.update],
+            deletes=batch.delete,
+            atomic=batch.atomic
+        )
+        return trusted_response(result)
+
+    except Exception as e:
+        logger.error(f"Ошибка пакетной записи инвентаря: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
 @router.put("/{item_id}", response_model=InventoryItemResponse)
 async def update_inventory_item(
     item_id: int,
@@ -270,7 +317,10 @@ async def get_inventory_analytics(db: Session = Depends(get_db)):
         logger.error(f"Ошибка получения аналитики инвентаря: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
-@router.get("/warehouses/{warehouse_id}/summary")
+@router.get(
+    "/warehouses/{warehouse_id}/summary",
+    dependencies=[Depends(conditional_get("warehouse_summary", ["warehouses", "inventory_items", "products"]))]
+)
 async def get_warehouse_summary(warehouse_id: int, db: Session = Depends(get_db)):
     """Получение сводки по складу"""
     try:
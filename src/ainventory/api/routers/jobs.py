@@ -0,0 +1,117 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+import inspect
+import json
+import logging
+
+from ...database.connection import get_db
+from ...database.models import JobSchedule, ScheduledJob
+from ...services.scheduler import (
+    ACTIVE_STATUSES, CronSchedule, JobNotCancellable, job_response, job_scheduler, schedule_response
+)
+from ..schemas import JobResponse, JobScheduleCreate, JobScheduleResponse
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/", response_model=List[JobResponse])
+async def get_jobs(
+    status: Optional[str] = Query(None, description="Фильтр по статусу: queued, running, completed, failed, cancelled"),
+    job_class: Optional[str] = Query(None, description="Фильтр по классу: import, forecast, report"),
+    kind: Optional[str] = Query(None, description="Фильтр по типу задачи"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """Задачи планировщика: сначала новые"""
+    query = db.query(ScheduledJob)
+    if status:
+        query = query.filter(ScheduledJob.status == status)
+    if job_class:
+        query = query.filter(ScheduledJob.job_class == job_class)
+    if kind:
+        query = query.filter(ScheduledJob.kind == kind)
+    jobs = query.order_by(ScheduledJob.id.desc()).offset(offset).limit(limit).all()
+    return [job_response(job) for job in jobs]
+
+@router.get("/status")
+async def get_scheduler_status(db: Session = Depends(get_db)):
+    """Состояние планировщика этого экземпляра и очередь по классам задач"""
+    rows = db.query(ScheduledJob.job_class, ScheduledJob.status, func.count()).filter(
+        ScheduledJob.status.in_(ACTIVE_STATUSES)
+    ).group_by(ScheduledJob.job_class, ScheduledJob.status).all()
+    queue: Dict[str, Dict[str, int]] = {}
+    for job_class, status, count in rows:
+        queue.setdefault(job_class, {name: 0 for name in ACTIVE_STATUSES})[status] = count
+    return {**job_scheduler.status(), "queue": queue}
+
+@router.get("/schedules", response_model=List[JobScheduleResponse])
+async def get_schedules(db: Session = Depends(get_db)):
+    """Расписания повторяющихся задач"""
+    return [schedule_response(schedule) for schedule in db.query(JobSchedule).order_by(JobSchedule.id).all()]
+
+@router.post("/schedules", response_model=JobScheduleResponse)
+async def create_schedule(request: JobScheduleCreate, db: Session = Depends(get_db)):
+    """Расписание повторяющейся задачи (cron, UTC); параметры - как у задачи этого типа"""
+    handler = job_scheduler.handlers.get(request.kind)
+    if handler is None:
+        raise HTTPException(status_code=400, detail=f"Неизвестный тип задачи: {request.kind}")
+    try:
+        cron = CronSchedule(request.cron)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        inspect.signature(handler.func).bind(**request.parameters)
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректные параметры задачи {request.kind}: {e}")
+    if db.query(JobSchedule).filter(JobSchedule.name == request.name).first():
+        raise HTTPException(status_code=400, detail="Расписание с таким именем уже существует")
+
+    schedule = JobSchedule(
+        name=request.name,
+        cron=request.cron,
+        kind=request.kind,
+        parameters=json.dumps(request.parameters),
+        priority=request.priority,
+        enabled=request.enabled,
+        next_run_at=cron.next_after(datetime.now(timezone.utc))
+    )
+    db.add(schedule)
+    db.commit()
+    db.refresh(schedule)
+    return schedule_response(schedule)
+
+@router.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: int, db: Session = Depends(get_db)):
+    """Удаление расписания (поставленные по нему задачи остаются)"""
+    schedule = db.query(JobSchedule).filter(JobSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Расписание не найдено")
+    db.query(ScheduledJob).filter(ScheduledJob.schedule_id == schedule_id).update(
+        {ScheduledJob.schedule_id: None}, synchronize_session=False
+    )
+    db.delete(schedule)
+    db.commit()
+    return {"message": "Расписание удалено"}
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Задача планировщика"""
+    job = db.query(ScheduledJob).filter(ScheduledJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job_response(job)
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: int):
+    """Отмена задачи: ожидающая снимается сразу, выполняемая останавливается лидером при следующем проходе"""
+    try:
+        job = job_scheduler.cancel(job_id)
+    except JobNotCancellable as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import ValidationError
+from typing import Any, Dict, List, Tuple
+import logging
+
+import orjson
+
+from ...config import settings
+from ...services.ingest import IngestOverloaded, sales_ingest
+from ..schemas import SaleEvent
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+def parse_events(body: bytes, content_type: str) -> List[Tuple[int, Any]]:
+    """Разбор тела: NDJSON (событие на строку) или JSON (массив, {"events": [...]} или одно событие)"""
+    if content_type.split(";")[0].strip().lower() in NDJSON_TYPES:
+        lines = [line for line in body.splitlines() if line.strip()]
+        parsed = []
+        for index, line in enumerate(lines):
+            try:
+                parsed.append((index, orjson.loads(line)))
+            except orjson.JSONDecodeError:
+                parsed.append((index, ValueError("Некорректный JSON")))
+        return parsed
+
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Некорректный JSON")
+    if isinstance(payload, dict):
+        payload = payload.get("events", [payload])
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив событий")
+    return list(enumerate(payload))
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+@router.post("/events")
+async def ingest_sale_events(request: Request):
+    """Прием продаж от касс потоком событий (NDJSON или JSON).
+
+    Ответ отправляется после фиксации пакета, в который попали события:
+    продажи записаны, остатки списаны, дневные итоги обновлены.
+    """
+    parsed = parse_events(await request.body(), request.headers.get("content-type", ""))
+    if len(parsed) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много событий в запросе: {len(parsed)} (максимум {settings.batch_max_items})"
+        )
+
+    errors: List[Dict[str, Any]] = []
+    indexes, events = [], []
+    for index, payload in parsed:
+        if isinstance(payload, Exception):
+            errors.append({"index": index, "error": str(payload)})
+            continue
+        try:
+            events.append(SaleEvent.model_validate(payload).model_dump())
+            indexes.append(index)
+        except ValidationError as e:
+            errors.append({"index": index, "error": validation_message(e)})
+
+    try:
+        results = await sales_ingest.submit(events)
+    except IngestOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Ошибка приема событий продаж: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+    accepted = duplicates = 0
+    for index, result in zip(indexes, results):
+        if result["status"] == "ok":
+            accepted += 1
+        elif result["status"] == "duplicate":
+            duplicates += 1
+        else:
+            errors.append({"index": index, "error": result["error"]})
+    errors.sort(key=lambda item: item["index"])
+
+    return {
+        "received": len(parsed),
+        "accepted": accepted,
+        "duplicates": duplicates,
+        "rejected": len(errors),
+        "errors": errors,
+    }
+
+@router.get("/events/status")
+async def ingest_status():
+    """Состояние буфера приема событий текущего воркера"""
+    return sales_ingest.status()
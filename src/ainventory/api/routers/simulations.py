@@ -0,0 +1,154 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import threading
+
+from ...database.connection import get_db, get_db_context
+from ...database.models import SimulationRun
+from ...services.scheduler import PRIORITY_LOW, job_scheduler
+from ..schemas import SimulationRunCreate, SimulationRunResponse
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Метрики сценариев, сравниваемые между запусками
+COMPARED_METRICS = ("fill_rate", "lost_sales", "stockout_days", "average_inventory", "holding_cost", "orders")
+
+def run_response(run: SimulationRun, include_results: bool = True) -> Dict[str, Any]:
+    return {
+        "id": run.id,
+        "name": run.name,
+        "status": run.status,
+        "demand_source": run.demand_source,
+        "parameters": json.loads(run.parameters) if run.parameters else {},
+        "results": json.loads(run.results) if include_results and run.results else None,
+        "items_simulated": run.items_simulated or 0,
+        "error_message": run.error_message,
+        "duration_seconds": run.duration_seconds,
+        "created_at": run.created_at,
+        "completed_at": run.completed_at,
+    }
+
+@router.post("/", response_model=SimulationRunResponse)
+async def create_simulation(
+    request: SimulationRunCreate,
+    db: Session = Depends(get_db)
+):
+    """Запуск симуляции политик пополнения по всем позициям инвентаря (фоновая задача)"""
+    # numpy и pandas загружаются при первом запуске симуляции, а не при старте API
+    from ...services.simulation import DEMAND_SOURCES, INITIAL_STOCK, POLICIES, resolve_parameters
+    
+    if request.demand_source not in DEMAND_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый источник спроса: {request.demand_source}")
+    if request.demand_source == "forecast" and not request.forecast_model:
+        raise HTTPException(status_code=400, detail="Для demand_source=forecast нужна forecast_model")
+    if request.initial_stock not in INITIAL_STOCK:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый начальный остаток: {request.initial_stock}")
+    names = [scenario.name for scenario in request.scenarios]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Имена сценариев должны быть уникальными")
+    unknown = [scenario.policy for scenario in request.scenarios if scenario.policy not in POLICIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая политика: {', '.join(unknown)}")
+
+    try:
+        parameters = resolve_parameters(request.model_dump())
+        run = SimulationRun(
+            name=request.name,
+            status="pending",
+            demand_source=request.demand_source,
+            parameters=json.dumps(parameters)
+        )
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+
+        job_scheduler.submit("simulation", {"run_id": run.id})
+        return run_response(run)
+
+    except Exception as e:
+        logger.error(f"Ошибка создания симуляции: {e}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+async def simulation_job(run_id: int, cancel_event: Optional[threading.Event] = None):
+    """Задача планировщика: выполнение запуска симуляции"""
+    from ...services.simulation import run_simulation
+
+    await run_simulation(run_id, cancel_event)
+
+def simulation_cancelled(parameters: Dict[str, Any]):
+    with get_db_context() as db:
+        run = db.query(SimulationRun).filter(SimulationRun.id == parameters["run_id"]).first()
+        if run and run.status in ("pending", "running"):
+            run.status = "failed"
+            run.error_message = "Симуляция отменена"
+
+job_scheduler.register(
+    "simulation", "report", simulation_job, PRIORITY_LOW,
+    event_job=lambda parameters: f"simulation:{parameters['run_id']}", on_cancel=simulation_cancelled
+)
+
+@router.get("/", response_model=List[SimulationRunResponse])
+async def get_simulations(
+    status: Optional[str] = Query(None, description="Фильтр по статусу"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """Список запусков симуляции (без результатов)"""
+    query = db.query(SimulationRun)
+    if status:
+        query = query.filter(SimulationRun.status == status)
+    runs = query.order_by(SimulationRun.created_at.desc(), SimulationRun.id.desc()).offset(offset).limit(limit).all()
+    return [run_response(run, include_results=False) for run in runs]
+
+@router.get("/compare")
+async def compare_simulations(
+    run_ids: List[int] = Query(..., description="ID запусков"),
+    db: Session = Depends(get_db)
+):
+    """Сравнение сценариев завершенных запусков; разница считается от первого сценария первого запуска"""
+    runs = {run.id: run for run in db.query(SimulationRun).filter(SimulationRun.id.in_(run_ids)).all()}
+    missing = [run_id for run_id in run_ids if run_id not in runs]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Запуски не найдены: {', '.join(map(str, missing))}")
+    not_completed = [run_id for run_id in run_ids if runs[run_id].status != "completed"]
+    if not_completed:
+        raise HTTPException(status_code=400, detail=f"Запуски не завершены: {', '.join(map(str, not_completed))}")
+
+    rows = []
+    for run_id in run_ids:
+        results = json.loads(runs[run_id].results)
+        for name, scenario in results["scenarios"].items():
+            rows.append({
+                "run_id": run_id,
+                "run_name": runs[run_id].name,
+                "scenario": name,
+                "policy": scenario["policy"],
+                **{metric: scenario["summary"][metric] for metric in COMPARED_METRICS},
+            })
+
+    baseline = rows[0] if rows else None
+    for row in rows:
+        row["delta"] = {metric: row[metric] - baseline[metric] for metric in COMPARED_METRICS}
+    return {"baseline": {"run_id": baseline["run_id"], "scenario": baseline["scenario"]} if baseline else None, "scenarios": rows}
+
+@router.get("/{run_id}", response_model=SimulationRunResponse)
+async def get_simulation(run_id: int, db: Session = Depends(get_db)):
+    """Запуск симуляции с результатами по сценариям"""
+    run = db.query(SimulationRun).filter(SimulationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Запуск симуляции не найден")
+    return run_response(run)
+
+@router.delete("/{run_id}")
+async def delete_simulation(run_id: int, db: Session = Depends(get_db)):
+    """Удаление запуска симуляции"""
+    run = db.query(SimulationRun).filter(SimulationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Запуск симуляции не найден")
+    db.delete(run)
+    db.commit()
+    return {"message": "Запуск симуляции удален"}
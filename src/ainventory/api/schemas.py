@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
 
 # Базовые схемы
@@ -121,8 +121,22 @@ class InventoryItemUpdate(InventoryItemBase):
     product_id: Optional[int] = None
     warehouse_id: Optional[int] = None
 
+class InventoryItemBatchUpdate(InventoryItemUpdate):
+    id: int
+
+class InventoryItemBatch(BaseModel):
+    create: List[InventoryItemCreate] = []
+    update: List[InventoryItemBatchUpdate] = []
+    delete: List[int] = []
+    atomic: bool = False
+
 class InventoryItemResponse(BaseModel):
     id: int
+    abc_class: Optional[str] = None
+    xyz_class: Optional[str] = None
+    revenue_share: Optional[float] = None
+    demand_cv: Optional[float] = None
+    classified_at: Optional[datetime] = None
     last_updated: Optional[datetime]
     created_at: datetime
     product: ProductResponse
@@ -152,6 +166,18 @@ class SaleUpdate(SaleBase):
     quantity: Optional[float] = Field(None, gt=0)
     revenue: Optional[float] = Field(None, gt=0)
 
+class SaleEvent(BaseModel):
+    """Событие продажи от кассы: продукт по product_id или sku"""
+    product_id: Optional[int] = None
+    sku: Optional[str] = Field(None, max_length=50)
+    warehouse_id: int
+    sale_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    quantity: float = Field(..., gt=0)
+    revenue: float = Field(default=0, ge=0)
+    cost: Optional[float] = Field(None, ge=0)
+    customer_id: Optional[str] = Field(None, max_length=100)
+    transaction_id: Optional[str] = Field(None, max_length=100)
+
 class SaleResponse(BaseModel):
     id: int
     created_at: datetime
@@ -183,6 +209,16 @@ class ForecastUpdate(ForecastBase):
     forecast_date: Optional[datetime] = None
     forecast_value: Optional[float] = Field(None, ge=0)
 
+class ForecastBatchUpdate(ForecastUpdate):
+    id: int
+    model_name: Optional[str] = Field(None, min_length=1, max_length=100)
+
+class ForecastBatch(BaseModel):
+    create: List[ForecastCreate] = []
+    update: List[ForecastBatchUpdate] = []
+    delete: List[int] = []
+    atomic: bool = False
+
 class ForecastResponse(BaseModel):
     id: int
     created_at: datetime
@@ -191,12 +227,50 @@ class ForecastResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Результаты пакетных операций
+class BatchItemResult(BaseModel):
+    operation: str
+    index: int
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    applied: bool
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+    results: List[BatchItemResult]
+
+# Доступное к обещанию (ATP) и резервы
+class AtpLine(BaseModel):
+    product_id: Optional[int] = None
+    sku: Optional[str] = Field(None, max_length=50)
+    quantity: float = Field(..., gt=0)
+
+class AtpCheckRequest(BaseModel):
+    lines: List[AtpLine] = Field(..., min_length=1)
+    warehouse_ids: Optional[List[int]] = None
+
+class ReservationCreate(BaseModel):
+    reference: str = Field(..., min_length=1, max_length=100)
+    warehouse_id: int
+    lines: List[AtpLine] = Field(..., min_length=1)
+    ttl_seconds: Optional[int] = Field(None, gt=0)
+
+# Схемы для выбросов продаж
+class AnomalyReview(BaseModel):
+    status: str = Field(..., pattern="^(open|confirmed|dismissed)$")
+    comment: Optional[str] = Field(None, max_length=500)
+
 # Схемы для загрузки данных
 class DataUploadBase(BaseModel):
     filename: str
     file_path: str
     file_size: Optional[int] = None
     file_type: Optional[str] = None
+    file_hash: Optional[str] = None
     status: str = "uploaded"
     records_processed: int = 0
     error_message: Optional[str] = None
@@ -216,6 +290,22 @@ class DataUploadResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Схемы для поэтапной загрузки
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    file_type: str = Field(..., description="Тип данных в файле: sales, inventory, products")
+    warehouse_id: Optional[int] = None
+    total_size: Optional[int] = Field(None, ge=0)
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    filename: str
+    file_type: str
+    warehouse_id: Optional[int] = None
+    total_size: Optional[int] = None
+    received: int
+    chunk_size: int
+
 # Схемы для анализа
 class InventoryAnalytics(BaseModel):
     total_products: int
@@ -249,6 +339,78 @@ class FileUploadResponse(BaseModel):
     records_processed: int
     errors: List[str] = []
     file_id: Optional[int] = None
+    job: Optional[str] = Field(None, description="Задача для подписки на события: /api/v1/events/stream?job=...")
+    scheduled_job: Optional[int] = Field(None, description="Задача планировщика: /api/v1/jobs/{id}")
+
+# Схемы для симуляции политик пополнения
+class SimulationScenario(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    policy: str = Field("settings", description="settings - уровни по параметрам сценария, current - точки заказа позиций")
+    safety_stock_days: Optional[float] = Field(None, ge=0, description="По умолчанию default_safety_stock_days")
+    reorder_point_multiplier: Optional[float] = Field(None, ge=0, description="По умолчанию default_reorder_point_multiplier")
+    order_cycle_days: Optional[float] = Field(None, ge=0, description="По умолчанию simulation_order_cycle_days")
+
+class SimulationRunCreate(BaseModel):
+    name: Optional[str] = Field(None, max_length=200)
+    demand_source: str = Field("history", description="history - история продаж, forecast - сохраненные прогнозы")
+    forecast_model: Optional[str] = Field(None, description="Модель прогноза для demand_source=forecast")
+    days: int = Field(365, ge=1, le=1095)
+    warehouse_id: Optional[int] = None
+    initial_stock: str = Field("policy", description="policy - уровень пополнения, current - текущий остаток")
+    holding_cost_rate: Optional[float] = Field(None, ge=0, description="Годовая стоимость хранения в долях себестоимости")
+    scenarios: List[SimulationScenario] = Field(
+        default_factory=lambda: [SimulationScenario(name="settings")], min_length=1, max_length=20
+    )
+
+class SimulationRunResponse(BaseModel):
+    id: int
+    name: Optional[str] = None
+    status: str
+    demand_source: str
+    parameters: Dict[str, Any]
+    results: Optional[Dict[str, Any]] = None
+    items_simulated: int = 0
+    error_message: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+# Схемы планировщика задач
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    job_class: str
+    priority: int
+    status: str
+    parameters: Dict[str, Any]
+    event_job: Optional[str] = None
+    schedule_id: Optional[int] = None
+    cancel_requested: bool = False
+    attempts: int = 0
+    owner: Optional[str] = None
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class JobScheduleCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    cron: str = Field(..., description="Минута час день месяц день_недели (UTC), например '0 3 * * *'")
+    kind: str = Field(..., description="Тип задачи: forecast_series, forecast_global, simulation, classification")
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    priority: Optional[int] = Field(None, ge=0, description="Меньше - раньше; по умолчанию приоритет типа задачи")
+    enabled: bool = True
+
+class JobScheduleResponse(BaseModel):
+    id: int
+    name: str
+    cron: str
+    kind: str
+    parameters: Dict[str, Any]
+    priority: Optional[int] = None
+    enabled: bool
+    next_run_at: datetime
+    last_run_at: Optional[datetime] = None
 
 # Схемы для поиска и фильтрации
 class SearchParams(BaseModel):
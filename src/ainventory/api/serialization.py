@@ -0,0 +1,57 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(value: Any) -> Any:
+    """Типы, которые orjson не сериализует сам"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "__table__"):
+        return orm_to_dict(value)
+    if hasattr(value, "item"):
+        # Скаляры numpy/pandas, не покрытые OPT_SERIALIZE_NUMPY
+        return value.item()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ через orjson (datetime, numpy и Decimal без предварительного jsonable_encoder)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def trusted_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """Ответ из данных, собранных самим сервером (строки запросов, словари отчетов).
+
+    Возвращенный Response минует проверку response_model и jsonable_encoder:
+    для больших выборок это основная часть времени ответа.
+    """
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+def orm_to_dict(obj: Any, exclude: Sequence[str] = ()) -> Dict[str, Any]:
+    """Значения колонок ORM-объекта (связи не загружаются)"""
+    state = obj.__dict__
+    return {
+        column.key: state[column.key] if column.key in state else getattr(obj, column.key)
+        for column in obj.__table__.columns
+        if column.key not in exclude
+    }
+
+def rows_to_dicts(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Строки запроса (Row) в словари по именам колонок"""
+    rows = list(rows)
+    if not rows:
+        return []
+    keys = list(rows[0]._fields)
+    return [dict(zip(keys, row)) for row in rows]
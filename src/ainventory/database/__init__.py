@@ -1 +1,4 @@
 # База данных
+# Учет версий таблиц (ETag ответов API) и маршрутизация чтения на реплику
+# подключаются к сессиям при импорте пакета
+from . import versions, replica
@@ -1,24 +1,143 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
 from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
 import logging
-from typing import Generator
+import threading
+import time
+from typing import Any, Callable, Dict, Generator, Optional, Tuple
 
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+def compute_pool_limits(workers: int, max_connections: int, reserved_connections: int) -> Tuple[int, int]:
+    """Размер пула на один воркер, чтобы все воркеры вместе не превысили max_connections БД"""
+    workers = max(workers, 1)
+    budget = max(max_connections - reserved_connections, workers)
+    per_worker = max(budget // workers, 1)
+    # Две трети соединений держим постоянно, остальное - временный overflow под пики
+    pool_size = max(per_worker * 2 // 3, 1)
+    max_overflow = per_worker - pool_size
+    return pool_size, max_overflow
+
+class PoolStats:
+    """Счетчики ожидания соединений из пула"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_total,
+                "wait_seconds_max": self.wait_max,
+                "wait_seconds_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+pool_stats = PoolStats()
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, замеряющий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+def _engine_options(database_url: str) -> Dict[str, Any]:
+    """Параметры движка и пула соединений из настроек"""
+    options: Dict[str, Any] = {
+        "echo": settings.database_echo,
+        "pool_pre_ping": True,
+    }
+
+    if database_url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if database_url in ("sqlite://", "sqlite:///:memory:"):
+            options["poolclass"] = StaticPool
+            return options
+
+    if settings.db_pgbouncer:
+        # PgBouncer (transaction pooling) сам держит пул: на стороне приложения
+        # соединения не кешируем и не используем серверные prepared statements
+        options["poolclass"] = NullPool
+        if database_url.startswith("postgresql+psycopg:"):
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+
+    pool_size, max_overflow = compute_pool_limits(
+        settings.api_workers,
+        settings.db_max_connections,
+        settings.db_reserved_connections
+    )
+    if settings.db_pool_size is not None:
+        pool_size = settings.db_pool_size
+    if settings.db_max_overflow is not None:
+        max_overflow = settings.db_max_overflow
+
+    total = (pool_size + max_overflow) * max(settings.api_workers, 1)
+    if total > settings.db_max_connections - settings.db_reserved_connections:
+        logger.warning(
+            f"Пулы всех воркеров могут открыть {total} соединений, "
+            f"что превышает лимит БД {settings.db_max_connections} (резерв {settings.db_reserved_connections})"
+        )
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    return options
+
 # Создание движка базы данных
-engine = create_engine(
-    settings.database_url,
-    echo=settings.database_echo,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=10,
-    max_overflow=20
-)
+engine = create_engine(settings.database_url, **_engine_options(settings.database_url))
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.record_connect()
+    if engine.dialect.name == "sqlite":
+        _ensure_sqlite_math(dbapi_connection)
+
+def _ensure_sqlite_math(dbapi_connection):
+    """sqrt для ABC/XYZ-классификации в сборках SQLite без математических функций"""
+    import math
+    import sqlite3
+
+    try:
+        dbapi_connection.execute("SELECT sqrt(1)")
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function("sqrt", 1, lambda value: None if value is None else math.sqrt(value), deterministic=True)
 
 # Создание фабрики сессий
 SessionLocal = sessionmaker(
@@ -30,6 +149,48 @@ SessionLocal = sessionmaker(
 # Базовый класс для моделей
 Base = declarative_base()
 
+# Бюджет времени одного SQL-запроса маршрута, мс (api/admission.py). Задается на время
+# HTTP-запроса и действует на все транзакции, начатые в нем, включая сессии реплики
+_statement_timeout_ms: ContextVar[Optional[int]] = ContextVar("statement_timeout_ms", default=None)
+
+@contextmanager
+def statement_timeout(milliseconds: Optional[int]) -> Generator[None, None, None]:
+    token = _statement_timeout_ms.set(milliseconds)
+    try:
+        yield
+    finally:
+        _statement_timeout_ms.reset(token)
+
+def current_statement_timeout() -> Optional[int]:
+    return _statement_timeout_ms.get()
+
+def set_statement_timeout(milliseconds: Optional[int]) -> Optional[int]:
+    """Бюджет для текущего контекста; возвращает прежнее значение"""
+    previous = _statement_timeout_ms.get()
+    _statement_timeout_ms.set(milliseconds)
+    return previous
+
+def _run_with_statement_timeout(milliseconds: Optional[int], func: Callable[[], Any]) -> Any:
+    with statement_timeout(milliseconds):
+        return func()
+
+def with_statement_timeout(func: Callable[[], Any]) -> Callable[[], Any]:
+    """Функция для пула потоков с бюджетом времени запросов текущего маршрута
+    (run_in_executor не переносит контекст запроса в поток)"""
+    return functools.partial(_run_with_statement_timeout, current_statement_timeout(), func)
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session: Session, transaction, connection):
+    milliseconds = _statement_timeout_ms.get()
+    # SET LOCAL действует до конца транзакции: соединение возвращается в пул (и в PgBouncer) без него
+    if milliseconds and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(milliseconds)}")
+
+def is_statement_timeout(error: BaseException) -> bool:
+    """Запрос отменен PostgreSQL по statement_timeout (SQLSTATE 57014)"""
+    original = getattr(error, "orig", None)
+    return getattr(original, "pgcode", None) == "57014" or getattr(original, "sqlstate", None) == "57014"
+
 def get_db() -> Generator[Session, None, None]:
     """Получение сессии базы данных"""
     db = SessionLocal()
@@ -56,11 +217,27 @@ def get_db_context() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+def pool_status() -> Dict[str, Any]:
+    """Состояние пула соединений текущего воркера"""
+    pool = engine.pool
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    status.update(pool_stats.snapshot())
+    return status
+
 def test_connection() -> bool:
     """Тестирование подключения к базе данных"""
     try:
         with engine.connect() as conn:
-            conn.execute("SELECT 1")
+            conn.execute(text("SELECT 1"))
         logger.info("Database connection successful")
         return True
     except Exception as e:
@@ -1,5 +1,8 @@
+from sqlalchemy import inspect, text
+
 from .connection import engine, Base, get_db_context
 from .models import *
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,8 +12,13 @@ async def init_db():
     try:
         # Создание всех таблиц
         Base.metadata.create_all(bind=engine)
+        add_missing_columns()
         logger.info("Database tables created successfully")
         
+        # Дневные итоги для продаж, загруженных до появления таблицы daily_sales
+        backfill_daily_sales()
+        backfill_series_watermarks()
+        
         # Создание начальных данных
         await create_initial_data()
         logger.info("Initial data created successfully")
@@ -19,6 +27,39 @@ async def init_db():
         logger.error(f"Database initialization failed: {e}")
         raise
 
+def add_missing_columns():
+    """Колонки и индексы, добавленные в модели после создания таблиц (create_all их не добавляет)"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        quote = connection.dialect.identifier_preparer.quote
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+def backfill_daily_sales():
+    """Пересчет daily_sales из sales, если итогов еще нет"""
+    from ..services.rollups import rebuild_daily_sales
+    
+    with get_db_context() as db:
+        if db.query(DailySales).first() is None and db.query(Sale).first() is not None:
+            rebuild_daily_sales(db)
+
+def backfill_series_watermarks():
+    """Водяные знаки данных для рядов, загруженных до появления series_watermarks"""
+    from ..services.watermarks import backfill_series_watermarks as backfill
+    
+    with get_db_context() as db:
+        backfill(db)
+
 async def create_initial_data():
     """Создание начальных данных"""
     from .connection import get_db_context
@@ -72,3 +113,8 @@ def reset_db():
     except Exception as e:
         logger.error(f"Database reset failed: {e}")
         raise
+
+if __name__ == "__main__":
+    # Явный шаг миграции перед запуском API: python -m ainventory.database.init_db
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(init_db())
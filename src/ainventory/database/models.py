@@ -1,11 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Index
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Text, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import uuid
 
-Base = declarative_base()
+from .connection import Base
 
 class Warehouse(Base):
     __tablename__ = "warehouses"
@@ -89,6 +88,13 @@ class InventoryItem(Base):
     reorder_point = Column(Float, default=0)
     safety_stock = Column(Float, default=0)
     lead_time_days = Column(Integer, default=0)
+    # ABC/XYZ-классификация (services/classification.py): класс по доле в выручке
+    # склада, класс по вариации спроса, накопленная доля выручки и коэффициент вариации
+    abc_class = Column(String(1))
+    xyz_class = Column(String(1))
+    revenue_share = Column(Float)
+    demand_cv = Column(Float)
+    classified_at = Column(DateTime(timezone=True))
     last_updated = Column(DateTime(timezone=True), onupdate=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -100,6 +106,7 @@ class InventoryItem(Base):
     __table_args__ = (
         Index('idx_inventory_product_warehouse', 'product_id', 'warehouse_id'),
         Index('idx_inventory_current_stock', 'current_stock'),
+        Index('idx_inventory_abc_xyz', 'abc_class', 'xyz_class'),
     )
 
 class Sale(Base):
@@ -127,6 +134,96 @@ class Sale(Base):
         Index('idx_sale_warehouse_date', 'warehouse_id', 'sale_date'),
     )
 
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+    
+    # Дневные итоги продаж продукта на складе: обновляются в той же транзакции,
+    # что и запись продаж (загрузка файлов и поток событий)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    sale_day = Column(Date, primary_key=True)
+    quantity = Column(Float, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_daily_sales_day', 'sale_day'),
+    )
+
+class SeriesWatermark(Base):
+    __tablename__ = "series_watermarks"
+    
+    # Версия входных данных ряда (продукт x склад): увеличивается при каждом изменении
+    # продаж или отметок выбросов ряда (services/watermarks.py)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    data_version = Column(BigInteger, nullable=False, default=1)
+    changed_at = Column(DateTime(timezone=True), nullable=False)
+
+class SeriesForecastState(Base):
+    __tablename__ = "series_forecast_state"
+    
+    # Последний прогноз ряда моделью: версия данных и хеш конфигурации, по которым он построен
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    model_name = Column(String(100), primary_key=True)
+    data_version = Column(BigInteger, nullable=False)
+    config_hash = Column(String(16), nullable=False)
+    forecasted_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_forecast_state_model', 'model_name', 'forecasted_at'),
+    )
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    
+    # Резерв остатка под заказ: уменьшает доступное к обещанию (ATP) до снятия или истечения
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)
+    quantity = Column(Float, nullable=False)
+    reference = Column(String(100), nullable=False)  # номер заказа
+    status = Column(String(20), nullable=False, default="active")  # active, released
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_reservation_item_status', 'product_id', 'warehouse_id', 'status'),
+        Index('idx_reservation_reference', 'reference'),
+        Index('idx_reservation_expires', 'expires_at'),
+    )
+
+class SalesAnomaly(Base):
+    __tablename__ = "sales_anomalies"
+    
+    # Выброс дневных продаж ряда (services/anomalies.py): open и confirmed обрабатываются
+    # во входе моделей прогноза (settings.anomaly_treatment), dismissed - признан нормальным спросом
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)
+    sale_day = Column(Date, nullable=False)
+    kind = Column(String(20), nullable=False)  # spike, negative
+    quantity = Column(Float, nullable=False)
+    expected = Column(Float, nullable=False)
+    upper_limit = Column(Float, nullable=False)
+    score = Column(Float, nullable=False)
+    status = Column(String(20), nullable=False, default="open")  # open, confirmed, dismissed
+    comment = Column(Text)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    reviewed_at = Column(DateTime(timezone=True))
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_anomaly_series_day', 'product_id', 'warehouse_id', 'sale_day', unique=True),
+        Index('idx_anomaly_status', 'status'),
+    )
+
 class Forecast(Base):
     __tablename__ = "forecasts"
     
@@ -161,6 +258,7 @@ class DataUpload(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer)
     file_type = Column(String(100))
+    file_hash = Column(String(64))  # SHA-256 содержимого
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String(50), default="uploaded")  # uploaded, processing, completed, failed
     records_processed = Column(Integer, default=0)
@@ -171,4 +269,82 @@ class DataUpload(Base):
     __table_args__ = (
         Index('idx_upload_status', 'status'),
         Index('idx_upload_date', 'upload_date'),
+        Index('idx_upload_hash', 'file_hash'),
+    )
+
+class SimulationRun(Base):
+    __tablename__ = "simulation_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200))
+    status = Column(String(50), default="pending")  # pending, running, completed, failed
+    demand_source = Column(String(50), nullable=False)  # history, forecast
+    parameters = Column(Text)  # JSON string
+    results = Column(Text)  # JSON string
+    items_simulated = Column(Integer, default=0)
+    error_message = Column(Text)
+    duration_seconds = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_simulation_status', 'status'),
+        Index('idx_simulation_created', 'created_at'),
+    )
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    
+    # Счетчик изменений таблицы: увеличивается после каждой фиксации, изменившей ее строки
+    table_name = Column(String(100), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+class ScheduledJob(Base):
+    __tablename__ = "scheduled_jobs"
+    
+    # Фоновая задача планировщика: загрузка, прогноз, отчет; выполняется лидером по приоритету
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # upload, forecast, forecast_series, forecast_global, simulation, classification
+    job_class = Column(String(20), nullable=False)  # import, forecast, report
+    priority = Column(Integer, nullable=False, default=20)  # меньше - раньше
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    parameters = Column(Text)  # JSON string
+    event_job = Column(String(200))  # идентификатор задачи в потоке событий
+    schedule_id = Column(Integer, ForeignKey("job_schedules.id", ondelete="SET NULL"))
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    owner = Column(String(100))  # экземпляр, выполняющий задачу
+    heartbeat_at = Column(DateTime(timezone=True))  # последняя отметка владельца, что задача выполняется
+    error_message = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_job_queue', 'status', 'priority', 'id'),
+        Index('idx_job_class_status', 'job_class', 'status'),
+        Index('idx_job_created', 'created_at'),
+    )
+
+class JobSchedule(Base):
+    __tablename__ = "job_schedules"
+    
+    # Повторяющаяся задача по расписанию cron (минута час день месяц день_недели, UTC)
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), nullable=False, unique=True)
+    cron = Column(String(100), nullable=False)
+    kind = Column(String(50), nullable=False)
+    parameters = Column(Text)  # JSON string
+    priority = Column(Integer)  # None - приоритет типа задачи
+    enabled = Column(Boolean, nullable=False, default=True)
+    next_run_at = Column(DateTime(timezone=True), nullable=False)
+    last_run_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_schedule_due', 'enabled', 'next_run_at'),
     )
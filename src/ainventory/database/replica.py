@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Generator, Optional
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..config import settings
+from .connection import SessionLocal, _engine_options
+
+logger = logging.getLogger(__name__)
+
+# Задержка репликации PostgreSQL; 0, если реплика воспроизвела весь полученный WAL
+# (pg_last_xact_replay_timestamp при простое primary устаревает, хотя отставания нет)
+POSTGRES_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+class ReplicaMonitor:
+    """Задержка реплики с кешированием на check_interval секунд.
+
+    Если реплика недоступна или отстает больше max_lag, чтение идет с primary.
+    """
+
+    def __init__(self, engine, max_lag: float, check_interval: float):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag: Optional[float] = None
+        self.fallbacks = 0
+
+    def _measure(self) -> Optional[float]:
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name != "postgresql":
+                    # Локальная БД вместо реплики (разработка, тесты): отставания нет
+                    conn.execute(text("SELECT 1"))
+                    return 0.0
+                return float(conn.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0.0)
+        except Exception as e:
+            logger.warning(f"Реплика недоступна: {e}")
+            return None
+
+    def lag(self) -> Optional[float]:
+        """Задержка в секундах; None - реплика недоступна"""
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._lag
+            # Пока идет проверка, остальные запросы используют прежнее значение
+            self._checked_at = time.monotonic()
+        lag = self._measure()
+        with self._lock:
+            self._lag = lag
+        return lag
+
+    def usable(self) -> bool:
+        lag = self.lag()
+        usable = lag is not None and lag <= self.max_lag
+        if not usable:
+            with self._lock:
+                self.fallbacks += 1
+        return usable
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"lag_seconds": self._lag, "max_lag_seconds": self.max_lag, "fallbacks": self.fallbacks}
+
+replica_engine = (
+    create_engine(settings.database_replica_url, **_engine_options(settings.database_replica_url))
+    if settings.database_replica_url else None
+)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+replica_monitor = (
+    ReplicaMonitor(replica_engine, settings.db_replica_max_lag_seconds, settings.db_replica_lag_check_interval)
+    if replica_engine else None
+)
+
+if ReplicaSessionLocal is not None:
+    @event.listens_for(ReplicaSessionLocal, "before_flush")
+    def _reject_replica_writes(session, flush_context, instances):
+        raise RuntimeError("Сессия реплики только для чтения")
+
+# Состояние HTTP-запроса для read-your-writes: время последней записи клиента
+# (из cookie) и отметка о записи в текущем запросе. Словарь изменяемый, чтобы
+# отметка из пула потоков была видна middleware.
+_request_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar("replica_request_state", default=None)
+
+@contextmanager
+def request_scope(last_write: Optional[float] = None) -> Generator[Dict[str, Any], None, None]:
+    state = {"last_write": last_write, "wrote": None}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+# insert=True: до обработчика versions.py, который забирает список измененных таблиц
+@event.listens_for(SessionLocal, "after_commit", insert=True)
+def _remember_write(session: Session):
+    state = _request_state.get()
+    if state is not None and session.info.get("changed_tables"):
+        state["wrote"] = time.time()
+
+def _sticky_to_primary() -> bool:
+    state = _request_state.get()
+    if state is None:
+        return False
+    if state["wrote"] is not None:
+        return True
+    return state["last_write"] is not None and time.time() - state["last_write"] < settings.db_read_your_writes_seconds
+
+def client_wrote_recently() -> bool:
+    """Текущий HTTP-запрос должен видеть собственные записи (читается с primary)"""
+    return _sticky_to_primary()
+
+def read_session() -> Session:
+    """Сессия для чтения: реплика, если она настроена, не отстает и клиент недавно не писал"""
+    if ReplicaSessionLocal is not None and not _sticky_to_primary() and replica_monitor.usable():
+        return ReplicaSessionLocal()
+    return SessionLocal()
+
+def get_read_db() -> Generator[Session, None, None]:
+    """Сессия только для чтения (аналитика, отчеты) с маршрутизацией на реплику"""
+    db = read_session()
+    try:
+        yield db
+    except Exception as e:
+        logger.error(f"Database session error: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@contextmanager
+def get_read_db_context() -> Generator[Session, None, None]:
+    """Контекстный менеджер сессии только для чтения (фоновые задачи)"""
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+def replica_status() -> Optional[Dict[str, Any]]:
+    if replica_monitor is None:
+        return None
+    return replica_monitor.status()
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .connection import SessionLocal, engine
+from .models import TableVersion
+
+logger = logging.getLogger(__name__)
+
+_CHANGED_KEY = "changed_tables"
+
+def _mark_changed(session: Session, tables: Iterable[str]):
+    session.info.setdefault(_CHANGED_KEY, set()).update(tables)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session: Session, flush_context):
+    _mark_changed(session, {
+        obj.__table__.name
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if hasattr(obj, "__table__")
+    })
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    # Массовые insert/update/delete выполняются без flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _mark_changed(orm_execute_state.session, [table.name])
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session: Session):
+    tables = session.info.pop(_CHANGED_KEY, None)
+    if tables:
+        bump_versions(tables)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(_CHANGED_KEY, None)
+
+def bump_versions(tables: Iterable[str]):
+    """Увеличение счетчиков таблиц отдельной короткой транзакцией.
+
+    Счетчик меняется после фиксации данных, а не внутри транзакции: строка
+    table_versions не блокируется на время долгой загрузки. Читатель, успевший
+    между фиксацией и увеличением счетчика, получит старый ETag, который
+    станет недействительным сразу после увеличения.
+    """
+    now = datetime.now(timezone.utc)
+    for table in sorted(set(tables)):
+        try:
+            with engine.begin() as conn:
+                bumped = conn.execute(
+                    update(TableVersion)
+                    .where(TableVersion.table_name == table)
+                    .values(version=TableVersion.version + 1, updated_at=now)
+                ).rowcount
+                if not bumped:
+                    conn.execute(insert(TableVersion).values(table_name=table, version=1, updated_at=now))
+        except IntegrityError:
+            # Строку одновременно создал другой процесс
+            with engine.begin() as conn:
+                conn.execute(
+                    update(TableVersion)
+                    .where(TableVersion.table_name == table)
+                    .values(version=TableVersion.version + 1, updated_at=now)
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить версию таблицы {table}: {e}")
+
+def table_versions(db: Session, tables: Iterable[str]) -> Tuple[Dict[str, int], Optional[datetime]]:
+    """Версии таблиц и время последнего изменения любой из них (одним запросом по первичному ключу)"""
+    tables = sorted(set(tables))
+    if not tables:
+        return {}, None
+    rows = db.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.table_name.in_(tables))
+    ).all()
+    versions = {table: 0 for table in tables}
+    last_modified = None
+    for row in rows:
+        versions[row.table_name] = row.version
+        updated_at = row.updated_at if row.updated_at.tzinfo else row.updated_at.replace(tzinfo=timezone.utc)
+        last_modified = max(last_modified, updated_at) if last_modified else updated_at
+    return versions, last_modified
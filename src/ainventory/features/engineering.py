@@ -1,8 +1,339 @@
+import hashlib
+import logging
+import math
+import pickle
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
 import pandas as pd
 
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+SERIES_KEYS = ["product_id", "warehouse_id"]
+DATE_COL = "date"
+
 def add_time_features(df: pd.DataFrame, date_col: str) -> pd.DataFrame:
-    d = df.copy()
+    # Поверхностная копия: новые столбцы добавляются без копирования данных исходного DataFrame
+    d = df.copy(deep=False)
     dt = pd.to_datetime(d[date_col])
     d["dow"] = dt.dt.dayofweek
     d["month"] = dt.dt.month
+    d["day"] = dt.dt.day
+    d["weekofyear"] = dt.dt.isocalendar().week.astype("int32").values
+    d["is_weekend"] = (d["dow"] >= 5).astype("int8")
     return d
+
+def daily_demand(
+    sales: pd.DataFrame,
+    date_col: str = "sale_date",
+    end_date: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Дневной спрос по рядам (продукт x склад) без пропусков: от первой продажи ряда до end_date"""
+    dates = pd.to_datetime(sales[date_col], utc=True).dt.tz_localize(None).dt.normalize()
+    grouped = (
+        sales.assign(**{DATE_COL: dates})
+        .groupby(SERIES_KEYS + [DATE_COL], sort=True)[["quantity", "revenue"]]
+        .sum()
+        .reset_index()
+    )
+    if grouped.empty:
+        return grouped
+
+    end = pd.Timestamp(end_date).normalize() if end_date is not None else grouped[DATE_COL].max()
+    starts = grouped.groupby(SERIES_KEYS, sort=True)[DATE_COL].min()
+    lengths = ((end - starts).dt.days + 1).clip(lower=1).to_numpy()
+
+    # Полная сетка дат для всех рядов без цикла по рядам
+    series_index = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    grid = pd.DataFrame({
+        key: np.repeat(starts.index.get_level_values(key).to_numpy(), lengths) for key in SERIES_KEYS
+    })
+    grid[DATE_COL] = starts.to_numpy()[series_index] + pd.to_timedelta(offsets, unit="D")
+
+    dense = grid.merge(grouped, on=SERIES_KEYS + [DATE_COL], how="left")
+    dense[["quantity", "revenue"]] = dense[["quantity", "revenue"]].fillna(0.0)
+    return dense
+
+class FeatureConfig:
+    """Параметры признаков; version меняется при любом изменении параметров"""
+
+    def __init__(
+        self,
+        lags: Sequence[int] = (1, 7, 14, 28),
+        windows: Sequence[int] = (7, 28),
+        price_window: int = 28,
+        promo_threshold: float = 0.1,
+        stockout_alpha: float = 0.01,
+        holiday_country: Optional[str] = None
+    ):
+        self.lags = tuple(sorted(lags))
+        self.windows = tuple(sorted(windows))
+        self.price_window = price_window
+        self.promo_threshold = promo_threshold
+        self.stockout_alpha = stockout_alpha
+        self.holiday_country = holiday_country or settings.holiday_country
+
+    @property
+    def version(self) -> str:
+        params = (self.lags, self.windows, self.price_window, self.promo_threshold, self.stockout_alpha, self.holiday_country)
+        return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+
+    @property
+    def lookback(self) -> int:
+        """Сколько предыдущих дней нужно для расчета признаков нового дня"""
+        return max(max(self.lags, default=0), self.zero_window + 1, self.price_window + 1)
+
+    @property
+    def zero_window(self) -> int:
+        """Окно оценки доли дней без продаж для флага отсутствия товара"""
+        return self.windows[-1] if self.windows else 28
+
+def _group_ids(df: pd.DataFrame) -> np.ndarray:
+    return df.groupby(SERIES_KEYS, sort=False).ngroup().to_numpy()
+
+def _rolling_sum(values: pd.Series, group_ids: np.ndarray, window: int) -> pd.Series:
+    """Скользящая сумма внутри рядов через кумулятивные суммы (NaN не учитываются)"""
+    cumulative = values.fillna(0.0).groupby(group_ids).cumsum()
+    return cumulative - cumulative.groupby(group_ids).shift(window).fillna(0.0)
+
+def _rolling_mean_std(values: pd.Series, group_ids: np.ndarray, window: int):
+    present = values.notna().astype("float64")
+    count = _rolling_sum(present, group_ids, window)
+    total = _rolling_sum(values, group_ids, window)
+    squares = _rolling_sum(values * values, group_ids, window)
+    mean = total / count.where(count > 0)
+    variance = (squares - total * mean) / (count - 1).where(count > 1)
+    return mean, np.sqrt(variance.clip(lower=0.0))
+
+def holiday_calendar(country: str, years: List[int]) -> pd.DatetimeIndex:
+    """Даты праздников страны за указанные годы"""
+    import holidays
+
+    try:
+        calendar = holidays.country_holidays(country, years=years)
+    except NotImplementedError:
+        logger.warning(f"Календарь праздников для страны {country} недоступен")
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(sorted(calendar.keys()))
+
+def _stateful_features(df: pd.DataFrame, config: FeatureConfig, state: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Признаки, зависящие от неограниченной истории ряда: последняя известная цена и серии нулевых дней.
+
+    state - значения unit_price, zero_run и run_zero_share на день перед первой строкой ряда.
+    """
+    group_ids = _group_ids(df)
+    quantity = df["quantity"].astype("float64")
+    seed = df[SERIES_KEYS].merge(state, on=SERIES_KEYS, how="left") if state is not None and len(state) else None
+
+    # Цена и промо: цена продажи = revenue / quantity, в дни без продаж - последняя известная
+    unit_price = (df["revenue"] / quantity.where(quantity > 0)).replace([np.inf, -np.inf], np.nan)
+    df["unit_price"] = unit_price.groupby(group_ids).ffill()
+    if seed is not None:
+        df["unit_price"] = df["unit_price"].fillna(pd.Series(seed["unit_price"].to_numpy(), index=df.index))
+    df["price_ratio"] = df["unit_price"] / df["reference_price"]
+    df["is_promo"] = (df["price_ratio"] < 1 - config.promo_threshold).astype("int8")
+
+    # Цензурирование спроса: подозрение на отсутствие товара, если серия нулевых дней
+    # маловероятна при доле дней без продаж, наблюдавшейся до начала серии
+    is_sale = (quantity > 0).astype("int64")
+    run_id = is_sale.groupby(group_ids).cumsum()
+    run_keys = [group_ids, run_id.to_numpy()]
+    zero_run = (1 - is_sale).groupby(run_keys).cumsum()
+    run_zero_share = df["zero_share"].groupby(run_keys).transform("first")
+    if seed is not None:
+        # Серия, начавшаяся до первой строки, продолжается с сохраненного состояния
+        continues = pd.Series((run_id.to_numpy() == 0) & seed["zero_run"].notna().to_numpy(), index=df.index)
+        zero_run = zero_run.where(~continues, zero_run + seed["zero_run"].fillna(0).to_numpy())
+        run_zero_share = run_zero_share.where(~continues, seed["run_zero_share"].to_numpy())
+
+    df["zero_run"] = zero_run.astype("int64")
+    df["run_zero_share"] = run_zero_share
+    df["stockout_suspected"] = (
+        (quantity == 0) & (df["zero_run"] * np.log(df["run_zero_share"].fillna(1.0)) < math.log(config.stockout_alpha))
+    ).astype("int8")
+    return df
+
+def build_features(daily: pd.DataFrame, config: Optional[FeatureConfig] = None) -> pd.DataFrame:
+    """Матрица признаков для всех рядов сразу: групповые векторные операции без циклов по рядам.
+
+    daily - результат daily_demand (сплошные ряды).
+    """
+    config = config or FeatureConfig()
+    df = daily.sort_values(SERIES_KEYS + [DATE_COL], kind="stable").reset_index(drop=True)
+    df = add_time_features(df, DATE_COL)
+    group_ids = _group_ids(df)
+    quantity = df["quantity"].astype("float64")
+    by_series = quantity.groupby(group_ids)
+
+    # Лаги и скользящие статистики (только по прошлым дням, без утечки текущего)
+    for lag in config.lags:
+        df[f"lag_{lag}"] = by_series.shift(lag)
+    previous = by_series.shift(1)
+    for window in config.windows:
+        mean, std = _rolling_mean_std(previous, group_ids, window)
+        df[f"rolling_mean_{window}"] = mean
+        df[f"rolling_std_{window}"] = std
+
+    # Доля дней без продаж (со сглаживанием Лапласа) - мера прерывистости спроса
+    days = _rolling_sum(previous.notna().astype("float64"), group_ids, config.zero_window)
+    zero_days = _rolling_sum((previous == 0).astype("float64"), group_ids, config.zero_window)
+    df["zero_share"] = ((zero_days + 1) / (days + 2)).where(days > 0)
+
+    # Праздники
+    years = list(range(df[DATE_COL].dt.year.min(), df[DATE_COL].dt.year.max() + 2)) if len(df) else []
+    holiday_dates = holiday_calendar(config.holiday_country, years) if years else pd.DatetimeIndex([])
+    df["is_holiday"] = df[DATE_COL].isin(holiday_dates).astype("int8")
+    df["is_pre_holiday"] = (df[DATE_COL] + pd.Timedelta(days=1)).isin(holiday_dates).astype("int8")
+    df["is_post_holiday"] = (df[DATE_COL] - pd.Timedelta(days=1)).isin(holiday_dates).astype("int8")
+
+    # Опорная цена - средняя цена продаж за прошлые price_window дней
+    unit_price = (df["revenue"] / quantity.where(quantity > 0)).replace([np.inf, -np.inf], np.nan)
+    df["reference_price"], _ = _rolling_mean_std(unit_price.groupby(group_ids).shift(1), group_ids, config.price_window)
+
+    return _stateful_features(df, config)
+
+def _series_bounds(codes: np.ndarray) -> np.ndarray:
+    """Позиции начала рядов в отсортированном массиве кодов рядов"""
+    return np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=np.int64)
+
+def _ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Склейка диапазонов [start, stop) в один массив позиций без цикла"""
+    lengths = stops - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+def _fingerprint(codes: np.ndarray, n_series: int, daily: pd.DataFrame, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Отпечаток истории рядов: число дней, суммы спроса и выручки, сумма спроса, взвешенная по дате"""
+    weights = np.ones(len(codes)) if mask is None else mask.astype("float64")
+    quantity = daily["quantity"].to_numpy(dtype="float64") * weights
+    days = daily[DATE_COL].to_numpy().astype("datetime64[D]").astype("float64")
+    return np.column_stack([
+        np.bincount(codes, weights=weights, minlength=n_series),
+        np.bincount(codes, weights=quantity, minlength=n_series),
+        np.bincount(codes, weights=daily["revenue"].to_numpy(dtype="float64") * weights, minlength=n_series),
+        np.bincount(codes, weights=quantity * (days - days.min(initial=0.0)), minlength=n_series),
+    ])
+
+FINGERPRINT_COLUMNS = ["fp_rows", "fp_quantity", "fp_revenue", "fp_weighted"]
+
+class FeatureStore:
+    """Кеш матриц признаков по версии признаков и версии данных каждого ряда.
+
+    Для рядов, история которых не менялась, признаки считаются только для новых
+    дней (с контекстом lookback дней); измененные ряды пересчитываются целиком.
+    """
+
+    def __init__(self, config: Optional[FeatureConfig] = None, cache_dir: Optional[str] = None):
+        self.config = config or FeatureConfig()
+        self.cache_dir = Path(cache_dir or settings.feature_cache_dir)
+
+    @property
+    def path(self) -> Path:
+        return self.cache_dir / f"features_{self.config.version}.pkl"
+
+    def load(self) -> Dict[str, pd.DataFrame]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кеш признаков {self.path}: {e}")
+            return {}
+
+    def save(self, features: pd.DataFrame, meta: pd.DataFrame):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"features": features, "meta": meta}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(self.path)
+
+    def get_features(self, daily: pd.DataFrame) -> pd.DataFrame:
+        """Признаки для переданных рядов (результат daily_demand); кеш обновляется"""
+        cached = self.load()
+        cached_features = cached.get("features")
+        cached_meta = cached.get("meta")
+
+        daily = daily.sort_values(SERIES_KEYS + [DATE_COL], kind="stable").reset_index(drop=True)
+        codes = _group_ids(daily)
+        starts = _series_bounds(codes)
+        series = daily.loc[starts, SERIES_KEYS].reset_index(drop=True)
+        n_series = len(series)
+        dates = daily[DATE_COL].to_numpy()
+
+        # Ряды, чья история до watermark совпадает с кешем, переиспользуются
+        reusable = np.zeros(n_series, dtype=bool)
+        if cached_meta is not None and len(cached_meta) and n_series:
+            matched = series.merge(cached_meta, on=SERIES_KEYS, how="left")
+            watermarks = matched["watermark"].to_numpy()
+            in_history = dates <= watermarks[codes]
+            current = _fingerprint(codes, n_series, daily, in_history)
+            stored = matched[FINGERPRINT_COLUMNS].to_numpy(dtype="float64")
+            reusable = matched["watermark"].notna().to_numpy() & np.isclose(current, stored, rtol=1e-9).all(axis=1)
+
+        reuse_row = reusable[codes] if n_series else np.zeros(0, dtype=bool)
+        parts = []
+        part_codes = []
+
+        # Ряды без кеша или с измененной историей - полный расчет
+        if (~reuse_row).any():
+            parts.append(build_features(daily[~reuse_row], self.config))
+            part_codes.append(codes[~reuse_row])
+
+        if reusable.any():
+            reused = matched[reusable]
+            # После left merge с рядами без кеша start/stop становятся float64
+            reused_start = reused["start"].to_numpy(dtype="int64")
+            reused_stop = reused["stop"].to_numpy(dtype="int64")
+            positions = _ranges(reused_start, reused_stop)
+            parts.append(cached_features.iloc[positions].reset_index(drop=True))
+            part_codes.append(np.repeat(np.flatnonzero(reusable), reused_stop - reused_start))
+
+            # Новые дни: расчет с контекстом lookback предыдущих дней
+            row_watermarks = watermarks[codes]
+            context = reuse_row & (dates > row_watermarks - np.timedelta64(self.config.lookback, "D"))
+            is_new = context & (dates > row_watermarks)
+            if is_new.any():
+                computed = build_features(daily[context], self.config)
+                computed = computed[is_new[context]].reset_index(drop=True)
+                # Цена и серии нулей продолжаются с состояния последнего кешированного дня
+                state = cached_features.iloc[reused_stop - 1]
+                state = state[SERIES_KEYS + ["unit_price", "zero_run", "run_zero_share"]]
+                parts.append(_stateful_features(computed, self.config, state))
+                part_codes.append(codes[is_new])
+
+        if not parts:
+            return build_features(daily, self.config)
+        features = pd.concat(parts, ignore_index=True)
+        order = np.lexsort((features[DATE_COL].to_numpy(), np.concatenate(part_codes)))
+        features = features.iloc[order].reset_index(drop=True)
+
+        lengths = np.diff(np.r_[starts, len(daily)])
+        meta = series.copy()
+        meta["watermark"] = dates[np.r_[starts[1:], len(daily)] - 1] if n_series else []
+        meta[FINGERPRINT_COLUMNS] = _fingerprint(codes, n_series, daily)
+        meta["stop"] = np.cumsum(lengths)
+        meta["start"] = meta["stop"] - lengths
+        self.save(*self._with_untouched(features, meta, cached_features, cached_meta))
+        return features
+
+    @staticmethod
+    def _with_untouched(features, meta, cached_features, cached_meta):
+        """Ряды, не попавшие в этот запуск, остаются в кеше"""
+        if cached_meta is None or not len(cached_meta):
+            return features, meta
+        untouched = cached_meta.merge(meta[SERIES_KEYS], on=SERIES_KEYS, how="left", indicator=True)
+        untouched = untouched[untouched["_merge"] == "left_only"].drop(columns="_merge").reset_index(drop=True)
+        if not len(untouched):
+            return features, meta
+        positions = _ranges(untouched["start"].to_numpy(), untouched["stop"].to_numpy())
+        lengths = (untouched["stop"] - untouched["start"]).to_numpy()
+        untouched["stop"] = len(features) + np.cumsum(lengths)
+        untouched["start"] = untouched["stop"] - lengths
+        return (
+            pd.concat([features, cached_features.iloc[positions]], ignore_index=True),
+            pd.concat([meta, untouched], ignore_index=True),
+        )
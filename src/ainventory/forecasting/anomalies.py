@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Коды флагов в матрице результата
+NORMAL, SPIKE, NEGATIVE = 0, 1, 2
+KINDS = {SPIKE: "spike", NEGATIVE: "negative"}
+# MAD нормального распределения в единицах стандартного отклонения
+MAD_TO_STD = 1.4826
+
+
+def nan_median(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Медиана без учета NaN: сортировка (NaN уходят в конец) и выбор середины по числу значений.
+
+    На окнах (ряды x дни x окно) в разы быстрее np.nanmedian; если значений нет - NaN.
+    """
+    ordered = np.sort(values, axis=axis)
+    count = np.sum(~np.isnan(values), axis=axis, keepdims=True)
+    lower = np.take_along_axis(ordered, np.maximum(count - 1, 0) // 2, axis=axis)
+    upper = np.take_along_axis(ordered, count // 2, axis=axis)
+    upper = np.where(count > 1, upper, lower)
+    return np.squeeze((lower + upper) / 2, axis=axis)
+
+
+def rolling_median(Y: np.ndarray, window: int, chunk_rows: int = 2000) -> np.ndarray:
+    """Центрированная скользящая медиана по строкам (NaN не учитываются), блоками строк для ограничения памяти"""
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    half = window // 2
+    result = np.empty(Y.shape, dtype=np.float32)
+    for begin in range(0, Y.shape[0], chunk_rows):
+        block = Y[begin:begin + chunk_rows]
+        padded = np.pad(block, ((0, 0), (half, window - 1 - half)), constant_values=np.nan)
+        result[begin:begin + chunk_rows] = nan_median(sliding_window_view(padded, window, axis=1), axis=-1)
+    return result
+
+
+def detect_anomalies(
+    Y: np.ndarray,
+    starts: Optional[np.ndarray] = None,
+    window: int = 29,
+    season: int = 7,
+    threshold: float = 5.0,
+    min_scale_ratio: float = 1.0
+) -> Dict[str, np.ndarray]:
+    """Выбросы дневных продаж сразу по всем рядам (строки матрицы Y, столбцы - дни).
+
+    Ожидаемое значение - скользящая медиана ряда плюс медианный остаток по дню
+    сезона (день недели при season=7). Масштаб - MAD остатков ряда, но не меньше
+    min_scale_ratio от медианы ненулевых продаж (у прерывистых рядов MAD равен 0).
+    Всплеск (spike) - остаток больше threshold масштабов; отрицательное количество
+    (negative) - возвраты или ошибки знака. Дни до starts (первой продажи ряда)
+    не участвуют в расчете.
+
+    Возвращает матрицы expected (ожидаемое), limit (верхняя граница для
+    винзоризации), score (остаток в масштабах) и flags (коды NORMAL/SPIKE/NEGATIVE).
+    """
+    n_series, n_days = Y.shape
+    values = Y.astype(np.float32, copy=True)
+    if starts is not None:
+        values[np.arange(n_days)[None, :] < np.asarray(starts)[:, None]] = np.nan
+    active = ~np.isnan(values)
+
+    baseline = rolling_median(values, window)
+    residual = values - baseline
+    seasonal = np.zeros((n_series, season), dtype=np.float32)
+    for phase in range(min(season, n_days)):
+        seasonal[:, phase] = nan_median(residual[:, phase::season], axis=1)
+    seasonal = np.nan_to_num(seasonal)
+    expected = np.clip(baseline + np.tile(seasonal, n_days // season + 1)[:, :n_days], 0.0, None)
+    residual = values - expected
+
+    center = nan_median(residual, axis=1)
+    scale = MAD_TO_STD * nan_median(np.abs(residual - center[:, None]), axis=1)
+    typical = nan_median(np.where(values > 0, values, np.nan), axis=1)
+    scale = np.fmax(np.nan_to_num(scale), min_scale_ratio * np.nan_to_num(typical))
+    scale = np.where(scale > 0, scale, np.inf)
+
+    score = residual / scale[:, None]
+    flags = np.zeros((n_series, n_days), dtype=np.int8)
+    flags[active & (score > threshold)] = SPIKE
+    flags[active & (values < 0)] = NEGATIVE
+    limit = expected + threshold * np.where(np.isfinite(scale), scale, 0.0)[:, None]
+    return {
+        "expected": np.nan_to_num(expected),
+        "limit": np.nan_to_num(limit),
+        "score": np.nan_to_num(score, nan=0.0, posinf=0.0, neginf=0.0),
+        "flags": flags,
+    }
+
+
+def treat_anomalies(
+    daily: pd.DataFrame,
+    flags: pd.DataFrame,
+    mode: str,
+    date_col: str = "sale_date",
+    value_col: str = "quantity",
+    keys=("product_id", "warehouse_id")
+) -> pd.DataFrame:
+    """Обработка отмеченных дней во входе модели.
+
+    flags - (product_id, warehouse_id, sale_day, expected, limit). winsorize -
+    значение ограничивается [0, limit], exclude - заменяется ожидаемым (в
+    плотном дневном ряду пропуск равносилен нулю, поэтому день не удаляется).
+    Возвращает копию daily; строки без отметок не меняются.
+    """
+    if mode == "none" or flags.empty or daily.empty:
+        return daily
+    keys = list(keys)
+    day = pd.to_datetime(daily[date_col], utc=True).dt.tz_localize(None).dt.normalize()
+    marks = flags.assign(_day=pd.to_datetime(flags["sale_day"]).dt.normalize())[keys + ["_day", "expected", "limit"]]
+    merged = daily[keys].assign(_day=day.to_numpy()).merge(marks, on=keys + ["_day"], how="left")
+    flagged = merged["expected"].notna().to_numpy()
+    if not flagged.any():
+        return daily
+
+    result = daily.copy()
+    values = result[value_col].to_numpy(dtype=np.float64, copy=True)
+    if mode == "exclude":
+        values[flagged] = merged["expected"].to_numpy()[flagged]
+    else:
+        values[flagged] = np.clip(values[flagged], 0.0, merged["limit"].to_numpy()[flagged])
+    result[value_col] = values
+    logger.debug(f"Аномалии во входе модели ({mode}): {int(flagged.sum())} дней")
+    return result
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import date
+from functools import cached_property
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+VALUES_FILE = "demand.npy"
+KEYS_FILE = "keys.npy"
+STARTS_FILE = "starts.npy"
+META_FILE = "meta.json"
+
+
+def encode_keys(product_ids, warehouse_ids) -> np.ndarray:
+    """Ключ ряда одним int64 (продукт в старших 32 битах): порядок совпадает с сортировкой по (продукт, склад)"""
+    return (np.asarray(product_ids, dtype=np.int64) << 32) | np.asarray(warehouse_ids, dtype=np.int64)
+
+
+class DemandMatrix:
+    """Плотная матрица дневного спроса (ряды x дни) в каталоге на диске.
+
+    Значения лежат в .npy, который процессы-исполнители отображают в память
+    (np.load(mmap_mode="r")): страницы общие через страничный кеш ОС, и в
+    задачу передается только путь и номера строк, а не история рядов. Для
+    настоящей разделяемой памяти каталог можно разместить в /dev/shm.
+    Рядом хранятся отсортированные ключи рядов (product_id, warehouse_id),
+    номер дня первой продажи каждого ряда в окне и дата первого дня.
+    """
+
+    def __init__(self, path: Path, values: np.ndarray, keys: np.ndarray, starts: np.ndarray, start_date: date):
+        self.path = Path(path)
+        self.values = values
+        self.keys = keys
+        self.starts = starts
+        self.start_date = start_date
+        self._encoded = encode_keys(keys[:, 0], keys[:, 1]) if len(keys) else np.zeros(0, dtype=np.int64)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @cached_property
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.date_range(pd.Timestamp(self.start_date), periods=self.values.shape[1], freq="D")
+
+    @classmethod
+    def create(
+        cls,
+        keys: np.ndarray,
+        start_date: date,
+        days: int,
+        root: Union[str, Path],
+        starts: Optional[np.ndarray] = None
+    ) -> "DemandMatrix":
+        """Новая матрица из нулей в подкаталоге root; keys - (ряды, 2), сортируются по (продукт, склад)"""
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(encode_keys(keys[:, 0], keys[:, 1]), kind="stable")
+        keys = keys[order]
+        starts = np.zeros(len(keys), dtype=np.int64) if starts is None else np.asarray(starts, dtype=np.int64)[order]
+
+        path = Path(root) / f"demand-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        path.mkdir(parents=True)
+        values = np.lib.format.open_memmap(path / VALUES_FILE, mode="w+", dtype=np.float32, shape=(len(keys), days))
+        np.save(path / KEYS_FILE, keys)
+        matrix = cls(path, values, keys, starts, start_date)
+        matrix._write_meta()
+        return matrix
+
+    def _write_meta(self):
+        np.save(self.path / STARTS_FILE, self.starts)
+        (self.path / META_FILE).write_text(json.dumps({
+            "start_date": self.start_date.isoformat(),
+            "series": int(self.values.shape[0]),
+            "days": int(self.values.shape[1]),
+        }))
+
+    @classmethod
+    def attach(cls, path: Union[str, Path]) -> "DemandMatrix":
+        """Подключение к готовой матрице только для чтения без копирования значений"""
+        path = Path(path)
+        meta = json.loads((path / META_FILE).read_text())
+        return cls(
+            path,
+            np.load(path / VALUES_FILE, mmap_mode="r"),
+            np.load(path / KEYS_FILE),
+            np.load(path / STARTS_FILE),
+            date.fromisoformat(meta["start_date"])
+        )
+
+    def add(self, product_ids, warehouse_ids, day_index, quantity):
+        """Прибавление продаж (ряд, номер дня, количество); строки вне матрицы и окна пропускаются"""
+        rows = self.rows(product_ids, warehouse_ids)
+        day_index = np.asarray(day_index, dtype=np.int64)
+        valid = (rows >= 0) & (day_index >= 0) & (day_index < self.values.shape[1])
+        np.add.at(self.values, (rows[valid], day_index[valid]), np.asarray(quantity, dtype=np.float32)[valid])
+
+    def rows(self, product_ids, warehouse_ids) -> np.ndarray:
+        """Номера строк рядов (-1 - ряда нет в матрице)"""
+        encoded = encode_keys(product_ids, warehouse_ids)
+        if not len(self._encoded):
+            return np.full(len(encoded), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._encoded, encoded), len(self._encoded) - 1)
+        return np.where(self._encoded[positions] == encoded, positions, -1)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Строки матрицы по номерам; для отсутствующих рядов (-1) - нули"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(self.values):
+            return np.zeros((len(rows), self.values.shape[1]), dtype=np.float32)
+        result = self.values[np.maximum(rows, 0)]
+        result[rows < 0] = 0.0
+        return result
+
+    def series(self, row: int) -> pd.DataFrame:
+        """Дневной ряд ds/y от первой продажи (в окне) до последнего дня матрицы"""
+        start = int(self.starts[row])
+        return pd.DataFrame({"ds": self.dates[start:], "y": self.values[row, start:].astype(np.float64)})
+
+    def apply_marks(self, marks: pd.DataFrame, mode: str) -> int:
+        """Обработка отметок выбросов (product_id, warehouse_id, sale_day, expected, limit) как в treat_anomalies"""
+        if mode == "none" or marks.empty:
+            return 0
+        rows = self.rows(marks["product_id"].to_numpy(), marks["warehouse_id"].to_numpy())
+        days = (pd.to_datetime(marks["sale_day"]) - pd.Timestamp(self.start_date)).dt.days.to_numpy()
+        valid = (rows >= 0) & (days >= 0) & (days < self.values.shape[1])
+        rows, days = rows[valid], days[valid]
+        if mode == "exclude":
+            self.values[rows, days] = marks["expected"].to_numpy(dtype=np.float32)[valid]
+        else:
+            self.values[rows, days] = np.clip(self.values[rows, days], 0.0, marks["limit"].to_numpy(dtype=np.float32)[valid])
+        return int(valid.sum())
+
+    def flush(self):
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
+
+    def remove(self):
+        """Удаление каталога матрицы (после завершения всех исполнителей)"""
+        self.values = np.zeros((0, 0), dtype=np.float32)
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,200 @@
+import asyncio
+import itertools
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..monitoring.metrics import track_forecast_fit
+
+# Сетка параметров сглаживания (alpha, beta, gamma) для подбора
+ALPHA_GRID = (0.05, 0.1, 0.2, 0.3, 0.5)
+BETA_GRID = (0.0, 0.01, 0.05)
+GAMMA_GRID = (0.0, 0.05, 0.1, 0.2)
+# Z-оценка 80% интервала
+INTERVAL_Z = 1.2816
+
+def holt_winters_pass(
+    y: np.ndarray,
+    alpha: np.ndarray,
+    beta: np.ndarray,
+    gamma: np.ndarray,
+    phi: float,
+    level: np.ndarray,
+    trend: np.ndarray,
+    season: np.ndarray,
+    season_index: int
+):
+    """Рекурсия аддитивного Холта-Уинтерса с затухающим трендом.
+
+    Векторизована по всем осям, кроме времени: y - (T, *batch), параметры и
+    level/trend - batch, season - (m, *batch). Возвращает обновленные
+    level, trend, season, season_index и сумму квадратов ошибок прогноза на шаг.
+    """
+    level, trend, season = level.copy(), trend.copy(), season.copy()
+    m = season.shape[0]
+    sse = np.zeros(np.broadcast(level, alpha).shape)
+    for t in range(y.shape[0]):
+        s = season[season_index]
+        forecast = level + phi * trend
+        error = y[t] - forecast - s
+        sse = sse + error ** 2
+        new_level = forecast + alpha * error
+        trend = phi * trend + beta * alpha * error
+        season[season_index] = s + gamma * (1 - alpha) * error
+        level = new_level
+        season_index = (season_index + 1) % m
+    return level, trend, season, season_index, sse
+
+class ExponentialSmoothingForecaster:
+    """Аддитивный Холт-Уинтерс (недельная сезонность) с инкрементальным обновлением состояния.
+
+    fit подбирает параметры по сетке (все комбинации считаются одним векторным
+    проходом), update продолжает рекурсию только по новым дням без подбора.
+    """
+
+    name = "ets"
+
+    def __init__(self, season_length: int = 7, phi: float = 0.98):
+        self.season_length = season_length
+        self.phi = phi
+
+    def params(self) -> Dict[str, Any]:
+        return {"season_length": self.season_length, "phi": self.phi}
+
+    def _initial_state(self, y: np.ndarray):
+        m = self.season_length
+        if len(y) >= 2 * m:
+            level = y[:m].mean()
+            trend = (y[m:2 * m].mean() - level) / m
+            season = y[:m] - level
+        else:
+            level, trend, season = y.mean() if len(y) else 0.0, 0.0, np.zeros(m)
+        return level, trend, season
+
+    def fit(self, sales_df: pd.DataFrame, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        y = sales_df["y"].to_numpy(dtype="float64")
+        level0, trend0, season0 = self._initial_state(y)
+        grid = np.array(list(itertools.product(ALPHA_GRID, BETA_GRID, GAMMA_GRID)))
+        if previous is not None:
+            # Прошлые параметры участвуют в подборе наравне с сеткой
+            grid = np.vstack([grid, [previous["alpha"], previous["beta"], previous["gamma"]]])
+        k = len(grid)
+
+        with track_forecast_fit(self.name):
+            level, trend, season, season_index, sse = holt_winters_pass(
+                y, grid[:, 0], grid[:, 1], grid[:, 2], self.phi,
+                np.full(k, level0), np.full(k, trend0), np.repeat(season0[:, None], k, axis=1), 0
+            )
+        best = int(np.argmin(sse))
+        return {
+            "alpha": float(grid[best, 0]),
+            "beta": float(grid[best, 1]),
+            "gamma": float(grid[best, 2]),
+            "level": float(level[best]),
+            "trend": float(trend[best]),
+            "season": season[:, best].tolist(),
+            "season_index": season_index,
+            "sse": float(sse[best]),
+            "n": int(len(y)),
+            "last_date": sales_df["ds"].max().isoformat(),
+        }
+
+    def update(self, state: Dict[str, Any], new_df: pd.DataFrame) -> Dict[str, Any]:
+        """Продолжение рекурсии по новым дням (после state["last_date"]) с прежними параметрами"""
+        y = new_df["y"].to_numpy(dtype="float64")
+        if not len(y):
+            return state
+        level, trend, season, season_index, sse = holt_winters_pass(
+            y, np.array(state["alpha"]), np.array(state["beta"]), np.array(state["gamma"]), self.phi,
+            np.array(state["level"]), np.array(state["trend"]), np.array(state["season"]), state["season_index"]
+        )
+        return {
+            **state,
+            "level": float(level),
+            "trend": float(trend),
+            "season": season.tolist(),
+            "season_index": season_index,
+            "sse": state["sse"] + float(sse),
+            "n": state["n"] + int(len(y)),
+            "last_date": new_df["ds"].max().isoformat(),
+        }
+
+    def predict(self, state: Dict[str, Any], horizon: int) -> List[Tuple[datetime, float, float, float]]:
+        steps = np.arange(1, horizon + 1)
+        damped = np.cumsum(self.phi ** steps)
+        season = np.array(state["season"])
+        values = state["level"] + damped * state["trend"] + season[(state["season_index"] + steps - 1) % len(season)]
+        sigma = np.sqrt(state["sse"] / max(state["n"], 1))
+        # Дисперсия ошибки растет с горизонтом (приближение для аддитивной модели)
+        spread = INTERVAL_Z * sigma * np.sqrt(1 + (steps - 1) * state["alpha"] ** 2)
+        dates = pd.date_range(pd.Timestamp(state["last_date"]) + pd.Timedelta(days=1), periods=horizon, freq="D")
+        return [
+            (date.to_pydatetime(), max(float(value), 0.0), max(float(value - s), 0.0), max(float(value + s), 0.0))
+            for date, value, s in zip(dates, values, spread)
+        ]
+
+    def dumps(self, state: Dict[str, Any]) -> bytes:
+        return json.dumps(state, sort_keys=True).encode()
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload)
+
+    async def forecast(self, sales_df: pd.DataFrame, horizon: int) -> List[Tuple[datetime, float, float, float]]:
+        """Прогноз на horizon дней: список (дата, значение, нижняя граница, верхняя граница)"""
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(None, self.fit, sales_df)
+        return self.predict(state, horizon)
+
+def batch_seasonal_ses(
+    Y: np.ndarray,
+    horizon: int,
+    season_length: int = 7,
+    alpha_grid=ALPHA_GRID,
+    gamma_grid=GAMMA_GRID
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Простое экспоненциальное сглаживание с сезонностью сразу для всех рядов.
+
+    Y - (ряды, дни). Параметры подбираются по сетке для каждого ряда отдельно,
+    но все ряды и все комбинации считаются одним векторным проходом по времени.
+    Возвращает прогноз (ряды, horizon) и дисперсию ошибки прогноза на шаг.
+    """
+    n, T = Y.shape
+    m = season_length
+    grid = np.array(list(itertools.product(alpha_grid, gamma_grid)))
+    k = len(grid)
+
+    if T >= 2 * m:
+        level0 = Y[:, :m].mean(axis=1)
+        season0 = (Y[:, :m] - level0[:, None]).T
+    else:
+        level0, season0 = Y.mean(axis=1) if T else np.zeros(n), np.zeros((m, n))
+
+    # Та же рекурсия, что в holt_winters_pass, без тренда и с вычислениями на месте
+    alpha, gamma = grid[:, 0], grid[:, 1] * (1 - grid[:, 0])
+    level = np.repeat(level0[:, None], k, axis=1)
+    season = np.repeat(season0[:, :, None], k, axis=2)
+    sse = np.zeros((n, k))
+    error = np.empty((n, k))
+    buffer = np.empty((n, k))
+    Y_time = np.ascontiguousarray(Y.T, dtype="float64")
+    for t in range(T):
+        s = season[t % m]
+        np.subtract(Y_time[t][:, None], level, out=error)
+        error -= s
+        np.multiply(error, error, out=buffer)
+        sse += buffer
+        np.multiply(error, alpha, out=buffer)
+        level += buffer
+        np.multiply(error, gamma, out=buffer)
+        s += buffer
+    season_index = T % m
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(n)
+    steps = (season_index + np.arange(horizon)) % m
+    forecast = level[rows, best][:, None] + season[steps][:, rows, best].T
+    variance = sse[rows, best] / max(T, 1)
+    return forecast, variance
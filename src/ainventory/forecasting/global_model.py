@@ -0,0 +1,309 @@
+import logging
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..config import settings
+from ..features.engineering import DATE_COL, SERIES_KEYS, holiday_calendar
+from ..monitoring.metrics import track_forecast_fit
+from .registry import MODEL_KINDS
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE_COLUMNS = ["category_id", "brand_id", "list_price"]
+# Идентификаторы - категории, а не числа: линейная модель получает one-hot, градиентный бустинг -
+# коды значений (categorical_features). Словарь - не больше MAX_LEVELS самых частых значений
+# при обучении (предел HistGradientBoostingRegressor - max_bins), остальные значения - пропуск
+CATEGORICAL_COLUMNS = ["warehouse_id", "category_id", "brand_id"]
+MAX_LEVELS = 255
+# Версия матрицы признаков: входит в хеш конфигурации прогноза, смена пересчитывает ряды
+DESIGN_VERSION = 2
+# Z-оценка 80% интервала
+INTERVAL_Z = 1.2816
+
+def origin_columns(features: pd.DataFrame) -> List[str]:
+    """Признаки ряда на дату построения прогноза"""
+    columns = ["quantity", "dow", "is_weekend", "unit_price", "price_ratio", "is_promo", "zero_share", "zero_run", "stockout_suspected"]
+    columns += [c for c in features.columns if c.startswith(("lag_", "rolling_mean_", "rolling_std_"))]
+    return [c for c in columns if c in features.columns]
+
+class GlobalDemandModel:
+    """Одна модель спроса для всех рядов (продукт x склад) с прямым прогнозом на несколько дней.
+
+    Строка обучения - (ряд, дата t, горизонт h): признаки ряда на дату t, атрибуты продукта
+    и календарь даты t + h; цель - спрос на дату t + h. Для каждой даты берется
+    horizon_samples горизонтов, чтобы объем обучения не рос в max_horizon раз.
+    Дни с подозрением на отсутствие товара в обучение как цель не попадают.
+
+    kind="gbm" - HistGradientBoostingRegressor (пуассоновская функция потерь, многопоточный);
+    kind="linear" - гребневая регрессия по накопленным X'X и X'y, дообучается точно.
+    Склад, категория и бренд кодируются словарем значений, собранным при обучении с нуля.
+    """
+
+    def __init__(
+        self,
+        kind: Optional[str] = None,
+        max_horizon: Optional[int] = None,
+        train_days: Optional[int] = None,
+        horizon_samples: Optional[int] = None,
+        ridge_alpha: float = 1.0,
+        holiday_country: Optional[str] = None
+    ):
+        self.kind = kind or settings.global_model_kind
+        if self.kind not in MODEL_KINDS:
+            raise ValueError(f"Неподдерживаемый тип глобальной модели: {self.kind}")
+        self.max_horizon = max_horizon or settings.global_model_max_horizon
+        self.train_days = train_days if train_days is not None else settings.global_model_train_days
+        self.horizon_samples = min(horizon_samples or settings.global_model_horizon_samples, self.max_horizon)
+        self.ridge_alpha = ridge_alpha
+        self.holiday_country = holiday_country or settings.holiday_country
+
+        self.feature_names: List[str] = []
+        self.levels: Dict[str, np.ndarray] = {}
+        self.trained_until: Optional[pd.Timestamp] = None
+        self.rows_trained = 0
+        self.estimator = None
+        self.xtx: Optional[np.ndarray] = None
+        self.xty: Optional[np.ndarray] = None
+        self.coef: Optional[np.ndarray] = None
+        self.residual_sq = np.zeros(self.max_horizon + 1)
+        self.residual_n = np.zeros(self.max_horizon + 1)
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.trained_until is not None
+
+    # Построение матрицы обучения
+
+    def _target_calendar(self, target_dates: pd.Series) -> Dict[str, np.ndarray]:
+        years = list(range(target_dates.dt.year.min(), target_dates.dt.year.max() + 1)) if len(target_dates) else []
+        holidays = holiday_calendar(self.holiday_country, years) if years else pd.DatetimeIndex([])
+        return {
+            "target_dow": target_dates.dt.dayofweek.to_numpy(),
+            "target_month": target_dates.dt.month.to_numpy(),
+            "target_day": target_dates.dt.day.to_numpy(),
+            "target_is_holiday": target_dates.isin(holidays).to_numpy().astype("int8"),
+        }
+
+    def _design(self, origins: pd.DataFrame, horizons: np.ndarray, attributes: Optional[pd.DataFrame]) -> pd.DataFrame:
+        """Матрица признаков для пар (строка-источник, горизонт)"""
+        frame = origins[origin_columns(origins)].reset_index(drop=True)
+        frame["warehouse_id"] = pd.to_numeric(origins["warehouse_id"], errors="coerce").to_numpy()
+        if attributes is not None and len(attributes):
+            joined = origins[["product_id"]].merge(attributes, left_on="product_id", right_index=True, how="left")
+            for column in ATTRIBUTE_COLUMNS:
+                frame[column] = joined[column].to_numpy(dtype="float64") if column in joined else np.nan
+        else:
+            for column in ATTRIBUTE_COLUMNS:
+                frame[column] = np.nan
+        frame["horizon"] = horizons
+        target_dates = pd.Series(origins[DATE_COL].to_numpy() + horizons.astype("timedelta64[D]"))
+        for column, values in self._target_calendar(target_dates).items():
+            frame[column] = values
+        return frame
+
+    def _sample_pairs(self, features: pd.DataFrame, since: Optional[pd.Timestamp]):
+        """Пары (источник, горизонт) с известной целью; при since - только с целью после since"""
+        codes = features.groupby(SERIES_KEYS, sort=False).ngroup().to_numpy()
+        dates = features[DATE_COL].to_numpy()
+        quantity = features["quantity"].to_numpy(dtype="float64")
+        censored = features["stockout_suspected"].to_numpy().astype(bool)
+        n = len(features)
+        last_date = dates.max()
+
+        # Горизонты выбираются детерминированно от ряда и даты, поэтому не зависят от разбиения на порции
+        series_hash = pd.util.hash_pandas_object(features[SERIES_KEYS], index=False).to_numpy() % np.uint64(self.max_horizon)
+        day_number = dates.astype("datetime64[D]").astype(np.int64)
+        step = max(self.max_horizon // self.horizon_samples, 1)
+
+        sources, horizons = [], []
+        for k in range(self.horizon_samples):
+            h = (series_hash.astype(np.int64) + day_number + k * step) % self.max_horizon + 1
+            target = np.arange(n) + h
+            valid = target < n
+            target = np.where(valid, target, 0)
+            valid &= codes[target] == codes
+            valid &= ~censored[target]
+            if self.train_days:
+                valid &= dates[target] > last_date - np.timedelta64(self.train_days, "D")
+            if since is not None:
+                valid &= dates[target] > np.datetime64(since)
+            sources.append(np.flatnonzero(valid))
+            horizons.append(h[valid])
+        sources = np.concatenate(sources)
+        horizons = np.concatenate(horizons)
+        return sources, horizons, quantity[sources + horizons]
+
+    def _fit_levels(self, design: pd.DataFrame) -> Dict[str, np.ndarray]:
+        levels = {}
+        for column in CATEGORICAL_COLUMNS:
+            counts = design[column].dropna().value_counts()
+            levels[column] = np.sort(counts.index[:MAX_LEVELS].to_numpy(dtype="float64"))
+        return levels
+
+    def _codes(self, design: pd.DataFrame, column: str) -> np.ndarray:
+        """Номера значений в словаре обучения; -1 - пропуск или значение, которого при обучении не было"""
+        levels = self.levels[column]
+        values = design[column].to_numpy(dtype="float64")
+        if not len(levels):
+            return np.full(len(values), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(levels, values), len(levels) - 1)
+        return np.where(levels[position] == values, position, -1)
+
+    # Обучение
+
+    def _linear_matrix(self, design: pd.DataFrame):
+        """Разреженная матрица: свободный член, числовые признаки и one-hot категорий"""
+        from scipy import sparse
+
+        numeric = [name for name in self.feature_names if name not in CATEGORICAL_COLUMNS]
+        X = design[numeric].to_numpy(dtype="float64")
+        X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+        blocks = [sparse.csr_matrix(np.hstack([np.ones((len(X), 1)), X]))]
+        for column in CATEGORICAL_COLUMNS:
+            codes = self._codes(design, column)
+            known = np.flatnonzero(codes >= 0)
+            blocks.append(sparse.csr_matrix(
+                (np.ones(len(known)), (known, codes[known])), shape=(len(X), len(self.levels[column]))
+            ))
+        return sparse.hstack(blocks, format="csr")
+
+    def _tree_matrix(self, design: pd.DataFrame) -> np.ndarray:
+        """Признаки бустинга: вместо идентификаторов - их коды, неизвестные значения - пропуск"""
+        X = design[self.feature_names].to_numpy(dtype="float64")
+        for column in CATEGORICAL_COLUMNS:
+            codes = self._codes(design, column)
+            X[:, self.feature_names.index(column)] = np.where(codes >= 0, codes, np.nan)
+        return X
+
+    def _fit_batch(self, design: pd.DataFrame, y: np.ndarray, warm: bool):
+        if self.kind == "linear":
+            X = self._linear_matrix(design)
+            if not warm or self.xtx is None:
+                self.xtx = np.zeros((X.shape[1], X.shape[1]))
+                self.xty = np.zeros(X.shape[1])
+            self.xtx += (X.T @ X).toarray()
+            self.xty += X.T @ y
+            penalty = self.ridge_alpha * np.eye(X.shape[1])
+            penalty[0, 0] = 0.0
+            self.coef = np.linalg.solve(self.xtx + penalty, self.xty)
+            return
+
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        X = self._tree_matrix(design)
+        if not warm or self.estimator is None:
+            self.estimator = HistGradientBoostingRegressor(
+                loss="poisson",
+                categorical_features=[name in CATEGORICAL_COLUMNS for name in self.feature_names],
+                max_iter=settings.global_model_max_iter,
+                learning_rate=0.1,
+                max_leaf_nodes=31,
+                min_samples_leaf=50,
+                early_stopping=False,
+                random_state=0,
+            )
+        else:
+            # Дообучение: новые деревья на свежих данных поверх существующего ансамбля
+            self.estimator.set_params(warm_start=True, max_iter=self.estimator.n_iter_ + settings.global_model_update_iter)
+        self.estimator.fit(X, y)
+
+    def _predict_design(self, design: pd.DataFrame) -> np.ndarray:
+        if self.kind == "linear":
+            prediction = self._linear_matrix(design) @ self.coef
+        else:
+            prediction = self.estimator.predict(self._tree_matrix(design))
+        return np.clip(prediction, 0.0, None)
+
+    def _train(self, features: pd.DataFrame, attributes: Optional[pd.DataFrame], since: Optional[pd.Timestamp]) -> Dict[str, Any]:
+        sources, horizons, y = self._sample_pairs(features, since)
+        if not len(y):
+            return {"rows": 0}
+        design = self._design(features.iloc[sources], horizons, attributes)
+        if not self.feature_names:
+            self.feature_names = list(design.columns)
+            self.levels = self._fit_levels(design)
+
+        with track_forecast_fit(f"global_{self.kind}"):
+            self._fit_batch(design, y, warm=since is not None)
+
+        # Разброс остатков по горизонтам для интервалов
+        residual = y - self._predict_design(design)
+        if since is None:
+            self.residual_sq[:] = 0.0
+            self.residual_n[:] = 0.0
+        np.add.at(self.residual_sq, horizons, residual ** 2)
+        np.add.at(self.residual_n, horizons, 1.0)
+
+        self.trained_until = features[DATE_COL].max()
+        self.rows_trained += len(y)
+        return {"rows": int(len(y)), "trained_until": self.trained_until.isoformat()}
+
+    def fit(self, features: pd.DataFrame, attributes: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Обучение с нуля на матрице признаков всех рядов (FeatureStore/build_features)"""
+        self.feature_names = []
+        self.rows_trained = 0
+        return self._train(features, attributes, since=None)
+
+    def update(self, features: pd.DataFrame, attributes: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Дообучение на парах, цель которых появилась после прошлого обучения"""
+        if not self.is_fitted:
+            return self.fit(features, attributes)
+        if features[DATE_COL].max() <= self.trained_until:
+            return {"rows": 0, "trained_until": self.trained_until.isoformat()}
+        return self._train(features, attributes, since=self.trained_until)
+
+    # Прогноз
+
+    def predict(self, features: pd.DataFrame, horizon: int, attributes: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Прогноз всех рядов на horizon дней от последней даты ряда одним вызовом модели"""
+        if not self.is_fitted:
+            raise ValueError("Глобальная модель не обучена")
+        if horizon > self.max_horizon:
+            raise ValueError(f"Горизонт {horizon} больше максимального {self.max_horizon}")
+
+        origins = features.groupby(SERIES_KEYS, sort=False).tail(1).reset_index(drop=True)
+        repeated = origins.loc[np.repeat(np.arange(len(origins)), horizon)].reset_index(drop=True)
+        horizons = np.tile(np.arange(1, horizon + 1), len(origins))
+        design = self._design(repeated, horizons, attributes)
+        values = self._predict_design(design)
+
+        counts = np.maximum(self.residual_n[horizons], 1.0)
+        spread = INTERVAL_Z * np.sqrt(self.residual_sq[horizons] / counts)
+        result = repeated[SERIES_KEYS].copy()
+        result["forecast_date"] = repeated[DATE_COL].to_numpy() + horizons.astype("timedelta64[D]")
+        result["forecast_value"] = values
+        result["confidence_lower"] = np.clip(values - spread, 0.0, None)
+        result["confidence_upper"] = values + spread
+        return result
+
+    # Хранение
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+
+    @staticmethod
+    def load(path: Path) -> Optional["GlobalDemandModel"]:
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                model = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить глобальную модель {path}: {e}")
+            return None
+        if not hasattr(model, "levels"):
+            # Модель с идентификаторами-числами: переобучается с нуля
+            logger.info(f"Глобальная модель {path} сохранена в прежнем формате, будет обучена заново")
+            return None
+        return model
+
+def model_path(kind: str) -> Path:
+    return Path(settings.forecast_model_dir) / f"global_{kind}.pkl"
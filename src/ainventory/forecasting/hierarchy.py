@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from scipy import sparse
+
+from .ets_model import batch_seasonal_ses
+
+logger = logging.getLogger(__name__)
+
+
+def category_ancestors(categories: pd.DataFrame) -> pd.DataFrame:
+    """Пары (category_id, ancestor_id) по parent_id, включая саму категорию"""
+    ids = categories["id"].to_numpy()
+    position = pd.Series(np.arange(len(ids)), index=ids)
+    parents = categories["parent_id"].map(position).fillna(-1).to_numpy(dtype=np.int64)
+
+    pairs = [np.column_stack([np.arange(len(ids)), np.arange(len(ids))])]
+    current = parents.copy()
+    # Подъем по дереву сразу для всех категорий; глубина ограничена числом категорий (защита от циклов)
+    for _ in range(len(ids)):
+        valid = np.flatnonzero(current >= 0)
+        if not len(valid):
+            break
+        pairs.append(np.column_stack([valid, current[valid]]))
+        current[valid] = parents[current[valid]]
+    pairs = np.vstack(pairs)
+    return pd.DataFrame({"category_id": ids[pairs[:, 0]], "ancestor_id": ids[pairs[:, 1]]}).drop_duplicates()
+
+class Hierarchy:
+    """Иерархия рядов: сеть -> склад, категория (со всеми предками) -> категория x склад -> продукт x склад.
+
+    S - разреженная матрица суммирования (узлы x нижние ряды), агрегатные узлы
+    идут первыми, нижние ряды - последними (S = [S_agg; I]).
+    """
+
+    def __init__(self, nodes: pd.DataFrame, S: sparse.csr_matrix, n_bottom: int):
+        self.nodes = nodes
+        self.S = S
+        self.n_bottom = n_bottom
+        self.n_aggregate = S.shape[0] - n_bottom
+
+    @property
+    def S_aggregate(self) -> sparse.csr_matrix:
+        return self.S[:self.n_aggregate]
+
+    @classmethod
+    def build(cls, bottom: pd.DataFrame, categories: Optional[pd.DataFrame] = None) -> "Hierarchy":
+        """bottom - нижние ряды (product_id, warehouse_id, category_id) в порядке строк матрицы истории"""
+        n = len(bottom)
+        columns = np.arange(n)
+        node_frames, rows, cols = [], [], []
+        offset = 0
+
+        def add_level(level: str, keys: Optional[pd.DataFrame], bottom_index: np.ndarray):
+            nonlocal offset
+            if keys is None:
+                codes, level_nodes = np.zeros(len(bottom_index), dtype=np.int64), pd.DataFrame(index=[0])
+            else:
+                codes, _ = pd.factorize(pd.MultiIndex.from_frame(keys))
+                # Коды идут в порядке первого появления - ключи узлов берутся из первых вхождений
+                first = np.unique(codes, return_index=True)[1]
+                level_nodes = keys.iloc[first].reset_index(drop=True)
+            level_nodes.insert(0, "level", level)
+            node_frames.append(level_nodes)
+            rows.append(codes + offset)
+            cols.append(bottom_index)
+            offset += len(level_nodes)
+
+        add_level("total", None, columns)
+        add_level("warehouse", bottom[["warehouse_id"]], columns)
+
+        if categories is not None and len(categories) and bottom["category_id"].notna().any():
+            pairs = bottom[["category_id"]].assign(bottom_index=columns).merge(
+                category_ancestors(categories), on="category_id"
+            )
+            pairs["warehouse_id"] = bottom["warehouse_id"].to_numpy()[pairs["bottom_index"].to_numpy()]
+            pairs = pairs.rename(columns={"category_id": "leaf_category_id", "ancestor_id": "category_id"})
+            add_level("category", pairs[["category_id"]], pairs["bottom_index"].to_numpy())
+            add_level("category_warehouse", pairs[["category_id", "warehouse_id"]], pairs["bottom_index"].to_numpy())
+
+        add_level("bottom", bottom[["product_id", "warehouse_id"]], columns)
+
+        nodes = pd.concat(node_frames, ignore_index=True)
+        for column in ("warehouse_id", "category_id", "product_id"):
+            if column not in nodes:
+                nodes[column] = np.nan
+        from scipy import sparse
+
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        S = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(offset, n))
+        return cls(nodes[["level", "warehouse_id", "category_id", "product_id"]], S, n)
+
+    def aggregate(self, bottom_values: np.ndarray) -> np.ndarray:
+        """Значения всех узлов из значений нижних рядов (ряды x время)"""
+        return np.asarray(self.S @ bottom_values)
+
+def reconcile(
+    hierarchy: Hierarchy,
+    base: np.ndarray,
+    method: str = "mint",
+    variances: Optional[np.ndarray] = None,
+    proportions: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Согласование прогнозов всех узлов (узлы x горизонт).
+
+    bottom_up - сумма прогнозов нижних рядов; top_down - прогноз сети,
+    распределенный по историческим долям proportions; mint - MinT с
+    диагональной W (дисперсии ошибок узлов) в проекционной форме
+    ỹ = ŷ − W Cᵀ (C W Cᵀ)⁻¹ C ŷ, где C = [I, −S_agg]: решается система
+    размера числа агрегатных узлов, а не нижних рядов.
+    """
+    n_aggregate = hierarchy.n_aggregate
+    if method == "bottom_up":
+        bottom = base[n_aggregate:]
+    elif method == "top_down":
+        if proportions is None:
+            raise ValueError("Для top_down нужны доли нижних рядов")
+        total = base[hierarchy.nodes.index[hierarchy.nodes["level"] == "total"][0]]
+        bottom = proportions[:, None] * total[None, :]
+    elif method == "mint":
+        if variances is None:
+            raise ValueError("Для mint нужны дисперсии ошибок узлов")
+        from scipy import sparse
+        from scipy.sparse.linalg import splu
+
+        w = np.maximum(variances, 1e-6)
+        w_aggregate, w_bottom = w[:n_aggregate], w[n_aggregate:]
+        S_aggregate = hierarchy.S_aggregate
+        # C W Cᵀ = W_agg + S_agg W_b S_aggᵀ
+        system = sparse.diags(w_aggregate) + S_aggregate @ sparse.diags(w_bottom) @ S_aggregate.T
+        incoherence = base[:n_aggregate] - S_aggregate @ base[n_aggregate:]
+        solution = splu(sparse.csc_matrix(system)).solve(np.ascontiguousarray(incoherence))
+        bottom = base[n_aggregate:] + w_bottom[:, None] * (S_aggregate.T @ solution)
+    else:
+        raise ValueError(f"Неизвестный метод согласования: {method}")
+
+    # Отрицательный спрос обрезается на нижнем уровне, агрегаты пересчитываются для согласованности
+    return hierarchy.aggregate(np.clip(bottom, 0.0, None))
+
+def forecast_hierarchy(
+    hierarchy: Hierarchy,
+    history: np.ndarray,
+    horizon: int,
+    method: str = "mint"
+) -> np.ndarray:
+    """Базовые прогнозы всех узлов (сезонное SES по агрегированной истории) и их согласование.
+
+    history - история нижних рядов (ряды x дни).
+    """
+    node_history = hierarchy.aggregate(history)
+    base, variances = batch_seasonal_ses(node_history, horizon)
+    bottom_totals = history.sum(axis=1)
+    grand_total = bottom_totals.sum()
+    proportions = bottom_totals / grand_total if grand_total > 0 else np.full(len(bottom_totals), 1 / max(len(bottom_totals), 1))
+    return reconcile(hierarchy, base, method, variances=variances, proportions=proportions)
+
+def history_matrix(sales: pd.DataFrame, history_days: int):
+    """Плотная матрица дневных продаж (ряды x дни) за последние history_days дней.
+
+    sales - дневные продажи (product_id, warehouse_id, sale_date, quantity).
+    Возвращает нижние ряды (product_id, warehouse_id), матрицу float32 и дату первого дня.
+    """
+    dates = pd.to_datetime(sales["sale_date"]).dt.normalize()
+    end = dates.max()
+    start = max(dates.min(), end - pd.Timedelta(days=history_days - 1))
+    recent = (dates >= start).to_numpy()
+    keys = sales[["product_id", "warehouse_id"]]
+    codes, _ = pd.factorize(pd.MultiIndex.from_frame(keys))
+    bottom = keys.iloc[np.unique(codes, return_index=True)[1]].reset_index(drop=True)
+
+    Y = np.zeros((len(bottom), (end - start).days + 1), dtype=np.float32)
+    day_index = (dates[recent] - start).dt.days.to_numpy()
+    np.add.at(Y, (codes[recent], day_index), sales["quantity"].to_numpy(dtype=np.float32)[recent])
+    return bottom, Y, start
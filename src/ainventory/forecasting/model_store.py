@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+def history_hash(sales_df: pd.DataFrame, until: Optional[pd.Timestamp] = None) -> str:
+    """Хеш дневного ряда ds/y (до даты until включительно)"""
+    if until is not None:
+        sales_df = sales_df[sales_df["ds"] <= until]
+    digest = hashlib.sha256()
+    digest.update(sales_df["ds"].to_numpy(dtype="datetime64[ns]").tobytes())
+    digest.update(sales_df["y"].to_numpy(dtype="float64").tobytes())
+    return digest.hexdigest()
+
+def params_hash(params: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class ModelStore:
+    """Хранилище обученных моделей по рядам.
+
+    Сериализованные модели лежат в objects/ под именем хеша содержимого
+    (одинаковые модели хранятся один раз), а refs/<модель>/<продукт>_<склад>.json
+    указывает на актуальный объект вместе с watermark данных, хешем истории
+    и параметрами модели.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.forecast_model_dir) / "series"
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def _ref_path(self, model_name: str, product_id: int, warehouse_id: int) -> Path:
+        return self.root / "refs" / model_name / f"{product_id}_{warehouse_id}.json"
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def put_object(self, payload: bytes) -> str:
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            self._write_atomic(path, payload)
+        return digest
+
+    def get_object(self, digest: str) -> Optional[bytes]:
+        path = self._object_path(digest)
+        return path.read_bytes() if path.exists() else None
+
+    def get(self, model_name: str, product_id: int, warehouse_id: int) -> Optional[Dict[str, Any]]:
+        path = self._ref_path(model_name, product_id, warehouse_id)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text())
+        except ValueError:
+            logger.warning(f"Поврежденная запись хранилища моделей: {path}")
+            return None
+
+    def put(
+        self,
+        model_name: str,
+        product_id: int,
+        warehouse_id: int,
+        payload: bytes,
+        watermark: pd.Timestamp,
+        data_hash: str,
+        params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        import pandas as pd
+
+        entry = {
+            "object": self.put_object(payload),
+            "watermark": pd.Timestamp(watermark).isoformat(),
+            "data_hash": data_hash,
+            "params_hash": params_hash(params),
+            "params": params,
+            "fitted_at": datetime.utcnow().isoformat(),
+        }
+        self._write_atomic(self._ref_path(model_name, product_id, warehouse_id), json.dumps(entry).encode())
+        return entry
+
+    def collect_garbage(self) -> int:
+        """Удаление объектов, на которые не ссылается ни одна запись"""
+        referenced = set()
+        for ref in (self.root / "refs").glob("*/*.json"):
+            try:
+                referenced.add(json.loads(ref.read_text())["object"])
+            except (ValueError, KeyError):
+                continue
+        removed = 0
+        for path in (self.root / "objects").glob("*/*"):
+            if path.name not in referenced and not path.name.startswith("."):
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+model_store = ModelStore()
+
+def _fit_or_update(forecaster, store: ModelStore, product_id: int, warehouse_id: int, sales_df: pd.DataFrame, horizon: int):
+    import pandas as pd
+
+    params = forecaster.params()
+    data_hash = history_hash(sales_df)
+    watermark = sales_df["ds"].max()
+    entry = store.get(forecaster.name, product_id, warehouse_id)
+    previous = None
+
+    if entry is not None and entry["params_hash"] == params_hash(params):
+        payload = store.get_object(entry["object"])
+        previous = forecaster.loads(payload) if payload is not None else None
+        previous_watermark = pd.Timestamp(entry["watermark"])
+
+        if previous is not None and entry["data_hash"] == data_hash:
+            # Данные не менялись - только прогноз
+            return forecaster.predict(previous, horizon), "cached"
+
+        if (
+            previous is not None
+            and hasattr(forecaster, "update")
+            and watermark > previous_watermark
+            and history_hash(sales_df, previous_watermark) == entry["data_hash"]
+        ):
+            # Добавились только новые дни - инкрементальное обновление состояния
+            model = forecaster.update(previous, sales_df[sales_df["ds"] > previous_watermark])
+            store.put(forecaster.name, product_id, warehouse_id, forecaster.dumps(model), watermark, data_hash, params)
+            return forecaster.predict(model, horizon), "incremental"
+
+    model = forecaster.fit(sales_df, previous=previous)
+    store.put(forecaster.name, product_id, warehouse_id, forecaster.dumps(model), watermark, data_hash, params)
+    return forecaster.predict(model, horizon), "warm_start" if previous is not None else "full"
+
+async def forecast_series(
+    forecaster,
+    product_id: int,
+    warehouse_id: int,
+    sales_df: pd.DataFrame,
+    horizon: int,
+    store: Optional[ModelStore] = None
+) -> Tuple[List[Tuple[datetime, float, float, float]], Dict[str, Any]]:
+    """Прогноз ряда с переиспользованием сохраненной модели.
+
+    Режимы: cached - данные не менялись, обучение пропускается; incremental -
+    появились новые дни, состояние модели обновляется (ETS); warm_start -
+    переобучение от прошлых параметров (Prophet); full - обучение с нуля.
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    result, mode = await loop.run_in_executor(
+        None, _fit_or_update, forecaster, store or model_store, product_id, warehouse_id, sales_df, horizon
+    )
+    return result, {"fit_mode": mode, "seconds": time.perf_counter() - start}
@@ -1,7 +1,103 @@
-from prophet import Prophet
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 import pandas as pd
 
+if TYPE_CHECKING:
+    # prophet (cmdstanpy, matplotlib) загружается при первом обучении, а не при старте API
+    from prophet import Prophet
+
+from ..config import settings
+from ..monitoring.metrics import track_forecast_fit
+
+logger = logging.getLogger(__name__)
+
 def fit_prophet(df: pd.DataFrame, ds_col: str, y_col: str) -> Prophet:
+    from prophet import Prophet
+
     m = Prophet()
     m.fit(df.rename(columns={ds_col: "ds", y_col: "y"}))
     return m
+
+def warm_start_init(model: Prophet) -> Dict[str, Any]:
+    """Параметры обученной модели как начальная точка оптимизации для следующего обучения"""
+    params = model.params
+    return {
+        "k": float(params["k"][0][0]),
+        "m": float(params["m"][0][0]),
+        "sigma_obs": float(params["sigma_obs"][0][0]),
+        "delta": params["delta"][0],
+        "beta": params["beta"][0],
+    }
+
+class ProphetForecaster:
+    """Прогнозирование спроса с помощью Prophet"""
+
+    name = "prophet"
+
+    def __init__(
+        self,
+        seasonality_mode: Optional[str] = None,
+        changepoint_prior_scale: Optional[float] = None,
+        seasonality_prior_scale: Optional[float] = None
+    ):
+        self.seasonality_mode = seasonality_mode or settings.prophet_seasonality_mode
+        self.changepoint_prior_scale = changepoint_prior_scale or settings.prophet_changepoint_prior_scale
+        self.seasonality_prior_scale = seasonality_prior_scale or settings.prophet_seasonality_prior_scale
+
+    def _build_model(self) -> Prophet:
+        from prophet import Prophet
+
+        return Prophet(
+            seasonality_mode=self.seasonality_mode,
+            changepoint_prior_scale=self.changepoint_prior_scale,
+            seasonality_prior_scale=self.seasonality_prior_scale
+        )
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "seasonality_mode": self.seasonality_mode,
+            "changepoint_prior_scale": self.changepoint_prior_scale,
+            "seasonality_prior_scale": self.seasonality_prior_scale,
+        }
+
+    def fit(self, sales_df: pd.DataFrame, previous: Optional[Prophet] = None) -> Prophet:
+        """Обучение; при previous оптимизация стартует с его параметров (warm start)"""
+        model = self._build_model()
+        with track_forecast_fit(self.name):
+            if previous is not None:
+                try:
+                    return model.fit(sales_df[["ds", "y"]], init=warm_start_init(previous))
+                except Exception as e:
+                    logger.warning(f"Warm start Prophet не удался, обучение с нуля: {e}")
+                    model = self._build_model()
+            return model.fit(sales_df[["ds", "y"]])
+
+    def predict(self, model: Prophet, horizon: int) -> List[Tuple[datetime, float, float, float]]:
+        future = model.make_future_dataframe(periods=horizon, include_history=False)
+        prediction = model.predict(future)
+        return [
+            (row.ds.to_pydatetime(), max(float(row.yhat), 0.0), max(float(row.yhat_lower), 0.0), max(float(row.yhat_upper), 0.0))
+            for row in prediction.itertuples()
+        ]
+
+    def dumps(self, model: Prophet) -> bytes:
+        from prophet.serialize import model_to_json
+
+        return model_to_json(model).encode()
+
+    def loads(self, payload: bytes) -> Prophet:
+        from prophet.serialize import model_from_json
+
+        return model_from_json(payload.decode())
+
+    def _fit_predict(self, sales_df: pd.DataFrame, horizon: int) -> List[Tuple[datetime, float, float, float]]:
+        return self.predict(self.fit(sales_df), horizon)
+
+    async def forecast(self, sales_df: pd.DataFrame, horizon: int) -> List[Tuple[datetime, float, float, float]]:
+        """Прогноз на horizon дней: список (дата, значение, нижняя граница, верхняя граница)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._fit_predict, sales_df, horizon)
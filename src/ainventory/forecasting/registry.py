@@ -0,0 +1,21 @@
+import importlib
+from typing import Dict, Tuple
+
+# Имена моделей и методов для проверки параметров API без загрузки numpy,
+# pandas и prophet: модули моделей импортируются при первом обучении
+SERIES_MODELS: Dict[str, Tuple[str, str]] = {
+    "prophet": ("prophet_model", "ProphetForecaster"),
+    "ets": ("ets_model", "ExponentialSmoothingForecaster"),
+}
+MODEL_KINDS = ("gbm", "linear")
+LEVELS = ("total", "warehouse", "category", "category_warehouse", "bottom")
+RECONCILIATION_METHODS = ("bottom_up", "top_down", "mint")
+ANOMALY_TREATMENTS = ("winsorize", "exclude", "none")
+ANOMALY_STATUSES = ("open", "confirmed", "dismissed")
+
+def series_forecaster(name: str):
+    """Класс модели, обучаемой по одному ряду (продукт x склад)"""
+    if name not in SERIES_MODELS:
+        raise ValueError(f"Неподдерживаемая модель: {name}")
+    module, attribute = SERIES_MODELS[name]
+    return getattr(importlib.import_module(f".{module}", __package__), attribute)
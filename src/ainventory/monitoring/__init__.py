@@ -0,0 +1 @@
+# Мониторинг и метрики
@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    """Текущее значение"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Реестр метрик процесса с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Функция, обновляющая метрики непосредственно перед выгрузкой"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# HTTP
+http_requests_total = registry.counter(
+    "ainventory_http_requests_total", "Количество HTTP-запросов", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "ainventory_http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")
+)
+http_request_sql_queries = registry.histogram(
+    "ainventory_http_request_sql_queries", "Количество SQL-запросов на один HTTP-запрос", ("route",), COUNT_BUCKETS
+)
+http_request_sql_duration = registry.histogram(
+    "ainventory_http_request_sql_duration_seconds", "Суммарное время SQL на один HTTP-запрос", ("route",)
+)
+
+# SQL
+sql_queries_total = registry.counter(
+    "ainventory_sql_queries_total", "Количество SQL-запросов", ("operation",)
+)
+sql_query_duration = registry.histogram(
+    "ainventory_sql_query_duration_seconds", "Время выполнения SQL-запроса", ("operation",)
+)
+
+# Загрузка данных
+ingest_rows_total = registry.counter(
+    "ainventory_ingest_rows_total", "Загружено строк из файлов", ("file_type",)
+)
+ingest_duration = registry.histogram(
+    "ainventory_ingest_duration_seconds", "Время обработки загруженного файла", ("file_type",)
+)
+ingest_rows_per_second = registry.gauge(
+    "ainventory_ingest_rows_per_second", "Скорость обработки последнего загруженного файла", ("file_type",)
+)
+
+# Прогнозирование
+forecast_fit_duration = registry.histogram(
+    "ainventory_forecast_fit_duration_seconds", "Время обучения модели прогноза", ("model",)
+)
+
+# Кеш аналитики: hits, stale_hits, coalesced (ждали идущего вычисления), misses, bypassed
+analytics_cache_requests_total = registry.counter(
+    "ainventory_analytics_cache_requests_total", "Запросы аналитики по результату кеша", ("route", "result")
+)
+
+# Допуск тяжелых маршрутов: admitted, queued (получили место после ожидания), rejected (429), timed_out (503)
+admission_requests_total = registry.counter(
+    "ainventory_admission_requests_total", "Запросы тяжелых маршрутов по результату допуска", ("endpoint_class", "result")
+)
+
+# Пул соединений
+db_pool_connections = registry.gauge(
+    "ainventory_db_pool_connections", "Соединения пула по состоянию", ("state",)
+)
+db_pool_wait_seconds_total = registry.gauge(
+    "ainventory_db_pool_wait_seconds_total", "Суммарное время ожидания соединения из пула"
+)
+db_pool_timeouts_total = registry.gauge(
+    "ainventory_db_pool_timeouts_total", "Количество таймаутов ожидания соединения"
+)
+
+def _collect_pool_metrics():
+    from ..database.connection import pool_status
+
+    status = pool_status()
+    for state in ("size", "checked_in", "checked_out", "overflow"):
+        if state in status:
+            db_pool_connections.set(status[state], state=state)
+    db_pool_wait_seconds_total.set(status["wait_seconds_total"])
+    db_pool_timeouts_total.set(status["timeouts"])
+
+registry.add_collector(_collect_pool_metrics)
+
+def record_ingestion(file_type: str, rows: int, seconds: float):
+    """Учет скорости загрузки данных по типу файла"""
+    ingest_rows_total.inc(rows, file_type=file_type)
+    ingest_duration.observe(seconds, file_type=file_type)
+    if seconds > 0:
+        ingest_rows_per_second.set(rows / seconds, file_type=file_type)
+
+@contextmanager
+def track_forecast_fit(model: str) -> Iterator[None]:
+    """Замер времени обучения модели прогноза"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        forecast_fit_duration.observe(time.perf_counter() - start, model=model)
@@ -0,0 +1,80 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from .metrics import (
+    http_requests_total, http_request_duration,
+    http_request_sql_queries, http_request_sql_duration
+)
+
+class RequestStats:
+    """Статистика одного HTTP-запроса, накапливаемая по ходу его обработки"""
+
+    __slots__ = ("sql_count", "sql_time", "active")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.active = True
+
+    def add_query(self, seconds: float):
+        if self.active:
+            self.sql_count += 1
+            self.sql_time += seconds
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """Шаблон пути маршрута (/items/{item_id}), а не фактический путь - ограничивает число меток"""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    templates = getattr(app.state, "route_templates", None)
+    if templates is None:
+        templates = {
+            route.endpoint: route.path
+            for route in app.routes
+            if getattr(route, "endpoint", None) is not None
+        }
+        app.state.route_templates = templates
+    return templates.get(endpoint, "unmatched")
+
+class MetricsMiddleware:
+    """ASGI middleware: время ответа и число SQL-запросов по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        finished_at = None
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code, finished_at
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Фоновые задачи выполняются после отправки ответа и в метрики запроса не входят
+                finished_at = time.perf_counter()
+                stats.active = False
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_stats.reset(token)
+            elapsed = (finished_at or time.perf_counter()) - start
+            method = scope.get("method", "")
+            route = route_template(scope)
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_request_sql_queries.observe(stats.sql_count, route=route)
+            http_request_sql_duration.observe(stats.sql_time, route=route)
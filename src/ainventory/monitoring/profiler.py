@@ -0,0 +1,254 @@
+import asyncio
+import collections
+import itertools
+import logging
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import settings
+from .middleware import route_template
+
+logger = logging.getLogger(__name__)
+
+MAX_STATEMENTS = 500
+MAX_STATEMENT_LENGTH = 4000
+
+class StackSampler:
+    """Семплирующий профилировщик: периодически снимает стек заданного потока"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def summary(self, limit: int = 30) -> Dict[str, Any]:
+        """Свернутые стеки (формат flamegraph) и функции с наибольшим собственным временем"""
+        leaf_counts: collections.Counter = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "top_functions": [{"frame": frame, "samples": count} for frame, count in leaf_counts.most_common(limit)],
+            "folded_stacks": [f"{stack} {count}" for stack, count in self.stacks.most_common(limit)],
+        }
+
+class RequestProfile:
+    """Профиль одного запроса: SQL-запросы с временем и срез CPU"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, query_string: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.route = "unmatched"
+        self.started_at = datetime.now()
+        self.duration = 0.0
+        self.status_code = 500
+        self.statements: List[Dict[str, Any]] = []
+        self.dropped_statements = 0
+        self.cpu: Dict[str, Any] = {}
+
+    def add_statement(self, statement: str, parameters: Any, seconds: float):
+        if len(self.statements) >= MAX_STATEMENTS:
+            self.dropped_statements += 1
+            return
+        self.statements.append({
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "parameters": parameters,
+            "duration_ms": seconds * 1000,
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration * 1000,
+            "status_code": self.status_code,
+            "sql_count": len(self.statements) + self.dropped_statements,
+            "sql_duration_ms": sum(s["duration_ms"] for s in self.statements),
+        }
+
+    def details(self) -> Dict[str, Any]:
+        statements = [
+            {**statement, "parameters": repr(statement["parameters"])[:MAX_STATEMENT_LENGTH]}
+            for statement in self.statements
+        ]
+        return {
+            **self.summary(),
+            "query_string": self.query_string,
+            "statements": statements,
+            "dropped_statements": self.dropped_statements,
+            "cpu": self.cpu,
+        }
+
+class ProfileStore:
+    """Ограниченный кольцевой буфер последних профилей"""
+
+    def __init__(self, size: int):
+        self._profiles: collections.deque = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def slowest(self, limit: int) -> List[RequestProfile]:
+        with self._lock:
+            profiles = list(self._profiles)
+        return sorted(profiles, key=lambda p: p.duration, reverse=True)[:limit]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+profile_store = ProfileStore(settings.profiling_buffer_size)
+
+active_profile: ContextVar[Optional[RequestProfile]] = ContextVar("active_profile", default=None)
+
+def instrument_engine_for_profiling(engine: Engine):
+    """Захват SQL-запросов профилируемого запроса (подключается только при включенном профилировании)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if active_profile.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = active_profile.get()
+        if profile is not None and conn.info.get("profile_start"):
+            profile.add_statement(statement, parameters, time.perf_counter() - conn.info["profile_start"].pop())
+
+def _explain_prefix(dialect_name: str) -> Optional[str]:
+    if dialect_name == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    if dialect_name in ("postgresql", "mysql", "mariadb"):
+        return "EXPLAIN "
+    return None
+
+def explain_slow_statements(engine: Engine, profile: RequestProfile, threshold_ms: float):
+    """Планы выполнения для медленных SELECT-запросов (без повторного выполнения запроса)"""
+    prefix = _explain_prefix(engine.dialect.name)
+    if prefix is None:
+        return
+    slow = [
+        statement for statement in profile.statements
+        if statement["duration_ms"] >= threshold_ms
+        and statement["statement"].lstrip().upper().startswith(("SELECT", "WITH"))
+    ]
+    if not slow:
+        return
+    with engine.connect() as conn:
+        for statement in slow:
+            try:
+                rows = conn.exec_driver_sql(prefix + statement["statement"], statement["parameters"]).fetchall()
+                statement["explain"] = [" ".join(str(value) for value in row) for row in rows]
+            except Exception as e:
+                statement["explain_error"] = str(e)
+                conn.rollback()
+
+class ProfilingMiddleware:
+    """Профилирование по заголовку или для заданных маршрутов"""
+
+    def __init__(self, app, engine: Engine):
+        self.app = app
+        self.engine = engine
+        self.header = settings.profiling_header.lower().encode()
+        self.routes = set(settings.profiling_routes)
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                return value.lower() in (b"1", b"true", b"yes")
+        if self.routes:
+            from starlette.routing import Match
+
+            for route in scope["app"].routes:
+                if getattr(route, "path", None) in self.routes and route.matches(scope)[0] == Match.FULL:
+                    return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            scope.get("method", ""), scope.get("path", ""), scope.get("query_string", b"").decode("latin-1")
+        )
+        token = active_profile.set(profile)
+        sampler = StackSampler(threading.get_ident(), settings.profiling_sample_interval_ms / 1000)
+        start = time.perf_counter()
+        finished = False
+
+        async def send_wrapper(message):
+            nonlocal finished
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", str(profile.id).encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finished = True
+                profile.duration = time.perf_counter() - start
+                sampler.stop()
+                active_profile.set(None)
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not finished:
+                profile.duration = time.perf_counter() - start
+                sampler.stop()
+            active_profile.reset(token)
+            profile.route = route_template(scope)
+            profile.cpu = sampler.summary()
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, explain_slow_statements, self.engine, profile, settings.profiling_slow_query_ms
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось получить планы запросов для профиля {profile.id}: {e}")
+            profile_store.add(profile)
@@ -0,0 +1,40 @@
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import sql_queries_total, sql_query_duration
+from .middleware import request_stats
+
+_instrumented = weakref.WeakSet()
+
+def _operation(statement: str) -> str:
+    parts = statement.lstrip().split(None, 1)
+    return parts[0].upper() if parts else "UNKNOWN"
+
+def instrument_engine(engine: Engine):
+    """Подключение счетчиков SQL-запросов к движку через события SQLAlchemy"""
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = _operation(statement)
+        sql_queries_total.inc(operation=operation)
+        sql_query_duration.observe(elapsed, operation=operation)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.add_query(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
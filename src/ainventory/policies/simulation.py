@@ -0,0 +1,115 @@
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Метрики, которые simulate_policy возвращает по каждой позиции
+ITEM_METRICS = ("demand", "sold", "stockout_days", "average_inventory", "holding_cost", "orders")
+
+def policy_levels(
+    mean_demand: np.ndarray,
+    lead_time_days: np.ndarray,
+    safety_stock_days: float,
+    reorder_point_multiplier: float,
+    order_cycle_days: float
+):
+    """Точка заказа и уровень пополнения (s, S) по среднему дневному спросу.
+
+    Страховой запас - safety_stock_days дней спроса, точка заказа - спрос за
+    срок поставки с множителем плюс страховой запас, уровень пополнения -
+    точка заказа плюс спрос за цикл заказа.
+    """
+    safety = safety_stock_days * mean_demand
+    reorder_point = reorder_point_multiplier * mean_demand * lead_time_days + safety
+    order_up_to = reorder_point + order_cycle_days * mean_demand
+    return reorder_point, order_up_to
+
+def simulate_policy(
+    demand: np.ndarray,
+    lead_time_days: np.ndarray,
+    reorder_point: np.ndarray,
+    order_up_to: np.ndarray,
+    initial_stock: np.ndarray,
+    unit_cost: Optional[np.ndarray] = None,
+    holding_cost_rate: float = 0.25
+) -> Dict[str, np.ndarray]:
+    """Дискретная по дням симуляция политики (s, S) сразу для всех позиций.
+
+    demand - спрос (позиции x дни). Каждый день: приход заказов, у которых
+    истек срок поставки, продажа из остатка (неудовлетворенный спрос
+    теряется), заказ до order_up_to, если остаток с учетом заказов в пути
+    не выше reorder_point. Срок поставки не меньше одного дня.
+    holding_cost_rate - годовая стоимость хранения в долях себестоимости.
+    """
+    n, days = demand.shape
+    lead = np.maximum(np.asarray(lead_time_days, dtype=np.int64), 1)
+    slots = int(lead.max(initial=1)) + 1
+    reorder_point = np.asarray(reorder_point, dtype=np.float64)
+    order_up_to = np.asarray(order_up_to, dtype=np.float64)
+
+    # Заказы в пути по дню прихода (кольцевой буфер)
+    pipeline = np.zeros((slots, n))
+    on_hand = np.asarray(initial_stock, dtype=np.float64).copy()
+    on_order = np.zeros(n)
+    sold_total = np.zeros(n)
+    inventory_total = np.zeros(n)
+    stockout_days = np.zeros(n, dtype=np.int32)
+    orders = np.zeros(n, dtype=np.int32)
+    sold = np.empty(n)
+
+    demand_by_day = np.ascontiguousarray(demand.T, dtype=np.float64)
+    for t in range(days):
+        arrivals = pipeline[t % slots]
+        on_hand += arrivals
+        on_order -= arrivals
+        arrivals[:] = 0.0
+
+        day_demand = demand_by_day[t]
+        np.minimum(on_hand, day_demand, out=sold)
+        on_hand -= sold
+        sold_total += sold
+        stockout_days += sold < day_demand
+        inventory_total += on_hand
+
+        position = on_hand + on_order
+        reorder = np.flatnonzero(position <= reorder_point)
+        if len(reorder):
+            quantity = order_up_to[reorder] - position[reorder]
+            positive = quantity > 0
+            reorder, quantity = reorder[positive], quantity[positive]
+            pipeline[(t + lead[reorder]) % slots, reorder] += quantity
+            on_order[reorder] += quantity
+            orders[reorder] += 1
+
+    average_inventory = inventory_total / max(days, 1)
+    cost = np.zeros(n) if unit_cost is None else np.nan_to_num(np.asarray(unit_cost, dtype=np.float64))
+    return {
+        "demand": demand_by_day.sum(axis=0),
+        "sold": sold_total,
+        "stockout_days": stockout_days,
+        "average_inventory": average_inventory,
+        "holding_cost": average_inventory * cost * holding_cost_rate * days / 365,
+        "orders": orders,
+    }
+
+def summarize(metrics: Dict[str, np.ndarray], days: int, unit_cost: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Сводка по позициям: уровень обслуживания (fill rate), дни дефицита, средний запас и стоимость хранения"""
+    n = len(metrics["demand"])
+    demand = float(metrics["demand"].sum())
+    sold = float(metrics["sold"].sum())
+    summary = {
+        "items": n,
+        "days": days,
+        "demand": demand,
+        "sold": sold,
+        "lost_sales": demand - sold,
+        "fill_rate": sold / demand if demand > 0 else 1.0,
+        "stockout_days": int(metrics["stockout_days"].sum()),
+        "stockout_days_per_item": float(metrics["stockout_days"].mean()) if n else 0.0,
+        "items_with_stockouts": int((metrics["stockout_days"] > 0).sum()),
+        "average_inventory": float(metrics["average_inventory"].sum()),
+        "holding_cost": float(metrics["holding_cost"].sum()),
+        "orders": int(metrics["orders"].sum()),
+    }
+    if unit_cost is not None:
+        summary["average_inventory_value"] = float((metrics["average_inventory"] * np.nan_to_num(unit_cost)).sum())
+    return summary
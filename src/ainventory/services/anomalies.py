@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
+import logging
+import time
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.connection import get_db_context
+from ..database.models import DailySales, SalesAnomaly
+from .watermarks import touch_series
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Отметки этих статусов обрабатываются во входе моделей
+ACTIVE_STATUSES = ("open", "confirmed")
+
+def _series_filter(query, model, series: Optional[Iterable[Tuple[int, int]]], warehouse_id: Optional[int]):
+    if series is not None:
+        query = query.where(tuple_(model.product_id, model.warehouse_id).in_(list(series)))
+    if warehouse_id:
+        query = query.where(model.warehouse_id == warehouse_id)
+    return query
+
+def load_daily_matrix(
+    db: Session,
+    history_days: int,
+    series: Optional[Iterable[Tuple[int, int]]] = None,
+    warehouse_id: Optional[int] = None
+):
+    """Плотная матрица дневных продаж (ряды x дни) за history_days дней по последний день продаж.
+
+    Возвращает ряды (product_id, warehouse_id), матрицу, номер дня первой продажи
+    каждого ряда в окне (0, если ряд продавался и раньше) и дату первого дня окна.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if series is not None:
+        series = list(series)
+    end = db.scalar(_series_filter(select(func.max(DailySales.sale_day)), DailySales, series, warehouse_id))
+    if end is None:
+        return None
+    start = end - timedelta(days=history_days - 1)
+
+    rows = db.execute(_series_filter(
+        select(DailySales.product_id, DailySales.warehouse_id, DailySales.sale_day, DailySales.quantity)
+        .where(DailySales.sale_day >= start),
+        DailySales, series, warehouse_id
+    )).all()
+    sales = pd.DataFrame(rows, columns=["product_id", "warehouse_id", "sale_day", "quantity"])
+    keys = sales[["product_id", "warehouse_id"]]
+    codes, _ = pd.factorize(pd.MultiIndex.from_frame(keys))
+    bottom = keys.iloc[np.unique(codes, return_index=True)[1]].reset_index(drop=True)
+
+    day_index = (pd.to_datetime(sales["sale_day"]) - pd.Timestamp(start)).dt.days.to_numpy()
+    Y = np.zeros((len(bottom), history_days), dtype=np.float32)
+    np.add.at(Y, (codes, day_index), sales["quantity"].to_numpy(dtype=np.float32))
+
+    # Ряды, начавшиеся внутри окна: дни до первой продажи не считаются нулевым спросом
+    first = db.execute(_series_filter(
+        select(DailySales.product_id, DailySales.warehouse_id, func.min(DailySales.sale_day))
+        .group_by(DailySales.product_id, DailySales.warehouse_id),
+        DailySales, series, warehouse_id
+    )).all()
+    first = pd.DataFrame(first, columns=["product_id", "warehouse_id", "first_day"])
+    first_day = bottom.merge(first, on=["product_id", "warehouse_id"], how="left")["first_day"]
+    starts = (pd.to_datetime(first_day) - pd.Timestamp(start)).dt.days.clip(lower=0).fillna(0).to_numpy(dtype=np.int64)
+    return bottom, Y, starts, start
+
+def scan_sales_anomalies(
+    db: Session,
+    history_days: Optional[int] = None,
+    series: Optional[Iterable[Tuple[int, int]]] = None,
+    warehouse_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Поиск выбросов во всех рядах (или в series) за history_days дней и запись отметок.
+
+    Статус проверенных отметок (confirmed, dismissed) сохраняется; открытые
+    отметки, которые больше не выбросы (например, продажи исправлены), удаляются.
+    """
+    import numpy as np
+    from ..forecasting.anomalies import KINDS, detect_anomalies
+
+    started = time.perf_counter()
+    history_days = history_days or settings.anomaly_history_days
+    loaded = load_daily_matrix(db, history_days, series, warehouse_id)
+    if loaded is None:
+        return {"series": 0, "days": 0, "detected": 0, "new": 0, "resolved": 0, "by_kind": {}, "seconds": 0.0}
+    bottom, Y, starts, start = loaded
+
+    result = detect_anomalies(Y, starts, window=settings.anomaly_window_days, threshold=settings.anomaly_threshold)
+    rows, days = np.nonzero(result["flags"])
+    detected = {
+        (int(product_id), int(warehouse_id_), start + timedelta(days=int(day))): {
+            "kind": KINDS[int(result["flags"][row, day])],
+            "quantity": float(Y[row, day]),
+            "expected": float(result["expected"][row, day]),
+            "upper_limit": float(result["limit"][row, day]),
+            "score": float(result["score"][row, day]),
+        }
+        for row, day, product_id, warehouse_id_ in zip(
+            rows, days, bottom["product_id"].to_numpy()[rows], bottom["warehouse_id"].to_numpy()[rows]
+        )
+    }
+
+    scanned = list(bottom.itertuples(index=False, name=None))
+    existing = {
+        (product_id, warehouse_id_, sale_day): (anomaly_id, status)
+        for anomaly_id, product_id, warehouse_id_, sale_day, status in db.execute(_series_filter(
+            select(SalesAnomaly.id, SalesAnomaly.product_id, SalesAnomaly.warehouse_id, SalesAnomaly.sale_day, SalesAnomaly.status)
+            .where(SalesAnomaly.sale_day >= start),
+            SalesAnomaly, scanned if series is not None else None, warehouse_id
+        ))
+    }
+
+    new = [
+        {"product_id": key[0], "warehouse_id": key[1], "sale_day": key[2], "status": "open", **values}
+        for key, values in detected.items() if key not in existing
+    ]
+    changed = [{"id": existing[key][0], **values} for key, values in detected.items() if key in existing]
+    resolved_keys = [key for key, (anomaly_id, status) in existing.items() if key not in detected and status == "open"]
+    resolved = [existing[key][0] for key in resolved_keys]
+    if new:
+        db.execute(insert(SalesAnomaly), new)
+    if changed:
+        db.execute(update(SalesAnomaly), changed)
+    if resolved:
+        db.execute(delete(SalesAnomaly).where(SalesAnomaly.id.in_(resolved)))
+    # Новые и снятые отметки меняют вход моделей: ряды пересчитываются плановым прогнозом
+    touch_series(db, [(row["product_id"], row["warehouse_id"]) for row in new] + [key[:2] for key in resolved_keys])
+
+    by_kind: Dict[str, int] = {}
+    for values in detected.values():
+        by_kind[values["kind"]] = by_kind.get(values["kind"], 0) + 1
+    summary = {
+        "series": len(bottom),
+        "days": history_days,
+        "start_date": start,
+        "detected": len(detected),
+        "new": len(new),
+        "resolved": len(resolved),
+        "by_kind": by_kind,
+        "seconds": time.perf_counter() - started,
+    }
+    logger.info(f"Поиск выбросов продаж: {summary['series']} рядов, {len(detected)} отметок, {len(new)} новых")
+    return summary
+
+def run_anomaly_scan(**kwargs) -> Dict[str, Any]:
+    """Поиск выбросов в отдельной сессии (для вызова из пула потоков, загрузки файлов или CLI)"""
+    with get_db_context() as db:
+        return scan_sales_anomalies(db, **kwargs)
+
+def anomaly_marks(
+    db: Session,
+    warehouse_id: Optional[int] = None,
+    series: Optional[Iterable[Tuple[int, int]]] = None
+) -> "pd.DataFrame":
+    """Отметки open и confirmed для обработки во входе моделей"""
+    import pandas as pd
+
+    rows = db.execute(_series_filter(
+        select(SalesAnomaly.product_id, SalesAnomaly.warehouse_id, SalesAnomaly.sale_day,
+               SalesAnomaly.expected, SalesAnomaly.upper_limit)
+        .where(SalesAnomaly.status.in_(ACTIVE_STATUSES)),
+        SalesAnomaly, series, warehouse_id
+    )).all()
+    return pd.DataFrame(rows, columns=["product_id", "warehouse_id", "sale_day", "expected", "limit"])
+
+def clean_demand(
+    db: Session,
+    daily: "pd.DataFrame",
+    mode: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+    series: Optional[Iterable[Tuple[int, int]]] = None,
+    date_col: str = "sale_date",
+    value_col: str = "quantity"
+) -> "pd.DataFrame":
+    """Дневные продажи для модели с обработанными выбросами (settings.anomaly_treatment по умолчанию)"""
+    from ..forecasting.anomalies import treat_anomalies
+
+    mode = mode or settings.anomaly_treatment
+    if mode == "none" or daily.empty:
+        return daily
+    return treat_anomalies(daily, anomaly_marks(db, warehouse_id, series), mode, date_col=date_col, value_col=value_col)
+
+def review_anomaly(db: Session, anomaly_id: int, status: str, comment: Optional[str] = None) -> Optional[SalesAnomaly]:
+    """Решение по отметке: confirmed - выброс, dismissed - нормальный спрос, open - вернуть на проверку"""
+    anomaly = db.get(SalesAnomaly, anomaly_id)
+    if anomaly is None:
+        return None
+    if (anomaly.status in ACTIVE_STATUSES) != (status in ACTIVE_STATUSES):
+        touch_series(db, [(anomaly.product_id, anomaly.warehouse_id)])
+    anomaly.status = status
+    if comment is not None:
+        anomaly.comment = comment
+    anomaly.reviewed_at = None if status == "open" else datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(anomaly)
+    return anomaly
+
+if __name__ == "__main__":
+    # Плановый запуск: python -m ainventory.services.anomalies
+    logging.basicConfig(level=logging.INFO)
+    print(run_anomaly_scan())
@@ -0,0 +1,506 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import event, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.connection import SessionLocal, get_db_context
+from ..database.models import InventoryItem, Product, StockReservation
+from ..database.versions import table_versions
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, от которых зависит индекс: при смене их версий индекс пересобирается
+ATP_TABLES = ("inventory_items", "stock_reservations", "products")
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+class InsufficientStock(Exception):
+    """Резерв не помещается в доступный остаток"""
+
+    def __init__(self, shortages: List[Dict[str, Any]]):
+        super().__init__("Недостаточно доступного остатка")
+        self.shortages = shortages
+
+class StockSnapshot:
+    """Неизменяемая по составу копия остатков: массивы, отсортированные по ключу (продукт, склад).
+
+    Ключ - product_id << 32 | warehouse_id, поэтому строки продукта идут подряд
+    и находятся двумя двоичными поисками. Остаток и резерв меняются на месте
+    после локальных записей, состав строк - только пересборкой.
+    """
+
+    def __init__(self, keys: "np.ndarray", stock: "np.ndarray", reserved: "np.ndarray",
+                 skus: Dict[str, int], versions: Dict[str, int], next_expiry: Optional[datetime], build_ms: float):
+        self.keys = keys
+        self.warehouse_ids = (keys & 0xFFFFFFFF).astype("int64")
+        self.stock = stock
+        self.reserved = reserved
+        self.skus = skus
+        self.versions = versions
+        self.next_expiry = next_expiry
+        self.build_ms = build_ms
+        self.built_at = time.time()
+
+    def rows(self, product_id: int, warehouse_id: int) -> int:
+        import numpy as np
+
+        key = (product_id << 32) | warehouse_id
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return -1
+
+def _fetch_tuples(db: Session, statement) -> List[tuple]:
+    """Строки запроса (константы подставлены в текст) курсором DBAPI: без построения Row в 3-5 раз быстрее на 100 тыс. строк"""
+    connection = db.connection()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def build_snapshot(db: Session) -> StockSnapshot:
+    """Снимок остатков и активных резервов (запросы по колонкам, без ORM-объектов)"""
+    import numpy as np
+
+    started = time.perf_counter()
+    versions, _ = table_versions(db, ATP_TABLES)
+    items = _fetch_tuples(db, select(
+        InventoryItem.product_id,
+        InventoryItem.warehouse_id,
+        func.coalesce(InventoryItem.current_stock, 0.0)
+    ))
+    now = utc_now()
+    reservations = db.execute(
+        select(
+            StockReservation.product_id,
+            StockReservation.warehouse_id,
+            func.sum(StockReservation.quantity),
+            func.min(StockReservation.expires_at)
+        )
+        .where(StockReservation.status == "active", StockReservation.expires_at > now)
+        .group_by(StockReservation.product_id, StockReservation.warehouse_id)
+    ).all()
+    skus = dict(_fetch_tuples(db, select(Product.sku, Product.id)))
+
+    if items:
+        data = np.array(items, dtype="float64")
+        keys = (data[:, 0].astype("int64") << 32) | data[:, 1].astype("int64")
+        order = np.argsort(keys, kind="stable")
+        keys, stock = keys[order], data[order, 2]
+    else:
+        keys, stock = np.empty(0, dtype="int64"), np.empty(0, dtype="float64")
+    reserved = np.zeros(len(keys), dtype="float64")
+    next_expiry = None
+    snapshot = StockSnapshot(keys, stock, reserved, skus, versions, None, 0.0)
+    for product_id, warehouse_id, quantity, expires_at in reservations:
+        position = snapshot.rows(product_id, warehouse_id)
+        if position >= 0:
+            reserved[position] += quantity
+        expires_at = _as_utc(expires_at)
+        next_expiry = expires_at if next_expiry is None else min(next_expiry, expires_at)
+    snapshot.next_expiry = next_expiry
+    snapshot.build_ms = (time.perf_counter() - started) * 1000
+    return snapshot
+
+class StockIndex:
+    """Индекс доступного к обещанию остатка (ATP) по (продукт, склад) в памяти процесса.
+
+    Поиск идет по снимку без обращения к БД. Снимок обновляется:
+    - сразу, если остаток изменен ORM-объектом, резервом или списанием
+      продаж (микропакеты ingest) в этом процессе;
+    - пересборкой в фоновом потоке после массовых записей в этом процессе,
+      при смене версий таблиц (записи других воркеров, проверка раз в
+      refresh_interval секунд) и при истечении резерва.
+    Пока идет пересборка, запросы обслуживает прежний снимок.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[StockSnapshot] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._stale = False
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rebuilds = 0
+
+    # Снимок и обновление
+
+    def build(self) -> StockSnapshot:
+        with get_db_context() as db:
+            snapshot = build_snapshot(db)
+        with self._lock:
+            self._snapshot = snapshot
+            self.rebuilds += 1
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._refresh_loop, name="atp-refresh", daemon=True)
+                self._thread.start()
+        logger.info(f"Индекс ATP построен: {len(snapshot.keys)} позиций за {snapshot.build_ms:.1f} мс")
+        return snapshot
+
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def snapshot(self) -> StockSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Одновременные первые запросы ждут одной сборки
+            with self._build_lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self.build()
+        return snapshot
+
+    def mark_stale(self):
+        """Пересборка в фоне как можно скорее (массовая запись в этом процессе)"""
+        self._stale = True
+        self._wakeup.set()
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            snapshot = self._snapshot
+            rebuild = self._stale or (snapshot.next_expiry is not None and utc_now() >= snapshot.next_expiry)
+            self._stale = False
+            try:
+                if not rebuild:
+                    with get_db_context() as db:
+                        versions, _ = table_versions(db, ATP_TABLES)
+                    rebuild = versions != snapshot.versions
+                if rebuild:
+                    self.build()
+            except Exception as e:
+                logger.warning(f"Не удалось обновить индекс ATP: {e}")
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def apply_stock(self, changes: Iterable[Tuple[int, int, float]]) -> bool:
+        """Новые остатки позиций после фиксации; False - позиции нет в снимке (нужна пересборка)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        for product_id, warehouse_id, stock in changes:
+            position = snapshot.rows(product_id, warehouse_id)
+            if position < 0:
+                return False
+            snapshot.stock[position] = stock
+        return True
+
+    def apply_sold(self, sold: Iterable[Tuple[int, int, float]]) -> bool:
+        """Списание проданного после фиксации (остаток не ниже нуля, как в UPDATE); False - позиции нет в снимке"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        for product_id, warehouse_id, quantity in sold:
+            position = snapshot.rows(product_id, warehouse_id)
+            if position < 0:
+                return False
+            snapshot.stock[position] = max(snapshot.stock[position] - quantity, 0.0)
+        return True
+
+    def expect_versions(self, tables: Iterable[str]):
+        """Свои записи уже примененные к снимку: увеличение версий их таблиц после фиксации
+        не считается чужим изменением. Чужая запись в те же таблицы все равно дает расхождение"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        for table in tables:
+            snapshot.versions[table] = snapshot.versions.get(table, 0) + 1
+
+    def apply_reserved(self, deltas: Iterable[Tuple[int, int, float]]):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        for product_id, warehouse_id, quantity in deltas:
+            position = snapshot.rows(product_id, warehouse_id)
+            if position >= 0:
+                snapshot.reserved[position] = max(snapshot.reserved[position] + quantity, 0.0)
+
+    # Запросы
+
+    def resolve_products(self, lines: Sequence[Dict[str, Any]]) -> List[Optional[int]]:
+        skus = self.snapshot().skus
+        return [line.get("product_id") if line.get("product_id") is not None else skus.get(line.get("sku")) for line in lines]
+
+    def lookup(
+        self,
+        product_ids: Sequence[int],
+        quantities: Sequence[float],
+        warehouse_ids: Optional[Sequence[int]] = None
+    ) -> Dict[str, Any]:
+        """Склады, способные отгрузить каждую строку корзины, одним векторным проходом.
+
+        Для каждой строки - склады с доступным остатком не меньше нужного
+        (по убыванию остатка) и общий доступный остаток; fulfillable_from -
+        склады, отгружающие всю корзину целиком.
+        """
+        import numpy as np
+
+        snapshot = self.snapshot()
+        products = np.asarray(product_ids, dtype="int64")
+        needed = np.asarray(quantities, dtype="float64")
+        start = np.searchsorted(snapshot.keys, products << 32)
+        end = np.searchsorted(snapshot.keys, (products + 1) << 32)
+        counts = end - start
+
+        # Все строки индекса для всех продуктов корзины (диапазоны подряд)
+        line = np.repeat(np.arange(len(products)), counts)
+        rows = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        warehouses = snapshot.warehouse_ids[rows]
+        available = np.maximum(snapshot.stock[rows] - snapshot.reserved[rows], 0.0)
+        allowed = np.isin(warehouses, np.asarray(warehouse_ids, dtype="int64")) if warehouse_ids else np.ones(len(rows), dtype=bool)
+        can_ship = allowed & (available >= needed[line])
+
+        totals = np.bincount(line[allowed], weights=available[allowed], minlength=len(products))
+
+        # Вся корзина с одного склада: строки одного продукта суммируются
+        unique_products, product_of_line = np.unique(products, return_inverse=True)
+        basket = np.bincount(product_of_line, weights=needed, minlength=len(unique_products))
+        can_ship_basket = allowed & (available >= basket[product_of_line[line]])
+        pairs = np.unique((product_of_line[line][can_ship_basket] << 32) | warehouses[can_ship_basket])
+        candidates, hits = np.unique(pairs & 0xFFFFFFFF, return_counts=True)
+        fulfillable = candidates[hits == len(unique_products)].tolist() if len(products) else []
+
+        order = np.lexsort((-available, line))
+        per_line: List[List[Dict[str, Any]]] = [[] for _ in range(len(products))]
+        for position in order[can_ship[order]].tolist():
+            per_line[line[position]].append({"warehouse_id": int(warehouses[position]), "available": float(available[position])})
+
+        return {
+            "lines": [
+                {
+                    "product_id": int(products[index]),
+                    "quantity": float(needed[index]),
+                    "known": bool(counts[index]),
+                    "total_available": float(totals[index]),
+                    "warehouses": per_line[index],
+                }
+                for index in range(len(products))
+            ],
+            "fulfillable_from": fulfillable,
+        }
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"built": False}
+        return {
+            "built": True,
+            "positions": len(snapshot.keys),
+            "memory_bytes": int(snapshot.keys.nbytes + snapshot.stock.nbytes + snapshot.reserved.nbytes + snapshot.warehouse_ids.nbytes),
+            "build_ms": snapshot.build_ms,
+            "age_seconds": time.time() - snapshot.built_at,
+            "versions": snapshot.versions,
+            "rebuilds": self.rebuilds,
+        }
+
+stock_index = StockIndex(refresh_interval=settings.atp_refresh_interval)
+
+# Изменения остатков в этом процессе: значения ORM-объектов применяются сразу,
+# массовые операции и новые/удаленные позиции ведут к пересборке. Исключения -
+# резервы reserve_stock / release_reservations и списание продаж stock_sold:
+# они применяются к снимку на месте
+_INFO_KEY = "atp_changes"
+_LOCAL_KEY = "atp_applied_table"
+
+def _changes(session: Session) -> Dict[str, Any]:
+    return session.info.setdefault(_INFO_KEY, {"stock": {}, "sold": {}, "rebuild": False, "local_tables": set()})
+
+@contextmanager
+def _applied_to_index(db: Session, table: str = StockReservation.__tablename__) -> Generator[None, None, None]:
+    """Массовая запись в table, которая применяется к снимку без пересборки (резервы - apply_reserved)"""
+    db.info[_LOCAL_KEY] = table
+    try:
+        yield
+    finally:
+        db.info.pop(_LOCAL_KEY, None)
+
+@contextmanager
+def stock_sold(db: Session, sold: Dict[Tuple[int, int], float]) -> Generator[None, None, None]:
+    """Массовое списание остатков по (продукт, склад): после фиксации снимок уменьшается на проданное"""
+    changes = _changes(db)["sold"]
+    for key, quantity in sold.items():
+        changes[key] = changes.get(key, 0.0) + quantity
+    with _applied_to_index(db, InventoryItem.__tablename__):
+        yield
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_stock_changes(session: Session, flush_context):
+    changes = _changes(session)
+    for obj in session.dirty:
+        if isinstance(obj, InventoryItem):
+            changes["stock"][(obj.product_id, obj.warehouse_id)] = obj.current_stock or 0.0
+        elif isinstance(obj, (Product, StockReservation)):
+            changes["rebuild"] = True
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, (InventoryItem, Product, StockReservation)):
+            changes["rebuild"] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is None or table.name not in ATP_TABLES:
+            return
+        changes = _changes(orm_execute_state.session)
+        if orm_execute_state.session.info.get(_LOCAL_KEY) == table.name:
+            changes["local_tables"].add(table.name)
+        else:
+            changes["rebuild"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_stock_changes(session: Session):
+    changes = session.info.pop(_INFO_KEY, None)
+    if not changes:
+        return
+    applied = stock_index.apply_stock((product, warehouse, stock) for (product, warehouse), stock in changes["stock"].items())
+    applied = stock_index.apply_sold(
+        (product, warehouse, quantity) for (product, warehouse), quantity in changes["sold"].items()
+    ) and applied
+    if changes["rebuild"] or not applied:
+        stock_index.mark_stale()
+    else:
+        stock_index.expect_versions(changes["local_tables"])
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_stock_changes(session: Session):
+    session.info.pop(_INFO_KEY, None)
+
+# Резервы
+
+def _aggregate_lines(product_ids: Sequence[int], quantities: Sequence[float]) -> Dict[int, float]:
+    totals: Dict[int, float] = {}
+    for product_id, quantity in zip(product_ids, quantities):
+        totals[product_id] = totals.get(product_id, 0.0) + quantity
+    return totals
+
+def reserve_stock(
+    db: Session,
+    reference: str,
+    warehouse_id: int,
+    product_ids: Sequence[int],
+    quantities: Sequence[float],
+    ttl_seconds: Optional[int] = None
+) -> Dict[str, Any]:
+    """Резерв всех строк заказа на складе или ни одной.
+
+    Резервы вставляются первыми, затем блокируются строки остатков (FOR UPDATE
+    в PostgreSQL; в SQLite транзакция уже держит блокировку записи) и
+    проверяется сумма активных резервов вместе с новыми: параллельные резервы
+    одной позиции проверяются по очереди и не превышают остаток.
+    """
+    totals = _aggregate_lines(product_ids, quantities)
+    keys = [(product_id, warehouse_id) for product_id in totals]
+    now = utc_now()
+    expires_at = now + timedelta(seconds=ttl_seconds or settings.atp_reservation_ttl_seconds)
+
+    with _applied_to_index(db):
+        db.execute(insert(StockReservation), [
+            {"product_id": product_id, "warehouse_id": warehouse_id, "quantity": quantity,
+             "reference": reference, "status": "active", "expires_at": expires_at}
+            for product_id, quantity in totals.items()
+        ])
+    stock = dict(
+        ((row.product_id, row.warehouse_id), row.current_stock or 0.0)
+        for row in db.execute(
+            select(InventoryItem.product_id, InventoryItem.warehouse_id, InventoryItem.current_stock)
+            .where(tuple_(InventoryItem.product_id, InventoryItem.warehouse_id).in_(keys))
+            .order_by(InventoryItem.id)
+            .with_for_update()
+        )
+    )
+    reserved = dict(
+        ((row[0], row[1]), row[2])
+        for row in db.execute(
+            select(StockReservation.product_id, StockReservation.warehouse_id, func.sum(StockReservation.quantity))
+            .where(
+                tuple_(StockReservation.product_id, StockReservation.warehouse_id).in_(keys),
+                StockReservation.status == "active",
+                StockReservation.expires_at > now
+            )
+            .group_by(StockReservation.product_id, StockReservation.warehouse_id)
+        )
+    )
+
+    shortages = []
+    for product_id, quantity in totals.items():
+        key = (product_id, warehouse_id)
+        if key not in stock:
+            shortages.append({"product_id": product_id, "requested": quantity, "available": 0.0, "error": "Товар на складе не найден"})
+            continue
+        # Доступно без учета этого резерва (он уже вставлен и вошел в сумму)
+        available = stock[key] - reserved.get(key, 0.0) + quantity
+        if available < quantity:
+            shortages.append({"product_id": product_id, "requested": quantity, "available": max(available, 0.0)})
+    if shortages:
+        db.rollback()
+        raise InsufficientStock(shortages)
+
+    db.commit()
+    stock_index.apply_reserved((product_id, warehouse_id, quantity) for product_id, quantity in totals.items())
+    return {
+        "reference": reference,
+        "warehouse_id": warehouse_id,
+        "expires_at": expires_at.isoformat(),
+        "lines": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in totals.items()],
+    }
+
+def release_reservations(db: Session, reference: str) -> int:
+    """Снятие активных резервов заказа; возвращает число снятых строк"""
+    with _applied_to_index(db):
+        released = db.execute(
+            update(StockReservation)
+            .where(StockReservation.reference == reference, StockReservation.status == "active")
+            .values(status="released")
+            .returning(StockReservation.product_id, StockReservation.warehouse_id, StockReservation.quantity)
+        ).all()
+    db.commit()
+    stock_index.apply_reserved((row[0], row[1], -row[2]) for row in released)
+    return len(released)
+
+def list_reservations(db: Session, reference: str) -> List[Dict[str, Any]]:
+    now = utc_now()
+    rows = db.execute(
+        select(StockReservation).where(StockReservation.reference == reference).order_by(StockReservation.id)
+    ).scalars().all()
+    return [
+        {
+            "id": row.id,
+            "product_id": row.product_id,
+            "warehouse_id": row.warehouse_id,
+            "quantity": row.quantity,
+            "status": "expired" if row.status == "active" and _as_utc(row.expires_at) <= now else row.status,
+            "expires_at": _as_utc(row.expires_at).isoformat(),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,160 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("create", "update", "delete")
+
+class BatchSpec:
+    """Описание пакетной записи для модели: уникальный ключ и ссылки на другие таблицы"""
+
+    def __init__(self, model, unique_key: Sequence[str], references: Dict[str, Tuple[Any, str]]):
+        self.model = model
+        self.unique_key = tuple(unique_key)
+        # Колонка -> (модель, на которую она ссылается; текст ошибки)
+        self.references = references
+
+    def key(self, row: Dict[str, Any]) -> Tuple:
+        return tuple(row[column] for column in self.unique_key)
+
+def _result(operation: str, index: int, id: Optional[int] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "operation": operation,
+        "index": index,
+        "id": id,
+        "status": "error" if error else "ok",
+        "error": error,
+    }
+
+def apply_batch(
+    db: Session,
+    spec: BatchSpec,
+    creates: List[Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    deletes: List[int],
+    atomic: bool = False
+) -> Dict[str, Any]:
+    """Пакет создания, изменения и удаления записей одной транзакцией.
+
+    Ссылки и уникальность проверяются запросами по множествам (по одному на
+    таблицу), изменения применяются массовыми insert/update/delete. Ошибочные
+    элементы попадают в результаты; при atomic=True ошибка любого элемента
+    отменяет весь пакет.
+    """
+    model = spec.model
+    # Явный null в колонке ключа означает "не менять" (колонки ключа обязательные)
+    for row in updates:
+        for column in spec.unique_key:
+            if column in row and row[column] is None:
+                del row[column]
+    results: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    # Существующие записи для изменения и удаления: ключ нужен для проверки уникальности
+    touched_ids = {row["id"] for row in updates} | set(deletes)
+    existing: Dict[int, Tuple] = {}
+    if touched_ids:
+        columns = [getattr(model, column) for column in spec.unique_key]
+        for row in db.execute(select(model.id, *columns).where(model.id.in_(touched_ids))):
+            existing[row[0]] = tuple(row[1:])
+
+    valid_deletes = []
+    for index, item_id in enumerate(deletes):
+        if item_id not in existing:
+            results[("delete", index)] = _result("delete", index, item_id, "Запись не найдена")
+        else:
+            valid_deletes.append(item_id)
+    deleted_ids = set(valid_deletes)
+
+    # Итоговые строки: создаваемые и изменяемые (с ключом после изменения)
+    candidates: List[Tuple[str, int, Dict[str, Any], Tuple]] = []
+    for index, row in enumerate(creates):
+        candidates.append(("create", index, row, spec.key(row)))
+    for index, row in enumerate(updates):
+        current = existing.get(row["id"])
+        if current is None:
+            results[("update", index)] = _result("update", index, row["id"], "Запись не найдена")
+        elif row["id"] in deleted_ids:
+            results[("update", index)] = _result("update", index, row["id"], "Запись удаляется в этом же пакете")
+        else:
+            key = tuple(row.get(column, value) for column, value in zip(spec.unique_key, current))
+            candidates.append(("update", index, row, key))
+
+    # Ссылки: один запрос на каждую таблицу
+    for column, (reference, message) in spec.references.items():
+        wanted = {row[column] for _, _, row, _ in candidates if row.get(column) is not None}
+        found = set(db.scalars(select(reference.id).where(reference.id.in_(wanted)))) if wanted else set()
+        for operation, index, row, _ in candidates:
+            if row.get(column) is not None and row[column] not in found and (operation, index) not in results:
+                results[(operation, index)] = _result(operation, index, row.get("id"), message)
+
+    # Уникальность: повторы внутри пакета и конфликты с записями, которые не удаляются
+    # и не меняют ключ в этом же пакете
+    final_keys = {row["id"]: key for operation, _, row, key in candidates if operation == "update"}
+    changed_keys = {key for operation, _, row, key in candidates if operation == "create" or existing[row["id"]] != key}
+    conflicts = {}
+    if changed_keys:
+        columns = [getattr(model, column) for column in spec.unique_key]
+        for row in db.execute(select(model.id, *columns).where(tuple_(*columns).in_(list(changed_keys)))):
+            item_id, key = row[0], tuple(row[1:])
+            if item_id in deleted_ids or (item_id in final_keys and final_keys[item_id] != key):
+                continue
+            conflicts[key] = item_id
+    seen: Dict[Tuple, Tuple[str, int]] = {}
+    for operation, index, row, key in candidates:
+        if (operation, index) in results:
+            continue
+        owner = conflicts.get(key)
+        if key in seen:
+            results[(operation, index)] = _result(operation, index, row.get("id"), "Повтор уникального ключа в пакете")
+        elif owner is not None and owner != row.get("id"):
+            results[(operation, index)] = _result(operation, index, row.get("id"), f"Запись с таким ключом уже существует (id={owner})")
+        else:
+            seen[key] = (operation, index)
+
+    failed = len(results)
+    valid_updates = [row for operation, index, row, _ in candidates if operation == "update" and (operation, index) not in results]
+    valid_creates = [(index, row) for operation, index, row, _ in candidates if operation == "create" and (operation, index) not in results]
+    applied = not (atomic and failed)
+
+    if applied:
+        if valid_deletes:
+            db.execute(delete(model).where(model.id.in_(valid_deletes)))
+        if valid_updates:
+            # Массовый UPDATE по первичному ключу (строки группируются по набору колонок)
+            db.execute(update(model), valid_updates)
+        created_ids = []
+        if valid_creates:
+            created_ids = list(db.scalars(
+                insert(model).returning(model.id, sort_by_parameter_order=True),
+                [row for _, row in valid_creates]
+            ))
+        db.commit()
+        logger.info(
+            f"Пакет {model.__tablename__}: создано {len(valid_creates)}, изменено {len(valid_updates)}, "
+            f"удалено {len(valid_deletes)}, ошибок {failed}"
+        )
+    else:
+        created_ids = [None] * len(valid_creates)
+
+    status = "ok" if applied else "skipped"
+    for (index, _), item_id in zip(valid_creates, created_ids):
+        results[("create", index)] = {**_result("create", index, item_id), "status": status}
+    for operation, index, row, _ in candidates:
+        if operation == "update" and ("update", index) not in results:
+            results[("update", index)] = {**_result("update", index, row["id"]), "status": status}
+    for index, item_id in enumerate(deletes):
+        if ("delete", index) not in results:
+            results[("delete", index)] = {**_result("delete", index, item_id), "status": status}
+
+    order = {operation: position for position, operation in enumerate(OPERATIONS)}
+    return {
+        "applied": applied,
+        "created": len(valid_creates) if applied else 0,
+        "updated": len(valid_updates) if applied else 0,
+        "deleted": len(valid_deletes) if applied else 0,
+        "failed": failed,
+        "results": [results[key] for key in sorted(results, key=lambda key: (order[key[0]], key[1]))],
+    }
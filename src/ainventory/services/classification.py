@@ -0,0 +1,167 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import logging
+import time
+
+from sqlalchemy import Integer, case, cast, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.connection import get_db_context
+from ..database.models import DailySales, InventoryItem
+
+logger = logging.getLogger(__name__)
+
+def _day_number(dialect: str, day):
+    """Номер дня (целое) для деления окна на периоды средствами БД"""
+    if dialect == "sqlite":
+        return cast(func.julianday(day), Integer)
+    return cast(func.to_char(day, "J"), Integer)
+
+def classification_query(dialect: str, start: date, end: date, period_days: int,
+                         a_share: float, b_share: float, x_cv: float, y_cv: float):
+    """Классы ABC/XYZ позиций с продажами в окне [start, end] одним запросом по daily_sales.
+
+    ABC: позиции склада по убыванию выручки, накопленная доля - оконной суммой;
+    позиция относится к A, если доля выручки перед ней меньше a_share (так
+    позиция, пересекающая порог, остается в A). XYZ: коэффициент вариации спроса
+    по периодам окна, периоды без продаж считаются нулевыми (n - число периодов
+    окна, а не периодов с продажами).
+    """
+    span = (end - start).days + 1
+    periods_total = -(-span // period_days)
+    offset = _day_number(dialect, DailySales.sale_day) - _day_number(dialect, literal(start))
+    if dialect == "sqlite":
+        # Окно обычно покрывает большую часть таблицы: SQLite быстрее читает ее целиком,
+        # чем по idx_daily_sales_day с выборкой строк вразброс (в 2 раза на 2 млн строк)
+        window = offset.between(0, span - 1)
+    else:
+        window = DailySales.sale_day.between(start, end)
+
+    periods = select(
+        DailySales.product_id,
+        DailySales.warehouse_id,
+        func.sum(DailySales.quantity).label("quantity"),
+        func.sum(DailySales.revenue).label("revenue")
+    ).where(window).group_by(DailySales.product_id, DailySales.warehouse_id, offset // period_days).subquery("periods")
+
+    totals = select(
+        periods.c.product_id,
+        periods.c.warehouse_id,
+        func.sum(periods.c.revenue).label("revenue"),
+        func.sum(periods.c.quantity).label("quantity"),
+        func.sum(periods.c.quantity * periods.c.quantity).label("squares")
+    ).group_by(periods.c.product_id, periods.c.warehouse_id).subquery("totals")
+
+    running = func.sum(totals.c.revenue).over(
+        partition_by=totals.c.warehouse_id,
+        order_by=(totals.c.revenue.desc(), totals.c.product_id),
+        rows=(None, 0)
+    )
+    warehouse_revenue = func.nullif(func.sum(totals.c.revenue).over(partition_by=totals.c.warehouse_id), 0)
+    mean = totals.c.quantity / periods_total
+    variance = totals.c.squares / periods_total - mean * mean
+    ranked = select(
+        totals.c.product_id,
+        totals.c.warehouse_id,
+        ((running - totals.c.revenue) / warehouse_revenue).label("share_before"),
+        (running / warehouse_revenue).label("revenue_share"),
+        case(
+            (totals.c.quantity > 0, func.sqrt(case((variance > 0, variance), else_=0.0)) / mean),
+            else_=None
+        ).label("demand_cv")
+    ).subquery("ranked")
+
+    return select(
+        ranked.c.product_id,
+        ranked.c.warehouse_id,
+        ranked.c.revenue_share,
+        ranked.c.demand_cv,
+        case(
+            (ranked.c.share_before < a_share, "A"),
+            (ranked.c.share_before < b_share, "B"),
+            else_="C"
+        ).label("abc_class"),
+        case(
+            (ranked.c.demand_cv.is_(None), None),
+            (ranked.c.demand_cv <= x_cv, "X"),
+            (ranked.c.demand_cv <= y_cv, "Y"),
+            else_="Z"
+        ).label("xyz_class")
+    ).subquery("classes")
+
+def classify_inventory(
+    db: Session,
+    days: Optional[int] = None,
+    period_days: Optional[int] = None,
+    as_of: Optional[date] = None
+) -> Dict[str, Any]:
+    """Пересчет ABC/XYZ-классов всех позиций инвентаря в текущей транзакции.
+
+    Окно - days дней по последний день продаж (или as_of). Расчет и запись
+    выполняет БД: UPDATE ... FROM по результату оконного запроса, без выгрузки
+    продаж в приложение. Позиции без продаж в окне получают класс C без класса XYZ.
+    """
+    started = time.perf_counter()
+    days = days or settings.classification_days
+    period_days = period_days or settings.classification_period_days
+    end = as_of or db.scalar(select(func.max(DailySales.sale_day)))
+    classified_at = datetime.now(timezone.utc)
+    keep_updated = {"last_updated": InventoryItem.last_updated, "classified_at": classified_at}
+
+    db.execute(update(InventoryItem).values(
+        abc_class="C", xyz_class=None, revenue_share=None, demand_cv=None, **keep_updated
+    ))
+    classified = 0
+    if end is not None:
+        start = end - timedelta(days=days - 1)
+        classes = classification_query(
+            db.get_bind().dialect.name, start, end, period_days,
+            settings.classification_a_share, settings.classification_b_share,
+            settings.classification_x_cv, settings.classification_y_cv
+        )
+        result = db.execute(
+            update(InventoryItem)
+            .where(InventoryItem.product_id == classes.c.product_id, InventoryItem.warehouse_id == classes.c.warehouse_id)
+            .values(
+                abc_class=classes.c.abc_class,
+                xyz_class=classes.c.xyz_class,
+                revenue_share=classes.c.revenue_share,
+                demand_cv=classes.c.demand_cv,
+                **keep_updated
+            ),
+            execution_options={"synchronize_session": False}
+        )
+        classified = result.rowcount
+
+    summary = {
+        "as_of": end,
+        "days": days,
+        "period_days": period_days,
+        "classified": classified,
+        "matrix": classification_matrix(db),
+        "classified_at": classified_at,
+        "duration_ms": (time.perf_counter() - started) * 1000,
+    }
+    logger.info(f"ABC/XYZ-классификация: {classified} позиций с продажами за {summary['duration_ms']:.0f} мс")
+    return summary
+
+def classification_matrix(db: Session) -> Dict[str, int]:
+    """Число позиций в каждой клетке ABC/XYZ ("C-" - без продаж в окне)"""
+    rows = db.execute(
+        select(InventoryItem.abc_class, InventoryItem.xyz_class, func.count())
+        .where(InventoryItem.abc_class.is_not(None))
+        .group_by(InventoryItem.abc_class, InventoryItem.xyz_class)
+    ).all()
+    return {f"{abc}{xyz or '-'}": count for abc, xyz, count in sorted(rows, key=lambda row: (row[0], row[1] or "~"))}
+
+def run_classification(**kwargs) -> Dict[str, Any]:
+    """Задача классификации в отдельной сессии (для вызова из пула потоков или CLI)"""
+    with get_db_context() as db:
+        return classify_inventory(db, **kwargs)
+
+if __name__ == "__main__":
+    # Плановый запуск: python -m ainventory.services.classification
+    logging.basicConfig(level=logging.INFO)
+    summary = run_classification()
+    print({key: value for key, value in summary.items() if key != "classified_at"})
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any, Optional
+import logging
+import time
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.models import DailySales
+
+if TYPE_CHECKING:
+    from ..forecasting.demand_matrix import DemandMatrix
+
+logger = logging.getLogger(__name__)
+
+# Строк daily_sales в одной порции при заполнении матрицы
+FETCH_ROWS = 200_000
+
+def _series_filter(query, series: Optional[Any], warehouse_id: Optional[int]):
+    if series is not None:
+        query = query.join(series, and_(
+            DailySales.product_id == series.c.product_id, DailySales.warehouse_id == series.c.warehouse_id
+        ))
+    if warehouse_id:
+        query = query.where(DailySales.warehouse_id == warehouse_id)
+    return query
+
+def build_demand_matrix(
+    db: Session,
+    days: Optional[int] = None,
+    end: Optional[date] = None,
+    warehouse_id: Optional[int] = None,
+    series: Optional[Any] = None,
+    anomaly_treatment: str = "none",
+    root: Optional[str] = None
+) -> Optional[DemandMatrix]:
+    """Матрица дневного спроса (ряды x дни) за days дней по end (последний день продаж) из daily_sales.
+
+    Строится один раз на запуск и передается исполнителям путем к каталогу.
+    series - подзапрос с product_id и warehouse_id (например, ряды к пересчету).
+    Продажи читаются порциями и сразу прибавляются к файлу, без промежуточного
+    DataFrame всей истории. anomaly_treatment - обработка отметок выбросов
+    (winsorize, exclude, none). None - продаж нет.
+    """
+    import numpy as np
+    import pandas as pd
+    from ..forecasting.demand_matrix import DemandMatrix
+
+    started = time.perf_counter()
+    days = days or settings.demand_matrix_days
+    if end is None:
+        # Последний день по всем рядам: ряды подмножества дополняются нулями до него
+        end = db.scalar(_series_filter(select(func.max(DailySales.sale_day)), None, warehouse_id))
+        if end is None:
+            return None
+    end = pd.Timestamp(end).date()
+    start = end - timedelta(days=days - 1)
+
+    bounds = db.execute(_series_filter(
+        select(DailySales.product_id, DailySales.warehouse_id, func.min(DailySales.sale_day), func.max(DailySales.sale_day))
+        .group_by(DailySales.product_id, DailySales.warehouse_id)
+        .having(func.max(DailySales.sale_day) >= start, func.min(DailySales.sale_day) <= end),
+        series, warehouse_id
+    )).all()
+    bounds = pd.DataFrame(bounds, columns=["product_id", "warehouse_id", "first_day", "last_day"])
+    # Дни до первой продажи ряда не считаются нулевым спросом
+    starts = (pd.to_datetime(bounds["first_day"]) - pd.Timestamp(start)).dt.days.clip(lower=0).to_numpy(dtype=np.int64)
+    matrix = DemandMatrix.create(
+        bounds[["product_id", "warehouse_id"]].to_numpy(dtype=np.int64), start, days,
+        root or settings.demand_matrix_dir, starts
+    )
+
+    result = db.execute(
+        _series_filter(
+            select(DailySales.product_id, DailySales.warehouse_id, DailySales.sale_day, DailySales.quantity)
+            .where(DailySales.sale_day.between(start, end)),
+            series, warehouse_id
+        ),
+        execution_options={"yield_per": FETCH_ROWS}
+    )
+    rows = 0
+    for partition in result.partitions():
+        part = pd.DataFrame(partition, columns=["product_id", "warehouse_id", "sale_day", "quantity"])
+        day_index = (pd.to_datetime(part["sale_day"]) - pd.Timestamp(start)).dt.days.to_numpy()
+        matrix.add(part["product_id"].to_numpy(), part["warehouse_id"].to_numpy(), day_index, part["quantity"].to_numpy())
+        rows += len(part)
+
+    if anomaly_treatment != "none":
+        from .anomalies import anomaly_marks
+        matrix.apply_marks(anomaly_marks(db, warehouse_id), anomaly_treatment)
+    matrix.flush()
+    logger.info(
+        f"Матрица спроса {matrix.shape[0]} x {matrix.shape[1]} ({rows} строк daily_sales) "
+        f"за {time.perf_counter() - started:.2f} с: {matrix.path}"
+    )
+    return matrix
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Типы событий, после которых задача больше не публикует событий
+FINAL_EVENTS = ("completed", "failed")
+
+def job_kind(job: str) -> str:
+    """Тип задачи из идентификатора вида upload:12, forecast:prophet:1:2, simulation:3"""
+    return job.split(":", 1)[0]
+
+class MemoryBackend:
+    """События доставляются только подписчикам текущего процесса"""
+
+    def start(self, dispatch: Callable[[str], None]):
+        self.dispatch = dispatch
+
+    def publish(self, message: str):
+        self.dispatch(message)
+
+    def close(self):
+        pass
+
+class PostgresBackend:
+    """Рассылка событий между воркерами через LISTEN/NOTIFY PostgreSQL.
+
+    Публикация - pg_notify в отдельном соединении, прием - фоновый поток со
+    своим соединением; событие доставляется и в процесс-отправитель через
+    NOTIFY, поэтому локально при публикации оно не рассылается.
+    """
+
+    channel = "ainventory_events"
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._lock = threading.Lock()
+        self._connection = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def start(self, dispatch: Callable[[str], None]):
+        self.dispatch = dispatch
+        self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while not self._stopped.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(connection.notifies.pop(0).payload)
+                connection.close()
+            except Exception as e:
+                logger.warning(f"Прием событий через PostgreSQL прерван: {e}")
+                self._stopped.wait(1.0)
+
+    def publish(self, message: str):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None or self._connection.closed:
+                        self._connection = self._connect()
+                    with self._connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+                    return
+                except Exception as e:
+                    self._connection = None
+                    if attempt:
+                        logger.warning(f"Не удалось опубликовать событие: {e}")
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+class Subscription:
+    """Очередь событий одного подписчика (фильтр по задачам и типам задач)"""
+
+    def __init__(self, broker: "EventBroker", jobs: Optional[Iterable[str]], kinds: Optional[Iterable[str]], queue_size: int):
+        self.broker = broker
+        self.jobs = set(jobs or ())
+        self.kinds = set(kinds or ())
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if not self.jobs and not self.kinds:
+            return True
+        return event["job"] in self.jobs or job_kind(event["job"]) in self.kinds
+
+    def _put(self, event: Dict[str, Any]):
+        # Медленный клиент теряет самые старые события, а не тормозит публикацию
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event: Dict[str, Any]):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._put(event)
+        else:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            async with asyncio.timeout(timeout):
+                return await self.queue.get()
+        except TimeoutError:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class EventBroker:
+    """Публикация событий фоновых задач (загрузка, прогнозы, симуляция) и подписка на них.
+
+    publish потокобезопасен и может вызываться из пула потоков; последние
+    события задач хранятся, чтобы подключившийся клиент сразу получил текущее
+    состояние без запроса к БД.
+    """
+
+    def __init__(self, backend=None, history_size: int = 1000, queue_size: int = 1000):
+        self.backend = backend or MemoryBackend()
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self._last: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sequence = 0
+        self._started = False
+
+    def start(self):
+        """Запуск приема событий backend (при первой публикации или подписке)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.backend.start(self._dispatch)
+
+    def publish(self, job: str, event_type: str, **data: Any):
+        self.start()
+        event = {"job": job, "type": event_type, "timestamp": time.time(), **data}
+        self.backend.publish(json.dumps(event, default=str))
+
+    def _dispatch(self, message: str):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logger.warning("Некорректное событие пропущено")
+            return
+        with self._lock:
+            self._sequence += 1
+            event["id"] = self._sequence
+            self._last[event["job"]] = event
+            self._last.move_to_end(event["job"])
+            while len(self._last) > self.history_size:
+                self._last.popitem(last=False)
+            subscribers = [subscriber for subscriber in self._subscribers if subscriber.matches(event)]
+        for subscriber in subscribers:
+            try:
+                subscriber.deliver(event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self._unsubscribe(subscriber)
+
+    def last_event(self, job: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._last.get(job)
+
+    def subscribe(self, jobs: Optional[Iterable[str]] = None, kinds: Optional[Iterable[str]] = None) -> Subscription:
+        self.start()
+        subscription = Subscription(self, jobs, kinds, self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def close(self):
+        self.backend.close()
+
+class ProgressReporter:
+    """Публикация прогресса задачи не чаще, чем раз в every единиц работы"""
+
+    def __init__(self, broker: EventBroker, job: Optional[str], total: Optional[int] = None, every: Optional[int] = None):
+        self.broker = broker
+        self.job = job
+        self.total = total
+        self.every = every or settings.events_progress_every
+        self._reported = 0
+
+    def update(self, processed: int, **data: Any) -> bool:
+        """Возвращает True, если событие опубликовано"""
+        if self.job is None or processed - self._reported < self.every:
+            return False
+        self._reported = processed
+        self.broker.publish(self.job, "progress", processed=processed, total=self.total, **data)
+        return True
+
+def create_backend():
+    if settings.events_backend == "postgres":
+        from sqlalchemy.engine import make_url
+
+        url = make_url(settings.events_database_url or settings.database_url).set(drivername="postgresql")
+        return PostgresBackend(url.render_as_string(hide_password=False))
+    if settings.events_backend != "memory":
+        raise ValueError(f"Неизвестный backend событий: {settings.events_backend}")
+    return MemoryBackend()
+
+event_broker = EventBroker(create_backend(), settings.events_history_size, settings.events_queue_size)
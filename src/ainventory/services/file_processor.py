@@ -1,13 +1,19 @@
+import asyncio
 import pandas as pd
 import logging
 from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime
 import json
+import time
 from pathlib import Path
 
 from ..database.models import Product, Category, Brand, Warehouse, InventoryItem, Sale, DataUpload
 from ..database.connection import get_db_context
 from ..config import settings
+from ..monitoring.metrics import record_ingestion
+from .events import ProgressReporter, event_broker
+from .anomalies import run_anomaly_scan
+from .rollups import upsert_daily_sales
 
 logger = logging.getLogger(__name__)
 
@@ -18,29 +24,56 @@ class FileProcessor:
         self.supported_formats = ['.xlsx', '.xls', '.csv']
         self.max_file_size = settings.max_file_size
     
-    async def process_file(self, file_path: str, file_type: str, warehouse_id: Optional[int] = None) -> Dict[str, Any]:
-        """Обработка загруженного файла"""
+    async def process_file(
+        self,
+        file_path: str,
+        file_type: str,
+        warehouse_id: Optional[int] = None,
+        df: Optional[pd.DataFrame] = None,
+        upload_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Обработка загруженного файла (df - уже разобранные при загрузке данные).
+
+        При заданном upload_id ход обработки публикуется как события задачи upload:<id>.
+        """
+        started = time.perf_counter()
+        job = f"upload:{upload_id}" if upload_id is not None else None
         try:
             # Проверяем формат файла
             file_ext = Path(file_path).suffix.lower()
             if file_ext not in self.supported_formats:
                 raise ValueError(f"Неподдерживаемый формат файла: {file_ext}")
             
-            # Читаем файл
-            df = await self._read_file(file_path)
+            # Читаем файл, если он не был разобран во время загрузки
+            if df is None:
+                df = await self._read_file(file_path)
+            else:
+                df = self._clean_dataframe(df)
+            
+            if job:
+                event_broker.publish(job, "started", file_type=file_type, total=len(df))
+                await self._flush_events()
+            progress = ProgressReporter(event_broker, job, total=len(df))
             
             # Обрабатываем данные в зависимости от типа
             if file_type == "products":
-                result = await self._process_products(df)
+                result = await self._process_products(df, progress)
             elif file_type == "inventory":
-                result = await self._process_inventory(df, warehouse_id)
+                result = await self._process_inventory(df, warehouse_id, progress)
             elif file_type == "sales":
-                result = await self._process_sales(df, warehouse_id)
+                result = await self._process_sales(df, warehouse_id, progress)
             else:
                 raise ValueError(f"Неизвестный тип файла: {file_type}")
             
+            record_ingestion(file_type, result["records_processed"], time.perf_counter() - started)
+            
             # Обновляем статус загрузки
             await self._update_upload_status(file_path, "completed", result["records_processed"])
+            if job:
+                event_broker.publish(
+                    job, "completed", records_processed=result["records_processed"],
+                    errors=len(result.get("errors", [])), seconds=time.perf_counter() - started
+                )
             
             return {
                 "success": True,
@@ -53,6 +86,8 @@ class FileProcessor:
         except Exception as e:
             logger.error(f"Ошибка обработки файла {file_path}: {e}")
             await self._update_upload_status(file_path, "failed", 0, str(e))
+            if job:
+                event_broker.publish(job, "failed", error=str(e))
             raise
     
     async def _read_file(self, file_path: str) -> pd.DataFrame:
@@ -95,14 +130,23 @@ class FileProcessor:
         
         return df
     
-    async def _process_products(self, df: pd.DataFrame) -> Dict[str, Any]:
+    async def _flush_events(self):
+        """Обработка файла не отдает управление циклу событий: короткая пауза, чтобы события ушли клиентам"""
+        await asyncio.sleep(0.01)
+    
+    async def _report_progress(self, progress: Optional[ProgressReporter], position: int, records_processed: int):
+        if progress is not None and progress.update(position, records_processed=records_processed):
+            await self._flush_events()
+    
+    async def _process_products(self, df: pd.DataFrame, progress: Optional[ProgressReporter] = None) -> Dict[str, Any]:
         """Обработка файла с продуктами"""
         records_processed = 0
         errors = []
         warnings = []
         
         with get_db_context() as db:
-            for index, row in df.iterrows():
+            for position, (index, row) in enumerate(df.iterrows()):
+                await self._report_progress(progress, position, records_processed)
                 try:
                     # Проверяем обязательные поля
                     if pd.isna(row.get('sku')) or pd.isna(row.get('name')):
@@ -163,7 +207,12 @@ class FileProcessor:
             "warnings": warnings
         }
     
-    async def _process_inventory(self, df: pd.DataFrame, warehouse_id: Optional[int] = None) -> Dict[str, Any]:
+    async def _process_inventory(
+        self,
+        df: pd.DataFrame,
+        warehouse_id: Optional[int] = None,
+        progress: Optional[ProgressReporter] = None
+    ) -> Dict[str, Any]:
         """Обработка файла с инвентарем"""
         records_processed = 0
         errors = []
@@ -182,7 +231,8 @@ class FileProcessor:
                     raise ValueError("Не найден ни один склад в системе")
                 warehouse_id = warehouse.id
             
-            for index, row in df.iterrows():
+            for position, (index, row) in enumerate(df.iterrows()):
+                await self._report_progress(progress, position, records_processed)
                 try:
                     # Проверяем обязательные поля
                     if pd.isna(row.get('sku')):
@@ -237,11 +287,17 @@ class FileProcessor:
             "warnings": warnings
         }
     
-    async def _process_sales(self, df: pd.DataFrame, warehouse_id: Optional[int] = None) -> Dict[str, Any]:
+    async def _process_sales(
+        self,
+        df: pd.DataFrame,
+        warehouse_id: Optional[int] = None,
+        progress: Optional[ProgressReporter] = None
+    ) -> Dict[str, Any]:
         """Обработка файла с продажами"""
         records_processed = 0
         errors = []
         warnings = []
+        daily_rows = []
         
         with get_db_context() as db:
             # Проверяем warehouse_id
@@ -256,7 +312,8 @@ class FileProcessor:
                     raise ValueError("Не найден ни один склад в системе")
                 warehouse_id = warehouse.id
             
-            for index, row in df.iterrows():
+            for position, (index, row) in enumerate(df.iterrows()):
+                await self._report_progress(progress, position, records_processed)
                 try:
                     # Проверяем обязательные поля
                     if pd.isna(row.get('sku')) or pd.isna(row.get('sale_date')) or pd.isna(row.get('quantity')):
@@ -292,14 +349,34 @@ class FileProcessor:
                     )
                     
                     db.add(sale)
+                    daily_rows.append({
+                        "product_id": sale.product_id,
+                        "warehouse_id": sale.warehouse_id,
+                        "sale_date": sale.sale_date,
+                        "quantity": sale.quantity,
+                        "revenue": sale.revenue,
+                        "cost": sale.cost
+                    })
                     records_processed += 1
                     
                 except Exception as e:
                     errors.append(f"Строка {index + 1}: {str(e)}")
                     continue
             
+            # Дневные итоги в той же транзакции, что и продажи
+            upsert_daily_sales(db, daily_rows)
             db.commit()
         
+        # Выбросы в рядах загрузки отмечаются сразу, до следующего прогноза
+        if settings.anomaly_scan_on_upload and daily_rows:
+            series = sorted({(row["product_id"], row["warehouse_id"]) for row in daily_rows})
+            try:
+                scan = await asyncio.get_running_loop().run_in_executor(None, lambda: run_anomaly_scan(series=series))
+                if scan["new"]:
+                    warnings.append(f"Найдено выбросов продаж: {scan['new']} (проверка: {settings.api_prefix}/anomalies/)")
+            except Exception as e:
+                logger.error(f"Ошибка поиска выбросов после загрузки продаж: {e}")
+        
         return {
             "records_processed": records_processed,
             "errors": errors,
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, insert, select, tuple_, update
+
+from ..config import settings
+from ..database.connection import get_db_context
+from ..database.models import InventoryItem, Product, Sale, Warehouse
+from .atp import stock_sold
+from .rollups import upsert_daily_sales
+
+logger = logging.getLogger(__name__)
+
+SALE_COLUMNS = ("product_id", "warehouse_id", "sale_date", "quantity", "revenue", "cost", "customer_id", "transaction_id")
+
+class IngestOverloaded(Exception):
+    """Буфер заполнен: клиент должен повторить отправку позже"""
+
+def write_sales_batch(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Запись микропакета событий продаж одной транзакцией (групповая фиксация).
+
+    SKU, продукты и склады проверяются запросами по множествам, повторная
+    доставка (тот же transaction_id, продукт и склад) пропускается. В той же
+    транзакции списываются остатки (не ниже нуля) и обновляются дневные итоги.
+    Возвращает результат для каждого события.
+    """
+    results: List[Dict[str, Any]] = [{"status": "ok"} for _ in events]
+
+    with get_db_context() as db:
+        skus = {event["sku"] for event in events if event.get("product_id") is None and event.get("sku")}
+        sku_ids = dict(db.execute(select(Product.sku, Product.id).where(Product.sku.in_(skus))).all()) if skus else {}
+        for event, result in zip(events, results):
+            if event.get("product_id") is None:
+                event["product_id"] = sku_ids.get(event.get("sku"))
+                if not event.get("sku"):
+                    result.update(status="error", error="Не указан product_id или sku")
+                elif event["product_id"] is None:
+                    result.update(status="error", error=f"Продукт с SKU {event['sku']} не найден")
+
+        product_ids = {event["product_id"] for event in events if event["product_id"] is not None}
+        warehouse_ids = {event["warehouse_id"] for event in events}
+        known_products = set(db.scalars(select(Product.id).where(Product.id.in_(product_ids)))) if product_ids else set()
+        known_warehouses = set(db.scalars(select(Warehouse.id).where(Warehouse.id.in_(warehouse_ids))))
+        for event, result in zip(events, results):
+            if result["status"] != "ok":
+                continue
+            if event["product_id"] not in known_products:
+                result.update(status="error", error="Продукт не найден")
+            elif event["warehouse_id"] not in known_warehouses:
+                result.update(status="error", error="Склад не найден")
+
+        # Повторная доставка после таймаута клиента не должна дважды списывать остаток
+        keys = {
+            (event["transaction_id"], event["product_id"], event["warehouse_id"])
+            for event, result in zip(events, results)
+            if result["status"] == "ok" and event.get("transaction_id")
+        }
+        seen = set()
+        if keys:
+            seen = set(db.execute(
+                select(Sale.transaction_id, Sale.product_id, Sale.warehouse_id)
+                .where(tuple_(Sale.transaction_id, Sale.product_id, Sale.warehouse_id).in_(list(keys)))
+            ).all())
+        rows = []
+        for event, result in zip(events, results):
+            if result["status"] != "ok":
+                continue
+            key = (event.get("transaction_id"), event["product_id"], event["warehouse_id"])
+            if key[0]:
+                if key in seen:
+                    result["status"] = "duplicate"
+                    continue
+                seen.add(key)
+            rows.append({column: event.get(column) for column in SALE_COLUMNS})
+
+        if rows:
+            db.execute(insert(Sale), rows)
+
+            stock = {}
+            for row in rows:
+                key = (row["product_id"], row["warehouse_id"])
+                stock[key] = stock.get(key, 0.0) + row["quantity"]
+            sold = bindparam("sold")
+            # Индекс ATP списывает то же количество на месте, без пересборки после каждого пакета
+            with stock_sold(db, stock):
+                db.execute(
+                    update(InventoryItem.__table__)
+                    .where(
+                        InventoryItem.__table__.c.product_id == bindparam("item_product_id"),
+                        InventoryItem.__table__.c.warehouse_id == bindparam("item_warehouse_id")
+                    )
+                    .values(current_stock=case(
+                        (InventoryItem.__table__.c.current_stock > sold, InventoryItem.__table__.c.current_stock - sold),
+                        else_=0
+                    )),
+                    [
+                        {"item_product_id": product_id, "item_warehouse_id": warehouse_id, "sold": quantity}
+                        for (product_id, warehouse_id), quantity in stock.items()
+                    ]
+                )
+            upsert_daily_sales(db, rows)
+
+    return results
+
+class SalesIngestBuffer:
+    """Буфер событий продаж с записью микропакетами.
+
+    Запросы ждут фиксации своего пакета: пакет пишется, когда в буфере
+    набралось max_batch событий или самое старое ждет max_delay секунд. Пока
+    идет запись, новые события копятся и уходят следующим пакетом, поэтому
+    под нагрузкой пакеты растут, а число фиксаций - нет.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float, max_pending: int):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        # (события запроса, future результата, время поступления)
+        self._pending: "deque[Tuple[List[Dict[str, Any]], asyncio.Future, float]]" = deque()
+        self._pending_events = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {"events": 0, "batches": 0, "duplicates": 0, "errors": 0, "rejected_overload": 0, "last_batch_size": 0}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def submit(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Постановка событий в буфер; возвращает их результаты после фиксации пакета"""
+        if not events:
+            return []
+        self._ensure_started()
+        if self._pending_events + len(events) > self.max_pending:
+            self.stats["rejected_overload"] += len(events)
+            raise IngestOverloaded(f"В буфере {self._pending_events} событий (максимум {self.max_pending})")
+        future = self._loop.create_future()
+        self._pending.append((events, future, self._loop.time()))
+        self._pending_events += len(events)
+        self._wakeup.set()
+        return await future
+
+    def _take_batch(self) -> List[Tuple[List[Dict[str, Any]], asyncio.Future]]:
+        # Запросы не делятся между пакетами: результат запроса фиксируется целиком
+        batch, size = [], 0
+        while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+            events, future, _ = self._pending.popleft()
+            batch.append((events, future))
+            size += len(events)
+        self._pending_events -= size
+        return batch
+
+    async def _run(self):
+        while self._pending or not self._closing:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            remaining = self._pending[0][2] + self.max_delay - self._loop.time()
+            if self._pending_events < self.max_batch and remaining > 0 and not self._closing:
+                self._wakeup.clear()
+                try:
+                    async with asyncio.timeout(remaining):
+                        await self._wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+            await self._flush(self._take_batch())
+
+    async def _flush(self, batch: List[Tuple[List[Dict[str, Any]], asyncio.Future]]):
+        events = [event for request, _ in batch for event in request]
+        started = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(None, write_sales_batch, events)
+        except Exception as e:
+            logger.error(f"Ошибка записи пакета продаж ({len(events)} событий): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = len(events)
+        offset = 0
+        for request, future in batch:
+            request_results = results[offset:offset + len(request)]
+            offset += len(request)
+            if not future.done():
+                future.set_result(request_results)
+        for result in results:
+            if result["status"] == "ok":
+                self.stats["events"] += 1
+            elif result["status"] == "duplicate":
+                self.stats["duplicates"] += 1
+            else:
+                self.stats["errors"] += 1
+        logger.debug(f"Пакет продаж: {len(events)} событий за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    async def close(self):
+        """Запись оставшихся событий и остановка (завершение приложения)"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pending_events": self._pending_events,
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+            "max_pending": self.max_pending,
+            **self.stats,
+        }
+
+sales_ingest = SalesIngestBuffer(
+    max_batch=settings.ingest_max_batch,
+    max_delay=settings.ingest_max_delay_ms / 1000,
+    max_pending=settings.ingest_max_pending
+)
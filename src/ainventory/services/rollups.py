@@ -0,0 +1,98 @@
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from ..database.models import DailySales, Sale
+from .watermarks import touch_daily_series, touch_series
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY = ("product_id", "warehouse_id", "sale_day")
+ROLLUP_SUMS = ("quantity", "revenue", "cost", "orders")
+
+def sale_day(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+def aggregate_daily_sales(sales: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Итоги по (продукт, склад, день) для набора продаж"""
+    totals: Dict[Tuple[int, int, date], Dict[str, Any]] = {}
+    for sale in sales:
+        key = (sale["product_id"], sale["warehouse_id"], sale_day(sale["sale_date"]))
+        row = totals.get(key)
+        if row is None:
+            row = totals[key] = dict(zip(ROLLUP_KEY, key), quantity=0.0, revenue=0.0, cost=0.0, orders=0)
+        row["quantity"] += sale["quantity"]
+        row["revenue"] += sale.get("revenue") or 0.0
+        row["cost"] += sale.get("cost") or 0.0
+        row["orders"] += 1
+    return list(totals.values())
+
+def upsert_daily_sales(db: Session, sales: Iterable[Dict[str, Any]]) -> int:
+    """Прибавление продаж к дневным итогам в текущей транзакции (INSERT ... ON CONFLICT DO UPDATE).
+
+    Версия данных затронутых рядов увеличивается там же (series_watermarks).
+    """
+    rows = aggregate_daily_sales(sales)
+    if not rows:
+        return 0
+    touch_series(db, {(row["product_id"], row["warehouse_id"]) for row in rows})
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        _merge_daily_sales(db, rows)
+        return len(rows)
+
+    statement = dialect_insert(DailySales)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={
+            **{column: getattr(DailySales, column) + getattr(statement.excluded, column) for column in ROLLUP_SUMS},
+            "updated_at": func.now()
+        }
+    )
+    db.execute(statement, rows)
+    return len(rows)
+
+def _merge_daily_sales(db: Session, rows: List[Dict[str, Any]]):
+    """Итоги для СУБД без ON CONFLICT: чтение существующих строк и запись по первичному ключу"""
+    for row in rows:
+        current = db.get(DailySales, tuple(row[column] for column in ROLLUP_KEY))
+        if current is None:
+            db.add(DailySales(**row))
+        else:
+            for column in ROLLUP_SUMS:
+                setattr(current, column, getattr(current, column) + row[column])
+    db.flush()
+
+def rebuild_daily_sales(db: Session, since: Optional[date] = None) -> int:
+    """Пересчет дневных итогов из sales (с даты since или полностью) одним INSERT ... SELECT"""
+    day = func.date(Sale.sale_date)
+    cleanup = delete(DailySales)
+    source = select(
+        Sale.product_id,
+        Sale.warehouse_id,
+        day,
+        func.sum(Sale.quantity),
+        func.sum(Sale.revenue),
+        func.coalesce(func.sum(Sale.cost), 0),
+        func.count(Sale.id)
+    ).group_by(Sale.product_id, Sale.warehouse_id, day)
+    if since is not None:
+        cleanup = cleanup.where(DailySales.sale_day >= since)
+        source = source.where(Sale.sale_date >= datetime.combine(since, datetime.min.time()))
+    db.execute(cleanup)
+    db.execute(insert(DailySales).from_select([*ROLLUP_KEY, *ROLLUP_SUMS], source))
+    touch_daily_series(db, since)
+    count = db.scalar(select(func.count()).select_from(DailySales))
+    logger.info(f"Дневные итоги продаж пересчитаны: {count} строк")
+    return count
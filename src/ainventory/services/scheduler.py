@@ -0,0 +1,691 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, select, update
+
+from ..config import settings
+from ..database.connection import engine, get_db_context
+from ..database.models import InventoryItem, JobSchedule, ScheduledJob
+from .events import event_broker
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты очереди: меньше - раньше
+PRIORITY_URGENT = 0     # загрузки файлов
+PRIORITY_HIGH = 10      # прогнозы позиций с наибольшей выручкой (ABC)
+PRIORITY_NORMAL = 20    # остальные прогнозы
+PRIORITY_LOW = 30       # отчеты и симуляции
+
+JOB_CLASSES = ("import", "forecast", "report")
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+ACTIVE_STATUSES = ("queued", "running")
+
+class JobNotCancellable(Exception):
+    """Задача уже завершена"""
+
+class JobCancelled(asyncio.CancelledError):
+    """Задача остановлена по запросу отмены между этапами работы"""
+
+def check_cancelled(cancel_event: Optional[threading.Event]):
+    """Проверка отмены между этапами и блоками задачи (в том числе в потоке пула)"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled("Задача отменена")
+
+async def run_job_stage(cancel_event: Optional[threading.Event], func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Этап задачи в пуле потоков.
+
+    Поток нельзя прервать: при отмене выставляется cancel_event, а задача
+    ждет возврата этапа, поэтому место класса освобождается только после
+    окончания работы, а не в момент отмены корутины.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+    cancelled = False
+    while not future.done():
+        try:
+            await asyncio.wait([future])
+        except asyncio.CancelledError:
+            cancelled = True
+            if cancel_event is not None:
+                cancel_event.set()
+    if cancelled:
+        raise JobCancelled("Задача отменена")
+    return future.result()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _naive_utc(moment: datetime) -> datetime:
+    # SQLite возвращает время без часового пояса; все время планировщика - UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+class CronSchedule:
+    """Расписание cron из пяти полей: минута, час, день месяца, месяц, день недели (0 и 7 - воскресенье).
+
+    Поле - *, число, диапазон a-b, шаг */n или a-b/n и их списки через запятую.
+    Если ограничены и день месяца, и день недели, подходит любой из них (как в cron).
+    """
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != len(self.FIELDS):
+            raise ValueError(f"Расписание cron должно состоять из {len(self.FIELDS)} полей: {expression}")
+        values = {}
+        for part, (name, low, high) in zip(parts, self.FIELDS):
+            values[name] = self._parse(part, name, low, high)
+        self.minutes = values["minute"]
+        self.hours = values["hour"]
+        self.days = values["day"]
+        self.months = values["month"]
+        self.weekdays = {day % 7 for day in values["weekday"]}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, name: str, low: int, high: int) -> Set[int]:
+        result: Set[int] = set()
+        for item in part.split(","):
+            span, _, step = item.partition("/")
+            try:
+                step = int(step) if step else 1
+                if span == "*":
+                    start, end = low, high
+                elif "-" in span:
+                    start, end = (int(value) for value in span.split("-", 1))
+                else:
+                    start = end = int(span)
+            except ValueError:
+                raise ValueError(f"Некорректное поле {name} в расписании cron: {part}")
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Некорректное поле {name} в расписании cron: {part}")
+            result.update(range(start, end + 1, step))
+        return result
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Первая подходящая минута позже moment (UTC)"""
+        candidate = _naive_utc(moment).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                month = candidate.month % 12 + 1
+                candidate = candidate.replace(
+                    year=candidate.year + (month == 1), month=month, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate.replace(tzinfo=timezone.utc)
+        raise ValueError(f"Расписание cron никогда не срабатывает: {self.expression}")
+
+class FileLeaderLock:
+    """Лидерство через неблокирующую блокировку файла (SQLite: экземпляры на одной машине)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        import fcntl
+
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handle = open(self.path, "a+")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class AdvisoryLeaderLock:
+    """Лидерство через сессионный advisory lock PostgreSQL.
+
+    Блокировка живет, пока открыто отдельное соединение (не из пула API):
+    при падении экземпляра ее снимает сервер, и лидером становится другой.
+    """
+
+    def __init__(self, dsn: str, key: int):
+        self.dsn = dsn
+        self.key = key
+        self._connection = None
+
+    @property
+    def held(self) -> bool:
+        return self._connection is not None
+
+    def acquire(self) -> bool:
+        import psycopg2
+
+        try:
+            if self._connection is not None:
+                # Лидерство сохраняется, пока живо соединение с блокировкой
+                with self._connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                return True
+            connection = psycopg2.connect(self.dsn)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+                locked = cursor.fetchone()[0]
+            if not locked:
+                connection.close()
+                return False
+            self._connection = connection
+            return True
+        except Exception as e:
+            logger.warning(f"Проверка лидерства планировщика не удалась: {e}")
+            self.release()
+            return False
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+def create_leader_lock():
+    if engine.dialect.name == "postgresql":
+        url = engine.url.set(drivername="postgresql")
+        return AdvisoryLeaderLock(url.render_as_string(hide_password=False), settings.scheduler_lock_key)
+    return FileLeaderLock(settings.scheduler_lock_file)
+
+class JobHandler:
+    """Тип задачи: класс (лимит одновременных задач), приоритет по умолчанию и функция выполнения"""
+
+    def __init__(
+        self,
+        kind: str,
+        job_class: str,
+        func: Callable[..., Any],
+        priority: int = PRIORITY_NORMAL,
+        event_job: Optional[Callable[[Dict[str, Any]], str]] = None,
+        on_cancel: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        if job_class not in JOB_CLASSES:
+            raise ValueError(f"Неизвестный класс задач: {job_class}")
+        self.kind = kind
+        self.job_class = job_class
+        self.func = func
+        self.priority = priority
+        # Идентификатор задачи в потоке событий по параметрам
+        self.event_job = event_job
+        self.on_cancel = on_cancel
+        # Обработчик с параметром cancel_event сам проверяет отмену между этапами
+        self.cancellable = "cancel_event" in inspect.signature(func).parameters
+
+def job_response(job: ScheduledJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "job_class": job.job_class,
+        "priority": job.priority,
+        "status": job.status,
+        "parameters": json.loads(job.parameters) if job.parameters else {},
+        "event_job": job.event_job,
+        "schedule_id": job.schedule_id,
+        "cancel_requested": bool(job.cancel_requested),
+        "attempts": job.attempts or 0,
+        "owner": job.owner,
+        "error_message": job.error_message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+def schedule_response(schedule: JobSchedule) -> Dict[str, Any]:
+    return {
+        "id": schedule.id,
+        "name": schedule.name,
+        "cron": schedule.cron,
+        "kind": schedule.kind,
+        "parameters": json.loads(schedule.parameters) if schedule.parameters else {},
+        "priority": schedule.priority,
+        "enabled": bool(schedule.enabled),
+        "next_run_at": schedule.next_run_at,
+        "last_run_at": schedule.last_run_at,
+    }
+
+def series_priority(db, product_id: int, warehouse_id: int) -> int:
+    """Приоритет прогноза ряда: позиции классов scheduler_high_priority_abc раньше остальных"""
+    abc_class = db.scalar(
+        select(InventoryItem.abc_class)
+        .where(InventoryItem.product_id == product_id, InventoryItem.warehouse_id == warehouse_id)
+    )
+    return PRIORITY_HIGH if abc_class in settings.scheduler_high_priority_abc else PRIORITY_NORMAL
+
+class JobScheduler:
+    """Планировщик фоновых задач с очередью в БД.
+
+    Задачи ставит любой экземпляр API (submit), выполняет только лидер:
+    каждые poll_interval секунд (и сразу после постановки в этом экземпляре)
+    он ставит в очередь задачи расписаний, которым пора, отменяет задачи по
+    запросу и запускает ожидающие по приоритету, пока не заняты
+    max_running мест и лимиты классов class_limits. Экземпляр отмечает
+    heartbeat_at своих выполняемых задач на каждом проходе; задачи без
+    отметки дольше stale_after секунд (упавший экземпляр) лидер возвращает
+    в очередь.
+    """
+
+    def __init__(
+        self,
+        lock,
+        poll_interval: float,
+        max_running: int,
+        class_limits: Dict[str, int],
+        stale_after: float = 30.0
+    ):
+        self.lock = lock
+        self.poll_interval = poll_interval
+        self.max_running = max_running
+        self.class_limits = class_limits
+        self.stale_after = stale_after
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self.leader = False
+        # id задачи -> (класс, asyncio.Task, событие отмены) для задач, выполняемых этим экземпляром
+        self._running: Dict[int, Tuple[str, asyncio.Task, threading.Event]] = {}
+        # Все задачи _execute, в том числе уже освободившие место и сохраняющие статус
+        self._tasks: Set[asyncio.Task] = set()
+        # Аргументы, которые нельзя сохранить в БД (например, уже разобранный файл)
+        self._transient: Dict[int, Dict[str, Any]] = {}
+        self._requeue: Set[int] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def register(
+        self,
+        kind: str,
+        job_class: str,
+        func: Callable[..., Any],
+        priority: int = PRIORITY_NORMAL,
+        event_job: Optional[Callable[[Dict[str, Any]], str]] = None,
+        on_cancel: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        """Регистрация типа задачи; func - корутина, принимающая параметры задачи (и cancel_event, если объявлен)"""
+        self.handlers[kind] = JobHandler(kind, job_class, func, priority, event_job, on_cancel)
+
+    def submit(
+        self,
+        kind: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        priority: Optional[int] = None,
+        transient: Optional[Dict[str, Any]] = None,
+        schedule_id: Optional[int] = None,
+        db=None
+    ) -> Dict[str, Any]:
+        """Постановка задачи в очередь; transient используется, только если задачу выполнит этот экземпляр"""
+        handler = self.handlers.get(kind)
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи: {kind}")
+        parameters = parameters or {}
+        job = ScheduledJob(
+            kind=kind,
+            job_class=handler.job_class,
+            priority=handler.priority if priority is None else priority,
+            status="queued",
+            parameters=json.dumps(parameters, default=str),
+            event_job=handler.event_job(parameters) if handler.event_job else None,
+            schedule_id=schedule_id,
+            cancel_requested=False,
+            attempts=0,
+        )
+        if db is not None:
+            db.add(job)
+            db.flush()
+            result = job_response(job)
+        else:
+            with get_db_context() as session:
+                session.add(job)
+                session.flush()
+                result = job_response(job)
+        if transient and self.leader:
+            self._transient[result["id"]] = transient
+        if result["event_job"]:
+            event_broker.publish(result["event_job"], "queued", scheduled_job=result["id"], priority=result["priority"])
+        self.notify()
+        return result
+
+    def cancel(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Отмена задачи: ожидающая снимается сразу, выполняемую останавливает лидер. None - задачи нет"""
+        with get_db_context() as db:
+            job = db.get(ScheduledJob, job_id)
+            if job is None:
+                return None
+            status = job.status
+            cancelled = status == "queued"
+            if cancelled:
+                job.status = "cancelled"
+                job.finished_at = _utcnow()
+            elif status == "running":
+                job.cancel_requested = True
+            db.flush()
+            result = job_response(job)
+        if status not in ACTIVE_STATUSES:
+            raise JobNotCancellable(f"Задача уже в статусе {status}")
+        if cancelled:
+            self._transient.pop(job_id, None)
+            self._cancelled(result)
+        self.notify()
+        return result
+
+    def _cancelled(self, job: Dict[str, Any]):
+        handler = self.handlers.get(job["kind"])
+        if handler is not None and handler.on_cancel is not None:
+            try:
+                handler.on_cancel(job["parameters"])
+            except Exception as e:
+                logger.warning(f"Ошибка обработки отмены задачи {job['id']}: {e}")
+        if job["event_job"]:
+            event_broker.publish(job["event_job"], "failed", error="Задача отменена", cancelled=True)
+
+    def notify(self):
+        """Внеочередной проход планировщика (потокобезопасно)"""
+        if self._loop is None or self._wakeup is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self):
+        """Запуск цикла планировщика в текущем цикле событий (при старте API)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                await self._tick()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика задач: {e}")
+            if self._closing:
+                break
+            try:
+                async with asyncio.timeout(self.poll_interval):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    async def _tick(self):
+        leader = await self._loop.run_in_executor(None, self.lock.acquire)
+        if self.leader and not leader:
+            # Задачи останавливаются и возвращаются в очередь, когда их работа в потоках закончится;
+            # до этого heartbeat_at не дает новому лидеру запустить их повторно
+            logger.warning("Планировщик потерял лидерство, выполняемые задачи останавливаются")
+            self._stop_running()
+        became_leader = leader and not self.leader
+        self.leader = leader
+        if not leader:
+            if self._running:
+                await self._loop.run_in_executor(None, self._heartbeat, set(self._running))
+            return
+        if became_leader:
+            logger.info(f"Планировщик задач: лидер {self.instance_id}")
+        counts: Dict[str, int] = {}
+        for job_class, *_ in self._running.values():
+            counts[job_class] = counts.get(job_class, 0) + 1
+        claimed, cancel = await self._loop.run_in_executor(None, self._claim, set(self._running), counts)
+        for job_id in cancel:
+            if job_id in self._running:
+                self._stop(job_id)
+        for job in claimed:
+            cancel_event = threading.Event()
+            task = self._loop.create_task(self._execute(job, cancel_event))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self._running[job["id"]] = (job["job_class"], task, cancel_event)
+
+    def _heartbeat(self, running: Set[int], db=None):
+        """Отметка, что задачи этого экземпляра еще выполняются"""
+        statement = (
+            update(ScheduledJob)
+            .where(ScheduledJob.id.in_(running), ScheduledJob.owner == self.instance_id)
+            .values(heartbeat_at=_utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if db is not None:
+            db.execute(statement)
+        else:
+            with get_db_context() as session:
+                session.execute(statement)
+
+    def _claim(self, running: Set[int], counts: Dict[str, int]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        now = _utcnow()
+        with get_db_context() as db:
+            if running:
+                self._heartbeat(running, db)
+            # Задачи упавших экземпляров: heartbeat_at не обновлялся дольше stale_after
+            orphaned = (
+                ScheduledJob.status == "running",
+                ScheduledJob.id.not_in(running),
+                or_(ScheduledJob.heartbeat_at.is_(None), ScheduledJob.heartbeat_at < now - timedelta(seconds=self.stale_after)),
+            )
+            db.execute(
+                update(ScheduledJob)
+                .where(*orphaned, ScheduledJob.cancel_requested.is_(True))
+                .values(status="cancelled", finished_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            orphaned = db.execute(
+                update(ScheduledJob)
+                .where(*orphaned)
+                .values(status="queued", owner=None, started_at=None, heartbeat_at=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if orphaned:
+                logger.info(f"Планировщик: {orphaned} задач остановившихся экземпляров возвращены в очередь")
+            self._enqueue_due(db, now)
+
+            cancel = list(db.scalars(
+                select(ScheduledJob.id).where(ScheduledJob.id.in_(running), ScheduledJob.cancel_requested.is_(True))
+            )) if running else []
+
+            free = self.max_running - sum(counts.values())
+            if free <= 0:
+                return [], cancel
+            # Лучшие ожидающие задачи каждого класса со свободными местами, затем общий порядок по приоритету
+            candidates = []
+            for job_class in JOB_CLASSES:
+                slots = min(self.class_limits.get(job_class, self.max_running) - counts.get(job_class, 0), free)
+                if slots <= 0:
+                    continue
+                candidates.extend(db.scalars(
+                    select(ScheduledJob)
+                    .where(ScheduledJob.status == "queued", ScheduledJob.job_class == job_class)
+                    .order_by(ScheduledJob.priority, ScheduledJob.id)
+                    .limit(slots)
+                ))
+            claimed = []
+            for job in sorted(candidates, key=lambda job: (job.priority, job.id))[:free]:
+                if job.kind not in self.handlers:
+                    job.status = "failed"
+                    job.error_message = f"Неизвестный тип задачи: {job.kind}"
+                    job.finished_at = now
+                    continue
+                taken = db.execute(
+                    update(ScheduledJob)
+                    .where(ScheduledJob.id == job.id, ScheduledJob.status == "queued")
+                    .values(
+                        status="running", owner=self.instance_id, started_at=now, heartbeat_at=now,
+                        attempts=ScheduledJob.attempts + 1
+                    )
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if taken:
+                    claimed.append({
+                        "id": job.id, "kind": job.kind, "job_class": job.job_class,
+                        "parameters": json.loads(job.parameters) if job.parameters else {}, "event_job": job.event_job,
+                    })
+        return claimed, cancel
+
+    def _enqueue_due(self, db, now: datetime):
+        """Задачи расписаний, которым пора; пока предыдущая задача расписания не завершена, новая не ставится"""
+        for schedule in db.scalars(
+            select(JobSchedule).where(JobSchedule.enabled.is_(True), JobSchedule.next_run_at <= now)
+        ):
+            handler = self.handlers.get(schedule.kind)
+            busy = db.scalar(
+                select(func.count()).select_from(ScheduledJob)
+                .where(ScheduledJob.schedule_id == schedule.id, ScheduledJob.status.in_(ACTIVE_STATUSES))
+            )
+            if handler is None:
+                logger.warning(f"Расписание {schedule.name}: неизвестный тип задачи {schedule.kind}")
+            elif busy:
+                logger.info(f"Расписание {schedule.name}: предыдущая задача еще не завершена, запуск пропущен")
+            else:
+                parameters = json.loads(schedule.parameters) if schedule.parameters else {}
+                db.add(ScheduledJob(
+                    kind=schedule.kind,
+                    job_class=handler.job_class,
+                    priority=handler.priority if schedule.priority is None else schedule.priority,
+                    status="queued",
+                    parameters=schedule.parameters or "{}",
+                    event_job=handler.event_job(parameters) if handler.event_job else None,
+                    schedule_id=schedule.id,
+                    cancel_requested=False,
+                    attempts=0,
+                ))
+                schedule.last_run_at = now
+            schedule.next_run_at = CronSchedule(schedule.cron).next_after(now)
+        db.flush()
+
+    async def _execute(self, job: Dict[str, Any], cancel_event: threading.Event):
+        handler = self.handlers[job["kind"]]
+        transient = self._transient.pop(job["id"], {})
+        if handler.cancellable:
+            transient = {**transient, "cancel_event": cancel_event}
+        status, error = "completed", None
+        try:
+            await handler.func(**job["parameters"], **transient)
+            # Обработчики сообщают об ошибке событием failed, а не исключением
+            last = event_broker.last_event(job["event_job"]) if job["event_job"] else None
+            if last is not None and last["type"] == "failed":
+                status, error = "failed", last.get("error")
+        except asyncio.CancelledError:
+            # В том числе JobCancelled: обработчик сам остановился по cancel_event
+            status = "queued" if job["id"] in self._requeue else "cancelled"
+        except Exception as e:
+            logger.error(f"Ошибка задачи {job['id']} ({job['kind']}): {e}")
+            status, error = "failed", str(e)
+        finally:
+            self._running.pop(job["id"], None)
+            self._requeue.discard(job["id"])
+        if status == "cancelled":
+            self._cancelled(job)
+        try:
+            await self._loop.run_in_executor(None, self._finish, job["id"], status, error)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить статус задачи {job['id']}: {e}")
+        self.notify()
+
+    def _finish(self, job_id: int, status: str, error: Optional[str]):
+        values: Dict[str, Any] = {"status": status, "error_message": error, "heartbeat_at": None}
+        if status == "queued":
+            values.update(owner=None, started_at=None)
+        else:
+            values.update(finished_at=_utcnow())
+        with get_db_context() as db:
+            # Задачу, которую уже вернул в очередь и взял другой экземпляр, не трогаем
+            db.execute(
+                update(ScheduledJob)
+                .where(ScheduledJob.id == job_id, ScheduledJob.owner == self.instance_id)
+                .values(**values)
+            )
+
+    def _stop(self, job_id: int):
+        """Остановка задачи: событие отмены для работы в потоках и отмена корутины (один раз)"""
+        _, task, cancel_event = self._running[job_id]
+        if not cancel_event.is_set():
+            cancel_event.set()
+            task.cancel()
+
+    def _stop_running(self):
+        for job_id in list(self._running):
+            self._requeue.add(job_id)
+            self._stop(job_id)
+
+    async def close(self):
+        """Остановка при завершении приложения: выполняемые задачи возвращаются в очередь"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        tasks = list(self._tasks)
+        self._stop_running()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.lock.release()
+        self.leader = False
+
+    def status(self) -> Dict[str, Any]:
+        running: Dict[str, int] = {}
+        for job_class, *_ in self._running.values():
+            running[job_class] = running.get(job_class, 0) + 1
+        return {
+            "instance": self.instance_id,
+            "enabled": self._task is not None and not self._task.done(),
+            "leader": self.leader,
+            "max_running": self.max_running,
+            "class_limits": self.class_limits,
+            "running_here": running,
+            "kinds": {kind: handler.job_class for kind, handler in sorted(self.handlers.items())},
+        }
+
+job_scheduler = JobScheduler(
+    create_leader_lock(),
+    poll_interval=settings.scheduler_poll_interval,
+    max_running=settings.scheduler_max_running,
+    class_limits=settings.scheduler_class_limits,
+    stale_after=settings.scheduler_job_stale_after
+)
@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..config import settings
+from ..database.connection import engine
+from ..forecasting.demand_matrix import DemandMatrix
+from ..forecasting.model_store import _fit_or_update, model_store
+from ..forecasting.registry import series_forecaster
+from .events import event_broker
+from .scheduler import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+def forecast_rows(path: str, rows: np.ndarray, model_name: str, horizon: int) -> Dict[str, Any]:
+    """Прогноз строк матрицы спроса моделью по рядам (выполняется в процессе пула).
+
+    Процесс подключается к матрице по пути: история рядов не передается через
+    pickle, в ответ уходят только массивы прогнозов (строки x горизонт).
+    """
+    matrix = DemandMatrix.attach(path)
+    forecaster = series_forecaster(model_name)()
+    values = np.zeros((3, len(rows), horizon), dtype=np.float32)
+    modes: Dict[str, int] = {}
+    for i, row in enumerate(rows):
+        product_id, warehouse_id = matrix.keys[row]
+        result, mode = _fit_or_update(forecaster, model_store, int(product_id), int(warehouse_id), matrix.series(row), horizon)
+        values[:, i] = np.array([point[1:] for point in result], dtype=np.float32).T
+        modes[mode] = modes.get(mode, 0) + 1
+    return {"rows": rows, "values": values, "modes": modes}
+
+def _init_worker():
+    # Соединения, унаследованные от родительского процесса при fork, не используются
+    engine.dispose(close=False)
+
+def forecast_matrix(
+    matrix: DemandMatrix,
+    model_name: str,
+    horizon: int,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    job: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Прогноз всех рядов матрицы в пуле процессов; блоки по chunk_size строк.
+
+    Отмена (cancel_event) проверяется после каждого блока: еще не начатые
+    блоки снимаются, начатые процессами дорабатывают. Возвращает прогнозы (product_id, warehouse_id, forecast_date, forecast_value,
+    confidence_lower, confidence_upper) и статистику режимов обучения.
+    """
+    started = time.perf_counter()
+    n_series = matrix.shape[0]
+    chunk_size = chunk_size or settings.forecast_chunk_size
+    chunks = [np.arange(begin, min(begin + chunk_size, n_series)) for begin in range(0, n_series, chunk_size)]
+    workers = min(workers or settings.forecast_workers or os.cpu_count() or 1, max(len(chunks), 1))
+    task = partial(forecast_rows, str(matrix.path), model_name=model_name, horizon=horizon)
+
+    values = np.zeros((3, n_series, horizon), dtype=np.float32)
+    modes: Dict[str, int] = {}
+    done = 0
+
+    def collect(part: Dict[str, Any]):
+        nonlocal done
+        values[:, part["rows"]] = part["values"]
+        for mode, count in part["modes"].items():
+            modes[mode] = modes.get(mode, 0) + count
+        done += len(part["rows"])
+        if job:
+            event_broker.publish(job, "progress", stage="forecasting", processed=done, total=n_series)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for part in pool.map(task, chunks):
+                collect(part)
+                if cancel_event is not None and cancel_event.is_set():
+                    pool.shutdown(cancel_futures=True)
+                    check_cancelled(cancel_event)
+    else:
+        for rows in chunks:
+            check_cancelled(cancel_event)
+            collect(task(rows))
+
+    dates = pd.date_range(matrix.dates[-1] + pd.Timedelta(days=1), periods=horizon, freq="D")
+    prediction = pd.DataFrame({
+        "product_id": np.repeat(matrix.keys[:, 0], horizon),
+        "warehouse_id": np.repeat(matrix.keys[:, 1], horizon),
+        "forecast_date": np.tile(dates, n_series),
+        "forecast_value": values[0].ravel().astype(np.float64),
+        "confidence_lower": values[1].ravel().astype(np.float64),
+        "confidence_upper": values[2].ravel().astype(np.float64),
+    })
+    stats = {"series": n_series, "workers": workers, "fit_modes": modes, "seconds": time.perf_counter() - started}
+    return prediction, stats
@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func
+
+from ..config import settings
+from ..database.connection import engine, get_db_context
+from ..database.replica import get_read_db_context, replica_engine
+from ..database.models import Forecast, InventoryItem, Product, Sale, SimulationRun
+from ..forecasting.demand_matrix import DemandMatrix
+from ..policies.simulation import ITEM_METRICS, policy_levels, simulate_policy, summarize
+from .demand_matrix import build_demand_matrix
+from .events import event_broker
+from .scheduler import check_cancelled, run_job_stage
+
+logger = logging.getLogger(__name__)
+
+DEMAND_SOURCES = ("history", "forecast")
+POLICIES = ("settings", "current")
+INITIAL_STOCK = ("policy", "current")
+# Сколько позиций с наибольшими потерянными продажами сохранять в результатах сценария
+WORST_ITEMS = 20
+
+def resolve_parameters(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Параметры запуска с подставленными значениями по умолчанию из настроек"""
+    defaults = {
+        "safety_stock_days": settings.default_safety_stock_days,
+        "reorder_point_multiplier": settings.default_reorder_point_multiplier,
+        "order_cycle_days": settings.simulation_order_cycle_days,
+    }
+    scenarios = [
+        {**scenario, **{key: value for key, value in defaults.items() if scenario.get(key) is None}}
+        for scenario in request["scenarios"]
+    ]
+    holding_cost_rate = request.get("holding_cost_rate")
+    return {
+        **request,
+        "holding_cost_rate": settings.simulation_holding_cost_rate if holding_cost_rate is None else holding_cost_rate,
+        "scenarios": scenarios,
+    }
+
+def demand_window(db, parameters: Dict[str, Any]) -> Tuple[datetime, int]:
+    """Первый день и число дней спроса: последние дни истории или ближайшие дни прогноза"""
+    days = parameters["days"]
+    if parameters["demand_source"] == "history":
+        query = db.query(func.max(Sale.sale_date))
+        if parameters.get("warehouse_id"):
+            query = query.filter(Sale.warehouse_id == parameters["warehouse_id"])
+        last = query.scalar()
+        if last is None:
+            raise ValueError("Нет данных о продажах")
+        end = pd.Timestamp(last).tz_localize(None).normalize()
+        return (end - pd.Timedelta(days=days - 1)).to_pydatetime(), days
+
+    query = db.query(func.min(Forecast.forecast_date), func.max(Forecast.forecast_date)).filter(
+        Forecast.model_name == parameters["forecast_model"],
+        Forecast.forecast_date >= datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    )
+    if parameters.get("warehouse_id"):
+        query = query.filter(Forecast.warehouse_id == parameters["warehouse_id"])
+    first, last = query.one()
+    if first is None:
+        raise ValueError(f"Нет прогнозов модели {parameters['forecast_model']} на будущие даты")
+    start = pd.Timestamp(first).tz_localize(None).normalize()
+    available = (pd.Timestamp(last).tz_localize(None).normalize() - start).days + 1
+    return start.to_pydatetime(), min(days, available)
+
+def item_chunks(db, warehouse_id: Optional[int], chunk_size: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Диапазоны id позиций инвентаря по chunk_size позиций"""
+    query = db.query(InventoryItem.id)
+    if warehouse_id:
+        query = query.filter(InventoryItem.warehouse_id == warehouse_id)
+    ids = [row[0] for row in query.order_by(InventoryItem.id).all()]
+    chunks = [(ids[i], ids[min(i + chunk_size, len(ids)) - 1]) for i in range(0, len(ids), chunk_size)]
+    return chunks, len(ids)
+
+def load_chunk(
+    db,
+    bounds: Tuple[int, int],
+    parameters: Dict[str, Any],
+    start: datetime,
+    days: int,
+    matrix: Optional[DemandMatrix] = None
+):
+    """Позиции инвентаря из диапазона id и матрица их дневного спроса (позиции x дни).
+
+    matrix - общая матрица спроса истории: строки позиций берутся из нее без запроса продаж.
+    """
+    query = db.query(
+        InventoryItem.id, InventoryItem.product_id, InventoryItem.warehouse_id, InventoryItem.current_stock,
+        InventoryItem.reorder_point, InventoryItem.max_stock, InventoryItem.lead_time_days, Product.unit_cost
+    ).join(Product, Product.id == InventoryItem.product_id).filter(InventoryItem.id.between(*bounds))
+    if parameters.get("warehouse_id"):
+        query = query.filter(InventoryItem.warehouse_id == parameters["warehouse_id"])
+    items = pd.DataFrame(query.order_by(InventoryItem.id).all(), columns=[
+        "item_id", "product_id", "warehouse_id", "current_stock", "reorder_point", "max_stock", "lead_time_days", "unit_cost"
+    ])
+
+    if matrix is not None:
+        return items, matrix.take(matrix.rows(items["product_id"].to_numpy(), items["warehouse_id"].to_numpy()))
+
+    end = start + timedelta(days=days)
+    if parameters["demand_source"] == "history":
+        day = func.date(Sale.sale_date)
+        demand_query = db.query(InventoryItem.id, day, func.sum(Sale.quantity)).join(
+            Sale, and_(Sale.product_id == InventoryItem.product_id, Sale.warehouse_id == InventoryItem.warehouse_id)
+        ).filter(Sale.sale_date >= start, Sale.sale_date < end)
+    else:
+        # При повторных прогнозах на один день берется среднее
+        day = func.date(Forecast.forecast_date)
+        demand_query = db.query(InventoryItem.id, day, func.avg(Forecast.forecast_value)).join(
+            Forecast, and_(Forecast.product_id == InventoryItem.product_id, Forecast.warehouse_id == InventoryItem.warehouse_id)
+        ).filter(
+            Forecast.model_name == parameters["forecast_model"],
+            Forecast.forecast_date >= start, Forecast.forecast_date < end
+        )
+    rows = demand_query.filter(InventoryItem.id.between(*bounds)).group_by(InventoryItem.id, day).all()
+
+    demand = np.zeros((len(items), days), dtype=np.float32)
+    if rows and len(items):
+        frame = pd.DataFrame(rows, columns=["item_id", "day", "quantity"])
+        positions = np.searchsorted(items["item_id"].to_numpy(), frame["item_id"].to_numpy())
+        valid = positions < len(items)
+        valid[valid] = items["item_id"].to_numpy()[positions[valid]] == frame["item_id"].to_numpy()[valid]
+        day_index = (pd.to_datetime(frame["day"]) - pd.Timestamp(start)).dt.days.to_numpy()
+        valid &= (day_index >= 0) & (day_index < days)
+        demand[positions[valid], day_index[valid]] = frame["quantity"].to_numpy(dtype=np.float32)[valid]
+    return items, demand
+
+def simulate_items(items: pd.DataFrame, demand: np.ndarray, parameters: Dict[str, Any]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Все сценарии запуска на одном блоке позиций"""
+    mean_demand = demand.mean(axis=1, dtype=np.float64) if demand.shape[1] else np.zeros(len(items))
+    lead_time = np.maximum(items["lead_time_days"].fillna(0).to_numpy(dtype=np.int64), 1)
+    unit_cost = items["unit_cost"].to_numpy(dtype=np.float64)
+
+    results = {}
+    for scenario in parameters["scenarios"]:
+        reorder_point, order_up_to = policy_levels(
+            mean_demand, lead_time, scenario["safety_stock_days"],
+            scenario["reorder_point_multiplier"], scenario["order_cycle_days"]
+        )
+        if scenario["policy"] == "current":
+            # Точки заказа позиций; без max_stock пополнение до точки заказа плюс спрос за цикл
+            reorder_point = items["reorder_point"].fillna(0).to_numpy(dtype=np.float64)
+            max_stock = items["max_stock"].fillna(0).to_numpy(dtype=np.float64)
+            order_up_to = np.where(max_stock > 0, max_stock, reorder_point + scenario["order_cycle_days"] * mean_demand)
+        if parameters["initial_stock"] == "current":
+            initial_stock = items["current_stock"].fillna(0).to_numpy(dtype=np.float64)
+        else:
+            initial_stock = order_up_to
+        metrics = simulate_policy(
+            demand, lead_time, reorder_point, order_up_to, initial_stock, unit_cost, parameters["holding_cost_rate"]
+        )
+        results[scenario["name"]] = {key: value.astype(np.float32) for key, value in metrics.items()}
+    return results
+
+def run_chunk(
+    bounds: Tuple[int, int],
+    parameters: Dict[str, Any],
+    start: datetime,
+    days: int,
+    matrix_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """Загрузка и симуляция одного блока позиций (выполняется в процессе пула)"""
+    matrix = DemandMatrix.attach(matrix_path) if matrix_path else None
+    with get_read_db_context() as db:
+        items, demand = load_chunk(db, bounds, parameters, start, days, matrix)
+    return {
+        "items": items[["item_id", "product_id", "warehouse_id", "unit_cost"]],
+        "scenarios": simulate_items(items, demand, parameters),
+    }
+
+def _init_worker():
+    # Соединения, унаследованные от родительского процесса при fork, не используются
+    engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
+
+def _group_summary(metrics: Dict[str, np.ndarray], keys: np.ndarray) -> List[Dict[str, Any]]:
+    codes, uniques = pd.factorize(keys)
+    totals = {name: np.bincount(codes, weights=metrics[name], minlength=len(uniques)) for name in
+              ("demand", "sold", "stockout_days", "average_inventory", "holding_cost")}
+    return [
+        {
+            "warehouse_id": int(key),
+            "fill_rate": float(totals["sold"][i] / totals["demand"][i]) if totals["demand"][i] > 0 else 1.0,
+            "lost_sales": float(totals["demand"][i] - totals["sold"][i]),
+            "stockout_days": int(totals["stockout_days"][i]),
+            "average_inventory": float(totals["average_inventory"][i]),
+            "holding_cost": float(totals["holding_cost"][i]),
+        }
+        for i, key in enumerate(uniques)
+    ]
+
+def combine_results(parts: List[Dict[str, Any]], parameters: Dict[str, Any], start: datetime, days: int) -> Dict[str, Any]:
+    """Сводка по сценариям из результатов блоков: итог, склады и позиции с наибольшими потерями"""
+    items = pd.concat([part["items"] for part in parts], ignore_index=True) if parts else pd.DataFrame(
+        columns=["item_id", "product_id", "warehouse_id", "unit_cost"]
+    )
+    unit_cost = items["unit_cost"].to_numpy(dtype=np.float64)
+    scenarios = {}
+    for scenario in parameters["scenarios"]:
+        name = scenario["name"]
+        metrics = {
+            key: np.concatenate([part["scenarios"][name][key] for part in parts]).astype(np.float64) if parts else np.zeros(0)
+            for key in ITEM_METRICS
+        }
+        lost = metrics["demand"] - metrics["sold"]
+        worst = np.argsort(-lost, kind="stable")[:WORST_ITEMS]
+        scenarios[name] = {
+            "policy": scenario,
+            "summary": summarize(metrics, days, unit_cost),
+            "warehouses": _group_summary(metrics, items["warehouse_id"].to_numpy()),
+            "worst_items": [
+                {
+                    "item_id": int(items["item_id"].iat[i]),
+                    "product_id": int(items["product_id"].iat[i]),
+                    "warehouse_id": int(items["warehouse_id"].iat[i]),
+                    "lost_sales": float(lost[i]),
+                    "fill_rate": float(metrics["sold"][i] / metrics["demand"][i]) if metrics["demand"][i] > 0 else 1.0,
+                    "stockout_days": int(metrics["stockout_days"][i]),
+                }
+                for i in worst if lost[i] > 0
+            ],
+        }
+    return {"start_date": start.date().isoformat(), "days": days, "scenarios": scenarios}
+
+def execute_simulation(
+    parameters: Dict[str, Any],
+    job: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> Tuple[Dict[str, Any], int]:
+    """Симуляция всех позиций: блоки позиций распределяются по процессам пула.
+
+    При заданном job после каждого блока публикуется событие прогресса;
+    после каждого блока проверяется отмена (cancel_event).
+    """
+    with get_read_db_context() as db:
+        start, days = demand_window(db, parameters)
+        chunks, total = item_chunks(db, parameters.get("warehouse_id"), settings.simulation_chunk_size)
+
+        # Спрос истории собирается один раз; процессы пула читают строки своих позиций из файла
+        matrix = None
+        if parameters["demand_source"] == "history":
+            matrix = build_demand_matrix(
+                db, days=days, end=(start + timedelta(days=days - 1)).date(), warehouse_id=parameters.get("warehouse_id")
+            )
+
+    workers = min(settings.simulation_workers or os.cpu_count() or 1, len(chunks))
+    task = partial(run_chunk, parameters=parameters, start=start, days=days, matrix_path=str(matrix.path) if matrix else None)
+    parts = []
+
+    def collect(part: Dict[str, Any]):
+        parts.append(part)
+        if job:
+            processed = sum(len(done["items"]) for done in parts)
+            event_broker.publish(job, "progress", processed=processed, total=total, chunks=len(parts), chunks_total=len(chunks))
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                for part in pool.map(task, chunks):
+                    collect(part)
+                    if cancel_event is not None and cancel_event.is_set():
+                        pool.shutdown(cancel_futures=True)
+                        check_cancelled(cancel_event)
+        else:
+            for bounds in chunks:
+                check_cancelled(cancel_event)
+                collect(task(bounds))
+    finally:
+        if matrix is not None:
+            matrix.remove()
+    return combine_results(parts, parameters, start, days), total
+
+async def run_simulation(run_id: int, cancel_event: Optional[threading.Event] = None):
+    """Фоновое выполнение запуска симуляции с сохранением результатов"""
+    with get_db_context() as db:
+        run = db.query(SimulationRun).filter(SimulationRun.id == run_id).first()
+        if not run:
+            return
+        run.status = "running"
+        parameters = json.loads(run.parameters)
+
+    job = f"simulation:{run_id}"
+    event_broker.publish(job, "started", scenarios=len(parameters["scenarios"]))
+    start = time.perf_counter()
+    try:
+        results, total = await run_job_stage(cancel_event, execute_simulation, parameters, job, cancel_event)
+        with get_db_context() as db:
+            run = db.query(SimulationRun).filter(SimulationRun.id == run_id).first()
+            run.status = "completed"
+            run.results = json.dumps(results)
+            run.items_simulated = total
+            run.duration_seconds = time.perf_counter() - start
+            run.completed_at = datetime.utcnow()
+        logger.info(f"Симуляция {run_id}: {total} позиций за {time.perf_counter() - start:.1f} с")
+        event_broker.publish(job, "completed", items_simulated=total, seconds=time.perf_counter() - start)
+
+    except Exception as e:
+        logger.error(f"Ошибка симуляции {run_id}: {e}")
+        with get_db_context() as db:
+            run = db.query(SimulationRun).filter(SimulationRun.id == run_id).first()
+            if run:
+                run.status = "failed"
+                run.error_message = str(e)
+                run.duration_seconds = time.perf_counter() - start
+        event_broker.publish(job, "failed", error=str(e))
@@ -0,0 +1,410 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(ValueError):
+    """Размер загружаемого файла превышает допустимый"""
+
+
+class UploadSessionError(ValueError):
+    """Ошибка поэтапной (возобновляемой) загрузки"""
+
+
+def safe_filename(filename: str) -> str:
+    """Имя файла на диске с меткой времени"""
+    timestamp = int(time.time())
+    return f"{timestamp}_{Path(filename).name.replace(' ', '_')}"
+
+
+async def iter_upload_file(file: Any, chunk_size: int) -> AsyncIterator[bytes]:
+    """Чтение UploadFile крупными блоками"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def rechunk(source: AsyncIterator[bytes], chunk_size: int) -> AsyncIterator[bytes]:
+    """Склейка мелких фрагментов тела запроса в блоки заданного размера"""
+    buffer = bytearray()
+    async for piece in source:
+        buffer.extend(piece)
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class _GrowingFileReader(io.RawIOBase):
+    """Чтение файла, который ещё дописывается: при достижении конца ждём новых данных"""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._cond = threading.Condition()
+        self._written = 0
+        self._finished = False
+        self._aborted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        with self._cond:
+            while True:
+                if self._aborted:
+                    raise UploadSessionError("Загрузка прервана")
+                available = self._written - self._file.tell()
+                if available > 0 or self._finished:
+                    break
+                self._cond.wait()
+        view = memoryview(b)
+        if not self._finished:
+            view = view[:available]
+        return self._file.readinto(view)
+
+    def advance(self, written: int):
+        with self._cond:
+            self._written = written
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class _PipelinedCsvParser:
+    """Разбор CSV параллельно с записью файла на диск.
+
+    Разбор ждет данных в readinto, поэтому выполняется в своем пуле потоков:
+    в общем пуле он занимал бы потоки, в которых пишутся блоки этих же файлов.
+    """
+
+    def __init__(self, path: Path, chunk_rows: int, executor: ThreadPoolExecutor):
+        self._reader = _GrowingFileReader(path)
+        self._chunk_rows = chunk_rows
+        loop = asyncio.get_running_loop()
+        self._future = loop.run_in_executor(executor, self._parse)
+
+    def _parse(self) -> Optional[Any]:
+        import pandas as pd
+
+        frames = []
+        try:
+            with io.BufferedReader(self._reader) as buffer:
+                for chunk in pd.read_csv(buffer, encoding="utf-8", chunksize=self._chunk_rows):
+                    frames.append(chunk)
+        except UnicodeDecodeError:
+            # Кодировка не utf-8: файл будет прочитан целиком с подбором кодировки
+            return None
+        except UploadSessionError:
+            return None
+        except Exception as e:
+            logger.warning(f"Потоковый разбор CSV не удался, файл будет прочитан повторно: {e}")
+            return None
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def advance(self, written: int):
+        self._reader.advance(written)
+
+    def finish(self):
+        self._reader.finish()
+
+    def abort(self):
+        self._reader.abort()
+
+    async def result(self) -> Optional[Any]:
+        return await self._future
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    """Запись блока на диск и обновление хеша (выполняется в пуле потоков)"""
+    out.write(chunk)
+    out.flush()
+    if hasher is not None:
+        hasher.update(chunk)
+
+
+class UploadPipeline:
+    """Потоковая запись загрузок на диск с хешированием и контролем размера"""
+
+    def __init__(self):
+        self.upload_dir = Path(settings.upload_dir)
+        self.sessions_dir = self.upload_dir / ".sessions"
+        self.chunk_size = settings.upload_chunk_size
+        self.max_file_size = settings.max_file_size
+        # Состояние хеша для сессий, загружаемых в этом процессе
+        self._hashers: Dict[str, Any] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Потоки разбора CSV во время записи: не больше max_parsers загрузок одновременно
+        self.max_parsers = max(settings.upload_max_pipelined_parsers, 0)
+        self._parsers = 0
+        self._parse_executor: Optional[ThreadPoolExecutor] = None
+
+    def _start_parser(self, dest: Path) -> Optional[_PipelinedCsvParser]:
+        """Разбор во время записи, если есть свободный поток; иначе файл разбирается после записи"""
+        if not settings.upload_pipelined_parsing or dest.suffix.lower() != ".csv" or self._parsers >= self.max_parsers:
+            return None
+        if self._parse_executor is None:
+            self._parse_executor = ThreadPoolExecutor(max_workers=self.max_parsers, thread_name_prefix="upload-parse")
+        self._parsers += 1
+        dest.touch()
+        return _PipelinedCsvParser(dest, settings.upload_parse_chunk_rows, self._parse_executor)
+
+    def _too_large_message(self) -> str:
+        return f"Файл слишком большой. Максимальный размер: {self.max_file_size / (1024*1024):.1f} MB"
+
+    async def _stream_to_file(
+        self,
+        chunks: AsyncIterator[bytes],
+        out,
+        start_size: int = 0,
+        hasher: Optional[Any] = None,
+        parser: Optional[_PipelinedCsvParser] = None,
+    ) -> int:
+        """Запись потока блоков: приём следующего блока совмещён с записью предыдущего"""
+        loop = asyncio.get_running_loop()
+        size = start_size
+        pending = None
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_file_size:
+                    raise UploadTooLargeError(self._too_large_message())
+                if pending is not None:
+                    await pending
+                    if parser:
+                        parser.advance(size - len(chunk))
+                pending = loop.run_in_executor(None, _write_chunk, out, hasher, chunk)
+            if pending is not None:
+                await pending
+                if parser:
+                    parser.advance(size)
+        except BaseException:
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            raise
+        return size
+
+    async def save_upload(self, file: Any, dest: Path) -> Dict[str, Any]:
+        """Сохранение UploadFile на диск; CSV разбирается по мере записи"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        parser = self._start_parser(dest)
+
+        try:
+            try:
+                with open(dest, "wb") as out:
+                    size = await self._stream_to_file(
+                        rechunk(iter_upload_file(file, self.chunk_size), self.chunk_size),
+                        out,
+                        hasher=hasher,
+                        parser=parser,
+                    )
+            except BaseException:
+                if parser:
+                    parser.abort()
+                    await parser.result()
+                dest.unlink(missing_ok=True)
+                raise
+
+            dataframe = None
+            if parser:
+                parser.finish()
+                dataframe = await parser.result()
+        finally:
+            if parser:
+                self._parsers -= 1
+
+        return {"size": size, "sha256": hasher.hexdigest(), "dataframe": dataframe}
+
+    # Возобновляемые поэтапные загрузки
+
+    def _meta_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.json"
+
+    def _part_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.part"
+
+    def _save_meta(self, meta: Dict[str, Any]):
+        tmp_path = self._meta_path(meta["session_id"]).with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(meta, ensure_ascii=False))
+        tmp_path.replace(self._meta_path(meta["session_id"]))
+
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        """Состояние сессии: сколько байт уже принято"""
+        if not session_id.isalnum():
+            raise UploadSessionError("Некорректный идентификатор сессии")
+        meta_path = self._meta_path(session_id)
+        if not meta_path.exists():
+            raise KeyError(session_id)
+        meta = json.loads(meta_path.read_text())
+        part_path = self._part_path(session_id)
+        meta["received"] = part_path.stat().st_size if part_path.exists() else 0
+        meta["chunk_size"] = self.chunk_size
+        return meta
+
+    def create_session(
+        self,
+        filename: str,
+        file_type: str,
+        warehouse_id: Optional[int] = None,
+        total_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Создание сессии поэтапной загрузки"""
+        if total_size is not None and total_size > self.max_file_size:
+            raise UploadTooLargeError(self._too_large_message())
+
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        self.cleanup_stale_sessions()
+
+        session_id = uuid.uuid4().hex
+        meta = {
+            "session_id": session_id,
+            "filename": filename,
+            "file_type": file_type,
+            "warehouse_id": warehouse_id,
+            "total_size": total_size,
+            "created_at": time.time(),
+        }
+        self._part_path(session_id).touch()
+        self._save_meta(meta)
+        self._hashers[session_id] = (0, hashlib.sha256())
+        return self.get_session(session_id)
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        """Блокировка сессии; для несуществующего идентификатора не создается"""
+        self.get_session(session_id)
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    def _locked_session(self, session_id: str) -> Dict[str, Any]:
+        """Состояние сессии под блокировкой: сессию могли завершить или отменить, пока ждали"""
+        try:
+            return self.get_session(session_id)
+        except KeyError:
+            self._locks.pop(session_id, None)
+            raise
+
+    async def append_chunk(self, session_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Дозапись блока по смещению; повтор с тем же смещением безопасен"""
+        async with self._session_lock(session_id):
+            meta = self._locked_session(session_id)
+            received = meta["received"]
+            if offset != received:
+                raise UploadSessionError(f"Неверное смещение {offset}, ожидается {received}")
+
+            hash_state = self._hashers.pop(session_id, None)
+            hasher = hash_state[1] if hash_state and hash_state[0] == offset else None
+
+            part_path = self._part_path(session_id)
+            try:
+                with open(part_path, "ab") as out:
+                    size = await self._stream_to_file(
+                        rechunk(chunks, self.chunk_size), out, start_size=offset, hasher=hasher
+                    )
+            except BaseException:
+                # Откатываем частично записанный блок, чтобы клиент мог повторить его
+                with open(part_path, "r+b") as out:
+                    out.truncate(offset)
+                raise
+
+            total_size = meta.get("total_size")
+            if total_size is not None and size > total_size:
+                with open(part_path, "r+b") as out:
+                    out.truncate(offset)
+                raise UploadSessionError(f"Принято больше данных, чем заявлено: {size} > {total_size}")
+
+            if hasher is not None:
+                self._hashers[session_id] = (size, hasher)
+
+        return self.get_session(session_id)
+
+    async def complete_session(self, session_id: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Завершение сессии: проверка размера и хеша, перенос файла в каталог загрузок"""
+        async with self._session_lock(session_id):
+            meta = self._locked_session(session_id)
+            total_size = meta.get("total_size")
+            if total_size is not None and meta["received"] != total_size:
+                raise UploadSessionError(f"Загрузка не завершена: принято {meta['received']} из {total_size} байт")
+
+            part_path = self._part_path(session_id)
+            hash_state = self._hashers.pop(session_id, None)
+            if hash_state and hash_state[0] == meta["received"]:
+                sha256 = hash_state[1].hexdigest()
+            else:
+                # Сессия продолжалась в другом процессе: пересчитываем хеш по файлу
+                sha256 = await asyncio.get_running_loop().run_in_executor(None, self._hash_file, part_path)
+
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise UploadSessionError("Контрольная сумма файла не совпадает")
+
+            dest = self.upload_dir / safe_filename(meta["filename"])
+            part_path.replace(dest)
+            self._meta_path(session_id).unlink(missing_ok=True)
+            self._locks.pop(session_id, None)
+
+        return {**meta, "file_path": str(dest), "size": meta["received"], "sha256": sha256}
+
+    def abort_session(self, session_id: str):
+        """Отмена сессии и удаление принятых данных"""
+        self.get_session(session_id)
+        self._part_path(session_id).unlink(missing_ok=True)
+        self._meta_path(session_id).unlink(missing_ok=True)
+        self._hashers.pop(session_id, None)
+        self._locks.pop(session_id, None)
+
+    def cleanup_stale_sessions(self):
+        """Удаление брошенных сессий старше заданного срока"""
+        if not self.sessions_dir.exists():
+            return
+        deadline = time.time() - settings.upload_session_ttl_hours * 3600
+        for meta_path in self.sessions_dir.glob("*.json"):
+            session_id = meta_path.stem
+            part_path = self._part_path(session_id)
+            try:
+                last_activity = part_path.stat().st_mtime if part_path.exists() else meta_path.stat().st_mtime
+                if last_activity < deadline:
+                    part_path.unlink(missing_ok=True)
+                    meta_path.unlink(missing_ok=True)
+                    self._hashers.pop(session_id, None)
+                    self._locks.pop(session_id, None)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить устаревшую сессию {meta_path}: {e}")
+
+    def _hash_file(self, path: Path) -> str:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+# Создание экземпляра сервиса
+upload_pipeline = UploadPipeline()
@@ -0,0 +1,205 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import and_, case, func, literal, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database.models import DailySales, SeriesForecastState, SeriesWatermark
+
+logger = logging.getLogger(__name__)
+
+SERIES_KEY = ("product_id", "warehouse_id")
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def touch_series(db: Session, series: Iterable[Tuple[int, int]]) -> int:
+    """Отметка изменения входных данных рядов в текущей транзакции: версия данных +1"""
+    keys = sorted(set(series))
+    if not keys:
+        return 0
+    changed_at = datetime.now(timezone.utc)
+    rows = [{"product_id": product_id, "warehouse_id": warehouse_id, "data_version": 1, "changed_at": changed_at}
+            for product_id, warehouse_id in keys]
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            current = db.get(SeriesWatermark, (row["product_id"], row["warehouse_id"]))
+            if current is None:
+                db.add(SeriesWatermark(**row))
+            else:
+                current.data_version += 1
+                current.changed_at = changed_at
+        db.flush()
+        return len(rows)
+
+    statement = dialect_insert(SeriesWatermark)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(SERIES_KEY),
+        set_={"data_version": SeriesWatermark.data_version + 1, "changed_at": statement.excluded.changed_at}
+    )
+    db.execute(statement, rows)
+    return len(rows)
+
+def touch_daily_series(db: Session, since: Optional[date] = None) -> int:
+    """Отметка изменения всех рядов с дневными итогами (с даты since) - после пересчета daily_sales"""
+    query = select(DailySales.product_id, DailySales.warehouse_id).distinct()
+    if since is not None:
+        query = query.where(DailySales.sale_day >= since)
+    return touch_series(db, db.execute(query).all())
+
+def forecast_config_hash(**config: Any) -> str:
+    """Хеш конфигурации прогноза: смена модели, горизонта или обработки входа делает ряды устаревшими"""
+    from ..forecasting.model_store import params_hash
+
+    return params_hash(config)
+
+def _reason(model_name: str, config_hash: str, max_age_days: Optional[int]):
+    """Причина пересчета ряда (NULL - прогноз актуален) и запрос рядов с состоянием прогноза модели"""
+    max_age_days = settings.forecast_max_staleness_days if max_age_days is None else max_age_days
+    state = and_(
+        SeriesForecastState.product_id == SeriesWatermark.product_id,
+        SeriesForecastState.warehouse_id == SeriesWatermark.warehouse_id,
+        SeriesForecastState.model_name == model_name
+    )
+    conditions = [
+        (SeriesForecastState.product_id.is_(None), "new"),
+        (SeriesForecastState.config_hash != config_hash, "config"),
+        (SeriesForecastState.data_version < SeriesWatermark.data_version, "data"),
+    ]
+    if max_age_days > 0:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        conditions.append((SeriesForecastState.forecasted_at < cutoff, "stale"))
+    return case(*conditions, else_=None), select(SeriesWatermark).outerjoin(SeriesForecastState, state)
+
+def dirty_series_query(
+    model_name: str,
+    config_hash: str,
+    force: bool = False,
+    max_age_days: Optional[int] = None,
+    warehouse_id: Optional[int] = None
+):
+    """Запрос рядов (product_id, warehouse_id, data_version), прогноз которых нужно пересчитать.
+
+    Ряд пересчитывается, если у модели нет его прогноза, изменилась конфигурация
+    (config_hash), данные ряда новее прогноза или прогноз старше max_age_days
+    дней (settings.forecast_max_staleness_days). force - все ряды.
+    """
+    reason, joined = _reason(model_name, config_hash, max_age_days)
+    query = joined.with_only_columns(SeriesWatermark.product_id, SeriesWatermark.warehouse_id, SeriesWatermark.data_version)
+    if not force:
+        query = query.where(reason.is_not(None))
+    if warehouse_id:
+        query = query.where(SeriesWatermark.warehouse_id == warehouse_id)
+    return query
+
+class RefreshPlan:
+    """Ряды к пересчету моделью: series - (product_id, warehouse_id, data_version), total - всех отслеживаемых рядов"""
+
+    def __init__(self, query, series: List[Tuple[int, int, int]], total: int):
+        self.query = query
+        self.series = series
+        self.total = total
+
+    @property
+    def skip(self) -> bool:
+        """Все отслеживаемые ряды актуальны"""
+        return bool(self.total) and not self.series
+
+    @property
+    def partial(self) -> bool:
+        """Пересчитывается часть рядов; без водяных знаков (total = 0) считаются все ряды"""
+        return bool(self.total) and len(self.series) < self.total
+
+    def subquery(self):
+        """Подзапрос рядов для соединения при загрузке данных (None - все ряды)"""
+        return self.query.subquery("dirty") if self.partial else None
+
+    def keys(self) -> Optional[List[Tuple[int, int]]]:
+        """Ряды для замены прогнозов (None - все ряды)"""
+        return [key[:2] for key in self.series] if self.partial else None
+
+def plan_refresh(
+    db: Session,
+    model_name: str,
+    config_hash: str,
+    force: bool = False,
+    warehouse_id: Optional[int] = None
+) -> RefreshPlan:
+    """Выборка рядов к пересчету (dirty_series_query) и числа отслеживаемых рядов"""
+    query = dirty_series_query(model_name, config_hash, force=force, warehouse_id=warehouse_id)
+    tracked = select(func.count()).select_from(SeriesWatermark)
+    if warehouse_id:
+        tracked = tracked.where(SeriesWatermark.warehouse_id == warehouse_id)
+    return RefreshPlan(query, [tuple(row) for row in db.execute(query).all()], db.scalar(tracked) or 0)
+
+def dirty_summary(
+    db: Session,
+    model_name: str,
+    config_hash: str,
+    max_age_days: Optional[int] = None,
+    warehouse_id: Optional[int] = None
+) -> Dict[str, int]:
+    """Число рядов по причине пересчета (new, config, data, stale) и актуальных (fresh)"""
+    reason, joined = _reason(model_name, config_hash, max_age_days)
+    label = func.coalesce(reason, literal("fresh")).label("reason")
+    query = joined.with_only_columns(label, func.count())
+    if warehouse_id:
+        query = query.where(SeriesWatermark.warehouse_id == warehouse_id)
+    counts = dict(db.execute(query.group_by(label)).all())
+    return {key: int(counts.get(key, 0)) for key in ("new", "config", "data", "stale", "fresh")}
+
+def mark_forecasted(db: Session, model_name: str, series: Iterable[Tuple[int, int, int]], config_hash: str) -> int:
+    """Запись состояния прогноза рядов (product_id, warehouse_id, data_version) в текущей транзакции.
+
+    Версия берется из выборки перед расчетом: данные, пришедшие во время
+    расчета, оставляют ряд устаревшим до следующего запуска.
+    """
+    forecasted_at = datetime.now(timezone.utc)
+    rows = [
+        {"product_id": int(product_id), "warehouse_id": int(warehouse_id), "model_name": model_name,
+         "data_version": int(version), "config_hash": config_hash, "forecasted_at": forecasted_at}
+        for product_id, warehouse_id, version in series
+    ]
+    if not rows:
+        return 0
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            db.merge(SeriesForecastState(**row))
+        db.flush()
+        return len(rows)
+
+    statement = dialect_insert(SeriesForecastState)
+    statement = statement.on_conflict_do_update(
+        index_elements=[*SERIES_KEY, "model_name"],
+        set_={column: getattr(statement.excluded, column) for column in ("data_version", "config_hash", "forecasted_at")}
+    )
+    db.execute(statement, rows)
+    return len(rows)
+
+def backfill_series_watermarks(db: Session) -> int:
+    """Водяные знаки для рядов с дневными итогами, загруженных до появления series_watermarks"""
+    missing = (
+        select(DailySales.product_id, DailySales.warehouse_id)
+        .distinct()
+        .outerjoin(SeriesWatermark, and_(
+            SeriesWatermark.product_id == DailySales.product_id,
+            SeriesWatermark.warehouse_id == DailySales.warehouse_id
+        ))
+        .where(SeriesWatermark.product_id.is_(None))
+    )
+    series: List[Tuple[int, int]] = [tuple(row) for row in db.execute(missing).all()]
+    if series:
+        touch_series(db, series)
+        logger.info(f"Водяные знаки данных созданы для {len(series)} рядов")
+    return len(series)
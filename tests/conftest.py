@@ -1 +1,5 @@
 # pytest fixtures
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.api.admission import AdmissionRejected, ConcurrencyLimiter
+from ainventory.api.routers import analytics
+from ainventory.config import settings
+from ainventory.database.connection import (
+    Base, current_statement_timeout, is_statement_timeout, statement_timeout, with_statement_timeout
+)
+from ainventory.database.models import DailySales, Product, Sale, Warehouse
+
+
+def test_limiter_queues_then_fails_fast():
+    limiter = ConcurrencyLimiter("report", limit=1, queue_size=1, queue_timeout=0.1)
+
+    async def run():
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # Очередь полна: сразу 429
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        # Место передается ожидающему, а не освобождается
+        limiter.release()
+        await queued
+        assert limiter.active == 1
+        # Место не освободилось за queue_timeout: 503
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        limiter.release()
+        return rejected.value.status_code, timed_out.value.status_code
+
+    assert asyncio.run(run()) == (429, 503)
+    assert limiter.status()["active"] == 0 and limiter.status()["waiting"] == 0
+    assert limiter.stats == {"admitted": 1, "queued": 1, "rejected": 1, "timed_out": 1}
+
+
+def test_statement_timeout_reaches_executor_threads():
+    class QueryCanceled(Exception):
+        pgcode = "57014"
+
+    class Wrapped(Exception):
+        orig = QueryCanceled()
+
+    async def run():
+        with statement_timeout(1500):
+            bound = with_statement_timeout(current_statement_timeout)
+        return await asyncio.get_running_loop().run_in_executor(None, current_statement_timeout), \
+            await asyncio.get_running_loop().run_in_executor(None, bound)
+
+    assert asyncio.run(run()) == (None, 1500)
+    assert is_statement_timeout(Wrapped()) and not is_statement_timeout(RuntimeError())
+
+
+def test_sales_report_downgrades_to_daily_totals(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add(Warehouse(id=1, name="Основной"))
+    db.add_all(Product(id=index, sku=f"SKU{index}", name=f"Товар {index}") for index in (1, 2))
+    start = date(2024, 3, 1)
+    for offset in range(4):
+        day = start + timedelta(days=offset)
+        for product_id, price in ((1, 10.0), (2, 4.0)):
+            for hour in (9, 15):
+                db.add(Sale(product_id=product_id, warehouse_id=1, sale_date=datetime(day.year, day.month, day.day, hour),
+                            quantity=2, revenue=2 * price))
+            db.add(DailySales(product_id=product_id, warehouse_id=1, sale_day=day, quantity=4, revenue=4 * price, cost=0, orders=2))
+    db.commit()
+    db.close()
+
+    @contextmanager
+    def read_context():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setattr(analytics, "get_read_db_context", read_context)
+    period = (datetime(2024, 3, 1), datetime(2024, 3, 4, 23, 59))
+
+    monkeypatch.setattr(settings, "admission_max_scan_rows", 100)
+    exact = analytics.sales_performance(*period, None, None, None)
+    # 16 продаж прочитали бы больше 10 строк: отчет по 8 дневным итогам с теми же итогами
+    monkeypatch.setattr(settings, "admission_max_scan_rows", 10)
+    rollup = analytics.sales_performance(*period, None, None, None)
+
+    assert (exact["source"], exact["approximate"]) == ("sales", False)
+    assert (rollup["source"], rollup["approximate"], rollup["estimated_rows"]) == ("daily_sales", True, 16)
+    assert rollup["data"] == exact["data"]
+    assert [row["sku"] for row in rollup["data"]] == ["SKU1", "SKU2"] and rollup["data"][0]["order_count"] == 8
+
+    monkeypatch.setattr(settings, "admission_max_scan_rows", 4)
+    with pytest.raises(analytics.ScanTooLarge):
+        analytics.sales_performance(*period, 1, None, None)
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import DailySales, Product, SalesAnomaly, Warehouse
+from ainventory.forecasting.anomalies import NEGATIVE, SPIKE, detect_anomalies, treat_anomalies
+from ainventory.services.anomalies import scan_sales_anomalies
+
+
+def weekly_series(n_series: int, n_days: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    week = np.array([1.0, 1.0, 1.0, 1.2, 1.5, 2.0, 0.8])
+    level = rng.uniform(2, 10, size=(n_series, 1))
+    return rng.poisson(level * np.tile(week, n_days // 7 + 1)[:n_days]).astype(np.float32)
+
+
+def test_detects_spikes_and_negatives_across_series():
+    Y = weekly_series(200, 180)
+    Y[3, 90] *= 100          # единицы вместо упаковок
+    Y[4, 120] = -5           # возврат отрицательным количеством
+    Y[5, :60] = 0            # ряд начался с 60-го дня
+    Y[5, 60] = 40
+
+    result = detect_anomalies(Y, starts=np.where(np.arange(200) == 5, 60, 0))
+    flags = result["flags"]
+    assert flags[3, 90] == SPIKE and flags[4, 120] == NEGATIVE
+    assert not flags[5, :60].any()
+    # На пуассоновском шуме почти нет ложных отметок
+    assert (flags == SPIKE).sum() <= 3
+    assert result["limit"][3, 90] < Y[3, 90]
+
+
+def test_treatment_modes():
+    daily = pd.DataFrame({
+        "product_id": [1, 1, 1], "warehouse_id": [1, 1, 1],
+        "sale_date": pd.to_datetime(["2024-03-01", "2024-03-02", "2024-03-03"]),
+        "quantity": [5.0, 500.0, -3.0],
+    })
+    flags = pd.DataFrame({
+        "product_id": [1, 1], "warehouse_id": [1, 1], "sale_day": [date(2024, 3, 2), date(2024, 3, 3)],
+        "expected": [6.0, 4.0], "limit": [20.0, 15.0],
+    })
+    assert treat_anomalies(daily, flags, "winsorize")["quantity"].tolist() == [5.0, 20.0, 0.0]
+    assert treat_anomalies(daily, flags, "exclude")["quantity"].tolist() == [5.0, 6.0, 4.0]
+    assert treat_anomalies(daily, flags, "none")["quantity"].tolist() == [5.0, 500.0, -3.0]
+
+
+def test_scan_keeps_reviewed_and_resolves_fixed_rows():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(Warehouse(id=1, name="Основной"))
+    db.add_all(Product(id=index, sku=f"SKU{index}", name=f"Товар {index}") for index in (1, 2))
+    db.flush()
+
+    Y = weekly_series(2, 120, seed=1)
+    Y[0, 100] = 900
+    Y[1, 110] = 700
+    start = date(2024, 1, 1)
+    db.add_all(
+        DailySales(product_id=row + 1, warehouse_id=1, sale_day=start + timedelta(days=day),
+                   quantity=float(Y[row, day]), revenue=0, cost=0, orders=1)
+        for row in range(2) for day in range(120) if Y[row, day]
+    )
+    db.commit()
+
+    summary = scan_sales_anomalies(db, history_days=120)
+    db.commit()
+    assert summary["new"] == 2
+    reviewed = db.query(SalesAnomaly).filter_by(product_id=1).one()
+    reviewed.status = "dismissed"
+    # Выброс второго ряда исправлен в данных
+    db.query(DailySales).filter_by(product_id=2, sale_day=start + timedelta(days=110)).update({"quantity": 5.0})
+    db.commit()
+
+    summary = scan_sales_anomalies(db, history_days=120)
+    db.commit()
+    assert (summary["new"], summary["resolved"]) == (0, 1)
+    assert [(anomaly.product_id, anomaly.status) for anomaly in db.query(SalesAnomaly)] == [(1, "dismissed")]
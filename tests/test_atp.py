@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database import versions
+from ainventory.database.connection import Base, SessionLocal
+from ainventory.database.models import InventoryItem, Product, Warehouse
+from ainventory.services import atp, ingest
+from ainventory.services.atp import (
+    ATP_TABLES, InsufficientStock, StockIndex, build_snapshot, release_reservations, reserve_stock
+)
+
+
+def make_session(engine=None):
+    if engine is None:
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Warehouse(id=1, name="Москва"), Warehouse(id=2, name="Казань")])
+    db.add_all([Product(id=1, sku="A", name="A"), Product(id=2, sku="B", name="B")])
+    db.add_all([
+        InventoryItem(product_id=1, warehouse_id=1, current_stock=10),
+        InventoryItem(product_id=1, warehouse_id=2, current_stock=3),
+        InventoryItem(product_id=2, warehouse_id=2, current_stock=8),
+    ])
+    db.commit()
+    return db
+
+
+def test_basket_lookup_and_reservations():
+    db = make_session()
+    index = StockIndex(refresh_interval=60)
+    index._snapshot = build_snapshot(db)
+
+    result = index.lookup([1, 2, 7], [4, 5, 1])
+    assert [line["warehouses"] for line in result["lines"]] == [[{"warehouse_id": 1, "available": 10.0}], [{"warehouse_id": 2, "available": 8.0}], []]
+    assert result["lines"][0]["total_available"] == 13.0 and not result["lines"][2]["known"]
+    assert result["fulfillable_from"] == []
+    # Две строки одного продукта суммируются: на складе 2 по 2 штуки есть, 4 - нет
+    basket = index.lookup([1, 1], [2, 2])
+    assert [len(line["warehouses"]) for line in basket["lines"]] == [2, 2]
+    assert basket["fulfillable_from"] == [1]
+    assert index.lookup([1, 2], [1, 1])["fulfillable_from"] == [2]
+    assert index.lookup([1, 2], [1, 1], warehouse_ids=[1])["fulfillable_from"] == []
+
+    reserve_stock(db, "order-1", warehouse_id=1, product_ids=[1], quantities=[7])
+    with pytest.raises(InsufficientStock) as error:
+        reserve_stock(db, "order-2", warehouse_id=1, product_ids=[1], quantities=[4])
+    assert error.value.shortages[0]["available"] == 3.0
+
+    index._snapshot = build_snapshot(db)
+    assert index.lookup([1], [1])["lines"][0]["total_available"] == 6.0
+
+
+def test_local_reservations_update_index_without_rebuild(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    make_session(engine).close()
+    # Сессии приложения (SessionLocal) со всеми слушателями, версии таблиц - в той же БД
+    monkeypatch.setattr(versions, "engine", engine)
+    db = SessionLocal(bind=engine)
+    index = StockIndex(refresh_interval=60)
+    index._snapshot = build_snapshot(db)
+    monkeypatch.setattr(atp, "stock_index", index)
+
+    def versions_match() -> bool:
+        current, _ = versions.table_versions(db, ATP_TABLES)
+        return current == index._snapshot.versions
+
+    reserve_stock(db, "order-1", warehouse_id=1, product_ids=[1, 1], quantities=[3, 1])
+    assert not index._stale and versions_match()
+    assert index.lookup([1], [1], warehouse_ids=[1])["lines"][0]["total_available"] == 6.0
+
+    assert release_reservations(db, "order-1") == 1
+    assert not index._stale and versions_match()
+    assert index.lookup([1], [1], warehouse_ids=[1])["lines"][0]["total_available"] == 10.0
+
+    # Другие массовые записи по-прежнему ведут к пересборке
+    db.execute(update(InventoryItem).where(InventoryItem.product_id == 2).values(current_stock=1))
+    db.commit()
+    assert index._stale
+    db.close()
+
+
+def test_ingest_batches_update_index_without_rebuild(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    make_session(engine).close()
+    monkeypatch.setattr(versions, "engine", engine)
+
+    @contextmanager
+    def db_context():
+        db = SessionLocal(bind=engine)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    monkeypatch.setattr(ingest, "get_db_context", db_context)
+    db = SessionLocal(bind=engine)
+    index = StockIndex(refresh_interval=60)
+    index._snapshot = build_snapshot(db)
+    monkeypatch.setattr(atp, "stock_index", index)
+
+    sale = {"sale_date": datetime(2024, 3, 1), "revenue": 1.0}
+    results = ingest.write_sales_batch([
+        {**sale, "product_id": 1, "warehouse_id": 1, "quantity": 2, "transaction_id": "t-1"},
+        {**sale, "product_id": 1, "warehouse_id": 1, "quantity": 1, "transaction_id": "t-2"},
+        {**sale, "sku": "B", "warehouse_id": 2, "quantity": 20, "transaction_id": "t-3"},
+    ])
+    assert [result["status"] for result in results] == ["ok", "ok", "ok"]
+    # Микропакет списывает остатки в снимке на месте (не ниже нуля), версии совпадают с БД
+    current, _ = versions.table_versions(db, ATP_TABLES)
+    assert not index._stale and current == index._snapshot.versions
+    assert index.lookup([1, 2], [1, 1])["lines"][0]["total_available"] == 10.0
+    assert index.lookup([2], [1])["lines"][0]["total_available"] == 0.0
+    fresh = build_snapshot(db)
+    assert fresh.stock.tolist() == index._snapshot.stock.tolist()
+    db.close()
@@ -0,0 +1,60 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import InventoryItem, Product, Warehouse
+from ainventory.services.batch import BatchSpec, apply_batch
+
+SPEC = BatchSpec(
+    InventoryItem,
+    unique_key=("product_id", "warehouse_id"),
+    references={"product_id": (Product, "Продукт не найден"), "warehouse_id": (Warehouse, "Склад не найден")}
+)
+
+
+def make_session():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Warehouse(id=1, name="Основной"), Product(id=1, sku="A", name="A"), Product(id=2, sku="B", name="B")])
+    db.add(InventoryItem(id=10, product_id=1, warehouse_id=1, current_stock=3))
+    db.commit()
+    return db
+
+
+def test_batch_reports_per_item_errors_and_applies_valid_items():
+    db = make_session()
+    result = apply_batch(
+        db, SPEC,
+        creates=[
+            {"product_id": 2, "warehouse_id": 1, "current_stock": 5},
+            {"product_id": 2, "warehouse_id": 1},
+            {"product_id": 1, "warehouse_id": 1},
+            {"product_id": 99, "warehouse_id": 1},
+        ],
+        updates=[{"id": 10, "current_stock": 7}, {"id": 404, "current_stock": 1}],
+        deletes=[]
+    )
+
+    assert result["applied"] and (result["created"], result["updated"], result["failed"]) == (1, 1, 4)
+    errors = {(item["operation"], item["index"]): item["error"] for item in result["results"] if item["error"]}
+    assert errors == {
+        ("create", 1): "Повтор уникального ключа в пакете",
+        ("create", 2): "Запись с таким ключом уже существует (id=10)",
+        ("create", 3): "Продукт не найден",
+        ("update", 1): "Запись не найдена",
+    }
+    assert db.get(InventoryItem, 10).current_stock == 7
+    assert db.query(InventoryItem).count() == 2
+
+
+def test_atomic_batch_is_skipped_on_error_and_deleted_key_can_be_reused():
+    db = make_session()
+    result = apply_batch(db, SPEC, creates=[{"product_id": 2, "warehouse_id": 1}], updates=[], deletes=[404], atomic=True)
+    assert not result["applied"] and result["results"][0]["status"] == "skipped"
+    assert db.query(InventoryItem).count() == 1
+
+    result = apply_batch(db, SPEC, creates=[{"product_id": 1, "warehouse_id": 1}], updates=[], deletes=[10])
+    assert result["failed"] == 0
+    assert [item.id for item in db.query(InventoryItem)] == [result["results"][0]["id"]]
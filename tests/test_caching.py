@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.api import caching
+from ainventory.api.caching import conditional_get, etag_matches, not_modified_since
+from ainventory.database import versions
+from ainventory.database.connection import Base, SessionLocal
+from ainventory.database.models import Warehouse
+from ainventory.database.versions import table_versions
+
+
+def test_conditional_request_validators():
+    etag = 'W/"abc"'
+    assert etag_matches(etag, 'W/"abc"')
+    # Сравнение слабое: прокси может снять или добавить префикс W/
+    assert etag_matches(etag, '"xyz", "abc"')
+    assert etag_matches(etag, "*")
+    assert not etag_matches(etag, 'W/"abd"')
+
+    modified = datetime(2024, 3, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    assert not_modified_since(modified, "Fri, 01 Mar 2024 12:00:00 GMT")
+    assert not not_modified_since(modified, "Fri, 01 Mar 2024 11:59:59 GMT")
+    assert not not_modified_since(modified, "не дата")
+    assert not not_modified_since(None, "Fri, 01 Mar 2024 12:00:00 GMT")
+
+
+def make_versioned_db(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    # Версии увеличиваются отдельной транзакцией через engine модуля versions
+    monkeypatch.setattr(versions, "engine", engine)
+    return engine
+
+
+def test_versions_bumped_after_commit_only(monkeypatch):
+    engine = make_versioned_db(monkeypatch)
+    db = SessionLocal(bind=engine)
+
+    db.add(Warehouse(name="Основной"))
+    db.rollback()
+    assert table_versions(db, ["warehouses"])[0] == {"warehouses": 0}
+
+    db.add(Warehouse(name="Основной"))
+    db.commit()
+    # Массовая запись без flush тоже меняет версию
+    db.execute(update(Warehouse).values(name="Центральный"))
+    db.commit()
+    db.execute(update(Warehouse).values(name="Северный"))
+    db.rollback()
+    versions_after, last_modified = table_versions(db, ["warehouses", "products"])
+    assert versions_after == {"warehouses": 2, "products": 0} and last_modified is not None
+    db.close()
+
+
+def test_conditional_get_returns_not_modified(monkeypatch):
+    engine = make_versioned_db(monkeypatch)
+    monkeypatch.setattr(caching, "SessionLocal", sessionmaker(bind=engine))
+    app = FastAPI()
+    calls = []
+
+    @app.get("/warehouses", dependencies=[Depends(conditional_get("warehouse_summary", ["warehouses"]))])
+    def warehouses():
+        calls.append(1)
+        return {"ok": True}
+
+    client = TestClient(app)
+    first = client.get("/warehouses")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.headers["cache-control"] == caching.cache_control("warehouse_summary")
+
+    assert client.get("/warehouses", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/warehouses", headers={"If-None-Match": 'W/"other"'}).status_code == 200
+    # If-Modified-Since: без записей ответ не изменился, после записи - изменился
+    versions.bump_versions(["warehouses"])
+    modified = client.get("/warehouses")
+    assert modified.headers["etag"] != etag
+    since = modified.headers["last-modified"]
+    not_modified = client.get("/warehouses", headers={"If-Modified-Since": since})
+    assert not_modified.status_code == 304 and not_modified.headers["etag"] == modified.headers["etag"]
+    assert client.get("/warehouses", headers={"If-None-Match": etag}).status_code == 200
+    # 304 отдается без вызова обработчика
+    assert len(calls) == 4
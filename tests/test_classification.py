@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import DailySales, InventoryItem, Product, Warehouse
+from ainventory.services.classification import classify_inventory
+
+
+def test_abc_xyz_classes_from_daily_sales():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(Warehouse(id=1, name="Основной"))
+    db.add_all(Product(id=index, sku=f"SKU{index}", name=f"Товар {index}") for index in range(1, 6))
+    db.flush()
+    db.add_all(InventoryItem(product_id=index, warehouse_id=1, current_stock=5) for index in range(1, 6))
+
+    end = date(2024, 3, 31)
+    for offset in range(28):
+        day = end - timedelta(days=offset)
+        # 1 - основная выручка и ровный спрос, 2 - ровный по неделям, 3 - две продажи за 4 недели
+        db.add(DailySales(product_id=1, warehouse_id=1, sale_day=day, quantity=10, revenue=700, cost=0, orders=1))
+        db.add(DailySales(product_id=2, warehouse_id=1, sale_day=day, quantity=6 if offset % 7 == 0 else 1, revenue=150, cost=0, orders=1))
+        if offset % 14 == 0:
+            db.add(DailySales(product_id=3, warehouse_id=1, sale_day=day, quantity=3, revenue=75, cost=0, orders=1))
+        db.add(DailySales(product_id=4, warehouse_id=1, sale_day=day, quantity=1, revenue=10, cost=0, orders=1))
+    # Продажа вне окна не учитывается
+    db.add(DailySales(product_id=5, warehouse_id=1, sale_day=end - timedelta(days=60), quantity=1, revenue=1e6, cost=0, orders=1))
+    db.commit()
+
+    summary = classify_inventory(db, days=28, period_days=7)
+    db.commit()
+
+    assert summary["as_of"] == end and summary["classified"] == 4
+    classes = {item.product_id: (item.abc_class, item.xyz_class) for item in db.query(InventoryItem)}
+    # Доля выручки перед позицией: 1 - 0, 2 - 0.81 (< 0.95), 4 - 0.98
+    assert classes == {1: ("A", "X"), 2: ("B", "X"), 3: ("C", "Y"), 4: ("C", "X"), 5: ("C", None)}
+    assert summary["matrix"] == {"AX": 1, "BX": 1, "CX": 1, "CY": 1, "C-": 1}
+    third = db.query(InventoryItem).filter_by(product_id=3).one()
+    assert third.demand_cv == 1.0 and third.last_updated is None
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from ainventory.api import coalescing
+from ainventory.api.coalescing import SingleFlightCache, request_key
+
+
+def test_request_key_normalization():
+    # Порядок параметров и пустые фильтры не меняют ключ
+    assert request_key("sales", start_date=datetime(2024, 3, 1), warehouse_id=None, category_id=2) == \
+        request_key("sales", category_id=2, start_date=datetime(2024, 3, 1, 0, 0, 0))
+    assert request_key("sales", category_id=2) != request_key("sales", category_id=3)
+    assert request_key("sales", ids=[3, 1]) == request_key("sales", ids=(1, 3))
+
+
+def test_concurrent_requests_share_one_computation(monkeypatch):
+    monkeypatch.setattr(coalescing, "client_wrote_recently", lambda: False)
+    cache = SingleFlightCache(ttl=0.2, stale=0.5, max_entries=10)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"value": len(calls)}
+
+    async def run():
+        key = request_key("sales", period="month")
+        waiters = [asyncio.ensure_future(cache.get(key, compute)) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        # Свежий результат - из кеша без вычисления
+        cached = await cache.get(key, compute)
+        await asyncio.sleep(0.25)
+        # Устаревший результат отдается сразу, обновление идет в фоне
+        stale = await cache.get(key, compute)
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if not cache._inflight:
+                break
+        refreshed = await cache.get(key, compute)
+        return results, cached, stale, refreshed
+
+    results, cached, stale, refreshed = asyncio.run(run())
+    assert all(result == {"value": 1} for result in results) and cached == {"value": 1}
+    assert stale == {"value": 1} and refreshed == {"value": 2} and len(calls) == 2
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] == 19 and cache.stats["stale_hits"] == 1
+
+
+def test_errors_not_cached_and_writers_bypass(monkeypatch):
+    wrote = {"recently": False}
+    monkeypatch.setattr(coalescing, "client_wrote_recently", lambda: wrote["recently"])
+    cache = SingleFlightCache(ttl=30, stale=30, max_entries=1)
+    calls = []
+
+    def failing():
+        calls.append("failing")
+        raise RuntimeError("БД недоступна")
+
+    def compute():
+        calls.append("compute")
+        return time.monotonic()
+
+    async def run():
+        for _ in range(2):
+            try:
+                await cache.get(("sales",), failing)
+            except RuntimeError:
+                pass
+        first = await cache.get(("sales",), compute)
+        wrote["recently"] = True
+        bypassed = await cache.get(("sales",), compute)
+        wrote["recently"] = False
+        # Один ключ в кеше: новый вытесняет старый
+        await cache.get(("trends",), compute)
+        again = await cache.get(("sales",), compute)
+        return first, bypassed, again
+
+    first, bypassed, again = asyncio.run(run())
+    assert calls == ["failing", "failing", "compute", "compute", "compute", "compute"]
+    assert bypassed != first and again != first and cache.stats["bypassed"] == 1
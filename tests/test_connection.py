@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from ainventory.config import settings
+from ainventory.database import connection
+from ainventory.database.connection import TimedQueuePool, compute_pool_limits, pool_stats, pool_status
+
+
+def test_pool_limits_split_connection_budget_between_workers():
+    # 100 соединений БД, 10 в резерве, 3 воркера: по 30 на воркер, из них 20 постоянных
+    assert compute_pool_limits(3, 100, 10) == (20, 10)
+    assert compute_pool_limits(0, 100, 10) == (60, 30)
+    # Бюджет меньше числа воркеров: хотя бы одно соединение на воркер
+    assert compute_pool_limits(8, 5, 10) == (1, 0)
+
+
+def test_pool_settings_reach_engine_and_status_reports_overflow(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "api_workers", 1)
+    monkeypatch.setattr(settings, "db_pool_size", 2)
+    monkeypatch.setattr(settings, "db_max_overflow", 1)
+    monkeypatch.setattr(settings, "db_pool_timeout", 0.2)
+    monkeypatch.setattr(settings, "db_pool_recycle", 120)
+    monkeypatch.setattr(settings, "db_pgbouncer", False)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **connection._engine_options(url))
+    monkeypatch.setattr(connection, "engine", engine)
+
+    pool = engine.pool
+    assert isinstance(pool, TimedQueuePool)
+    assert (pool.size(), pool._max_overflow, pool.timeout(), pool._recycle) == (2, 1, 0.2, 120)
+
+    before = pool_stats.snapshot()
+    held = [engine.connect() for _ in range(3)]
+    status = pool_status()
+    assert status["pool_class"] == "TimedQueuePool"
+    assert (status["size"], status["checked_out"], status["overflow"], status["max_overflow"]) == (2, 3, 1, 1)
+
+    # Пул и overflow заняты: следующий запрос соединения ждет pool_timeout и учитывается как таймаут
+    with pytest.raises(PoolTimeout):
+        engine.connect()
+    status = pool_status()
+    assert status["timeouts"] == before["timeouts"] + 1
+    assert status["checkouts"] == before["checkouts"] + 4
+    assert status["wait_seconds_max"] >= 0.2
+
+    for conn in held:
+        conn.close()
+    status = pool_status()
+    # Соединение сверх pool_size закрывается при возврате
+    assert (status["checked_out"], status["checked_in"], status["overflow"]) == (0, 2, 0)
+    engine.dispose()
@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import DailySales, Product, SalesAnomaly, Warehouse
+from ainventory.forecasting.demand_matrix import DemandMatrix
+from ainventory.forecasting.model_store import ModelStore
+from ainventory.services import series_forecasts
+from ainventory.services.demand_matrix import build_demand_matrix
+
+
+def make_session():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(Warehouse(id=index, name=f"Склад {index}") for index in (1, 2))
+    db.add_all(Product(id=index, sku=f"SKU{index}", name=f"Товар {index}") for index in (1, 2, 3))
+    db.flush()
+    return db
+
+
+def test_matrix_from_daily_sales_attaches_read_only(tmp_path):
+    db = make_session()
+    end = date(2024, 3, 31)
+    rows = [
+        {"product_id": 2, "warehouse_id": 1, "sale_day": end - timedelta(days=offset), "quantity": 2.0}
+        for offset in range(60)
+    ]
+    rows += [{"product_id": 1, "warehouse_id": 2, "sale_day": end - timedelta(days=9), "quantity": 5.0}]
+    rows += [{"product_id": 3, "warehouse_id": 1, "sale_day": end - timedelta(days=200), "quantity": 1.0}]
+    db.execute(insert(DailySales), rows)
+    db.add(SalesAnomaly(product_id=2, warehouse_id=1, sale_day=end, kind="spike", quantity=2.0,
+                        expected=1.5, upper_limit=1.0, score=6.0, status="open"))
+    db.flush()
+
+    matrix = build_demand_matrix(db, days=30, anomaly_treatment="winsorize", root=str(tmp_path))
+    # Ряд без продаж в окне не попадает в матрицу, ключи отсортированы
+    assert matrix.keys.tolist() == [[1, 2], [2, 1]]
+    assert matrix.start_date == end - timedelta(days=29)
+
+    attached = DemandMatrix.attach(matrix.path)
+    assert isinstance(attached.values, np.memmap) and not attached.values.flags.writeable
+    assert attached.rows([2, 3], [1, 1]).tolist() == [1, -1]
+    assert attached.values[1, :-1].tolist() == [2.0] * 29 and attached.values[1, -1] == 1.0
+    # Ряд продукта 1 начался в окне: история ds/y от первой продажи
+    series = attached.series(0)
+    assert series["ds"].iloc[0] == pd.Timestamp(end - timedelta(days=9)) and series["y"].tolist()[:2] == [5.0, 0.0]
+    assert attached.take(attached.rows([3, 2], [1, 1]))[0].sum() == 0.0
+
+    matrix.remove()
+    assert not matrix.path.exists()
+
+
+def test_forecast_matrix_in_process_pool_matches_single_process(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    keys = np.array([[index + 1, 1] for index in range(6)])
+    matrix = DemandMatrix.create(keys, date(2024, 1, 1), 120, tmp_path)
+    matrix.values[:] = rng.poisson(5.0, size=(6, 120))
+    matrix.flush()
+
+    monkeypatch.setattr(series_forecasts, "model_store", ModelStore(str(tmp_path / "models")))
+    single, stats = series_forecasts.forecast_matrix(matrix, "ets", 14, workers=1, chunk_size=2)
+    assert stats["fit_modes"] == {"full": 6}
+    pooled, stats = series_forecasts.forecast_matrix(matrix, "ets", 14, workers=2, chunk_size=2)
+    # Данные не менялись: модели из хранилища, прогнозы те же
+    assert stats["fit_modes"] == {"cached": 6} and stats["workers"] == 2
+    assert len(pooled) == 6 * 14 and pooled["forecast_date"].min() == pd.Timestamp("2024-04-30")
+    np.testing.assert_allclose(pooled["forecast_value"], single["forecast_value"])
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+from ainventory.services.events import EventBroker, ProgressReporter
+
+
+def test_event_broker_filters_subscribers_and_keeps_last_event():
+    async def scenario():
+        broker = EventBroker()
+        uploads = broker.subscribe(kinds=["upload"])
+        one_job = broker.subscribe(jobs=["forecast:ets:1:2"])
+        progress = ProgressReporter(broker, "upload:7", total=10, every=5)
+
+        for processed in range(11):
+            progress.update(processed)
+        # Публикация из другого потока (фоновая задача в пуле потоков)
+        worker = threading.Thread(target=broker.publish, args=("upload:7", "completed"), kwargs={"records_processed": 10})
+        worker.start()
+        worker.join()
+        broker.publish("forecast:ets:1:2", "failed", error="Нет данных")
+
+        received = [await uploads.get(1.0) for _ in range(3)]
+        assert [(event["type"], event.get("processed")) for event in received] == [
+            ("progress", 5), ("progress", 10), ("completed", None)
+        ]
+        assert (await one_job.get(1.0))["error"] == "Нет данных"
+        assert await one_job.get(0.01) is None
+        assert broker.last_event("upload:7")["records_processed"] == 10
+
+        uploads.close()
+        one_job.close()
+        assert broker.subscribers == 0
+
+    asyncio.run(scenario())
@@ -1,2 +1,198 @@
 # Tests for forecasting functionality
-# Add actual tests here when implementing forecasting features
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from ainventory.api.routers.forecasts import prepare_sales_data
+from ainventory.config import settings
+from ainventory.features.engineering import FeatureConfig, FeatureStore, build_features, daily_demand
+from ainventory.forecasting.ets_model import ExponentialSmoothingForecaster
+from ainventory.forecasting.global_model import GlobalDemandModel
+from ainventory.forecasting.hierarchy import Hierarchy, reconcile
+from ainventory.forecasting.model_store import ModelStore, forecast_series
+from ainventory.forecasting.prophet_model import ProphetForecaster
+from ainventory.metrics.evaluation import smape
+
+
+def make_sales(days, quantity=1.0, start=datetime(2024, 1, 1)):
+    return [
+        SimpleNamespace(sale_date=start + timedelta(days=day), quantity=quantity)
+        for day in days
+    ]
+
+
+def test_prepare_sales_data_aggregates_daily_and_fills_gaps():
+    sales = make_sales([0, 0, 3], quantity=2.0)
+
+    df = prepare_sales_data(sales)
+
+    assert list(df.columns) == ["ds", "y"]
+    assert df["ds"].tolist() == list(pd.date_range("2024-01-01", periods=4, freq="D"))
+    assert df["y"].tolist() == [4.0, 0.0, 0.0, 2.0]
+
+
+def test_smape_ignores_zero_denominators():
+    assert smape([0, 10], [0, 10]) == 0.0
+    assert smape([10], [0]) == 200.0
+
+
+def test_prophet_forecaster_returns_horizon_without_negative_values():
+    days = pd.date_range("2024-01-01", periods=90, freq="D")
+    sales_df = pd.DataFrame({"ds": days, "y": 5 + 3 * np.sin(np.arange(90) * 2 * np.pi / 7)})
+
+    result = asyncio.run(ProphetForecaster().forecast(sales_df, 14))
+
+    assert len(result) == 14
+    assert result[0][0] == datetime(2024, 3, 31)
+    assert all(lower <= value <= upper for _, value, lower, upper in result)
+    assert all(value >= 0 for _, value, _, _ in result)
+
+
+def make_sales_frame(days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for product_id in (1, 2):
+        for day in range(days):
+            quantity = 0 if 60 <= day < 75 and product_id == 1 else rng.poisson(4)
+            if quantity:
+                price = 80.0 if day % 30 == 0 else 100.0
+                rows.append((product_id, 1, datetime(2024, 1, 1) + timedelta(days=day), quantity, quantity * price))
+    return pd.DataFrame(rows, columns=["product_id", "warehouse_id", "sale_date", "quantity", "revenue"])
+
+
+def test_build_features_lags_promo_and_stockout_flags():
+    daily = daily_demand(make_sales_frame())
+
+    features = build_features(daily, FeatureConfig(holiday_country="RU"))
+    product = features[features["product_id"] == 1].reset_index(drop=True)
+
+    assert len(product) == 120
+    assert product["lag_7"].iloc[7:].tolist() == product["quantity"].iloc[:-7].tolist()
+    expected_mean = product["quantity"].iloc[20:27].mean()
+    assert np.isclose(product["rolling_mean_7"].iloc[27], expected_mean)
+    assert product.loc[product["date"] == "2024-01-01", "is_holiday"].item() == 1
+    assert product.loc[30, "is_promo"] == 1
+    assert product.loc[74, "stockout_suspected"] == 1
+    assert product.loc[product["quantity"] > 0, "stockout_suspected"].eq(0).all()
+
+
+def test_feature_store_incremental_matches_full_rebuild(tmp_path):
+    daily = daily_demand(make_sales_frame())
+    store = FeatureStore(FeatureConfig(holiday_country="RU"), cache_dir=str(tmp_path))
+    columns = build_features(daily, store.config).columns
+
+    store.get_features(daily[daily["date"] < "2024-03-25"])
+    incremental = store.get_features(daily)
+
+    pd.testing.assert_frame_equal(incremental[columns], build_features(daily, store.config), check_dtype=False)
+
+    corrected = daily.copy()
+    corrected.loc[10, "quantity"] += 5
+    pd.testing.assert_frame_equal(
+        store.get_features(corrected)[columns], build_features(corrected, store.config), check_dtype=False
+    )
+
+
+def test_feature_store_adds_series_missing_from_cache(tmp_path):
+    daily = daily_demand(make_sales_frame())
+    store = FeatureStore(FeatureConfig(holiday_country="RU"), cache_dir=str(tmp_path))
+    columns = build_features(daily, store.config).columns
+
+    # В кеше только второй ряд; новый ряд считается полностью, второй берется из кеша
+    store.get_features(daily[daily["product_id"] == 2])
+    features = store.get_features(daily)
+
+    pd.testing.assert_frame_equal(features[columns], build_features(daily, store.config), check_dtype=False)
+
+
+def test_global_model_predicts_all_series_and_updates_incrementally():
+    features = build_features(daily_demand(make_sales_frame(days=200)), FeatureConfig(holiday_country="RU"))
+    attributes = pd.DataFrame({"category_id": [1, 2], "brand_id": [1, 1], "list_price": [100.0, 100.0]}, index=[1, 2])
+    cutoff = features["date"].max() - pd.Timedelta(days=20)
+
+    full = GlobalDemandModel(kind="linear", max_horizon=14, train_days=0)
+    full.fit(features, attributes)
+    incremental = GlobalDemandModel(kind="linear", max_horizon=14, train_days=0)
+    incremental.fit(features[features["date"] <= cutoff], attributes)
+    incremental.update(features, attributes)
+
+    assert np.allclose(full.coef, incremental.coef)
+    prediction = incremental.predict(features, 7, attributes)
+    assert len(prediction) == 2 * 7
+    assert prediction["forecast_date"].min() == features["date"].max() + pd.Timedelta(days=1)
+    assert (prediction["confidence_lower"] <= prediction["forecast_value"]).all()
+    assert (prediction["forecast_value"] >= 0).all()
+
+
+def test_global_model_treats_ids_as_categories(monkeypatch):
+    features = build_features(daily_demand(make_sales_frame(days=150)), FeatureConfig(holiday_country="RU"))
+    attributes = pd.DataFrame({"category_id": [30, 7], "brand_id": [5, 5], "list_price": [100.0, 100.0]}, index=[1, 2])
+    # Незнакомые при обучении категория и бренд - пропуск, а не число за пределами обучения
+    unseen = pd.DataFrame({"category_id": [99, 7], "brand_id": [5, 6], "list_price": [100.0, 100.0]}, index=[1, 2])
+
+    linear = GlobalDemandModel(kind="linear", max_horizon=14, train_days=0)
+    linear.fit(features, attributes)
+    assert {column: levels.tolist() for column, levels in linear.levels.items()} == {
+        "warehouse_id": [1.0], "category_id": [7.0, 30.0], "brand_id": [5.0]
+    }
+    numeric = len(linear.feature_names) - 3
+    assert linear.coef.shape == (1 + numeric + 1 + 2 + 1,)
+    assert np.isfinite(linear.predict(features, 7, unseen)["forecast_value"]).all()
+
+    monkeypatch.setattr(settings, "global_model_max_iter", 10)
+    gbm = GlobalDemandModel(kind="gbm", max_horizon=14, train_days=0)
+    gbm.fit(features, attributes)
+    categorical = [gbm.feature_names[i] for i in np.flatnonzero(gbm.estimator.is_categorical_)]
+    assert sorted(categorical) == ["brand_id", "category_id", "warehouse_id"]
+    assert len(gbm.predict(features, 7, unseen)) == 2 * 7
+
+
+def test_model_store_skips_fit_for_unchanged_data_and_updates_new_days(tmp_path):
+    days = pd.date_range("2024-01-01", periods=120, freq="D")
+    sales_df = pd.DataFrame({"ds": days, "y": 5 + 3 * np.sin(np.arange(120) * 2 * np.pi / 7)})
+    store = ModelStore(str(tmp_path))
+    forecaster = ExponentialSmoothingForecaster()
+
+    modes = []
+    for data in (sales_df.iloc[:-7], sales_df.iloc[:-7], sales_df):
+        result, info = asyncio.run(forecast_series(forecaster, 1, 1, data, 7, store))
+        modes.append(info["fit_mode"])
+
+    assert modes == ["full", "cached", "incremental"]
+    assert result[0][0] == datetime(2024, 4, 30)
+    state = forecaster.fit(sales_df.iloc[:-7])
+    updated = forecaster.update(state, sales_df.iloc[-7:])
+    assert store.get("ets", 1, 1)["watermark"] == "2024-04-29T00:00:00"
+    assert forecaster.predict(updated, 7) == result
+
+    corrected = sales_df.copy()
+    corrected.loc[3, "y"] += 10
+    _, info = asyncio.run(forecast_series(forecaster, 1, 1, corrected, 7, store))
+    assert info["fit_mode"] == "warm_start"
+    assert store.collect_garbage() == 2
+
+
+def test_hierarchy_reconciliation_is_coherent():
+    bottom = pd.DataFrame({"product_id": [1, 2, 3, 1], "warehouse_id": [1, 1, 1, 2], "category_id": [11, 11, 12, 11]})
+    categories = pd.DataFrame({"id": [10, 11, 12], "parent_id": [None, 10, 10]})
+    hierarchy = Hierarchy.build(bottom, categories)
+    nodes = hierarchy.nodes
+
+    root = nodes.index[(nodes["level"] == "category") & (nodes["category_id"] == 10)][0]
+    assert hierarchy.S[root].toarray().ravel().tolist() == [1, 1, 1, 1]
+    assert len(nodes[nodes["level"] == "category_warehouse"]) == 5
+
+    history = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0], [7.0, 8.0]])
+    coherent = hierarchy.aggregate(history)
+    variances = np.linspace(1, 2, len(nodes))
+    assert np.allclose(reconcile(hierarchy, coherent, "mint", variances=variances), coherent)
+
+    base = coherent.copy()
+    base[0] += 10
+    reconciled = reconcile(hierarchy, base, "mint", variances=variances)
+    assert np.allclose(hierarchy.aggregate(reconciled[hierarchy.n_aggregate:]), reconciled)
+    assert reconciled[0, 0] > coherent[0, 0]
+    assert np.allclose(reconcile(hierarchy, base, "bottom_up"), coherent)
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import DailySales, Product, Warehouse
+from ainventory.services import ingest
+from ainventory.services.ingest import SalesIngestBuffer
+from ainventory.services.rollups import upsert_daily_sales
+
+
+def test_buffer_groups_requests_into_batches(monkeypatch):
+    batches = []
+
+    def write(events):
+        batches.append(len(events))
+        return [{"status": "ok"} for _ in events]
+
+    monkeypatch.setattr(ingest, "write_sales_batch", write)
+    buffer = SalesIngestBuffer(max_batch=5, max_delay=0.05, max_pending=100)
+
+    async def run():
+        results = await asyncio.gather(*(buffer.submit([{"n": i}] * 2) for i in range(4)))
+        late = await buffer.submit([{"n": 9}])
+        await buffer.close()
+        return results, late
+
+    results, late = asyncio.run(run())
+    # Запросы не делятся между пакетами: 2 + 2 (+2 не помещается), затем 2 + 2 и по таймеру 1
+    assert batches == [4, 4, 1]
+    assert all(len(result) == 2 for result in results) and late == [{"status": "ok"}]
+    assert buffer.status()["batches"] == 3
+
+
+def test_daily_sales_upsert_accumulates():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Warehouse(id=1, name="Основной"), Product(id=1, sku="A", name="A")])
+    db.commit()
+
+    sale = {"product_id": 1, "warehouse_id": 1, "quantity": 2.0, "revenue": 10.0, "cost": None}
+    upsert_daily_sales(db, [{**sale, "sale_date": datetime(2024, 3, 1, 9)}, {**sale, "sale_date": datetime(2024, 3, 1, 18)}])
+    upsert_daily_sales(db, [{**sale, "sale_date": datetime(2024, 3, 1, 20)}, {**sale, "sale_date": datetime(2024, 3, 2, 8)}])
+    db.commit()
+
+    rows = {row.sale_day: (row.quantity, row.revenue, row.orders) for row in db.query(DailySales)}
+    assert rows == {date(2024, 3, 1): (6.0, 30.0, 3), date(2024, 3, 2): (2.0, 10.0, 1)}
+
+
+def test_sales_file_upload_fills_daily_sales(monkeypatch):
+    import pandas as pd
+    from contextlib import contextmanager
+
+    from ainventory.database.models import DataUpload, Sale
+    from ainventory.services import file_processor as processor_module
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([Warehouse(id=1, name="Основной"), Product(id=1, sku="A", name="A"), Product(id=2, sku="B", name="B")])
+    db.add(DataUpload(filename="sales.csv", file_path="uploads/sales.csv", file_type="sales", status="processing"))
+    db.commit()
+    db.close()
+
+    @contextmanager
+    def db_context():
+        session = Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    monkeypatch.setattr(processor_module, "get_db_context", db_context)
+    # Поиск выбросов после загрузки идет в своей сессии и здесь не проверяется
+    monkeypatch.setattr(processor_module.settings, "anomaly_scan_on_upload", False)
+    df = pd.DataFrame({
+        "SKU": ["A", "A", "B", "C", "A"],
+        "Sale_Date": ["2024-03-01 09:00", "2024-03-01 18:00", "2024-03-01 12:00", "2024-03-01 12:00", "2024-03-02 10:00"],
+        "Quantity": [2, 3, 1, 5, 4],
+        "Revenue": [20, 30, 7, 50, 40],
+    })
+
+    result = asyncio.run(processor_module.FileProcessor().process_file("uploads/sales.csv", "sales", warehouse_id=1, df=df))
+
+    # Неизвестный SKU - ошибка строки, остальные строки записаны вместе с дневными итогами
+    assert result["records_processed"] == 4 and len(result["errors"]) == 1 and "C" in result["errors"][0]
+    db = Session()
+    assert db.query(Sale).count() == 4
+    rows = {(row.product_id, row.sale_day): (row.quantity, row.revenue, row.orders) for row in db.query(DailySales)}
+    assert rows == {
+        (1, date(2024, 3, 1)): (5.0, 50.0, 2),
+        (2, date(2024, 3, 1)): (1.0, 7.0, 1),
+        (1, date(2024, 3, 2)): (4.0, 40.0, 1),
+    }
+    upload = db.query(DataUpload).one()
+    assert (upload.status, upload.records_processed) == ("completed", 4)
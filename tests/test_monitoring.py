@@ -0,0 +1,108 @@
+import re
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.pool import StaticPool
+
+from ainventory.api.routers import admin
+from ainventory.config import settings
+from ainventory.database.connection import Base
+from ainventory.database.models import Warehouse
+from ainventory.monitoring.metrics import registry
+from ainventory.monitoring.middleware import MetricsMiddleware
+from ainventory.monitoring.profiler import ProfilingMiddleware, instrument_engine_for_profiling, profile_store
+from ainventory.monitoring.sql import instrument_engine
+
+
+def make_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def sample(body: str, name: str, **labels) -> float:
+    """Значение серии из выгрузки /metrics (0 - серии нет)"""
+    expected = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{re.escape(name)}{{{re.escape(expected)}}} (\S+)$", body, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_metrics_report_route_and_sql_series():
+    engine = make_engine()
+    instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics-test/warehouses/{warehouse_id}")
+    async def get_warehouse(warehouse_id: int):
+        with engine.connect() as connection:
+            connection.execute(select(Warehouse.id).where(Warehouse.id == warehouse_id)).all()
+            connection.execute(select(Warehouse.name)).all()
+        return {"id": warehouse_id}
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(registry.render())
+
+    client = TestClient(app)
+    before = client.get("/metrics").text
+    for warehouse_id in (1, 2):
+        assert client.get(f"/metrics-test/warehouses/{warehouse_id}").status_code == 200
+    body = client.get("/metrics").text
+
+    # Метка маршрута - шаблон пути, а не фактический путь
+    route = "/metrics-test/warehouses/{warehouse_id}"
+    assert sample(body, "ainventory_http_requests_total", method="GET", route=route, status="200") == 2
+    assert 'route="/metrics-test/warehouses/1"' not in body
+    assert sample(body, "ainventory_http_request_duration_seconds_count", method="GET", route=route) == 2
+    assert sample(body, "ainventory_http_request_sql_queries_count", route=route) == 2
+    assert sample(body, "ainventory_http_request_sql_queries_sum", route=route) == 4
+    assert sample(body, "ainventory_http_request_sql_duration_seconds_sum", route=route) > 0
+    # Счетчики SQL процесса выросли на запросы маршрута
+    selects = sample(body, "ainventory_sql_queries_total", operation="SELECT")
+    assert selects - sample(before, "ainventory_sql_queries_total", operation="SELECT") >= 4
+    assert sample(body, "ainventory_sql_query_duration_seconds_count", operation="SELECT") >= selects
+
+
+def test_profiling_captures_explain_of_slow_query(monkeypatch):
+    engine = make_engine()
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+    monkeypatch.setattr(settings, "profiling_slow_query_ms", 5.0)
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    instrument_engine_for_profiling(engine)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, engine=engine)
+    app.include_router(admin.router, prefix="/admin")
+    profile_store.clear()
+
+    @app.get("/report")
+    async def report():
+        with engine.connect() as connection:
+            connection.execute(select(Warehouse.id).where(Warehouse.id == 1)).all()
+            total = connection.execute(text(
+                "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 300000) SELECT count(*) FROM n"
+            )).scalar()
+        return {"total": total}
+
+    client = TestClient(app)
+    # Без заголовка профилирования запрос не профилируется
+    assert "x-profile-id" not in client.get("/report").headers
+    response = client.get("/report", headers={"X-Profile": "1"})
+    profile_id = int(response.headers["x-profile-id"])
+
+    headers = {"X-Admin-Token": "secret"}
+    assert client.get("/admin/profiles").status_code == 403
+    listing = client.get("/admin/profiles", headers=headers).json()
+    assert listing["profiling_enabled"] is True
+    assert [profile["id"] for profile in listing["profiles"]] == [profile_id]
+    assert listing["profiles"][0]["route"] == "/report" and listing["profiles"][0]["sql_count"] == 2
+
+    details = client.get(f"/admin/profiles/{profile_id}", headers=headers).json()
+    fast, slow = details["statements"]
+    # План - только у запроса медленнее порога; сам запрос повторно не выполняется
+    assert slow["duration_ms"] >= 5.0 and slow["explain"]
+    assert any("SCAN" in line for line in slow["explain"])
+    assert "explain" not in fast
+    assert details["cpu"]["interval_ms"] == settings.profiling_sample_interval_ms
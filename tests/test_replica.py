@@ -0,0 +1,105 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.api.read_your_writes import COOKIE_NAME, ReadYourWritesMiddleware
+from ainventory.database import replica, versions
+from ainventory.database.connection import Base, SessionLocal
+from ainventory.database.models import Warehouse
+from ainventory.database.replica import ReplicaMonitor, get_read_db, read_session, request_scope
+
+
+def test_replica_lag_guard_and_read_your_writes():
+    healthy = ReplicaMonitor(create_engine("sqlite://"), max_lag=5.0, check_interval=60.0)
+    assert healthy.usable() and healthy.lag() == 0.0
+
+    broken = ReplicaMonitor(create_engine("sqlite:////nonexistent/dir/replica.db"), max_lag=5.0, check_interval=60.0)
+    assert not broken.usable()
+    assert broken.status()["fallbacks"] == 1
+
+    assert not replica._sticky_to_primary()
+    with request_scope(last_write=time.time() - 3600) as state:
+        assert not replica._sticky_to_primary()
+        state["wrote"] = time.time()
+        assert replica._sticky_to_primary()
+    with request_scope(last_write=time.time()):
+        assert replica._sticky_to_primary()
+
+
+def memory_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def use_replica(monkeypatch, lag):
+    """Реплика в отдельной БД; задержка - значение lag() (None - реплика недоступна)"""
+    engine = memory_engine()
+    monitor = ReplicaMonitor(engine, max_lag=5.0, check_interval=0.0)
+    monkeypatch.setattr(monitor, "_measure", lambda: lag["value"])
+    monkeypatch.setattr(replica, "ReplicaSessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(replica, "replica_monitor", monitor)
+    return engine, monitor
+
+
+def read_target(replica_engine) -> str:
+    dependency = get_read_db()
+    db = next(dependency)
+    try:
+        return "replica" if db.get_bind() is replica_engine else "primary"
+    finally:
+        dependency.close()
+
+
+def test_reads_fall_back_to_primary_when_replica_lags_or_is_down(monkeypatch):
+    lag = {"value": 1.0}
+    replica_engine, monitor = use_replica(monkeypatch, lag)
+    assert read_target(replica_engine) == "replica"
+
+    lag["value"] = 30.0
+    assert read_target(replica_engine) == "primary"
+    lag["value"] = None
+    assert read_target(replica_engine) == "primary"
+    assert monitor.status()["fallbacks"] == 2
+
+    # Реплика догнала primary: чтение возвращается на нее
+    lag["value"] = 0.0
+    assert read_target(replica_engine) == "replica"
+
+
+def test_write_pins_following_reads_to_primary(monkeypatch):
+    replica_engine, _ = use_replica(monkeypatch, {"value": 0.0})
+    primary_engine = memory_engine()
+    monkeypatch.setattr(versions, "engine", primary_engine)
+
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    @app.post("/write")
+    def write():
+        with SessionLocal(bind=primary_engine) as db:
+            db.add(Warehouse(name="Основной"))
+            db.commit()
+        return {}
+
+    @app.get("/read")
+    def read():
+        with read_session() as db:
+            return {"target": "replica" if db.get_bind() is replica_engine else "primary"}
+
+    client = TestClient(app)
+    assert client.get("/read").json()["target"] == "replica"
+    assert COOKIE_NAME not in client.get("/read").cookies
+
+    response = client.post("/write")
+    assert float(response.cookies[COOKIE_NAME]) <= time.time()
+    assert client.get("/read").json()["target"] == "primary"
+
+    # Окно read-your-writes прошло: снова реплика
+    client.cookies.clear()
+    client.cookies.set(COOKIE_NAME, f"{time.time() - 3600:.3f}")
+    assert client.get("/read").json()["target"] == "replica"
@@ -0,0 +1,243 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import JobSchedule, ScheduledJob
+from ainventory.services import scheduler
+from ainventory.services.scheduler import (
+    PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_URGENT, CronSchedule, FileLeaderLock, JobScheduler, check_cancelled,
+    run_job_stage
+)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_cron_next_run():
+    assert CronSchedule("0 3 * * *").next_after(utc(2024, 3, 1, 3, 0)) == utc(2024, 3, 2, 3, 0)
+    assert CronSchedule("*/15 * * * *").next_after(utc(2024, 3, 1, 10, 7, 30)) == utc(2024, 3, 1, 10, 15)
+    # Будни в 9:00: из субботы - понедельник
+    assert CronSchedule("0 9 * * 1-5").next_after(utc(2024, 3, 2, 12, 0)) == utc(2024, 3, 4, 9, 0)
+    # День месяца и день недели ограничены оба: подходит любой (1-е число или воскресенье)
+    assert CronSchedule("30 0 1 * 0").next_after(utc(2024, 3, 1, 1, 0)) == utc(2024, 3, 3, 0, 30)
+    assert CronSchedule("0 0 29 2 *").next_after(utc(2023, 3, 1)) == utc(2024, 2, 29, 0, 0)
+    for expression in ("0 3 * *", "61 * * * *", "0 0 31 2 *", "a * * * *"):
+        with pytest.raises(ValueError):
+            CronSchedule(expression).next_after(utc(2024, 1, 1))
+
+
+def test_file_lock_single_leader(tmp_path):
+    first, second = FileLeaderLock(str(tmp_path / "scheduler.lock")), FileLeaderLock(str(tmp_path / "scheduler.lock"))
+    assert first.acquire() and first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_jobs_run_by_priority_within_class_limits(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def db_context():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    monkeypatch.setattr(scheduler, "get_db_context", db_context)
+    jobs = JobScheduler(FileLeaderLock(str(tmp_path / "scheduler.lock")), 0.05, max_running=2, class_limits={"report": 1})
+    order = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def work(name: str, block: bool = False):
+            order.append(name)
+            if block:
+                await gate.wait()
+
+        jobs.register("report", "report", work, PRIORITY_LOW)
+        jobs.register("import", "import", work, PRIORITY_URGENT)
+        jobs.register("forecast", "forecast", work)
+        submitted = [
+            jobs.submit("report", {"name": "report-1", "block": True}),
+            jobs.submit("report", {"name": "report-2"}),
+            jobs.submit("forecast", {"name": "tail"}),
+            jobs.submit("forecast", {"name": "top"}, priority=PRIORITY_HIGH),
+            jobs.submit("import", {"name": "upload"}),
+            jobs.submit("forecast", {"name": "cancelled"}),
+        ]
+        jobs.cancel(submitted[-1]["id"])
+        with db_context() as db:
+            db.add(JobSchedule(name="nightly", cron="0 3 * * *", kind="forecast", parameters='{"name": "cron"}',
+                               enabled=True, next_run_at=utc(2024, 1, 1)))
+
+        jobs.start()
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if len(order) >= 6:
+                break
+        # Отчет занимает единственное место класса report: второй ждет, остальные идут мимо него
+        assert "report-2" not in order
+        jobs.cancel(submitted[0]["id"])
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if "report-2" in order:
+                break
+        await jobs.close()
+        return submitted
+
+    submitted = asyncio.run(run())
+    # Два места: срочная загрузка и прогноз важной позиции раньше длинного хвоста и отчетов
+    assert order[:2] == ["upload", "top"]
+    assert order.index("tail") < order.index("report-2") and "cancelled" not in order
+    assert "cron" in order
+    with db_context() as db:
+        statuses = {job.id: job.status for job in db.query(ScheduledJob)}
+        schedule = db.query(JobSchedule).one()
+        assert schedule.next_run_at > datetime(2024, 1, 1) and schedule.last_run_at is not None
+    assert statuses[submitted[0]["id"]] == "cancelled" and statuses[submitted[-1]["id"]] == "cancelled"
+    assert statuses[submitted[1]["id"]] == "completed" and statuses[submitted[4]["id"]] == "completed"
+
+
+class SwitchLock:
+    """Блокировка лидерства, которую тест передает от экземпляра к экземпляру"""
+
+    def __init__(self, held: bool):
+        self.value = held
+
+    def acquire(self) -> bool:
+        return self.value
+
+    def release(self):
+        self.value = False
+
+
+def scheduler_db(monkeypatch, tmp_path):
+    # Файл, а не общая StaticPool-память: потоки планировщика пишут статусы через свои соединения
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def db_context():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    monkeypatch.setattr(scheduler, "get_db_context", db_context)
+    return db_context
+
+
+def test_cancelled_job_keeps_slot_until_thread_returns(tmp_path, monkeypatch):
+    db_context = scheduler_db(monkeypatch, tmp_path)
+    jobs = JobScheduler(SwitchLock(True), 0.02, max_running=2, class_limits={"forecast": 1})
+    log = []
+
+    def chunks(name: str, cancel_event):
+        # Блок, начатый до отмены, дорабатывает; следующий не начинается
+        for _ in range(50):
+            time.sleep(0.02)
+            if cancel_event.is_set():
+                time.sleep(0.2)
+                log.append(f"{name} returned")
+                check_cancelled(cancel_event)
+        log.append(f"{name} returned")
+
+    async def work(name: str, cancel_event):
+        log.append(f"{name} started")
+        await run_job_stage(cancel_event, chunks, name, cancel_event)
+        log.append(f"{name} finished")
+
+    async def run():
+        jobs.register("forecast", "forecast", work)
+        first = jobs.submit("forecast", {"name": "first"})
+        second = jobs.submit("forecast", {"name": "second"})
+        jobs.start()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if "first started" in log:
+                break
+        jobs.cancel(first["id"])
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            if "second finished" in log:
+                break
+        await jobs.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    # Второй прогноз ждет, пока поток отмененного не вернется, а не только отмены корутины
+    assert log == ["first started", "first returned", "second started", "second returned", "second finished"]
+    with db_context() as db:
+        statuses = {job.id: job.status for job in db.query(ScheduledJob)}
+    assert statuses == {first["id"]: "cancelled", second["id"]: "completed"}
+
+
+def test_lost_leader_requeues_job_only_after_its_thread_returns(tmp_path, monkeypatch):
+    db_context = scheduler_db(monkeypatch, tmp_path)
+    old, new = SwitchLock(True), SwitchLock(False)
+    first = JobScheduler(old, 0.02, max_running=1, class_limits={}, stale_after=30.0)
+    second = JobScheduler(new, 0.02, max_running=1, class_limits={}, stale_after=30.0)
+    active, runs = [], []
+    guard = threading.Lock()
+
+    def stage(cancel_event):
+        with guard:
+            active.append(1)
+            runs.append(len(active))
+        try:
+            cancel_event.wait(0.3)
+            # Поток замечает отмену не сразу (дорабатывает блок)
+            time.sleep(0.2)
+            check_cancelled(cancel_event)
+        finally:
+            with guard:
+                active.pop()
+
+    async def work(cancel_event):
+        await run_job_stage(cancel_event, stage, cancel_event)
+
+    async def run():
+        for jobs in (first, second):
+            jobs.register("forecast", "forecast", work)
+        submitted = first.submit("forecast")
+        first.start()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if runs:
+                break
+        # Лидерство переходит ко второму экземпляру, пока задача первого еще в потоке
+        old.value, new.value = False, True
+        second.start()
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            with db_context() as db:
+                if db.get(ScheduledJob, submitted["id"]).status == "completed":
+                    break
+        await first.close()
+        await second.close()
+        return submitted
+
+    submitted = asyncio.run(run())
+    assert runs == [1, 1]
+    with db_context() as db:
+        job = db.get(ScheduledJob, submitted["id"])
+        assert job.status == "completed" and job.attempts == 2 and job.owner == second.instance_id
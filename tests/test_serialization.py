@@ -0,0 +1,42 @@
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from ainventory.api.compression import CompressionMiddleware
+from ainventory.api.serialization import FastJSONResponse, trusted_response
+
+
+def test_fast_json_and_compression_only_for_large_single_body_responses():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    rows = [{"sku": f"SKU{i}", "stock": np.float64(i), "price": Decimal("1.5"), "at": datetime(2024, 1, 1)} for i in range(50)]
+
+    @app.get("/report")
+    async def report():
+        return trusted_response({"data": rows, "total": np.int64(50)})
+
+    @app.get("/small")
+    async def small():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"x" * 500, b"y" * 500]), media_type="text/event-stream")
+
+    client = TestClient(app)
+    response = client.get("/report", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json()["data"][3] == {"sku": "SKU3", "stock": 3.0, "price": 1.5, "at": "2024-01-01T00:00:00"}
+    assert response.json()["total"] == 50
+    assert int(response.headers["content-length"]) < len(orjson.dumps(response.json()))
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/report", headers={"Accept-Encoding": "identity"}).headers
+    streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in streamed.headers and len(streamed.content) == 1000
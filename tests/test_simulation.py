@@ -0,0 +1,33 @@
+import numpy as np
+
+from ainventory.policies.simulation import policy_levels, simulate_policy, summarize
+
+
+def test_simulate_policy_orders_arrive_after_lead_time_and_lost_sales_are_counted():
+    demand = np.full((2, 6), 4.0)
+    metrics = simulate_policy(
+        demand,
+        lead_time_days=np.array([3, 0]),
+        reorder_point=np.array([4.0, 4.0]),
+        order_up_to=np.array([12.0, 12.0]),
+        initial_stock=np.array([8.0, 8.0]),
+        unit_cost=np.array([10.0, 10.0]),
+        holding_cost_rate=0.365
+    )
+
+    # Первая позиция: заказ 8 в день 0 приходит в день 3, в дни 2 и 5 остатка не хватает
+    assert metrics["sold"].tolist() == [16.0, 24.0]
+    assert metrics["stockout_days"].tolist() == [2, 0]
+    assert metrics["orders"].tolist() == [2, 3]
+    assert np.allclose(metrics["holding_cost"], metrics["average_inventory"] * 10.0 * 0.365 * 6 / 365)
+
+    summary = summarize(metrics, 6)
+    assert summary["fill_rate"] == 40.0 / 48.0
+    assert summary["lost_sales"] == 8.0
+    assert summary["items_with_stockouts"] == 1
+
+
+def test_policy_levels_from_settings_parameters():
+    reorder_point, order_up_to = policy_levels(np.array([2.0]), np.array([5]), 7, 1.2, 14)
+    assert np.allclose(reorder_point, [1.2 * 2 * 5 + 7 * 2])
+    assert np.allclose(order_up_to, reorder_point + 14 * 2)
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_api_import_does_not_load_heavy_dependencies():
+    code = (
+        "import sys, ainventory.api.main; "
+        "print(','.join(m for m in ('pandas', 'numpy', 'scipy', 'sklearn', 'prophet', 'matplotlib') if m in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env={"PYTHONPATH": str(ROOT / "src"), "PATH": ""},
+        capture_output=True, text=True, check=True
+    )
+    assert completed.stdout.strip() == ""
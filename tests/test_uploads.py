@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.api.routers import data
+from ainventory.config import settings
+from ainventory.database.connection import Base, get_db
+from ainventory.database.models import DataUpload
+from ainventory.services.upload_pipeline import UploadPipeline, UploadTooLargeError
+
+CSV = b"sku,sale_date,quantity\n" + b"".join(f"SKU{i},2024-03-01,{i}\n".encode() for i in range(2000))
+
+
+class ChunkedFile:
+    """UploadFile, отдающий тело мелкими кусками"""
+
+    def __init__(self, body: bytes, piece: int = 1000):
+        self.body = body
+        self.piece = piece
+        self.position = 0
+
+    async def read(self, size: int) -> bytes:
+        chunk = self.body[self.position:self.position + min(size, self.piece)]
+        self.position += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, "upload_chunk_size", 4096)
+    monkeypatch.setattr(settings, "max_file_size", 64000)
+    return UploadPipeline()
+
+
+@pytest.fixture
+def client(pipeline, monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    def db_session():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    submitted = []
+    monkeypatch.setattr(data, "upload_pipeline", pipeline)
+    monkeypatch.setattr(data.job_scheduler, "submit", lambda kind, parameters, **options: submitted.append(parameters) or {
+        "id": len(submitted), "event_job": f"upload:{parameters['upload_id']}"
+    })
+    app = FastAPI()
+    app.include_router(data.router, prefix="/data")
+    app.dependency_overrides[get_db] = db_session
+    client = TestClient(app)
+    client.session, client.submitted = Session, submitted
+    return client
+
+
+def test_streamed_upload_hashes_and_parses_while_writing(pipeline):
+    dest = Path(settings.upload_dir) / "sales.csv"
+    result = asyncio.run(pipeline.save_upload(ChunkedFile(CSV), dest))
+    assert result["size"] == len(CSV) == dest.stat().st_size
+    assert result["sha256"] == hashlib.sha256(CSV).hexdigest()
+    assert len(result["dataframe"]) == 2000 and result["dataframe"]["quantity"].sum() == sum(range(2000))
+
+    # Лимит проверяется по ходу записи, без заявленного размера; недописанный файл удаляется
+    too_large = Path(settings.upload_dir) / "large.csv"
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(pipeline.save_upload(ChunkedFile(CSV * 2), too_large))
+    assert not too_large.exists()
+
+
+def test_concurrent_csv_uploads_do_not_exhaust_shared_executor(pipeline):
+    # Общий пул меньше числа загрузок: разбор не должен занимать потоки, в которых пишутся блоки
+    async def run():
+        loop = asyncio.get_running_loop()
+        shared = ThreadPoolExecutor(max_workers=2)
+        loop.set_default_executor(shared)
+        uploads = [
+            pipeline.save_upload(ChunkedFile(CSV), Path(settings.upload_dir) / f"sales-{index}.csv") for index in range(8)
+        ]
+        results = await asyncio.wait_for(asyncio.gather(*uploads), timeout=30)
+        # Общий пул по-прежнему свободен для остальных задач
+        assert await asyncio.wait_for(loop.run_in_executor(None, lambda: "free"), timeout=5) == "free"
+        return results
+
+    results = asyncio.run(run())
+    assert all(result["sha256"] == hashlib.sha256(CSV).hexdigest() for result in results)
+    # Сверх лимита разборщиков файл разбирается после записи (dataframe нет)
+    parsed = [result["dataframe"] for result in results if result["dataframe"] is not None]
+    assert 1 <= len(parsed) <= pipeline.max_parsers and all(len(frame) == 2000 for frame in parsed)
+    assert pipeline._parsers == 0
+
+
+def test_upload_endpoint_limits_size(client):
+    response = client.post("/data/upload", files={"file": ("sales.csv", CSV, "text/csv")}, data={"file_type": "sales"})
+    assert response.status_code == 200
+    with client.session() as db:
+        upload = db.query(DataUpload).one()
+        assert (upload.file_size, upload.file_hash) == (len(CSV), hashlib.sha256(CSV).hexdigest())
+    assert client.submitted[0]["upload_id"] == upload.id
+
+    response = client.post("/data/upload", files={"file": ("big.csv", CSV * 2, "text/csv")}, data={"file_type": "sales"})
+    assert response.status_code == 413
+    assert [path.name for path in Path(settings.upload_dir).iterdir() if path.is_file()] == [Path(upload.file_path).name]
+
+
+def test_resumable_upload_session(client, pipeline):
+    assert client.post("/data/uploads/sessions", json={"filename": "big.csv", "file_type": "sales", "total_size": 10 ** 6}).status_code == 413
+
+    session = client.post("/data/uploads/sessions", json={"filename": "sales.csv", "file_type": "sales", "total_size": len(CSV)}).json()
+    url = f"/data/uploads/sessions/{session['session_id']}"
+    half = len(CSV) // 2
+    assert client.put(f"{url}/chunks", params={"offset": 0}, content=CSV[:half]).json()["received"] == half
+    # Повтор уже принятого блока и пропуск данных отклоняются, принятое не меняется
+    assert client.put(f"{url}/chunks", params={"offset": 0}, content=CSV[:half]).status_code == 409
+    assert client.put(f"{url}/chunks", params={"offset": half + 10}, content=CSV[half:]).status_code == 409
+    # Клиент после обрыва узнает, с какого места продолжать
+    assert client.get(url).json()["received"] == half
+    assert client.post(f"{url}/complete").status_code == 409
+    assert client.put(f"{url}/chunks", params={"offset": half}, content=CSV[half:]).json()["received"] == len(CSV)
+    assert client.post(f"{url}/complete", params={"sha256": "0" * 64}).status_code == 409
+
+    response = client.post(f"{url}/complete", params={"sha256": hashlib.sha256(CSV).hexdigest()})
+    assert response.status_code == 200
+    with client.session() as db:
+        upload = db.query(DataUpload).one()
+        assert Path(upload.file_path).read_bytes() == CSV
+    assert client.get(url).status_code == 404
+
+    # Выдуманные идентификаторы не оставляют блокировок
+    assert client.put("/data/uploads/sessions/deadbeef/chunks", params={"offset": 0}, content=b"x").status_code == 404
+    assert client.post("/data/uploads/sessions/deadbeef/complete").status_code == 404
+    assert pipeline._locks == {}
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from ainventory.database.connection import Base
+from ainventory.database.models import Product, SeriesForecastState, SeriesWatermark, Warehouse
+from ainventory.services.rollups import upsert_daily_sales
+from ainventory.services.watermarks import dirty_series_query, dirty_summary, mark_forecasted
+
+
+def make_session():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(Warehouse(id=index, name=f"Склад {index}") for index in (1, 2))
+    db.add_all(Product(id=index, sku=f"SKU{index}", name=f"Товар {index}") for index in (1, 2, 3))
+    db.flush()
+    return db
+
+
+def sales(*series, day=datetime(2024, 3, 1, 12)):
+    return [{"product_id": product_id, "warehouse_id": warehouse_id, "sale_date": day, "quantity": 1.0, "revenue": 10.0}
+            for product_id, warehouse_id in series]
+
+
+def dirty(db, config_hash="v1", **kwargs):
+    return sorted(tuple(row) for row in db.execute(dirty_series_query("global_gbm", config_hash, **kwargs)).all())
+
+
+def test_only_changed_series_are_dirty_after_forecast():
+    db = make_session()
+    upsert_daily_sales(db, sales((1, 1), (2, 1), (3, 2)))
+    assert dirty(db) == [(1, 1, 1), (2, 1, 1), (3, 2, 1)]
+
+    mark_forecasted(db, "global_gbm", dirty(db), "v1")
+    assert dirty(db) == []
+    assert dirty_summary(db, "global_gbm", "v1")["fresh"] == 3
+
+    # Новые продажи двух рядов (в том числе повторно за тот же день) - пересчет только их
+    upsert_daily_sales(db, sales((2, 1), (3, 2)))
+    upsert_daily_sales(db, sales((3, 2), day=datetime(2024, 3, 2, 9)))
+    assert dirty(db) == [(2, 1, 2), (3, 2, 3)]
+    assert dirty(db, warehouse_id=2) == [(3, 2, 3)]
+    assert len(dirty(db, force=True)) == 3
+    # Другая модель ведет свое состояние
+    assert len(db.execute(dirty_series_query("global_linear", "v1")).all()) == 3
+
+    # Данные, пришедшие во время расчета, оставляют ряд устаревшим
+    selected = dirty(db)
+    upsert_daily_sales(db, sales((3, 2), day=datetime(2024, 3, 3, 9)))
+    mark_forecasted(db, "global_gbm", selected, "v1")
+    assert dirty(db) == [(3, 2, 4)]
+
+
+def test_config_change_and_staleness_cap():
+    db = make_session()
+    upsert_daily_sales(db, sales((1, 1), (2, 1)))
+    mark_forecasted(db, "global_gbm", dirty(db), "v1")
+
+    assert len(dirty(db, config_hash="v2")) == 2
+    assert dirty_summary(db, "global_gbm", "v2")["config"] == 2
+
+    db.execute(
+        update(SeriesForecastState)
+        .where(SeriesForecastState.product_id == 1)
+        .values(forecasted_at=datetime.now(timezone.utc) - timedelta(days=10))
+    )
+    assert dirty(db, max_age_days=7) == [(1, 1, 1)]
+    assert dirty(db, max_age_days=0) == []
+    assert dirty_summary(db, "global_gbm", "v1", max_age_days=7)["stale"] == 1
+    assert db.get(SeriesWatermark, (1, 1)).data_version == 1